@@ -0,0 +1,210 @@
+"""
+Asyncio database connection module
+"""
+import asyncio
+import aiomysql
+from pymysql.constants import CLIENT
+from app.config import DB_CONFIG, DB_POOL_CONFIG
+from app.database import server_supports_returning, returning_batch
+from app.query_cache import query_cache, TrackingCursor
+from app.query_stats import query_stats, AsyncInstrumentedCursor
+from contextlib import asynccontextmanager
+
+
+class AsyncDatabase:
+    def __init__(self):
+        self.config = DB_CONFIG
+        self.pool_config = DB_POOL_CONFIG
+        self.pool = None
+        self._pool_lock = None
+        self.multi_statements = bool(self.config.get('client_flag', 0) & CLIENT.MULTI_STATEMENTS)
+        self._supports_returning = None
+
+    def _connect_kwargs(self):
+        # aiomysql names the schema argument "db" rather than "database"
+        kwargs = dict(self.config)
+        kwargs['db'] = kwargs.pop('database')
+        return kwargs
+
+    async def connect(self):
+        """Create the connection pool if it does not exist yet"""
+        # Created lazily so the lock binds to the running event loop
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await aiomysql.create_pool(
+                    minsize=self.pool_config['min_size'],
+                    maxsize=self.pool_config['max_size'],
+                    pool_recycle=int(self.pool_config['max_lifetime']),
+                    **self._connect_kwargs()
+                )
+        return self.pool
+
+    async def close(self):
+        """Close the connection pool"""
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    @asynccontextmanager
+    async def get_connection(self, probe=None):
+        """Get a pooled database connection with async context manager"""
+        pool = self.pool or await self.connect()
+        timeout = self.pool_config['checkout_timeout']
+        conn = await asyncio.wait_for(pool.acquire(), timeout)
+        if probe is not None:
+            probe.acquired()
+        try:
+            yield conn
+        except Exception as e:
+            try:
+                await conn.rollback()
+            except Exception:
+                # The connection is unusable; close it so the pool drops it
+                conn.close()
+            raise e
+        finally:
+            pool.release(conn)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Run statements on one connection inside a single transaction"""
+        written = set()
+        try:
+            async with self.get_connection() as conn:
+                await conn.begin()
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    tracking = TrackingCursor(AsyncInstrumentedCursor(cursor, query_stats))
+                    try:
+                        yield tracking
+                    finally:
+                        written = tracking.written
+                await conn.commit()
+        finally:
+            query_cache.invalidate(written)
+
+    def pool_stats(self):
+        """Get connection pool statistics"""
+        if self.pool is None:
+            return {'min_size': self.pool_config['min_size'], 'max_size': self.pool_config['max_size'],
+                    'size': 0, 'idle': 0, 'in_use': 0}
+        return {
+            'min_size': self.pool.minsize,
+            'max_size': self.pool.maxsize,
+            'size': self.pool.size,
+            'idle': self.pool.freesize,
+            'in_use': self.pool.size - self.pool.freesize,
+        }
+
+    async def fetch_all(self, query, params=None):
+        """Execute a query and return all rows"""
+        hit, cached, ticket = query_cache.lookup('all', query, params)
+        if hit:
+            return cached
+        with query_stats.observe(query, params) as probe:
+            async with self.get_connection(probe) as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(query, params)
+                    result = await cursor.fetchall()
+                    probe.rows = len(result)
+        query_cache.store(ticket, result)
+        return result
+
+    async def fetch_one(self, query, params=None):
+        """Execute a query and return single row"""
+        hit, cached, ticket = query_cache.lookup('one', query, params)
+        if hit:
+            return cached
+        with query_stats.observe(query, params) as probe:
+            async with self.get_connection(probe) as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(query, params)
+                    result = await cursor.fetchone()
+                    probe.rows = int(result is not None)
+        query_cache.store(ticket, result)
+        return result
+
+    async def insert(self, query, params=None):
+        """Execute insert and return last insert id"""
+        try:
+            with query_stats.observe(query, params) as probe:
+                async with self.get_connection(probe) as conn:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute(query, params)
+                        probe.rows = max(cursor.rowcount, 0)
+                        return cursor.lastrowid
+        finally:
+            query_cache.written(query)
+
+    async def execute(self, query, params=None):
+        """Execute a statement and return the affected row count"""
+        try:
+            with query_stats.observe(query, params) as probe:
+                async with self.get_connection(probe) as conn:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute(query, params)
+                        probe.rows = max(cursor.rowcount, 0)
+                        return cursor.rowcount
+        finally:
+            query_cache.written(query)
+
+    def _returns_rows(self, conn):
+        if self._supports_returning is None:
+            self._supports_returning = server_supports_returning(conn.get_server_info())
+        return self._supports_returning
+
+    async def _fetch_batch(self, cursor, query, params):
+        """Execute a multi-statement batch and return the row of its SELECT"""
+        await cursor.execute(query, params)
+        row = None
+        while True:
+            if cursor.description:
+                row = await cursor.fetchone()
+            if not await cursor.nextset():
+                return row
+
+    async def insert_returning(self, query, params, table, key):
+        """Insert a row and return it without a second round trip"""
+        select_query = f"SELECT * FROM {table} WHERE {key} = LAST_INSERT_ID()"
+        try:
+            with query_stats.observe(query, params) as probe:
+                async with self.get_connection(probe) as conn:
+                    async with conn.cursor(aiomysql.DictCursor) as cursor:
+                        if self._returns_rows(conn):
+                            await cursor.execute(f"{query.rstrip()} RETURNING *", params)
+                            return await cursor.fetchone()
+                        if self.multi_statements:
+                            return await self._fetch_batch(cursor, returning_batch(query, select_query), params)
+                        # No batching available: still one connection and one transaction
+                        await conn.begin()
+                        await cursor.execute(query, params)
+                        await cursor.execute(select_query)
+                        row = await cursor.fetchone()
+                        await conn.commit()
+                        return row
+        finally:
+            query_cache.written(query)
+
+    async def update_returning(self, query, params, table, key):
+        """Update a row keyed by params[key] and return it in the same round trip"""
+        select_query = f"SELECT * FROM {table} WHERE {key} = %({key})s"
+        try:
+            with query_stats.observe(query, params) as probe:
+                async with self.get_connection(probe) as conn:
+                    async with conn.cursor(aiomysql.DictCursor) as cursor:
+                        if self.multi_statements:
+                            return await self._fetch_batch(cursor, returning_batch(query, select_query), params)
+                        await conn.begin()
+                        await cursor.execute(query, params)
+                        await cursor.execute(select_query, params)
+                        row = await cursor.fetchone()
+                        await conn.commit()
+                        return row
+        finally:
+            query_cache.written(query)
+
+
+# Global async database instance
+adb = AsyncDatabase()
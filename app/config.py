@@ -1,8 +1,10 @@
 """
 Database configuration for Smart City Management System
 """
+import json
 import os
 from dotenv import load_dotenv
+from pymysql.constants import CLIENT
 
 load_dotenv()
 
@@ -14,6 +16,225 @@ DB_CONFIG = {
     'database': os.getenv('DB_NAME', 'smart_city_management'),
     'port': int(os.getenv('DB_PORT', 3306)),
     'charset': 'utf8mb4',
-    'autocommit': True
+    'autocommit': True,
+    # Opt-in: lets a write and the SELECT that echoes it share one round trip, but also lets any
+    # injected ';' run extra statements. Off, writes that return their row use RETURNING (MariaDB)
+    # or a write + SELECT transaction on one connection
+    'client_flag': CLIENT.MULTI_STATEMENTS if os.getenv('DB_MULTI_STATEMENTS', 'false').lower() == 'true' else 0
 }
 
+# Connection pool configuration
+DB_POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+    # Seconds a caller waits for a free connection before giving up
+    'checkout_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    # Idle connections above min_size are closed after this many seconds
+    'max_idle_time': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+    # Connections are recycled after this many seconds regardless of use
+    'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+    # Connections idle longer than this are pinged before being handed out
+    'ping_interval': float(os.getenv('DB_POOL_PING_INTERVAL', 30)),
+}
+
+# Bulk ingestion configuration
+BULK_CONFIG = {
+    # Rows written per executemany/transaction
+    'chunk_size': int(os.getenv('BULK_CHUNK_SIZE', 1000)),
+    # Per-row errors reported back before the list is truncated
+    'max_errors': int(os.getenv('BULK_MAX_ERRORS', 1000)),
+}
+
+# Dashboard statistics snapshot
+STATS_CONFIG = {
+    # Seconds between background refreshes of the /stats snapshot
+    'refresh_interval': float(os.getenv('STATS_REFRESH_INTERVAL', 15)),
+}
+
+# Citizen name search index
+SEARCH_CONFIG = {
+    # Rows per batch when the index is built from the citizens table
+    'load_batch_size': int(os.getenv('SEARCH_LOAD_BATCH_SIZE', 5000)),
+    # Substring matches ranked per query; bounds latency for very broad queries
+    'max_candidates': int(os.getenv('SEARCH_MAX_CANDIDATES', 20000)),
+}
+
+# Query result cache
+_QUERY_CACHE_TABLES = os.getenv('QUERY_CACHE_TABLES',
+                                'emergency_services,public_transport_routes,waste_collection_zones,drivers')
+QUERY_CACHE_CONFIG = {
+    'enabled': os.getenv('QUERY_CACHE_ENABLED', 'true').lower() == 'true',
+    # Least recently used results are evicted past this many entries
+    'max_entries': int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 2048)),
+    # Seconds a result may be served; bounds staleness from other processes' writes
+    'ttl': float(os.getenv('QUERY_CACHE_TTL', 60)),
+    # Larger results are not cached
+    'max_rows': int(os.getenv('QUERY_CACHE_MAX_ROWS', 1000)),
+    # Only SELECTs reading exclusively from these tables are cached; "*" caches all
+    'tables': None if _QUERY_CACHE_TABLES.strip() == '*' else
+              [table.strip().lower() for table in _QUERY_CACHE_TABLES.split(',') if table.strip()],
+}
+
+# Per-statement instrumentation
+QUERY_STATS_CONFIG = {
+    'enabled': os.getenv('QUERY_STATS_ENABLED', 'true').lower() == 'true',
+    # Statements slower than this are logged (with parameter values redacted); 0 disables
+    'slow_query_ms': float(os.getenv('SLOW_QUERY_MS', 500)),
+    # Distinct fingerprints tracked before new ones are folded into "<other>"
+    'max_fingerprints': int(os.getenv('QUERY_STATS_MAX_FINGERPRINTS', 500)),
+}
+
+# Prometheus metrics
+METRICS_CONFIG = {
+    # Record per-route request metrics and serve them on /metrics
+    'enabled': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+}
+
+# Monthly billing runs
+BILLING_CONFIG = {
+    # Days after the end of the billing period that bills fall due
+    'due_days': int(os.getenv('BILL_DUE_DAYS', 15)),
+    # Usage rows fetched per server-side cursor batch
+    'batch_size': int(os.getenv('BILLING_BATCH_SIZE', 10000)),
+    # Bills written per multi-row INSERT/transaction
+    'chunk_size': int(os.getenv('BILLING_CHUNK_SIZE', 5000)),
+    # Robust z-score above which a month's consumption is reported as an outlier
+    'outlier_threshold': float(os.getenv('BILLING_OUTLIER_THRESHOLD', 6.0)),
+    # Slabs are [upper limit, rate per unit]; a null limit marks the last, unbounded slab
+    'tariffs': {
+        'electricity': json.loads(os.getenv(
+            'ELECTRICITY_TARIFF', '{"fixed_charge": 50, "slabs": [[100, 3.5], [300, 5.0], [null, 7.5]]}')),
+        'water': json.loads(os.getenv(
+            'WATER_TARIFF', '{"fixed_charge": 30, "slabs": [[10000, 0.005], [30000, 0.008], [null, 0.012]]}')),
+    },
+}
+
+# Payment reconciliation
+RECONCILIATION_CONFIG = {
+    # Refresh bill statuses as part of every payment write
+    'inline': os.getenv('RECONCILE_INLINE', 'true').lower() == 'true',
+    # Payments per catch-up batch/transaction
+    'batch_size': int(os.getenv('RECONCILE_BATCH_SIZE', 5000)),
+    # The catch-up job leaves payments younger than this for its next run, so a lower payment_id
+    # that commits after a higher one is not skipped by the high-water mark
+    'lag_seconds': int(os.getenv('RECONCILE_LAG_SECONDS', 300)),
+}
+
+# Overdue bill sweeper
+OVERDUE_CONFIG = {
+    # Bill ids per primary-key window/transaction
+    'chunk_size': int(os.getenv('OVERDUE_CHUNK_SIZE', 2000)),
+    # Seconds between scheduled sweeps while the API runs; 0 disables the schedule
+    'interval_seconds': float(os.getenv('OVERDUE_SWEEP_INTERVAL', 3600)),
+}
+
+# Account balance ledger
+LEDGER_CONFIG = {
+    # Refresh account_balances as part of every bill and payment write
+    'inline': os.getenv('LEDGER_INLINE', 'true').lower() == 'true',
+    # Accounts recomputed per rebuild window/transaction
+    'rebuild_batch_size': int(os.getenv('LEDGER_REBUILD_BATCH_SIZE', 1000)),
+}
+
+# Usage anomaly detection
+ANOMALY_CONFIG = {
+    # Previous readings of the same account that form each baseline
+    'window': int(os.getenv('ANOMALY_WINDOW', 6)),
+    # Readings with a shorter history are not scored
+    'min_history': int(os.getenv('ANOMALY_MIN_HISTORY', 3)),
+    # |z| at or above this flags a spike or drop
+    'z_threshold': float(os.getenv('ANOMALY_Z_THRESHOLD', 3.5)),
+    # Lower bound on the baseline std as a fraction of the baseline mean
+    'min_std_ratio': float(os.getenv('ANOMALY_MIN_STD_RATIO', 0.1)),
+    # Readings fetched per server-side cursor batch
+    'batch_size': int(os.getenv('ANOMALY_BATCH_SIZE', 20000)),
+}
+
+# Consumption rollup cube
+ROLLUP_CONFIG = {
+    # Refresh the affected cells as part of every usage and bill write
+    'inline': os.getenv('ROLLUP_INLINE', 'true').lower() == 'true',
+    # A write touching more (city, area) cells than this refreshes its whole month instead
+    'max_cells': int(os.getenv('ROLLUP_MAX_CELLS', 50)),
+}
+
+# Streaming CSV meter file imports
+IMPORT_CONFIG = {
+    # Validated rows per batch handed to a DB writer (one transaction each)
+    'batch_size': int(os.getenv('IMPORT_BATCH_SIZE', 5000)),
+    # Validation processes; 0 validates in the reading thread
+    'workers': int(os.getenv('IMPORT_WORKERS', 2)),
+    # Concurrent DB writer threads
+    'writers': int(os.getenv('IMPORT_WRITERS', 2)),
+    # Validated batches waiting for a writer before reading pauses
+    'queue_size': int(os.getenv('IMPORT_QUEUE_SIZE', 4)),
+    # Bytes read from a file per chunk
+    'read_size': int(os.getenv('IMPORT_READ_SIZE', 1 << 20)),
+    # Seconds between progress log lines
+    'progress_interval': float(os.getenv('IMPORT_PROGRESS_INTERVAL', 5)),
+}
+
+# Yearly partitions of the usage, bill and payment tables
+PARTITION_CONFIG = {
+    # Years ahead of the current one that always have a partition
+    'future_years': int(os.getenv('PARTITION_FUTURE_YEARS', 2)),
+    # Years kept in the live tables, the current one included; 0 never retires a year
+    'retain_years': int(os.getenv('PARTITION_RETAIN_YEARS', 0)),
+    # Retired years move to <table>_<year> archive tables instead of being dropped
+    'archive': os.getenv('PARTITION_ARCHIVE', 'true').lower() == 'true',
+}
+
+# In-memory transit route graph
+TRANSIT_CONFIG = {
+    # Rows per batch when the graph is built from the routes table
+    'load_batch_size': int(os.getenv('TRANSIT_LOAD_BATCH_SIZE', 5000)),
+    # Path results kept until the graph changes (least recently used dropped first)
+    'cache_size': int(os.getenv('TRANSIT_CACHE_SIZE', 10000)),
+    # Most queried (mode, from, to) pairs recomputed after every change
+    'precompute_pairs': int(os.getenv('TRANSIT_PRECOMPUTE_PAIRS', 200)),
+}
+
+# Live bus positions
+POSITIONS_CONFIG = {
+    # Pings kept per bus; older ones are overwritten
+    'buffer_size': int(os.getenv('POSITIONS_BUFFER_SIZE', 120)),
+    # Where buffers are snapshotted so a restart keeps recent positions; empty disables snapshots
+    'snapshot_path': os.getenv('POSITIONS_SNAPSHOT_PATH', 'data/bus_positions.npz'),
+    # Seconds between snapshots
+    'snapshot_interval': float(os.getenv('POSITIONS_SNAPSHOT_INTERVAL', 30)),
+}
+
+# Live change events (server-sent events)
+EVENTS_CONFIG = {
+    # Frames buffered per client; a client that falls this far behind gets a resync event instead
+    'queue_size': int(os.getenv('EVENTS_QUEUE_SIZE', 100)),
+    'max_clients': int(os.getenv('EVENTS_MAX_CLIENTS', 1000)),
+    # Recent events kept for clients reconnecting with Last-Event-ID
+    'replay_size': int(os.getenv('EVENTS_REPLAY_SIZE', 1000)),
+    # Seconds between keepalive comments on an idle stream
+    'heartbeat_interval': float(os.getenv('EVENTS_HEARTBEAT_INTERVAL', 15)),
+}
+
+# Emergency dispatch queue
+DISPATCH_CONFIG = {
+    # Service types dispatched first at equal severity, most urgent first; others follow
+    'service_priority': [name.strip() for name in os.getenv('DISPATCH_SERVICE_PRIORITY', 'Ambulance,Fire,Police').split(',') if name.strip()],
+    # Requests locked per claim attempt; the best one not held by another worker is dispatched
+    'claim_candidates': int(os.getenv('DISPATCH_CLAIM_CANDIDATES', 8)),
+    # Attempts from the in-memory queue before claiming straight from the table
+    'claim_attempts': int(os.getenv('DISPATCH_CLAIM_ATTEMPTS', 3)),
+    'load_batch_size': int(os.getenv('DISPATCH_LOAD_BATCH_SIZE', 5000)),
+}
+
+# Geocoding and spatial index
+GEO_CONFIG = {
+    # CSV of name, city, latitude, longitude; a row named after its city is the city centre
+    'gazetteer_path': os.getenv('GAZETTEER_PATH', 'data/gazetteer.csv'),
+    # Location strings whose geocoding result is remembered
+    'cache_size': int(os.getenv('GEOCODE_CACHE_SIZE', 10000)),
+    # Side of a spatial index grid cell
+    'cell_km': float(os.getenv('SPATIAL_CELL_KM', 1.0)),
+    # Largest radius the nearby endpoints accept
+    'max_radius_km': float(os.getenv('SPATIAL_MAX_RADIUS_KM', 100)),
+    'load_batch_size': int(os.getenv('SPATIAL_LOAD_BATCH_SIZE', 5000)),
+}
@@ -0,0 +1,1248 @@
+"""
+Async CRUD operations for all tables
+"""
+from app.async_database import adb
+from typing import List, Optional, Dict, Union
+from datetime import date
+import json
+from app.crud.pagination import InvalidCursorError, keyset_query, build_page
+from app.hooks import notify_async
+from app.services.citizen_search import citizen_index, normalize, match_kind, fallback_query, hits_query, order_hits
+
+# ==================== PAGINATION ====================
+async def _keyset_page(table: str, cursor: str, limit: int, sort: str = "id", where: str = "", params=()):
+    query, query_params = keyset_query(table, cursor, limit, sort, where, params)
+    return build_page(table, await adb.fetch_all(query, query_params), limit, sort)
+
+# ==================== ADDRESSES ====================
+async def create_address(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO addresses (street, area, city, state, zipcode, country)
+        VALUES (%(street)s, %(area)s, %(city)s, %(state)s, %(zipcode)s, %(country)s)
+    """
+    if not returning:
+        return {"address_id": await adb.insert(query, data)}
+    return await adb.insert_returning(query, data, "addresses", "address_id")
+
+async def get_address(address_id: int):
+    query = "SELECT * FROM addresses WHERE address_id = %s"
+    return await adb.fetch_one(query, (address_id,))
+
+async def get_all_addresses(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("addresses", cursor, limit)
+    query = "SELECT * FROM addresses ORDER BY address_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def update_address(address_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_address(address_id) if returning else {"address_id": address_id}
+    
+    params['address_id'] = address_id
+    query = f"UPDATE addresses SET {', '.join(fields)} WHERE address_id = %(address_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        return {"address_id": address_id}
+    return await adb.update_returning(query, params, "addresses", "address_id")
+
+async def delete_address(address_id: int):
+    query = "DELETE FROM addresses WHERE address_id = %s"
+    await adb.execute(query, (address_id,))
+    return {"message": "Address deleted successfully"}
+
+# ==================== CITIZENS ====================
+async def create_citizen(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO citizens (name, dob, gender, phone, email, address_id)
+        VALUES (%(name)s, %(dob)s, %(gender)s, %(phone)s, %(email)s, %(address_id)s)
+    """
+    if not returning:
+        row = {**data, "citizen_id": await adb.insert(query, data)}
+        await notify_async("citizens", "insert", [row])
+        return {"citizen_id": row["citizen_id"]}
+    row = await adb.insert_returning(query, data, "citizens", "citizen_id")
+    await notify_async("citizens", "insert", [row])
+    return row
+
+async def get_citizen(identifier: Union[int, str]):
+    if isinstance(identifier, str) and not identifier.isdigit():
+        # If it's a string and not a digit, search by name (exact match)
+        query = "SELECT * FROM citizens WHERE name = %s"
+        return await adb.fetch_one(query, (identifier,))
+    else:
+        # If it's an int or a string that represents a digit, search by ID
+        citizen_id = int(identifier)
+        query = "SELECT * FROM citizens WHERE citizen_id = %s"
+        return await adb.fetch_one(query, (citizen_id,))
+
+async def get_all_citizens(skip: int = 0, limit: int = 100, name: Optional[str] = None, cursor: Optional[str] = None):
+    if cursor is not None:
+        if name:
+            # Name matches are ranked, not in key order, so a keyset cursor cannot page through them
+            raise InvalidCursorError("A cursor cannot be combined with name; page name matches with skip/limit "
+                                     "or use /citizens/search")
+        return await _keyset_page("citizens", cursor, limit)
+    if name:
+        return await search_citizens(name, limit, skip)
+    else:
+        query = "SELECT * FROM citizens ORDER BY citizen_id LIMIT %s OFFSET %s"
+        return await adb.fetch_all(query, (limit, skip))
+
+async def search_citizens(q: str, limit: int = 20, skip: int = 0):
+    """Rank citizens by name match: exact, prefix, word prefix, then substring"""
+    if not normalize(q):
+        return []
+    if citizen_index.ready:
+        hits = citizen_index.search(q, skip + limit)[skip:]
+        if not hits:
+            return []
+        query, params = hits_query(hits)
+        return order_hits(await adb.fetch_all(query, params), hits)
+    # The index is still being built; rank the same way in SQL
+    query, params = fallback_query(q, limit, skip)
+    return [{**row, "match": match_kind(row["name"], q)} for row in await adb.fetch_all(query, params)]
+
+async def update_citizen(citizen_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_citizen(citizen_id) if returning else {"citizen_id": citizen_id}
+    
+    params['citizen_id'] = citizen_id
+    query = f"UPDATE citizens SET {', '.join(fields)} WHERE citizen_id = %(citizen_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("citizens", "update", [params])
+        return {"citizen_id": citizen_id}
+    row = await adb.update_returning(query, params, "citizens", "citizen_id")
+    if row:
+        await notify_async("citizens", "update", [row])
+    return row
+
+async def delete_citizen(citizen_id: int):
+    # utility_accounts cascades from citizens, but the accounts' usage, bills and payments do not
+    async with adb.transaction() as cursor:
+        await cursor.execute("SELECT account_id FROM utility_accounts WHERE citizen_id = %s", (citizen_id,))
+        deleted = await _delete_accounts(cursor, [row['account_id'] for row in await cursor.fetchall()])
+        await cursor.execute("DELETE FROM citizens WHERE citizen_id = %s", (citizen_id,))
+    await _notify_deleted(deleted)
+    await notify_async("citizens", "delete", [{"citizen_id": citizen_id}])
+    return {"message": "Citizen deleted successfully"}
+
+# ==================== UTILITY ACCOUNTS ====================
+async def create_utility_account(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO utility_accounts (citizen_id, electricity_account_no, water_account_no)
+        VALUES (%(citizen_id)s, %(electricity_account_no)s, %(water_account_no)s)
+    """
+    if not returning:
+        return {"account_id": await adb.insert(query, data)}
+    return await adb.insert_returning(query, data, "utility_accounts", "account_id")
+
+async def get_utility_account(account_id: int):
+    query = "SELECT * FROM utility_accounts WHERE account_id = %s"
+    return await adb.fetch_one(query, (account_id,))
+
+async def get_all_utility_accounts(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("utility_accounts", cursor, limit)
+    query = "SELECT * FROM utility_accounts ORDER BY account_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_utility_accounts_by_citizen(citizen_id: int):
+    query = "SELECT * FROM utility_accounts WHERE citizen_id = %s"
+    return await adb.fetch_all(query, (citizen_id,))
+
+async def get_account_balance(account_id: int):
+    """Outstanding balance from the account_balances ledger; zero for accounts never billed"""
+    query = """
+        SELECT a.account_id, COALESCE(b.billed, 0) AS billed, COALESCE(b.paid, 0) AS paid,
+               COALESCE(b.balance, 0) AS balance, COALESCE(b.open_bills, 0) AS open_bills, b.updated_at
+        FROM utility_accounts a
+        LEFT JOIN account_balances b ON b.account_id = a.account_id
+        WHERE a.account_id = %s
+    """
+    return await adb.fetch_one(query, (account_id,))
+
+async def get_top_debtors(limit: int = 10):
+    """Accounts owing the most, read off the ledger's balance index"""
+    query = """
+        SELECT b.account_id, a.citizen_id, b.billed, b.paid, b.balance, b.open_bills, b.updated_at
+        FROM account_balances b
+        JOIN utility_accounts a ON a.account_id = b.account_id
+        WHERE b.balance > 0
+        ORDER BY b.balance DESC
+        LIMIT %s
+    """
+    return await adb.fetch_all(query, (limit,))
+
+async def update_utility_account(account_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_utility_account(account_id) if returning else {"account_id": account_id}
+    
+    params['account_id'] = account_id
+    query = f"UPDATE utility_accounts SET {', '.join(fields)} WHERE account_id = %(account_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        return {"account_id": account_id}
+    return await adb.update_returning(query, params, "utility_accounts", "account_id")
+
+# Partitioned tables cannot have foreign keys, so an account's usage, bills and payments are deleted here
+ACCOUNT_CHILD_TABLES = ('electricity_usage', 'water_usage', 'electricity_bills', 'water_bills')
+# bill table -> payments.bill_type
+BILL_PAYMENT_TYPES = {'electricity_bills': 'Electricity', 'water_bills': 'Water'}
+
+async def _delete_accounts(cursor, account_ids):
+    """Delete accounts with their payments, bills and usage inside an open transaction.
+
+    Rows are read before they go so the change listeners get whole rows;
+    returns (table, rows) pairs for _notify_deleted once committed.
+    """
+    if not account_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(account_ids))
+    # Child writes share-lock their account (see the account triggers), so they wait for this delete
+    await cursor.execute(f"SELECT account_id FROM utility_accounts WHERE account_id IN ({placeholders}) FOR UPDATE",
+                         account_ids)
+    payments = []
+    for table, bill_type in BILL_PAYMENT_TYPES.items():
+        paid = (f"FROM payments p JOIN {table} b ON b.bill_id = p.bill_id "
+                f"WHERE p.bill_type = %s AND b.account_id IN ({placeholders})")
+        await cursor.execute(f"SELECT p.* {paid} FOR UPDATE", (bill_type, *account_ids))
+        payments += await cursor.fetchall()
+        await cursor.execute(f"DELETE p {paid}", (bill_type, *account_ids))
+    deleted = [('payments', payments)]
+    for table in ACCOUNT_CHILD_TABLES:
+        await cursor.execute(f"SELECT * FROM {table} WHERE account_id IN ({placeholders}) FOR UPDATE", account_ids)
+        deleted.append((table, await cursor.fetchall()))
+        await cursor.execute(f"DELETE FROM {table} WHERE account_id IN ({placeholders})", account_ids)
+    await cursor.execute(f"DELETE FROM utility_accounts WHERE account_id IN ({placeholders})", account_ids)
+    return deleted
+
+async def _notify_deleted(deleted):
+    for table, rows in deleted:
+        if rows:
+            await notify_async(table, "delete", list(rows))
+
+async def delete_utility_account(account_id: int):
+    async with adb.transaction() as cursor:
+        deleted = await _delete_accounts(cursor, [account_id])
+    await _notify_deleted(deleted)
+    return {"message": "Utility account deleted successfully"}
+
+# ==================== ELECTRICITY USAGE ====================
+async def create_electricity_usage(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO electricity_usage (account_id, usage_month, usage_month_number, units_consumed, meter_reading_time)
+        VALUES (%(account_id)s, %(usage_month)s, %(usage_month_number)s, %(units_consumed)s, %(meter_reading_time)s)
+    """
+    if not returning:
+        row = {**data, "usage_id": await adb.insert(query, data)}
+        await notify_async("electricity_usage", "insert", [row])
+        return {"usage_id": row["usage_id"]}
+    row = await adb.insert_returning(query, data, "electricity_usage", "usage_id")
+    await notify_async("electricity_usage", "insert", [row])
+    return row
+
+async def get_electricity_usage(usage_id: int):
+    query = "SELECT * FROM electricity_usage WHERE usage_id = %s"
+    return await adb.fetch_one(query, (usage_id,))
+
+async def get_all_electricity_usage(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return await _keyset_page("electricity_usage", cursor, limit, sort)
+    query = "SELECT * FROM electricity_usage ORDER BY usage_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_electricity_usage_by_account(account_id: int, year: Optional[int] = None):
+    query = "SELECT * FROM electricity_usage WHERE account_id = %s"
+    params = (account_id,)
+    if year is not None:
+        # The year is the partition key, so MySQL reads only that year's partition
+        query += " AND usage_month = %s"
+        params += (year,)
+    return await adb.fetch_all(query + " ORDER BY usage_month DESC, usage_month_number DESC", params)
+
+async def get_electricity_usage_for_month(account_id: int, year: int, month: int):
+    query = "SELECT * FROM electricity_usage WHERE account_id = %s AND usage_month = %s AND usage_month_number = %s"
+    return await adb.fetch_one(query, (account_id, year, month))
+
+async def upsert_electricity_usage(account_id: int, year: int, month: int, data: dict, returning: bool = True):
+    """Create or replace the reading for an account-month; resending the same reading is a no-op"""
+    row = {"meter_reading_time": None, **data, "account_id": account_id, "usage_month": year, "usage_month_number": month}
+    query = """
+        INSERT INTO electricity_usage (account_id, usage_month, usage_month_number, units_consumed, meter_reading_time)
+        VALUES (%(account_id)s, %(usage_month)s, %(usage_month_number)s, %(units_consumed)s, %(meter_reading_time)s)
+        ON DUPLICATE KEY UPDATE units_consumed = VALUES(units_consumed), meter_reading_time = VALUES(meter_reading_time)
+    """
+    affected = await adb.execute(query, row)
+    if affected:
+        await notify_async("electricity_usage", "upsert", [row])
+    usage = await get_electricity_usage_for_month(account_id, year, month)
+    return usage if returning or usage is None else {"usage_id": usage["usage_id"]}
+
+async def update_electricity_usage(usage_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_electricity_usage(usage_id) if returning else {"usage_id": usage_id}
+    
+    params['usage_id'] = usage_id
+    query = f"UPDATE electricity_usage SET {', '.join(fields)} WHERE usage_id = %(usage_id)s"
+    # Moving a reading to another account or month changes the totals it leaves too
+    moved = {'account_id', 'usage_month', 'usage_month_number'} & params.keys()
+    moved_from = await get_electricity_usage(usage_id) if moved else None
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("electricity_usage", "update", [params] + ([moved_from] if moved_from else []))
+        return {"usage_id": usage_id}
+    row = await adb.update_returning(query, params, "electricity_usage", "usage_id")
+    if row:
+        await notify_async("electricity_usage", "update", [row] + ([moved_from] if moved_from else []))
+    return row
+
+async def delete_electricity_usage(usage_id: int):
+    usage = await get_electricity_usage(usage_id)
+    query = "DELETE FROM electricity_usage WHERE usage_id = %s"
+    await adb.execute(query, (usage_id,))
+    if usage:
+        await notify_async("electricity_usage", "delete", [usage])
+    return {"message": "Electricity usage deleted successfully"}
+
+# ==================== WATER USAGE ====================
+async def create_water_usage(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO water_usage (account_id, usage_month, usage_month_number, litres_consumed, recorded_at)
+        VALUES (%(account_id)s, %(usage_month)s, %(usage_month_number)s, %(litres_consumed)s, %(recorded_at)s)
+    """
+    if not returning:
+        row = {**data, "usage_id": await adb.insert(query, data)}
+        await notify_async("water_usage", "insert", [row])
+        return {"usage_id": row["usage_id"]}
+    row = await adb.insert_returning(query, data, "water_usage", "usage_id")
+    await notify_async("water_usage", "insert", [row])
+    return row
+
+async def get_water_usage(usage_id: int):
+    query = "SELECT * FROM water_usage WHERE usage_id = %s"
+    return await adb.fetch_one(query, (usage_id,))
+
+async def get_all_water_usage(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return await _keyset_page("water_usage", cursor, limit, sort)
+    query = "SELECT * FROM water_usage ORDER BY usage_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_water_usage_by_account(account_id: int, year: Optional[int] = None):
+    query = "SELECT * FROM water_usage WHERE account_id = %s"
+    params = (account_id,)
+    if year is not None:
+        query += " AND usage_month = %s"
+        params += (year,)
+    return await adb.fetch_all(query + " ORDER BY usage_month DESC, usage_month_number DESC", params)
+
+async def get_water_usage_for_month(account_id: int, year: int, month: int):
+    query = "SELECT * FROM water_usage WHERE account_id = %s AND usage_month = %s AND usage_month_number = %s"
+    return await adb.fetch_one(query, (account_id, year, month))
+
+async def upsert_water_usage(account_id: int, year: int, month: int, data: dict, returning: bool = True):
+    """Create or replace the reading for an account-month; resending the same reading is a no-op"""
+    row = {"recorded_at": None, **data, "account_id": account_id, "usage_month": year, "usage_month_number": month}
+    query = """
+        INSERT INTO water_usage (account_id, usage_month, usage_month_number, litres_consumed, recorded_at)
+        VALUES (%(account_id)s, %(usage_month)s, %(usage_month_number)s, %(litres_consumed)s, %(recorded_at)s)
+        ON DUPLICATE KEY UPDATE litres_consumed = VALUES(litres_consumed), recorded_at = VALUES(recorded_at)
+    """
+    affected = await adb.execute(query, row)
+    if affected:
+        await notify_async("water_usage", "upsert", [row])
+    usage = await get_water_usage_for_month(account_id, year, month)
+    return usage if returning or usage is None else {"usage_id": usage["usage_id"]}
+
+async def update_water_usage(usage_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_water_usage(usage_id) if returning else {"usage_id": usage_id}
+    
+    params['usage_id'] = usage_id
+    query = f"UPDATE water_usage SET {', '.join(fields)} WHERE usage_id = %(usage_id)s"
+    # Moving a reading to another account or month changes the totals it leaves too
+    moved = {'account_id', 'usage_month', 'usage_month_number'} & params.keys()
+    moved_from = await get_water_usage(usage_id) if moved else None
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("water_usage", "update", [params] + ([moved_from] if moved_from else []))
+        return {"usage_id": usage_id}
+    row = await adb.update_returning(query, params, "water_usage", "usage_id")
+    if row:
+        await notify_async("water_usage", "update", [row] + ([moved_from] if moved_from else []))
+    return row
+
+async def delete_water_usage(usage_id: int):
+    usage = await get_water_usage(usage_id)
+    query = "DELETE FROM water_usage WHERE usage_id = %s"
+    await adb.execute(query, (usage_id,))
+    if usage:
+        await notify_async("water_usage", "delete", [usage])
+    return {"message": "Water usage deleted successfully"}
+
+# ==================== ELECTRICITY BILLS ====================
+async def create_electricity_bill(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO electricity_bills (account_id, bill_year, bill_month, units_consumed, amount, status, due_date)
+        VALUES (%(account_id)s, %(bill_year)s, %(bill_month)s, %(units_consumed)s, %(amount)s, %(status)s, %(due_date)s)
+    """
+    if not returning:
+        row = {**data, "bill_id": await adb.insert(query, data)}
+        await notify_async("electricity_bills", "insert", [row])
+        return {"bill_id": row["bill_id"]}
+    row = await adb.insert_returning(query, data, "electricity_bills", "bill_id")
+    await notify_async("electricity_bills", "insert", [row])
+    return row
+
+async def get_electricity_bill(bill_id: int):
+    query = "SELECT * FROM electricity_bills WHERE bill_id = %s"
+    return await adb.fetch_one(query, (bill_id,))
+
+async def get_all_electricity_bills(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return await _keyset_page("electricity_bills", cursor, limit, sort)
+    query = "SELECT * FROM electricity_bills ORDER BY bill_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_electricity_bills_by_account(account_id: int, year: Optional[int] = None):
+    query = "SELECT * FROM electricity_bills WHERE account_id = %s"
+    params = (account_id,)
+    if year is not None:
+        query += " AND bill_year = %s"
+        params += (year,)
+    return await adb.fetch_all(query + " ORDER BY bill_year DESC, bill_month DESC", params)
+
+async def update_electricity_bill(bill_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_electricity_bill(bill_id) if returning else {"bill_id": bill_id}
+    
+    params['bill_id'] = bill_id
+    query = f"UPDATE electricity_bills SET {', '.join(fields)} WHERE bill_id = %(bill_id)s"
+    # Moving a bill to another account changes the balance of the account it leaves too
+    moved_from = await get_electricity_bill(bill_id) if 'account_id' in params else None
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("electricity_bills", "update", [params] + ([moved_from] if moved_from else []))
+        return {"bill_id": bill_id}
+    row = await adb.update_returning(query, params, "electricity_bills", "bill_id")
+    if row:
+        await notify_async("electricity_bills", "update", [row] + ([moved_from] if moved_from else []))
+    return row
+
+async def delete_electricity_bill(bill_id: int):
+    bill = await get_electricity_bill(bill_id)
+    query = "DELETE FROM electricity_bills WHERE bill_id = %s"
+    await adb.execute(query, (bill_id,))
+    if bill:
+        await notify_async("electricity_bills", "delete", [bill])
+    return {"message": "Electricity bill deleted successfully"}
+
+# ==================== WATER BILLS ====================
+async def create_water_bill(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO water_bills (account_id, bill_year, bill_month, litres_consumed, amount, status, due_date)
+        VALUES (%(account_id)s, %(bill_year)s, %(bill_month)s, %(litres_consumed)s, %(amount)s, %(status)s, %(due_date)s)
+    """
+    if not returning:
+        row = {**data, "bill_id": await adb.insert(query, data)}
+        await notify_async("water_bills", "insert", [row])
+        return {"bill_id": row["bill_id"]}
+    row = await adb.insert_returning(query, data, "water_bills", "bill_id")
+    await notify_async("water_bills", "insert", [row])
+    return row
+
+async def get_water_bill(bill_id: int):
+    query = "SELECT * FROM water_bills WHERE bill_id = %s"
+    return await adb.fetch_one(query, (bill_id,))
+
+async def get_all_water_bills(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return await _keyset_page("water_bills", cursor, limit, sort)
+    query = "SELECT * FROM water_bills ORDER BY bill_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_water_bills_by_account(account_id: int, year: Optional[int] = None):
+    query = "SELECT * FROM water_bills WHERE account_id = %s"
+    params = (account_id,)
+    if year is not None:
+        query += " AND bill_year = %s"
+        params += (year,)
+    return await adb.fetch_all(query + " ORDER BY bill_year DESC, bill_month DESC", params)
+
+async def update_water_bill(bill_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_water_bill(bill_id) if returning else {"bill_id": bill_id}
+    
+    params['bill_id'] = bill_id
+    query = f"UPDATE water_bills SET {', '.join(fields)} WHERE bill_id = %(bill_id)s"
+    # Moving a bill to another account changes the balance of the account it leaves too
+    moved_from = await get_water_bill(bill_id) if 'account_id' in params else None
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("water_bills", "update", [params] + ([moved_from] if moved_from else []))
+        return {"bill_id": bill_id}
+    row = await adb.update_returning(query, params, "water_bills", "bill_id")
+    if row:
+        await notify_async("water_bills", "update", [row] + ([moved_from] if moved_from else []))
+    return row
+
+async def delete_water_bill(bill_id: int):
+    bill = await get_water_bill(bill_id)
+    query = "DELETE FROM water_bills WHERE bill_id = %s"
+    await adb.execute(query, (bill_id,))
+    if bill:
+        await notify_async("water_bills", "delete", [bill])
+    return {"message": "Water bill deleted successfully"}
+
+# ==================== PAYMENTS ====================
+async def create_payment(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO payments (bill_type, bill_id, payment_date, amount_paid, mode, transaction_ref)
+        VALUES (%(bill_type)s, %(bill_id)s, %(payment_date)s, %(amount_paid)s, %(mode)s, %(transaction_ref)s)
+    """
+    if not returning:
+        row = {**data, "payment_id": await adb.insert(query, data)}
+        await notify_async("payments", "insert", [row])
+        return {"payment_id": row["payment_id"]}
+    row = await adb.insert_returning(query, data, "payments", "payment_id")
+    await notify_async("payments", "insert", [row])
+    return row
+
+async def get_payment(payment_id: int):
+    query = "SELECT * FROM payments WHERE payment_id = %s"
+    return await adb.fetch_one(query, (payment_id,))
+
+async def get_all_payments(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return await _keyset_page("payments", cursor, limit, sort)
+    query = "SELECT * FROM payments ORDER BY payment_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_payments_by_bill(bill_type: str, bill_id: int):
+    query = "SELECT * FROM payments WHERE bill_type = %s AND bill_id = %s"
+    return await adb.fetch_all(query, (bill_type, bill_id))
+
+async def update_payment(payment_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_payment(payment_id) if returning else {"payment_id": payment_id}
+    
+    params['payment_id'] = payment_id
+    query = f"UPDATE payments SET {', '.join(fields)} WHERE payment_id = %(payment_id)s"
+    # Moving a payment to another bill changes the balance of the bill it leaves too
+    moved_from = await get_payment(payment_id) if 'bill_id' in params or 'bill_type' in params else None
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("payments", "update", [params] + ([moved_from] if moved_from else []))
+        return {"payment_id": payment_id}
+    row = await adb.update_returning(query, params, "payments", "payment_id")
+    if row:
+        await notify_async("payments", "update", [row] + ([moved_from] if moved_from else []))
+    return row
+
+async def delete_payment(payment_id: int):
+    payment = await get_payment(payment_id)
+    query = "DELETE FROM payments WHERE payment_id = %s"
+    await adb.execute(query, (payment_id,))
+    if payment:
+        await notify_async("payments", "delete", [payment])
+    return {"message": "Payment deleted successfully"}
+
+# ==================== PUBLIC TRANSPORT ROUTES ====================
+async def create_route(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO public_transport_routes (route_name, start_point, end_point, distance_km)
+        VALUES (%(route_name)s, %(start_point)s, %(end_point)s, %(distance_km)s)
+    """
+    if not returning:
+        row = {**data, "route_id": await adb.insert(query, data)}
+        await notify_async("public_transport_routes", "insert", [row])
+        return {"route_id": row["route_id"]}
+    row = await adb.insert_returning(query, data, "public_transport_routes", "route_id")
+    await notify_async("public_transport_routes", "insert", [row])
+    return row
+
+async def get_route(route_id: int):
+    query = "SELECT * FROM public_transport_routes WHERE route_id = %s"
+    return await adb.fetch_one(query, (route_id,))
+
+async def get_all_routes(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("public_transport_routes", cursor, limit)
+    query = "SELECT * FROM public_transport_routes ORDER BY route_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def update_route(route_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_route(route_id) if returning else {"route_id": route_id}
+    
+    params['route_id'] = route_id
+    query = f"UPDATE public_transport_routes SET {', '.join(fields)} WHERE route_id = %(route_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("public_transport_routes", "update", [params])
+        return {"route_id": route_id}
+    row = await adb.update_returning(query, params, "public_transport_routes", "route_id")
+    if row:
+        await notify_async("public_transport_routes", "update", [row])
+    return row
+
+async def delete_route(route_id: int):
+    query = "DELETE FROM public_transport_routes WHERE route_id = %s"
+    await adb.execute(query, (route_id,))
+    await notify_async("public_transport_routes", "delete", [{"route_id": route_id}])
+    return {"message": "Route deleted successfully"}
+
+# ==================== DRIVERS ====================
+async def create_driver(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO drivers (name, license_no, phone, address)
+        VALUES (%(name)s, %(license_no)s, %(phone)s, %(address)s)
+    """
+    if not returning:
+        return {"driver_id": await adb.insert(query, data)}
+    return await adb.insert_returning(query, data, "drivers", "driver_id")
+
+async def get_driver(driver_id: int):
+    query = "SELECT * FROM drivers WHERE driver_id = %s"
+    return await adb.fetch_one(query, (driver_id,))
+
+async def get_all_drivers(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("drivers", cursor, limit)
+    query = "SELECT * FROM drivers ORDER BY driver_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def update_driver(driver_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_driver(driver_id) if returning else {"driver_id": driver_id}
+    
+    params['driver_id'] = driver_id
+    query = f"UPDATE drivers SET {', '.join(fields)} WHERE driver_id = %(driver_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        return {"driver_id": driver_id}
+    return await adb.update_returning(query, params, "drivers", "driver_id")
+
+async def delete_driver(driver_id: int):
+    query = "DELETE FROM drivers WHERE driver_id = %s"
+    await adb.execute(query, (driver_id,))
+    return {"message": "Driver deleted successfully"}
+
+# ==================== BUSES ====================
+async def create_bus(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO buses (route_id, registration_no, capacity, driver_id, active)
+        VALUES (%(route_id)s, %(registration_no)s, %(capacity)s, %(driver_id)s, %(active)s)
+    """
+    if not returning:
+        row = {**data, "bus_id": await adb.insert(query, data)}
+        await notify_async("buses", "insert", [row])
+        return {"bus_id": row["bus_id"]}
+    row = await adb.insert_returning(query, data, "buses", "bus_id")
+    await notify_async("buses", "insert", [row])
+    return row
+
+async def get_bus(bus_id: int):
+    query = "SELECT * FROM buses WHERE bus_id = %s"
+    return await adb.fetch_one(query, (bus_id,))
+
+async def get_all_buses(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("buses", cursor, limit)
+    query = "SELECT * FROM buses ORDER BY bus_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_buses_by_route(route_id: int):
+    query = "SELECT * FROM buses WHERE route_id = %s"
+    return await adb.fetch_all(query, (route_id,))
+
+async def update_bus(bus_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_bus(bus_id) if returning else {"bus_id": bus_id}
+    
+    params['bus_id'] = bus_id
+    query = f"UPDATE buses SET {', '.join(fields)} WHERE bus_id = %(bus_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("buses", "update", [params])
+        return {"bus_id": bus_id}
+    row = await adb.update_returning(query, params, "buses", "bus_id")
+    if row:
+        await notify_async("buses", "update", [row])
+    return row
+
+async def delete_bus(bus_id: int):
+    query = "DELETE FROM buses WHERE bus_id = %s"
+    await adb.execute(query, (bus_id,))
+    await notify_async("buses", "delete", [{"bus_id": bus_id}])
+    return {"message": "Bus deleted successfully"}
+
+# ==================== EMERGENCY SERVICES ====================
+async def create_emergency_service(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO emergency_services (service_type, phone, area_covered)
+        VALUES (%(service_type)s, %(phone)s, %(area_covered)s)
+    """
+    if not returning:
+        row = {**data, "service_id": await adb.insert(query, data)}
+        await notify_async("emergency_services", "insert", [row])
+        return {"service_id": row["service_id"]}
+    row = await adb.insert_returning(query, data, "emergency_services", "service_id")
+    await notify_async("emergency_services", "insert", [row])
+    return row
+
+async def get_emergency_service(service_id: int):
+    query = "SELECT * FROM emergency_services WHERE service_id = %s"
+    return await adb.fetch_one(query, (service_id,))
+
+async def get_all_emergency_services(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("emergency_services", cursor, limit)
+    query = "SELECT * FROM emergency_services ORDER BY service_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def update_emergency_service(service_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_emergency_service(service_id) if returning else {"service_id": service_id}
+    
+    params['service_id'] = service_id
+    query = f"UPDATE emergency_services SET {', '.join(fields)} WHERE service_id = %(service_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("emergency_services", "update", [params])
+        return {"service_id": service_id}
+    row = await adb.update_returning(query, params, "emergency_services", "service_id")
+    if row:
+        await notify_async("emergency_services", "update", [row])
+    return row
+
+async def delete_emergency_service(service_id: int):
+    query = "DELETE FROM emergency_services WHERE service_id = %s"
+    await adb.execute(query, (service_id,))
+    await notify_async("emergency_services", "delete", [{"service_id": service_id}])
+    return {"message": "Emergency service deleted successfully"}
+
+# ==================== EMERGENCY REQUESTS ====================
+async def create_emergency_request(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO emergency_requests (citizen_id, service_id, request_datetime, incident_datetime, location, status, severity, notes)
+        VALUES (%(citizen_id)s, %(service_id)s, %(request_datetime)s, %(incident_datetime)s, %(location)s, %(status)s, %(severity)s, %(notes)s)
+    """
+    if not returning:
+        row = {**data, "req_id": await adb.insert(query, data)}
+        await notify_async("emergency_requests", "insert", [row])
+        return {"req_id": row["req_id"]}
+    row = await adb.insert_returning(query, data, "emergency_requests", "req_id")
+    await notify_async("emergency_requests", "insert", [row])
+    return row
+
+async def get_emergency_request(req_id: int):
+    query = "SELECT * FROM emergency_requests WHERE req_id = %s"
+    return await adb.fetch_one(query, (req_id,))
+
+async def get_all_emergency_requests(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("emergency_requests", cursor, limit)
+    query = "SELECT * FROM emergency_requests ORDER BY req_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_emergency_requests_by_status(status: str):
+    query = "SELECT * FROM emergency_requests WHERE status = %s"
+    return await adb.fetch_all(query, (status,))
+
+async def update_emergency_request(req_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_emergency_request(req_id) if returning else {"req_id": req_id}
+    
+    params['req_id'] = req_id
+    query = f"UPDATE emergency_requests SET {', '.join(fields)} WHERE req_id = %(req_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("emergency_requests", "update", [params])
+        return {"req_id": req_id}
+    row = await adb.update_returning(query, params, "emergency_requests", "req_id")
+    if row:
+        await notify_async("emergency_requests", "update", [row])
+    return row
+
+async def delete_emergency_request(req_id: int):
+    query = "DELETE FROM emergency_requests WHERE req_id = %s"
+    await adb.execute(query, (req_id,))
+    await notify_async("emergency_requests", "delete", [{"req_id": req_id}])
+    return {"message": "Emergency request deleted successfully"}
+
+# ==================== WASTE COLLECTION ZONES ====================
+def _load_schedule(result):
+    if result and result.get('schedule'):
+        try:
+            result['schedule'] = json.loads(result['schedule'])
+        except:
+            pass
+    return result
+
+async def create_waste_collection_zone(data: dict, returning: bool = True):
+    schedule = data.get('schedule')
+    if schedule and isinstance(schedule, dict):
+        schedule = json.dumps(schedule)
+    
+    query = """
+        INSERT INTO waste_collection_zones (zone_name, area_description, schedule)
+        VALUES (%(zone_name)s, %(area_description)s, %(schedule)s)
+    """
+    data['schedule'] = schedule
+    if not returning:
+        return {"zone_id": await adb.insert(query, data)}
+    return _load_schedule(await adb.insert_returning(query, data, "waste_collection_zones", "zone_id"))
+
+async def get_waste_collection_zone(zone_id: int):
+    query = "SELECT * FROM waste_collection_zones WHERE zone_id = %s"
+    return _load_schedule(await adb.fetch_one(query, (zone_id,)))
+
+async def get_all_waste_collection_zones(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        page = await _keyset_page("waste_collection_zones", cursor, limit)
+        for result in page['items']:
+            _load_schedule(result)
+        return page
+    query = "SELECT * FROM waste_collection_zones ORDER BY zone_id LIMIT %s OFFSET %s"
+    results = await adb.fetch_all(query, (limit, skip))
+    for result in results:
+        _load_schedule(result)
+    return results
+
+async def update_waste_collection_zone(zone_id: int, data: dict, returning: bool = True):
+    schedule = data.get('schedule')
+    if schedule and isinstance(schedule, dict):
+        data['schedule'] = json.dumps(schedule)
+    
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_waste_collection_zone(zone_id) if returning else {"zone_id": zone_id}
+    
+    params['zone_id'] = zone_id
+    query = f"UPDATE waste_collection_zones SET {', '.join(fields)} WHERE zone_id = %(zone_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        return {"zone_id": zone_id}
+    return _load_schedule(await adb.update_returning(query, params, "waste_collection_zones", "zone_id"))
+
+async def delete_waste_collection_zone(zone_id: int):
+    query = "DELETE FROM waste_collection_zones WHERE zone_id = %s"
+    await adb.execute(query, (zone_id,))
+    return {"message": "Waste collection zone deleted successfully"}
+
+# ==================== TRUCKS ====================
+async def create_truck(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO trucks (registration_no, driver_id, capacity_kg, active)
+        VALUES (%(registration_no)s, %(driver_id)s, %(capacity_kg)s, %(active)s)
+    """
+    if not returning:
+        return {"truck_id": await adb.insert(query, data)}
+    return await adb.insert_returning(query, data, "trucks", "truck_id")
+
+async def get_truck(truck_id: int):
+    query = "SELECT * FROM trucks WHERE truck_id = %s"
+    return await adb.fetch_one(query, (truck_id,))
+
+async def get_all_trucks(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("trucks", cursor, limit)
+    query = "SELECT * FROM trucks ORDER BY truck_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def update_truck(truck_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_truck(truck_id) if returning else {"truck_id": truck_id}
+    
+    params['truck_id'] = truck_id
+    query = f"UPDATE trucks SET {', '.join(fields)} WHERE truck_id = %(truck_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        return {"truck_id": truck_id}
+    return await adb.update_returning(query, params, "trucks", "truck_id")
+
+async def delete_truck(truck_id: int):
+    query = "DELETE FROM trucks WHERE truck_id = %s"
+    await adb.execute(query, (truck_id,))
+    return {"message": "Truck deleted successfully"}
+
+# ==================== WASTE COLLECTION LOGS ====================
+async def create_waste_collection_log(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO waste_collection_logs (zone_id, truck_id, collection_date, status, notes)
+        VALUES (%(zone_id)s, %(truck_id)s, %(collection_date)s, %(status)s, %(notes)s)
+    """
+    if not returning:
+        return {"log_id": await adb.insert(query, data)}
+    return await adb.insert_returning(query, data, "waste_collection_logs", "log_id")
+
+async def get_waste_collection_log(log_id: int):
+    query = "SELECT * FROM waste_collection_logs WHERE log_id = %s"
+    return await adb.fetch_one(query, (log_id,))
+
+async def get_all_waste_collection_logs(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("waste_collection_logs", cursor, limit)
+    query = "SELECT * FROM waste_collection_logs ORDER BY log_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_waste_collection_logs_by_zone(zone_id: int):
+    query = "SELECT * FROM waste_collection_logs WHERE zone_id = %s ORDER BY collection_date DESC"
+    return await adb.fetch_all(query, (zone_id,))
+
+async def update_waste_collection_log(log_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_waste_collection_log(log_id) if returning else {"log_id": log_id}
+    
+    params['log_id'] = log_id
+    query = f"UPDATE waste_collection_logs SET {', '.join(fields)} WHERE log_id = %(log_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        return {"log_id": log_id}
+    return await adb.update_returning(query, params, "waste_collection_logs", "log_id")
+
+async def delete_waste_collection_log(log_id: int):
+    query = "DELETE FROM waste_collection_logs WHERE log_id = %s"
+    await adb.execute(query, (log_id,))
+    return {"message": "Waste collection log deleted successfully"}
+
+# ==================== COMPLAINTS ====================
+async def create_complaint(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO complaints (citizen_id, category, description, date_reported, status, assigned_to, priority)
+        VALUES (%(citizen_id)s, %(category)s, %(description)s, %(date_reported)s, %(status)s, %(assigned_to)s, %(priority)s)
+    """
+    if not returning:
+        row = {**data, "complaint_id": await adb.insert(query, data)}
+        await notify_async("complaints", "insert", [row])
+        return {"complaint_id": row["complaint_id"]}
+    row = await adb.insert_returning(query, data, "complaints", "complaint_id")
+    await notify_async("complaints", "insert", [row])
+    return row
+
+async def get_complaint(complaint_id: int):
+    query = "SELECT * FROM complaints WHERE complaint_id = %s"
+    return await adb.fetch_one(query, (complaint_id,))
+
+async def get_all_complaints(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("complaints", cursor, limit)
+    query = "SELECT * FROM complaints ORDER BY complaint_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_complaints_by_status(status: str):
+    query = "SELECT * FROM complaints WHERE status = %s"
+    return await adb.fetch_all(query, (status,))
+
+async def get_complaints_by_citizen(citizen_id: int):
+    query = "SELECT * FROM complaints WHERE citizen_id = %s ORDER BY date_reported DESC"
+    return await adb.fetch_all(query, (citizen_id,))
+
+async def update_complaint(complaint_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_complaint(complaint_id) if returning else {"complaint_id": complaint_id}
+    
+    params['complaint_id'] = complaint_id
+    query = f"UPDATE complaints SET {', '.join(fields)} WHERE complaint_id = %(complaint_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        await notify_async("complaints", "update", [params])
+        return {"complaint_id": complaint_id}
+    row = await adb.update_returning(query, params, "complaints", "complaint_id")
+    if row:
+        await notify_async("complaints", "update", [row])
+    return row
+
+async def delete_complaint(complaint_id: int):
+    query = "DELETE FROM complaints WHERE complaint_id = %s"
+    await adb.execute(query, (complaint_id,))
+    await notify_async("complaints", "delete", [{"complaint_id": complaint_id}])
+    return {"message": "Complaint deleted successfully"}
+
+# ==================== COMPLAINT UPDATES ====================
+async def create_complaint_update(data: dict, returning: bool = True):
+    query = """
+        INSERT INTO complaint_updates (complaint_id, update_time, updated_by, comment)
+        VALUES (%(complaint_id)s, %(update_time)s, %(updated_by)s, %(comment)s)
+    """
+    if not returning:
+        return {"update_id": await adb.insert(query, data)}
+    return await adb.insert_returning(query, data, "complaint_updates", "update_id")
+
+async def get_complaint_update(update_id: int):
+    query = "SELECT * FROM complaint_updates WHERE update_id = %s"
+    return await adb.fetch_one(query, (update_id,))
+
+async def get_all_complaint_updates(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return await _keyset_page("complaint_updates", cursor, limit)
+    query = "SELECT * FROM complaint_updates ORDER BY update_id LIMIT %s OFFSET %s"
+    return await adb.fetch_all(query, (limit, skip))
+
+async def get_complaint_updates_by_complaint(complaint_id: int):
+    query = "SELECT * FROM complaint_updates WHERE complaint_id = %s ORDER BY update_time DESC"
+    return await adb.fetch_all(query, (complaint_id,))
+
+async def update_complaint_update(update_id: int, data: dict, returning: bool = True):
+    fields = []
+    params = {}
+    for key, value in data.items():
+        if value is not None:
+            fields.append(f"{key} = %({key})s")
+            params[key] = value
+    
+    if not fields:
+        return await get_complaint_update(update_id) if returning else {"update_id": update_id}
+    
+    params['update_id'] = update_id
+    query = f"UPDATE complaint_updates SET {', '.join(fields)} WHERE update_id = %(update_id)s"
+    if not returning:
+        await adb.execute(query, params)
+        return {"update_id": update_id}
+    return await adb.update_returning(query, params, "complaint_updates", "update_id")
+
+async def delete_complaint_update(update_id: int):
+    query = "DELETE FROM complaint_updates WHERE update_id = %s"
+    await adb.execute(query, (update_id,))
+    return {"message": "Complaint update deleted successfully"}
+
+# ==================== USAGE ANOMALIES ====================
+async def get_usage_anomalies(utility: Optional[str] = None, account_id: Optional[int] = None,
+                              year: Optional[int] = None, month: Optional[int] = None, kind: Optional[str] = None,
+                              skip: int = 0, limit: int = 100):
+    """Stored anomalies from the last detection run, most recent period and strongest score first"""
+    conditions = []
+    params = []
+    for column, value in (("utility", utility), ("account_id", account_id), ("usage_month", year),
+                          ("usage_month_number", month), ("kind", kind)):
+        if value is not None:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT * FROM usage_anomalies {where}
+        ORDER BY usage_month DESC, usage_month_number DESC, ABS(z_score) DESC, anomaly_id
+        LIMIT %s OFFSET %s
+    """
+    return await adb.fetch_all(query, (*params, limit, skip))
+
+# ==================== CONSUMPTION ROLLUP ====================
+# Dimensions the rollup can be grouped and filtered by -> consumption_rollup column
+ROLLUP_DIMENSIONS = {
+    "utility": "utility",
+    "year": "period_year",
+    "month": "period_month",
+    "city": "city",
+    "area": "area",
+}
+
+async def get_consumption_rollup(group_by: List[str], filters: dict, limit: int = 1000):
+    """Slice the pre-aggregated cube: sum its measures over every cell matching filters"""
+    columns = [ROLLUP_DIMENSIONS[dimension] for dimension in group_by]
+    conditions = []
+    params = []
+    for dimension, value in filters.items():
+        if value is not None:
+            conditions.append(f"{ROLLUP_DIMENSIONS[dimension]} = %s")
+            params.append(value)
+    select = "".join(f"{column}, " for column in columns)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    grouping = f"GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}" if columns else ""
+    query = f"""
+        SELECT {select}SUM(accounts) AS accounts, SUM(readings) AS readings, SUM(consumed) AS consumed,
+               SUM(bills) AS bills, SUM(billed) AS billed
+        FROM consumption_rollup {where} {grouping}
+        LIMIT %s
+    """
+    return await adb.fetch_all(query, (*params, limit))
+
+# ==================== DASHBOARD STATS ====================
+DASHBOARD_TOTALS_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM citizens) AS total_citizens,
+        (SELECT COUNT(*) FROM utility_accounts) AS total_utility_accounts,
+        (SELECT COALESCE(SUM(units_consumed), 0) FROM electricity_usage
+            WHERE usage_month = %(year)s AND usage_month_number = %(month)s) AS electricity_usage_kwh,
+        (SELECT COALESCE(SUM(litres_consumed), 0) FROM water_usage
+            WHERE usage_month = %(year)s AND usage_month_number = %(month)s) AS water_usage_litres,
+        (SELECT COUNT(*) FROM buses WHERE active = TRUE) AS active_buses,
+        (SELECT COUNT(*) FROM waste_collection_zones) AS waste_zones,
+        (SELECT COUNT(*) FROM trucks WHERE active = TRUE) AS active_trucks,
+        (SELECT COALESCE(SUM(amount), 0) FROM electricity_bills WHERE status = 'Paid')
+            + (SELECT COALESCE(SUM(amount), 0) FROM water_bills WHERE status = 'Paid') AS total_revenue,
+        (SELECT COUNT(*) FROM electricity_bills WHERE status != 'Paid')
+            + (SELECT COUNT(*) FROM water_bills WHERE status != 'Paid') AS pending_bills
+"""
+
+DASHBOARD_STATUS_QUERY = """
+    SELECT 'emergency' AS source, status, COUNT(*) AS count FROM emergency_requests GROUP BY status
+    UNION ALL
+    SELECT 'complaints' AS source, status, COUNT(*) AS count FROM complaints GROUP BY status
+"""
+
+# (source, status) -> stats key
+DASHBOARD_STATUS_KEYS = {
+    ('emergency', 'Open'): 'emergency_open',
+    ('emergency', 'Dispatched'): 'emergency_dispatched',
+    ('emergency', 'Resolved'): 'emergency_resolved',
+    ('complaints', 'Open'): 'complaints_open',
+    ('complaints', 'In Progress'): 'complaints_in_progress',
+    ('complaints', 'Resolved'): 'complaints_resolved',
+}
+
+async def get_dashboard_stats():
+    """Get aggregated statistics for dashboard"""
+    # Bound as values rather than CURRENT_DATE so the usage subqueries prune to this year's partition
+    today = date.today()
+    totals = await adb.fetch_one(DASHBOARD_TOTALS_QUERY, {"year": today.year, "month": today.month}) or {}
+    stats = {
+        'total_citizens': totals.get('total_citizens') or 0,
+        'total_utility_accounts': totals.get('total_utility_accounts') or 0,
+        'electricity_usage_kwh': float(totals.get('electricity_usage_kwh') or 0),
+        'water_usage_litres': float(totals.get('water_usage_litres') or 0),
+        'active_buses': totals.get('active_buses') or 0,
+        'waste_zones': totals.get('waste_zones') or 0,
+        'active_trucks': totals.get('active_trucks') or 0,
+        'total_revenue': float(totals.get('total_revenue') or 0),
+        'pending_bills': int(totals.get('pending_bills') or 0),
+    }
+
+    # Emergency requests and complaints by status
+    for key in DASHBOARD_STATUS_KEYS.values():
+        stats[key] = 0
+    for row in await adb.fetch_all(DASHBOARD_STATUS_QUERY):
+        key = DASHBOARD_STATUS_KEYS.get((row['source'], row['status']))
+        if key:
+            stats[key] = row['count']
+
+    # Recent emergency requests (last 5)
+    stats['recent_emergencies'] = await adb.fetch_all(
+        "SELECT req_id, service_id, location, status, request_datetime, created_at FROM emergency_requests ORDER BY request_datetime DESC LIMIT 5"
+    ) or []
+
+    # Recent complaints (last 5)
+    stats['recent_complaints'] = await adb.fetch_all(
+        "SELECT complaint_id, category, description, status, date_reported, created_at FROM complaints ORDER BY date_reported DESC LIMIT 5"
+    ) or []
+
+    return stats
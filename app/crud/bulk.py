@@ -0,0 +1,221 @@
+"""
+Bulk insert operations for high-volume tables
+"""
+import json
+import logging
+from app.config import BULK_CONFIG, LEDGER_CONFIG, RECONCILIATION_CONFIG, ROLLUP_CONFIG
+from app.database import db
+from app.hooks import notify
+from app.jobs.balances import accounts_for_bills, refresh_accounts
+from app.jobs.reconciliation import BILL_TABLES, reconcile_bills
+from app.jobs.rollup import refresh_months
+
+logger = logging.getLogger(__name__)
+
+# Tables that accept bulk writes
+BULK_TABLES = ('electricity_usage', 'water_usage', 'electricity_bills', 'water_bills', 'payments')
+# Bulk tables feeding the consumption rollup -> (utility, year column, month column)
+ROLLUP_PERIODS = {
+    'electricity_usage': ('electricity', 'usage_month', 'usage_month_number'),
+    'water_usage': ('water', 'usage_month', 'usage_month_number'),
+    'electricity_bills': ('electricity', 'bill_year', 'bill_month'),
+    'water_bills': ('water', 'bill_year', 'bill_month'),
+}
+# Tables that accept bulk upserts -> columns of the unique key rows are matched on
+UPSERT_KEYS = {
+    'electricity_usage': ('account_id', 'usage_month', 'usage_month_number'),
+    'water_usage': ('account_id', 'usage_month', 'usage_month_number'),
+}
+
+
+class BulkReport:
+    """Counters and per-row errors for one bulk request"""
+
+    def __init__(self, max_errors: int = BULK_CONFIG['max_errors']):
+        self.received = 0
+        self.inserted = 0
+        # MySQL affected rows: 1 per new row, 2 per changed row, 0 per unchanged upsert
+        self.affected_rows = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+        # What unpropagated writes touched, for catch_up: rollup months, ledger accounts, paid bills
+        self.periods = set()
+        self.accounts = set()
+        self.bills = set()
+
+    def add_error(self, index: int, error):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"index": index, "error": str(error)})
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "affected_rows": self.affected_rows,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def parse_json_array(body: bytes):
+    """Parse a JSON array request body"""
+    records = json.loads(body or b'[]')
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON array of records")
+    return records
+
+
+def iter_json_array(body: bytes):
+    """Parse a JSON array body up front and return an async iterator of (index, record)"""
+    records = parse_json_array(body)
+
+    async def _iter():
+        for index, record in enumerate(records):
+            yield index, record
+    return _iter()
+
+
+async def iter_ndjson(stream):
+    """Yield (index, record) pairs from an NDJSON byte stream without buffering it"""
+    index = 0
+    pending = b''
+    async for chunk in stream:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield index, _parse_line(line)
+                index += 1
+    if pending.strip():
+        yield index, _parse_line(pending)
+
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
+
+
+def validate_record(index: int, record, model, report: BulkReport):
+    """Validate one record with a *Create model; returns the row dict or None"""
+    report.received += 1
+    if isinstance(record, Exception):
+        report.add_error(index, f"Invalid JSON: {record}")
+        return None
+    if not isinstance(record, dict):
+        report.add_error(index, "Expected a JSON object")
+        return None
+    try:
+        return model(**record).dict(exclude_none=True)
+    except Exception as e:
+        report.add_error(index, e)
+        return None
+
+
+def _insert_query(table: str, columns, upsert: bool = False):
+    placeholders = ', '.join(f"%({column})s" for column in columns)
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    if upsert:
+        # Still a single multi-row statement under executemany; a replayed row changes nothing
+        key = UPSERT_KEYS[table]
+        updates = ', '.join(f"{column} = VALUES({column})" for column in columns if column not in key)
+        query += f" ON DUPLICATE KEY UPDATE {updates or f'{key[0]} = {key[0]}'}"
+    return query
+
+
+def _group_by_columns(rows):
+    """Group rows by the columns they provide so omitted columns keep their DB defaults"""
+    groups = {}
+    for index, row in rows:
+        groups.setdefault(tuple(row), []).append((index, row))
+    return groups
+
+
+def _track(table: str, rows, report: BulkReport):
+    if table in ROLLUP_PERIODS:
+        _, year, month = ROLLUP_PERIODS[table]
+        report.periods.update((row[year], row[month]) for row in rows)
+    if table in BILL_TABLES.values():
+        report.accounts.update(row['account_id'] for row in rows)
+    elif table == 'payments':
+        report.bills.update((row['bill_type'], row['bill_id']) for row in rows)
+
+
+def _changed(table: str, action: str, rows, report: BulkReport, propagate: bool):
+    if propagate:
+        notify(table, action, rows)
+    else:
+        _track(table, rows, report)
+
+
+def insert_chunk(table: str, rows, report: BulkReport, upsert: bool = False, propagate: bool = True):
+    """Insert one chunk of (index, row) pairs in a single transaction.
+
+    executemany turns each column group into multi-row INSERT statements. If the
+    chunk fails, it is rolled back and replayed row by row so that only the
+    offending rows are reported and the rest are still written. With upsert,
+    rows matching an existing unique key overwrite it instead of failing.
+    propagate=False skips the change listeners and records what the rows
+    touched in the report instead; call catch_up once the load is done.
+    """
+    if table not in BULK_TABLES:
+        raise ValueError(f"Bulk insert is not supported for {table}")
+    if upsert and table not in UPSERT_KEYS:
+        raise ValueError(f"Bulk upsert is not supported for {table}")
+    if not rows:
+        return
+    action = "upsert" if upsert else "insert"
+    groups = _group_by_columns(rows)
+    try:
+        affected = 0
+        with db.transaction() as cursor:
+            for columns, group in groups.items():
+                cursor.executemany(_insert_query(table, columns, upsert), [row for _, row in group])
+                affected += cursor.rowcount
+        report.inserted += len(rows)
+        report.affected_rows += affected
+        # A fully replayed chunk changed nothing, so there is nothing to propagate
+        if affected:
+            _changed(table, action, [row for _, row in rows], report, propagate)
+        return
+    except Exception:
+        pass
+    written = []
+    for columns, group in groups.items():
+        query = _insert_query(table, columns, upsert)
+        for index, row in group:
+            try:
+                with db.transaction() as cursor:
+                    cursor.execute(query, row)
+                    affected = cursor.rowcount
+                report.inserted += 1
+                report.affected_rows += affected
+                if affected:
+                    written.append(row)
+            except Exception as e:
+                report.add_error(index, e)
+    if written:
+        _changed(table, action, written, report, propagate)
+
+
+def catch_up(table: str, report: BulkReport):
+    """Bring derived tables up to date once after a load written with propagate=False.
+
+    Per-chunk listeners would recompute a rollup month for every chunk of
+    a large load; here each touched month is recomputed once, and touched
+    bills and ledger accounts are refreshed in windows.
+    """
+    try:
+        if report.bills and RECONCILIATION_CONFIG['inline']:
+            reconcile_bills(report.bills)
+        if LEDGER_CONFIG['inline'] and (report.accounts or report.bills):
+            refresh_accounts(report.accounts | accounts_for_bills(report.bills))
+        if report.periods and ROLLUP_CONFIG['inline']:
+            refresh_months(ROLLUP_PERIODS[table][0], report.periods)
+    except Exception as e:
+        # The rows are in; the balances and rollup rebuild jobs catch the derived tables up
+        logger.warning("Catching up derived data after a bulk load into %s failed: %s", table, e)
@@ -0,0 +1,98 @@
+"""
+Streaming table exports backed by server-side cursors
+"""
+import csv
+import io
+import json
+from app.database import db
+
+# Exportable tables and the primary key rows are streamed in
+EXPORT_TABLES = {
+    'addresses': 'address_id',
+    'citizens': 'citizen_id',
+    'utility_accounts': 'account_id',
+    'electricity_usage': 'usage_id',
+    'water_usage': 'usage_id',
+    'electricity_bills': 'bill_id',
+    'water_bills': 'bill_id',
+    'payments': 'payment_id',
+    'public_transport_routes': 'route_id',
+    'drivers': 'driver_id',
+    'buses': 'bus_id',
+    'emergency_services': 'service_id',
+    'emergency_requests': 'req_id',
+    'waste_collection_zones': 'zone_id',
+    'trucks': 'truck_id',
+    'waste_collection_logs': 'log_id',
+    'complaints': 'complaint_id',
+    'complaint_updates': 'update_id',
+}
+
+# Filter columns and the tables that carry them
+EXPORT_FILTERS = {
+    'account_id': {'utility_accounts', 'electricity_usage', 'water_usage', 'electricity_bills', 'water_bills'},
+    'zone_id': {'waste_collection_zones', 'waste_collection_logs'},
+    'citizen_id': {'citizens', 'utility_accounts', 'emergency_requests', 'complaints'},
+    'status': {'electricity_bills', 'water_bills', 'emergency_requests', 'waste_collection_logs', 'complaints'},
+}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def build_export_query(table: str, filters: dict):
+    """Build the export SELECT; raises ValueError for unknown tables or filters"""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}'")
+    conditions = []
+    params = []
+    for column, value in filters.items():
+        if value is None:
+            continue
+        if table not in EXPORT_FILTERS.get(column, ()):
+            raise ValueError(f"Table '{table}' cannot be filtered by {column}")
+        conditions.append(f"{column} = %s")
+        params.append(value)
+    where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    query = f"SELECT * FROM {table}{where_clause} ORDER BY {EXPORT_TABLES[table]}"
+    return query, tuple(params)
+
+
+def _ndjson_chunks(batches):
+    for rows in batches:
+        yield ''.join(json.dumps(row, default=str) + '\n' for row in rows).encode()
+
+
+def _columns(table: str):
+    """Column names of an export table, in SELECT * order"""
+    with db.transaction() as cursor:
+        cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+        return [column[0] for column in cursor.description]
+
+
+def _csv_chunks(table, batches):
+    writer = None
+    buffer = io.StringIO()
+    for rows in batches:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if writer is None:
+        # Nothing matched: still send the header so the file is a valid CSV with known columns
+        csv.writer(buffer).writerow(_columns(table))
+        yield buffer.getvalue().encode()
+
+
+def stream_export(table: str, filters: dict, fmt: str = 'ndjson', batch_size: int = 1000):
+    """Yield encoded export chunks; memory is bounded by batch_size rows"""
+    query, params = build_export_query(table, filters)
+    batches = db.stream_query(query, params, batch_size)
+    if fmt == 'csv':
+        return _csv_chunks(table, batches)
+    return _ndjson_chunks(batches)
@@ -3,26 +3,38 @@ CRUD operations for all tables
 """
 from app.database import db
 from typing import List, Optional, Dict, Union
+from datetime import date
 import json
+from app.crud.pagination import InvalidCursorError, keyset_query, build_page
+from app.hooks import notify
+from app.services.citizen_search import citizen_index, normalize, match_kind, fallback_query, hits_query, order_hits
+
+# ==================== PAGINATION ====================
+def _keyset_page(table: str, cursor: str, limit: int, sort: str = "id", where: str = "", params=()):
+    query, query_params = keyset_query(table, cursor, limit, sort, where, params)
+    return build_page(table, db.execute_query(query, query_params), limit, sort)
 
 # ==================== ADDRESSES ====================
-def create_address(data: dict):
+def create_address(data: dict, returning: bool = True):
     query = """
         INSERT INTO addresses (street, area, city, state, zipcode, country)
         VALUES (%(street)s, %(area)s, %(city)s, %(state)s, %(zipcode)s, %(country)s)
     """
-    address_id = db.execute_insert(query, data)
-    return get_address(address_id)
+    if not returning:
+        return {"address_id": db.execute_insert(query, data)}
+    return db.insert_returning(query, data, "addresses", "address_id")
 
 def get_address(address_id: int):
     query = "SELECT * FROM addresses WHERE address_id = %s"
     return db.execute_one(query, (address_id,))
 
-def get_all_addresses(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM addresses LIMIT %s OFFSET %s"
+def get_all_addresses(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("addresses", cursor, limit)
+    query = "SELECT * FROM addresses ORDER BY address_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def update_address(address_id: int, data: dict):
+def update_address(address_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -31,12 +43,14 @@ def update_address(address_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_address(address_id)
+        return get_address(address_id) if returning else {"address_id": address_id}
     
     params['address_id'] = address_id
     query = f"UPDATE addresses SET {', '.join(fields)} WHERE address_id = %(address_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_address(address_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        return {"address_id": address_id}
+    return db.update_returning(query, params, "addresses", "address_id")
 
 def delete_address(address_id: int):
     query = "DELETE FROM addresses WHERE address_id = %s"
@@ -44,13 +58,18 @@ def delete_address(address_id: int):
     return {"message": "Address deleted successfully"}
 
 # ==================== CITIZENS ====================
-def create_citizen(data: dict):
+def create_citizen(data: dict, returning: bool = True):
     query = """
         INSERT INTO citizens (name, dob, gender, phone, email, address_id)
         VALUES (%(name)s, %(dob)s, %(gender)s, %(phone)s, %(email)s, %(address_id)s)
     """
-    citizen_id = db.execute_insert(query, data)
-    return get_citizen(citizen_id)
+    if not returning:
+        row = {**data, "citizen_id": db.execute_insert(query, data)}
+        notify("citizens", "insert", [row])
+        return {"citizen_id": row["citizen_id"]}
+    row = db.insert_returning(query, data, "citizens", "citizen_id")
+    notify("citizens", "insert", [row])
+    return row
 
 def get_citizen(identifier: Union[int, str]):
     if isinstance(identifier, str) and not identifier.isdigit():
@@ -63,16 +82,34 @@ def get_citizen(identifier: Union[int, str]):
         query = "SELECT * FROM citizens WHERE citizen_id = %s"
         return db.execute_one(query, (citizen_id,))
 
-def get_all_citizens(skip: int = 0, limit: int = 100, name: Optional[str] = None):
+def get_all_citizens(skip: int = 0, limit: int = 100, name: Optional[str] = None, cursor: Optional[str] = None):
+    if cursor is not None:
+        if name:
+            # Name matches are ranked, not in key order, so a keyset cursor cannot page through them
+            raise InvalidCursorError("A cursor cannot be combined with name; page name matches with skip/limit "
+                                     "or use /citizens/search")
+        return _keyset_page("citizens", cursor, limit)
     if name:
-        query = "SELECT * FROM citizens WHERE name LIKE %s LIMIT %s OFFSET %s"
-        search_pattern = f"%{name}%"
-        return db.execute_query(query, (search_pattern, limit, skip))
+        return search_citizens(name, limit, skip)
     else:
-        query = "SELECT * FROM citizens LIMIT %s OFFSET %s"
+        query = "SELECT * FROM citizens ORDER BY citizen_id LIMIT %s OFFSET %s"
         return db.execute_query(query, (limit, skip))
 
-def update_citizen(citizen_id: int, data: dict):
+def search_citizens(q: str, limit: int = 20, skip: int = 0):
+    """Rank citizens by name match: exact, prefix, word prefix, then substring"""
+    if not normalize(q):
+        return []
+    if citizen_index.ready:
+        hits = citizen_index.search(q, skip + limit)[skip:]
+        if not hits:
+            return []
+        query, params = hits_query(hits)
+        return order_hits(db.execute_query(query, params), hits)
+    # The index is still being built; rank the same way in SQL
+    query, params = fallback_query(q, limit, skip)
+    return [{**row, "match": match_kind(row["name"], q)} for row in db.execute_query(query, params)]
+
+def update_citizen(citizen_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -81,40 +118,77 @@ def update_citizen(citizen_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_citizen(citizen_id)
+        return get_citizen(citizen_id) if returning else {"citizen_id": citizen_id}
     
     params['citizen_id'] = citizen_id
     query = f"UPDATE citizens SET {', '.join(fields)} WHERE citizen_id = %(citizen_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_citizen(citizen_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("citizens", "update", [params])
+        return {"citizen_id": citizen_id}
+    row = db.update_returning(query, params, "citizens", "citizen_id")
+    if row:
+        notify("citizens", "update", [row])
+    return row
 
 def delete_citizen(citizen_id: int):
-    query = "DELETE FROM citizens WHERE citizen_id = %s"
-    db.execute_query(query, (citizen_id,), fetch=False)
+    # utility_accounts cascades from citizens, but the accounts' usage, bills and payments do not
+    with db.transaction() as cursor:
+        cursor.execute("SELECT account_id FROM utility_accounts WHERE citizen_id = %s", (citizen_id,))
+        deleted = _delete_accounts(cursor, [row['account_id'] for row in cursor.fetchall()])
+        cursor.execute("DELETE FROM citizens WHERE citizen_id = %s", (citizen_id,))
+    _notify_deleted(deleted)
+    notify("citizens", "delete", [{"citizen_id": citizen_id}])
     return {"message": "Citizen deleted successfully"}
 
 # ==================== UTILITY ACCOUNTS ====================
-def create_utility_account(data: dict):
+def create_utility_account(data: dict, returning: bool = True):
     query = """
         INSERT INTO utility_accounts (citizen_id, electricity_account_no, water_account_no)
         VALUES (%(citizen_id)s, %(electricity_account_no)s, %(water_account_no)s)
     """
-    account_id = db.execute_insert(query, data)
-    return get_utility_account(account_id)
+    if not returning:
+        return {"account_id": db.execute_insert(query, data)}
+    return db.insert_returning(query, data, "utility_accounts", "account_id")
 
 def get_utility_account(account_id: int):
     query = "SELECT * FROM utility_accounts WHERE account_id = %s"
     return db.execute_one(query, (account_id,))
 
-def get_all_utility_accounts(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM utility_accounts LIMIT %s OFFSET %s"
+def get_all_utility_accounts(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("utility_accounts", cursor, limit)
+    query = "SELECT * FROM utility_accounts ORDER BY account_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
 def get_utility_accounts_by_citizen(citizen_id: int):
     query = "SELECT * FROM utility_accounts WHERE citizen_id = %s"
     return db.execute_query(query, (citizen_id,))
 
-def update_utility_account(account_id: int, data: dict):
+def get_account_balance(account_id: int):
+    """Outstanding balance from the account_balances ledger; zero for accounts never billed"""
+    query = """
+        SELECT a.account_id, COALESCE(b.billed, 0) AS billed, COALESCE(b.paid, 0) AS paid,
+               COALESCE(b.balance, 0) AS balance, COALESCE(b.open_bills, 0) AS open_bills, b.updated_at
+        FROM utility_accounts a
+        LEFT JOIN account_balances b ON b.account_id = a.account_id
+        WHERE a.account_id = %s
+    """
+    return db.execute_one(query, (account_id,))
+
+def get_top_debtors(limit: int = 10):
+    """Accounts owing the most, read off the ledger's balance index"""
+    query = """
+        SELECT b.account_id, a.citizen_id, b.billed, b.paid, b.balance, b.open_bills, b.updated_at
+        FROM account_balances b
+        JOIN utility_accounts a ON a.account_id = b.account_id
+        WHERE b.balance > 0
+        ORDER BY b.balance DESC
+        LIMIT %s
+    """
+    return db.execute_query(query, (limit,))
+
+def update_utility_account(account_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -123,40 +197,112 @@ def update_utility_account(account_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_utility_account(account_id)
+        return get_utility_account(account_id) if returning else {"account_id": account_id}
     
     params['account_id'] = account_id
     query = f"UPDATE utility_accounts SET {', '.join(fields)} WHERE account_id = %(account_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_utility_account(account_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        return {"account_id": account_id}
+    return db.update_returning(query, params, "utility_accounts", "account_id")
+
+# Partitioned tables cannot have foreign keys, so an account's usage, bills and payments are deleted here
+ACCOUNT_CHILD_TABLES = ('electricity_usage', 'water_usage', 'electricity_bills', 'water_bills')
+# bill table -> payments.bill_type
+BILL_PAYMENT_TYPES = {'electricity_bills': 'Electricity', 'water_bills': 'Water'}
+
+def _delete_accounts(cursor, account_ids):
+    """Delete accounts with their payments, bills and usage inside an open transaction.
+
+    Rows are read before they go so the change listeners get whole rows;
+    returns (table, rows) pairs for _notify_deleted once committed.
+    """
+    if not account_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(account_ids))
+    # Child writes share-lock their account (see the account triggers), so they wait for this delete
+    cursor.execute(f"SELECT account_id FROM utility_accounts WHERE account_id IN ({placeholders}) FOR UPDATE",
+                   account_ids)
+    payments = []
+    for table, bill_type in BILL_PAYMENT_TYPES.items():
+        paid = (f"FROM payments p JOIN {table} b ON b.bill_id = p.bill_id "
+                f"WHERE p.bill_type = %s AND b.account_id IN ({placeholders})")
+        cursor.execute(f"SELECT p.* {paid} FOR UPDATE", (bill_type, *account_ids))
+        payments += cursor.fetchall()
+        cursor.execute(f"DELETE p {paid}", (bill_type, *account_ids))
+    deleted = [('payments', payments)]
+    for table in ACCOUNT_CHILD_TABLES:
+        cursor.execute(f"SELECT * FROM {table} WHERE account_id IN ({placeholders}) FOR UPDATE", account_ids)
+        deleted.append((table, cursor.fetchall()))
+        cursor.execute(f"DELETE FROM {table} WHERE account_id IN ({placeholders})", account_ids)
+    cursor.execute(f"DELETE FROM utility_accounts WHERE account_id IN ({placeholders})", account_ids)
+    return deleted
+
+def _notify_deleted(deleted):
+    for table, rows in deleted:
+        if rows:
+            notify(table, "delete", list(rows))
 
 def delete_utility_account(account_id: int):
-    query = "DELETE FROM utility_accounts WHERE account_id = %s"
-    db.execute_query(query, (account_id,), fetch=False)
+    with db.transaction() as cursor:
+        deleted = _delete_accounts(cursor, [account_id])
+    _notify_deleted(deleted)
     return {"message": "Utility account deleted successfully"}
 
 # ==================== ELECTRICITY USAGE ====================
-def create_electricity_usage(data: dict):
+def create_electricity_usage(data: dict, returning: bool = True):
     query = """
         INSERT INTO electricity_usage (account_id, usage_month, usage_month_number, units_consumed, meter_reading_time)
         VALUES (%(account_id)s, %(usage_month)s, %(usage_month_number)s, %(units_consumed)s, %(meter_reading_time)s)
     """
-    usage_id = db.execute_insert(query, data)
-    return get_electricity_usage(usage_id)
+    if not returning:
+        row = {**data, "usage_id": db.execute_insert(query, data)}
+        notify("electricity_usage", "insert", [row])
+        return {"usage_id": row["usage_id"]}
+    row = db.insert_returning(query, data, "electricity_usage", "usage_id")
+    notify("electricity_usage", "insert", [row])
+    return row
 
 def get_electricity_usage(usage_id: int):
     query = "SELECT * FROM electricity_usage WHERE usage_id = %s"
     return db.execute_one(query, (usage_id,))
 
-def get_all_electricity_usage(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM electricity_usage LIMIT %s OFFSET %s"
+def get_all_electricity_usage(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return _keyset_page("electricity_usage", cursor, limit, sort)
+    query = "SELECT * FROM electricity_usage ORDER BY usage_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def get_electricity_usage_by_account(account_id: int):
-    query = "SELECT * FROM electricity_usage WHERE account_id = %s ORDER BY usage_month DESC, usage_month_number DESC"
-    return db.execute_query(query, (account_id,))
-
-def update_electricity_usage(usage_id: int, data: dict):
+def get_electricity_usage_by_account(account_id: int, year: Optional[int] = None):
+    query = "SELECT * FROM electricity_usage WHERE account_id = %s"
+    params = (account_id,)
+    if year is not None:
+        # The year is the partition key, so MySQL reads only that year's partition
+        query += " AND usage_month = %s"
+        params += (year,)
+    return db.execute_query(query + " ORDER BY usage_month DESC, usage_month_number DESC", params)
+
+def get_electricity_usage_for_month(account_id: int, year: int, month: int):
+    query = "SELECT * FROM electricity_usage WHERE account_id = %s AND usage_month = %s AND usage_month_number = %s"
+    return db.execute_one(query, (account_id, year, month))
+
+def upsert_electricity_usage(account_id: int, year: int, month: int, data: dict, returning: bool = True):
+    """Create or replace the reading for an account-month; resending the same reading is a no-op"""
+    row = {"meter_reading_time": None, **data, "account_id": account_id, "usage_month": year, "usage_month_number": month}
+    query = """
+        INSERT INTO electricity_usage (account_id, usage_month, usage_month_number, units_consumed, meter_reading_time)
+        VALUES (%(account_id)s, %(usage_month)s, %(usage_month_number)s, %(units_consumed)s, %(meter_reading_time)s)
+        ON DUPLICATE KEY UPDATE units_consumed = VALUES(units_consumed), meter_reading_time = VALUES(meter_reading_time)
+    """
+    with db.transaction() as cursor:
+        cursor.execute(query, row)
+        affected = cursor.rowcount
+    if affected:
+        notify("electricity_usage", "upsert", [row])
+    usage = get_electricity_usage_for_month(account_id, year, month)
+    return usage if returning or usage is None else {"usage_id": usage["usage_id"]}
+
+def update_electricity_usage(usage_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -165,40 +311,83 @@ def update_electricity_usage(usage_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_electricity_usage(usage_id)
+        return get_electricity_usage(usage_id) if returning else {"usage_id": usage_id}
     
     params['usage_id'] = usage_id
     query = f"UPDATE electricity_usage SET {', '.join(fields)} WHERE usage_id = %(usage_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_electricity_usage(usage_id)
+    # Moving a reading to another account or month changes the totals it leaves too
+    moved = {'account_id', 'usage_month', 'usage_month_number'} & params.keys()
+    moved_from = get_electricity_usage(usage_id) if moved else None
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("electricity_usage", "update", [params] + ([moved_from] if moved_from else []))
+        return {"usage_id": usage_id}
+    row = db.update_returning(query, params, "electricity_usage", "usage_id")
+    if row:
+        notify("electricity_usage", "update", [row] + ([moved_from] if moved_from else []))
+    return row
 
 def delete_electricity_usage(usage_id: int):
+    usage = get_electricity_usage(usage_id)
     query = "DELETE FROM electricity_usage WHERE usage_id = %s"
     db.execute_query(query, (usage_id,), fetch=False)
+    if usage:
+        notify("electricity_usage", "delete", [usage])
     return {"message": "Electricity usage deleted successfully"}
 
 # ==================== WATER USAGE ====================
-def create_water_usage(data: dict):
+def create_water_usage(data: dict, returning: bool = True):
     query = """
         INSERT INTO water_usage (account_id, usage_month, usage_month_number, litres_consumed, recorded_at)
         VALUES (%(account_id)s, %(usage_month)s, %(usage_month_number)s, %(litres_consumed)s, %(recorded_at)s)
     """
-    usage_id = db.execute_insert(query, data)
-    return get_water_usage(usage_id)
+    if not returning:
+        row = {**data, "usage_id": db.execute_insert(query, data)}
+        notify("water_usage", "insert", [row])
+        return {"usage_id": row["usage_id"]}
+    row = db.insert_returning(query, data, "water_usage", "usage_id")
+    notify("water_usage", "insert", [row])
+    return row
 
 def get_water_usage(usage_id: int):
     query = "SELECT * FROM water_usage WHERE usage_id = %s"
     return db.execute_one(query, (usage_id,))
 
-def get_all_water_usage(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM water_usage LIMIT %s OFFSET %s"
+def get_all_water_usage(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return _keyset_page("water_usage", cursor, limit, sort)
+    query = "SELECT * FROM water_usage ORDER BY usage_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def get_water_usage_by_account(account_id: int):
-    query = "SELECT * FROM water_usage WHERE account_id = %s ORDER BY usage_month DESC, usage_month_number DESC"
-    return db.execute_query(query, (account_id,))
-
-def update_water_usage(usage_id: int, data: dict):
+def get_water_usage_by_account(account_id: int, year: Optional[int] = None):
+    query = "SELECT * FROM water_usage WHERE account_id = %s"
+    params = (account_id,)
+    if year is not None:
+        query += " AND usage_month = %s"
+        params += (year,)
+    return db.execute_query(query + " ORDER BY usage_month DESC, usage_month_number DESC", params)
+
+def get_water_usage_for_month(account_id: int, year: int, month: int):
+    query = "SELECT * FROM water_usage WHERE account_id = %s AND usage_month = %s AND usage_month_number = %s"
+    return db.execute_one(query, (account_id, year, month))
+
+def upsert_water_usage(account_id: int, year: int, month: int, data: dict, returning: bool = True):
+    """Create or replace the reading for an account-month; resending the same reading is a no-op"""
+    row = {"recorded_at": None, **data, "account_id": account_id, "usage_month": year, "usage_month_number": month}
+    query = """
+        INSERT INTO water_usage (account_id, usage_month, usage_month_number, litres_consumed, recorded_at)
+        VALUES (%(account_id)s, %(usage_month)s, %(usage_month_number)s, %(litres_consumed)s, %(recorded_at)s)
+        ON DUPLICATE KEY UPDATE litres_consumed = VALUES(litres_consumed), recorded_at = VALUES(recorded_at)
+    """
+    with db.transaction() as cursor:
+        cursor.execute(query, row)
+        affected = cursor.rowcount
+    if affected:
+        notify("water_usage", "upsert", [row])
+    usage = get_water_usage_for_month(account_id, year, month)
+    return usage if returning or usage is None else {"usage_id": usage["usage_id"]}
+
+def update_water_usage(usage_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -207,40 +396,63 @@ def update_water_usage(usage_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_water_usage(usage_id)
+        return get_water_usage(usage_id) if returning else {"usage_id": usage_id}
     
     params['usage_id'] = usage_id
     query = f"UPDATE water_usage SET {', '.join(fields)} WHERE usage_id = %(usage_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_water_usage(usage_id)
+    # Moving a reading to another account or month changes the totals it leaves too
+    moved = {'account_id', 'usage_month', 'usage_month_number'} & params.keys()
+    moved_from = get_water_usage(usage_id) if moved else None
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("water_usage", "update", [params] + ([moved_from] if moved_from else []))
+        return {"usage_id": usage_id}
+    row = db.update_returning(query, params, "water_usage", "usage_id")
+    if row:
+        notify("water_usage", "update", [row] + ([moved_from] if moved_from else []))
+    return row
 
 def delete_water_usage(usage_id: int):
+    usage = get_water_usage(usage_id)
     query = "DELETE FROM water_usage WHERE usage_id = %s"
     db.execute_query(query, (usage_id,), fetch=False)
+    if usage:
+        notify("water_usage", "delete", [usage])
     return {"message": "Water usage deleted successfully"}
 
 # ==================== ELECTRICITY BILLS ====================
-def create_electricity_bill(data: dict):
+def create_electricity_bill(data: dict, returning: bool = True):
     query = """
         INSERT INTO electricity_bills (account_id, bill_year, bill_month, units_consumed, amount, status, due_date)
         VALUES (%(account_id)s, %(bill_year)s, %(bill_month)s, %(units_consumed)s, %(amount)s, %(status)s, %(due_date)s)
     """
-    bill_id = db.execute_insert(query, data)
-    return get_electricity_bill(bill_id)
+    if not returning:
+        row = {**data, "bill_id": db.execute_insert(query, data)}
+        notify("electricity_bills", "insert", [row])
+        return {"bill_id": row["bill_id"]}
+    row = db.insert_returning(query, data, "electricity_bills", "bill_id")
+    notify("electricity_bills", "insert", [row])
+    return row
 
 def get_electricity_bill(bill_id: int):
     query = "SELECT * FROM electricity_bills WHERE bill_id = %s"
     return db.execute_one(query, (bill_id,))
 
-def get_all_electricity_bills(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM electricity_bills LIMIT %s OFFSET %s"
+def get_all_electricity_bills(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return _keyset_page("electricity_bills", cursor, limit, sort)
+    query = "SELECT * FROM electricity_bills ORDER BY bill_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def get_electricity_bills_by_account(account_id: int):
-    query = "SELECT * FROM electricity_bills WHERE account_id = %s ORDER BY bill_year DESC, bill_month DESC"
-    return db.execute_query(query, (account_id,))
+def get_electricity_bills_by_account(account_id: int, year: Optional[int] = None):
+    query = "SELECT * FROM electricity_bills WHERE account_id = %s"
+    params = (account_id,)
+    if year is not None:
+        query += " AND bill_year = %s"
+        params += (year,)
+    return db.execute_query(query + " ORDER BY bill_year DESC, bill_month DESC", params)
 
-def update_electricity_bill(bill_id: int, data: dict):
+def update_electricity_bill(bill_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -249,40 +461,62 @@ def update_electricity_bill(bill_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_electricity_bill(bill_id)
+        return get_electricity_bill(bill_id) if returning else {"bill_id": bill_id}
     
     params['bill_id'] = bill_id
     query = f"UPDATE electricity_bills SET {', '.join(fields)} WHERE bill_id = %(bill_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_electricity_bill(bill_id)
+    # Moving a bill to another account changes the balance of the account it leaves too
+    moved_from = get_electricity_bill(bill_id) if 'account_id' in params else None
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("electricity_bills", "update", [params] + ([moved_from] if moved_from else []))
+        return {"bill_id": bill_id}
+    row = db.update_returning(query, params, "electricity_bills", "bill_id")
+    if row:
+        notify("electricity_bills", "update", [row] + ([moved_from] if moved_from else []))
+    return row
 
 def delete_electricity_bill(bill_id: int):
+    bill = get_electricity_bill(bill_id)
     query = "DELETE FROM electricity_bills WHERE bill_id = %s"
     db.execute_query(query, (bill_id,), fetch=False)
+    if bill:
+        notify("electricity_bills", "delete", [bill])
     return {"message": "Electricity bill deleted successfully"}
 
 # ==================== WATER BILLS ====================
-def create_water_bill(data: dict):
+def create_water_bill(data: dict, returning: bool = True):
     query = """
         INSERT INTO water_bills (account_id, bill_year, bill_month, litres_consumed, amount, status, due_date)
         VALUES (%(account_id)s, %(bill_year)s, %(bill_month)s, %(litres_consumed)s, %(amount)s, %(status)s, %(due_date)s)
     """
-    bill_id = db.execute_insert(query, data)
-    return get_water_bill(bill_id)
+    if not returning:
+        row = {**data, "bill_id": db.execute_insert(query, data)}
+        notify("water_bills", "insert", [row])
+        return {"bill_id": row["bill_id"]}
+    row = db.insert_returning(query, data, "water_bills", "bill_id")
+    notify("water_bills", "insert", [row])
+    return row
 
 def get_water_bill(bill_id: int):
     query = "SELECT * FROM water_bills WHERE bill_id = %s"
     return db.execute_one(query, (bill_id,))
 
-def get_all_water_bills(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM water_bills LIMIT %s OFFSET %s"
+def get_all_water_bills(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return _keyset_page("water_bills", cursor, limit, sort)
+    query = "SELECT * FROM water_bills ORDER BY bill_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def get_water_bills_by_account(account_id: int):
-    query = "SELECT * FROM water_bills WHERE account_id = %s ORDER BY bill_year DESC, bill_month DESC"
-    return db.execute_query(query, (account_id,))
+def get_water_bills_by_account(account_id: int, year: Optional[int] = None):
+    query = "SELECT * FROM water_bills WHERE account_id = %s"
+    params = (account_id,)
+    if year is not None:
+        query += " AND bill_year = %s"
+        params += (year,)
+    return db.execute_query(query + " ORDER BY bill_year DESC, bill_month DESC", params)
 
-def update_water_bill(bill_id: int, data: dict):
+def update_water_bill(bill_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -291,40 +525,58 @@ def update_water_bill(bill_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_water_bill(bill_id)
+        return get_water_bill(bill_id) if returning else {"bill_id": bill_id}
     
     params['bill_id'] = bill_id
     query = f"UPDATE water_bills SET {', '.join(fields)} WHERE bill_id = %(bill_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_water_bill(bill_id)
+    # Moving a bill to another account changes the balance of the account it leaves too
+    moved_from = get_water_bill(bill_id) if 'account_id' in params else None
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("water_bills", "update", [params] + ([moved_from] if moved_from else []))
+        return {"bill_id": bill_id}
+    row = db.update_returning(query, params, "water_bills", "bill_id")
+    if row:
+        notify("water_bills", "update", [row] + ([moved_from] if moved_from else []))
+    return row
 
 def delete_water_bill(bill_id: int):
+    bill = get_water_bill(bill_id)
     query = "DELETE FROM water_bills WHERE bill_id = %s"
     db.execute_query(query, (bill_id,), fetch=False)
+    if bill:
+        notify("water_bills", "delete", [bill])
     return {"message": "Water bill deleted successfully"}
 
 # ==================== PAYMENTS ====================
-def create_payment(data: dict):
+def create_payment(data: dict, returning: bool = True):
     query = """
         INSERT INTO payments (bill_type, bill_id, payment_date, amount_paid, mode, transaction_ref)
         VALUES (%(bill_type)s, %(bill_id)s, %(payment_date)s, %(amount_paid)s, %(mode)s, %(transaction_ref)s)
     """
-    payment_id = db.execute_insert(query, data)
-    return get_payment(payment_id)
+    if not returning:
+        row = {**data, "payment_id": db.execute_insert(query, data)}
+        notify("payments", "insert", [row])
+        return {"payment_id": row["payment_id"]}
+    row = db.insert_returning(query, data, "payments", "payment_id")
+    notify("payments", "insert", [row])
+    return row
 
 def get_payment(payment_id: int):
     query = "SELECT * FROM payments WHERE payment_id = %s"
     return db.execute_one(query, (payment_id,))
 
-def get_all_payments(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM payments LIMIT %s OFFSET %s"
+def get_all_payments(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, sort: str = "id"):
+    if cursor is not None:
+        return _keyset_page("payments", cursor, limit, sort)
+    query = "SELECT * FROM payments ORDER BY payment_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
 def get_payments_by_bill(bill_type: str, bill_id: int):
     query = "SELECT * FROM payments WHERE bill_type = %s AND bill_id = %s"
     return db.execute_query(query, (bill_type, bill_id))
 
-def update_payment(payment_id: int, data: dict):
+def update_payment(payment_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -333,36 +585,54 @@ def update_payment(payment_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_payment(payment_id)
+        return get_payment(payment_id) if returning else {"payment_id": payment_id}
     
     params['payment_id'] = payment_id
     query = f"UPDATE payments SET {', '.join(fields)} WHERE payment_id = %(payment_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_payment(payment_id)
+    # Moving a payment to another bill changes the balance of the bill it leaves too
+    moved_from = get_payment(payment_id) if 'bill_id' in params or 'bill_type' in params else None
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("payments", "update", [params] + ([moved_from] if moved_from else []))
+        return {"payment_id": payment_id}
+    row = db.update_returning(query, params, "payments", "payment_id")
+    if row:
+        notify("payments", "update", [row] + ([moved_from] if moved_from else []))
+    return row
 
 def delete_payment(payment_id: int):
+    payment = get_payment(payment_id)
     query = "DELETE FROM payments WHERE payment_id = %s"
     db.execute_query(query, (payment_id,), fetch=False)
+    if payment:
+        notify("payments", "delete", [payment])
     return {"message": "Payment deleted successfully"}
 
 # ==================== PUBLIC TRANSPORT ROUTES ====================
-def create_route(data: dict):
+def create_route(data: dict, returning: bool = True):
     query = """
         INSERT INTO public_transport_routes (route_name, start_point, end_point, distance_km)
         VALUES (%(route_name)s, %(start_point)s, %(end_point)s, %(distance_km)s)
     """
-    route_id = db.execute_insert(query, data)
-    return get_route(route_id)
+    if not returning:
+        row = {**data, "route_id": db.execute_insert(query, data)}
+        notify("public_transport_routes", "insert", [row])
+        return {"route_id": row["route_id"]}
+    row = db.insert_returning(query, data, "public_transport_routes", "route_id")
+    notify("public_transport_routes", "insert", [row])
+    return row
 
 def get_route(route_id: int):
     query = "SELECT * FROM public_transport_routes WHERE route_id = %s"
     return db.execute_one(query, (route_id,))
 
-def get_all_routes(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM public_transport_routes LIMIT %s OFFSET %s"
+def get_all_routes(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("public_transport_routes", cursor, limit)
+    query = "SELECT * FROM public_transport_routes ORDER BY route_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def update_route(route_id: int, data: dict):
+def update_route(route_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -371,36 +641,46 @@ def update_route(route_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_route(route_id)
+        return get_route(route_id) if returning else {"route_id": route_id}
     
     params['route_id'] = route_id
     query = f"UPDATE public_transport_routes SET {', '.join(fields)} WHERE route_id = %(route_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_route(route_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("public_transport_routes", "update", [params])
+        return {"route_id": route_id}
+    row = db.update_returning(query, params, "public_transport_routes", "route_id")
+    if row:
+        notify("public_transport_routes", "update", [row])
+    return row
 
 def delete_route(route_id: int):
     query = "DELETE FROM public_transport_routes WHERE route_id = %s"
     db.execute_query(query, (route_id,), fetch=False)
+    notify("public_transport_routes", "delete", [{"route_id": route_id}])
     return {"message": "Route deleted successfully"}
 
 # ==================== DRIVERS ====================
-def create_driver(data: dict):
+def create_driver(data: dict, returning: bool = True):
     query = """
         INSERT INTO drivers (name, license_no, phone, address)
         VALUES (%(name)s, %(license_no)s, %(phone)s, %(address)s)
     """
-    driver_id = db.execute_insert(query, data)
-    return get_driver(driver_id)
+    if not returning:
+        return {"driver_id": db.execute_insert(query, data)}
+    return db.insert_returning(query, data, "drivers", "driver_id")
 
 def get_driver(driver_id: int):
     query = "SELECT * FROM drivers WHERE driver_id = %s"
     return db.execute_one(query, (driver_id,))
 
-def get_all_drivers(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM drivers LIMIT %s OFFSET %s"
+def get_all_drivers(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("drivers", cursor, limit)
+    query = "SELECT * FROM drivers ORDER BY driver_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def update_driver(driver_id: int, data: dict):
+def update_driver(driver_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -409,12 +689,14 @@ def update_driver(driver_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_driver(driver_id)
+        return get_driver(driver_id) if returning else {"driver_id": driver_id}
     
     params['driver_id'] = driver_id
     query = f"UPDATE drivers SET {', '.join(fields)} WHERE driver_id = %(driver_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_driver(driver_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        return {"driver_id": driver_id}
+    return db.update_returning(query, params, "drivers", "driver_id")
 
 def delete_driver(driver_id: int):
     query = "DELETE FROM drivers WHERE driver_id = %s"
@@ -422,27 +704,34 @@ def delete_driver(driver_id: int):
     return {"message": "Driver deleted successfully"}
 
 # ==================== BUSES ====================
-def create_bus(data: dict):
+def create_bus(data: dict, returning: bool = True):
     query = """
         INSERT INTO buses (route_id, registration_no, capacity, driver_id, active)
         VALUES (%(route_id)s, %(registration_no)s, %(capacity)s, %(driver_id)s, %(active)s)
     """
-    bus_id = db.execute_insert(query, data)
-    return get_bus(bus_id)
+    if not returning:
+        row = {**data, "bus_id": db.execute_insert(query, data)}
+        notify("buses", "insert", [row])
+        return {"bus_id": row["bus_id"]}
+    row = db.insert_returning(query, data, "buses", "bus_id")
+    notify("buses", "insert", [row])
+    return row
 
 def get_bus(bus_id: int):
     query = "SELECT * FROM buses WHERE bus_id = %s"
     return db.execute_one(query, (bus_id,))
 
-def get_all_buses(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM buses LIMIT %s OFFSET %s"
+def get_all_buses(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("buses", cursor, limit)
+    query = "SELECT * FROM buses ORDER BY bus_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
 def get_buses_by_route(route_id: int):
     query = "SELECT * FROM buses WHERE route_id = %s"
     return db.execute_query(query, (route_id,))
 
-def update_bus(bus_id: int, data: dict):
+def update_bus(bus_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -451,36 +740,50 @@ def update_bus(bus_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_bus(bus_id)
+        return get_bus(bus_id) if returning else {"bus_id": bus_id}
     
     params['bus_id'] = bus_id
     query = f"UPDATE buses SET {', '.join(fields)} WHERE bus_id = %(bus_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_bus(bus_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("buses", "update", [params])
+        return {"bus_id": bus_id}
+    row = db.update_returning(query, params, "buses", "bus_id")
+    if row:
+        notify("buses", "update", [row])
+    return row
 
 def delete_bus(bus_id: int):
     query = "DELETE FROM buses WHERE bus_id = %s"
     db.execute_query(query, (bus_id,), fetch=False)
+    notify("buses", "delete", [{"bus_id": bus_id}])
     return {"message": "Bus deleted successfully"}
 
 # ==================== EMERGENCY SERVICES ====================
-def create_emergency_service(data: dict):
+def create_emergency_service(data: dict, returning: bool = True):
     query = """
         INSERT INTO emergency_services (service_type, phone, area_covered)
         VALUES (%(service_type)s, %(phone)s, %(area_covered)s)
     """
-    service_id = db.execute_insert(query, data)
-    return get_emergency_service(service_id)
+    if not returning:
+        row = {**data, "service_id": db.execute_insert(query, data)}
+        notify("emergency_services", "insert", [row])
+        return {"service_id": row["service_id"]}
+    row = db.insert_returning(query, data, "emergency_services", "service_id")
+    notify("emergency_services", "insert", [row])
+    return row
 
 def get_emergency_service(service_id: int):
     query = "SELECT * FROM emergency_services WHERE service_id = %s"
     return db.execute_one(query, (service_id,))
 
-def get_all_emergency_services(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM emergency_services LIMIT %s OFFSET %s"
+def get_all_emergency_services(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("emergency_services", cursor, limit)
+    query = "SELECT * FROM emergency_services ORDER BY service_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def update_emergency_service(service_id: int, data: dict):
+def update_emergency_service(service_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -489,40 +792,54 @@ def update_emergency_service(service_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_emergency_service(service_id)
+        return get_emergency_service(service_id) if returning else {"service_id": service_id}
     
     params['service_id'] = service_id
     query = f"UPDATE emergency_services SET {', '.join(fields)} WHERE service_id = %(service_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_emergency_service(service_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("emergency_services", "update", [params])
+        return {"service_id": service_id}
+    row = db.update_returning(query, params, "emergency_services", "service_id")
+    if row:
+        notify("emergency_services", "update", [row])
+    return row
 
 def delete_emergency_service(service_id: int):
     query = "DELETE FROM emergency_services WHERE service_id = %s"
     db.execute_query(query, (service_id,), fetch=False)
+    notify("emergency_services", "delete", [{"service_id": service_id}])
     return {"message": "Emergency service deleted successfully"}
 
 # ==================== EMERGENCY REQUESTS ====================
-def create_emergency_request(data: dict):
+def create_emergency_request(data: dict, returning: bool = True):
     query = """
-        INSERT INTO emergency_requests (citizen_id, service_id, request_datetime, incident_datetime, location, status, notes)
-        VALUES (%(citizen_id)s, %(service_id)s, %(request_datetime)s, %(incident_datetime)s, %(location)s, %(status)s, %(notes)s)
+        INSERT INTO emergency_requests (citizen_id, service_id, request_datetime, incident_datetime, location, status, severity, notes)
+        VALUES (%(citizen_id)s, %(service_id)s, %(request_datetime)s, %(incident_datetime)s, %(location)s, %(status)s, %(severity)s, %(notes)s)
     """
-    req_id = db.execute_insert(query, data)
-    return get_emergency_request(req_id)
+    if not returning:
+        row = {**data, "req_id": db.execute_insert(query, data)}
+        notify("emergency_requests", "insert", [row])
+        return {"req_id": row["req_id"]}
+    row = db.insert_returning(query, data, "emergency_requests", "req_id")
+    notify("emergency_requests", "insert", [row])
+    return row
 
 def get_emergency_request(req_id: int):
     query = "SELECT * FROM emergency_requests WHERE req_id = %s"
     return db.execute_one(query, (req_id,))
 
-def get_all_emergency_requests(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM emergency_requests LIMIT %s OFFSET %s"
+def get_all_emergency_requests(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("emergency_requests", cursor, limit)
+    query = "SELECT * FROM emergency_requests ORDER BY req_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
 def get_emergency_requests_by_status(status: str):
     query = "SELECT * FROM emergency_requests WHERE status = %s"
     return db.execute_query(query, (status,))
 
-def update_emergency_request(req_id: int, data: dict):
+def update_emergency_request(req_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -531,20 +848,35 @@ def update_emergency_request(req_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_emergency_request(req_id)
+        return get_emergency_request(req_id) if returning else {"req_id": req_id}
     
     params['req_id'] = req_id
     query = f"UPDATE emergency_requests SET {', '.join(fields)} WHERE req_id = %(req_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_emergency_request(req_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("emergency_requests", "update", [params])
+        return {"req_id": req_id}
+    row = db.update_returning(query, params, "emergency_requests", "req_id")
+    if row:
+        notify("emergency_requests", "update", [row])
+    return row
 
 def delete_emergency_request(req_id: int):
     query = "DELETE FROM emergency_requests WHERE req_id = %s"
     db.execute_query(query, (req_id,), fetch=False)
+    notify("emergency_requests", "delete", [{"req_id": req_id}])
     return {"message": "Emergency request deleted successfully"}
 
 # ==================== WASTE COLLECTION ZONES ====================
-def create_waste_collection_zone(data: dict):
+def _load_schedule(result):
+    if result and result.get('schedule'):
+        try:
+            result['schedule'] = json.loads(result['schedule'])
+        except:
+            pass
+    return result
+
+def create_waste_collection_zone(data: dict, returning: bool = True):
     schedule = data.get('schedule')
     if schedule and isinstance(schedule, dict):
         schedule = json.dumps(schedule)
@@ -554,31 +886,27 @@ def create_waste_collection_zone(data: dict):
         VALUES (%(zone_name)s, %(area_description)s, %(schedule)s)
     """
     data['schedule'] = schedule
-    zone_id = db.execute_insert(query, data)
-    return get_waste_collection_zone(zone_id)
+    if not returning:
+        return {"zone_id": db.execute_insert(query, data)}
+    return _load_schedule(db.insert_returning(query, data, "waste_collection_zones", "zone_id"))
 
 def get_waste_collection_zone(zone_id: int):
     query = "SELECT * FROM waste_collection_zones WHERE zone_id = %s"
-    result = db.execute_one(query, (zone_id,))
-    if result and result.get('schedule'):
-        try:
-            result['schedule'] = json.loads(result['schedule'])
-        except:
-            pass
-    return result
-
-def get_all_waste_collection_zones(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM waste_collection_zones LIMIT %s OFFSET %s"
+    return _load_schedule(db.execute_one(query, (zone_id,)))
+
+def get_all_waste_collection_zones(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        page = _keyset_page("waste_collection_zones", cursor, limit)
+        for result in page['items']:
+            _load_schedule(result)
+        return page
+    query = "SELECT * FROM waste_collection_zones ORDER BY zone_id LIMIT %s OFFSET %s"
     results = db.execute_query(query, (limit, skip))
     for result in results:
-        if result.get('schedule'):
-            try:
-                result['schedule'] = json.loads(result['schedule'])
-            except:
-                pass
+        _load_schedule(result)
     return results
 
-def update_waste_collection_zone(zone_id: int, data: dict):
+def update_waste_collection_zone(zone_id: int, data: dict, returning: bool = True):
     schedule = data.get('schedule')
     if schedule and isinstance(schedule, dict):
         data['schedule'] = json.dumps(schedule)
@@ -591,12 +919,14 @@ def update_waste_collection_zone(zone_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_waste_collection_zone(zone_id)
+        return get_waste_collection_zone(zone_id) if returning else {"zone_id": zone_id}
     
     params['zone_id'] = zone_id
     query = f"UPDATE waste_collection_zones SET {', '.join(fields)} WHERE zone_id = %(zone_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_waste_collection_zone(zone_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        return {"zone_id": zone_id}
+    return _load_schedule(db.update_returning(query, params, "waste_collection_zones", "zone_id"))
 
 def delete_waste_collection_zone(zone_id: int):
     query = "DELETE FROM waste_collection_zones WHERE zone_id = %s"
@@ -604,23 +934,26 @@ def delete_waste_collection_zone(zone_id: int):
     return {"message": "Waste collection zone deleted successfully"}
 
 # ==================== TRUCKS ====================
-def create_truck(data: dict):
+def create_truck(data: dict, returning: bool = True):
     query = """
         INSERT INTO trucks (registration_no, driver_id, capacity_kg, active)
         VALUES (%(registration_no)s, %(driver_id)s, %(capacity_kg)s, %(active)s)
     """
-    truck_id = db.execute_insert(query, data)
-    return get_truck(truck_id)
+    if not returning:
+        return {"truck_id": db.execute_insert(query, data)}
+    return db.insert_returning(query, data, "trucks", "truck_id")
 
 def get_truck(truck_id: int):
     query = "SELECT * FROM trucks WHERE truck_id = %s"
     return db.execute_one(query, (truck_id,))
 
-def get_all_trucks(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM trucks LIMIT %s OFFSET %s"
+def get_all_trucks(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("trucks", cursor, limit)
+    query = "SELECT * FROM trucks ORDER BY truck_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
-def update_truck(truck_id: int, data: dict):
+def update_truck(truck_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -629,12 +962,14 @@ def update_truck(truck_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_truck(truck_id)
+        return get_truck(truck_id) if returning else {"truck_id": truck_id}
     
     params['truck_id'] = truck_id
     query = f"UPDATE trucks SET {', '.join(fields)} WHERE truck_id = %(truck_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_truck(truck_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        return {"truck_id": truck_id}
+    return db.update_returning(query, params, "trucks", "truck_id")
 
 def delete_truck(truck_id: int):
     query = "DELETE FROM trucks WHERE truck_id = %s"
@@ -642,27 +977,30 @@ def delete_truck(truck_id: int):
     return {"message": "Truck deleted successfully"}
 
 # ==================== WASTE COLLECTION LOGS ====================
-def create_waste_collection_log(data: dict):
+def create_waste_collection_log(data: dict, returning: bool = True):
     query = """
         INSERT INTO waste_collection_logs (zone_id, truck_id, collection_date, status, notes)
         VALUES (%(zone_id)s, %(truck_id)s, %(collection_date)s, %(status)s, %(notes)s)
     """
-    log_id = db.execute_insert(query, data)
-    return get_waste_collection_log(log_id)
+    if not returning:
+        return {"log_id": db.execute_insert(query, data)}
+    return db.insert_returning(query, data, "waste_collection_logs", "log_id")
 
 def get_waste_collection_log(log_id: int):
     query = "SELECT * FROM waste_collection_logs WHERE log_id = %s"
     return db.execute_one(query, (log_id,))
 
-def get_all_waste_collection_logs(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM waste_collection_logs LIMIT %s OFFSET %s"
+def get_all_waste_collection_logs(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("waste_collection_logs", cursor, limit)
+    query = "SELECT * FROM waste_collection_logs ORDER BY log_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
 def get_waste_collection_logs_by_zone(zone_id: int):
     query = "SELECT * FROM waste_collection_logs WHERE zone_id = %s ORDER BY collection_date DESC"
     return db.execute_query(query, (zone_id,))
 
-def update_waste_collection_log(log_id: int, data: dict):
+def update_waste_collection_log(log_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -671,12 +1009,14 @@ def update_waste_collection_log(log_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_waste_collection_log(log_id)
+        return get_waste_collection_log(log_id) if returning else {"log_id": log_id}
     
     params['log_id'] = log_id
     query = f"UPDATE waste_collection_logs SET {', '.join(fields)} WHERE log_id = %(log_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_waste_collection_log(log_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        return {"log_id": log_id}
+    return db.update_returning(query, params, "waste_collection_logs", "log_id")
 
 def delete_waste_collection_log(log_id: int):
     query = "DELETE FROM waste_collection_logs WHERE log_id = %s"
@@ -684,20 +1024,27 @@ def delete_waste_collection_log(log_id: int):
     return {"message": "Waste collection log deleted successfully"}
 
 # ==================== COMPLAINTS ====================
-def create_complaint(data: dict):
+def create_complaint(data: dict, returning: bool = True):
     query = """
         INSERT INTO complaints (citizen_id, category, description, date_reported, status, assigned_to, priority)
         VALUES (%(citizen_id)s, %(category)s, %(description)s, %(date_reported)s, %(status)s, %(assigned_to)s, %(priority)s)
     """
-    complaint_id = db.execute_insert(query, data)
-    return get_complaint(complaint_id)
+    if not returning:
+        row = {**data, "complaint_id": db.execute_insert(query, data)}
+        notify("complaints", "insert", [row])
+        return {"complaint_id": row["complaint_id"]}
+    row = db.insert_returning(query, data, "complaints", "complaint_id")
+    notify("complaints", "insert", [row])
+    return row
 
 def get_complaint(complaint_id: int):
     query = "SELECT * FROM complaints WHERE complaint_id = %s"
     return db.execute_one(query, (complaint_id,))
 
-def get_all_complaints(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM complaints LIMIT %s OFFSET %s"
+def get_all_complaints(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("complaints", cursor, limit)
+    query = "SELECT * FROM complaints ORDER BY complaint_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
 def get_complaints_by_status(status: str):
@@ -708,7 +1055,7 @@ def get_complaints_by_citizen(citizen_id: int):
     query = "SELECT * FROM complaints WHERE citizen_id = %s ORDER BY date_reported DESC"
     return db.execute_query(query, (citizen_id,))
 
-def update_complaint(complaint_id: int, data: dict):
+def update_complaint(complaint_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -717,40 +1064,50 @@ def update_complaint(complaint_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_complaint(complaint_id)
+        return get_complaint(complaint_id) if returning else {"complaint_id": complaint_id}
     
     params['complaint_id'] = complaint_id
     query = f"UPDATE complaints SET {', '.join(fields)} WHERE complaint_id = %(complaint_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_complaint(complaint_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        notify("complaints", "update", [params])
+        return {"complaint_id": complaint_id}
+    row = db.update_returning(query, params, "complaints", "complaint_id")
+    if row:
+        notify("complaints", "update", [row])
+    return row
 
 def delete_complaint(complaint_id: int):
     query = "DELETE FROM complaints WHERE complaint_id = %s"
     db.execute_query(query, (complaint_id,), fetch=False)
+    notify("complaints", "delete", [{"complaint_id": complaint_id}])
     return {"message": "Complaint deleted successfully"}
 
 # ==================== COMPLAINT UPDATES ====================
-def create_complaint_update(data: dict):
+def create_complaint_update(data: dict, returning: bool = True):
     query = """
         INSERT INTO complaint_updates (complaint_id, update_time, updated_by, comment)
         VALUES (%(complaint_id)s, %(update_time)s, %(updated_by)s, %(comment)s)
     """
-    update_id = db.execute_insert(query, data)
-    return get_complaint_update(update_id)
+    if not returning:
+        return {"update_id": db.execute_insert(query, data)}
+    return db.insert_returning(query, data, "complaint_updates", "update_id")
 
 def get_complaint_update(update_id: int):
     query = "SELECT * FROM complaint_updates WHERE update_id = %s"
     return db.execute_one(query, (update_id,))
 
-def get_all_complaint_updates(skip: int = 0, limit: int = 100):
-    query = "SELECT * FROM complaint_updates LIMIT %s OFFSET %s"
+def get_all_complaint_updates(skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    if cursor is not None:
+        return _keyset_page("complaint_updates", cursor, limit)
+    query = "SELECT * FROM complaint_updates ORDER BY update_id LIMIT %s OFFSET %s"
     return db.execute_query(query, (limit, skip))
 
 def get_complaint_updates_by_complaint(complaint_id: int):
     query = "SELECT * FROM complaint_updates WHERE complaint_id = %s ORDER BY update_time DESC"
     return db.execute_query(query, (complaint_id,))
 
-def update_complaint_update(update_id: int, data: dict):
+def update_complaint_update(update_id: int, data: dict, returning: bool = True):
     fields = []
     params = {}
     for key, value in data.items():
@@ -759,102 +1116,137 @@ def update_complaint_update(update_id: int, data: dict):
             params[key] = value
     
     if not fields:
-        return get_complaint_update(update_id)
+        return get_complaint_update(update_id) if returning else {"update_id": update_id}
     
     params['update_id'] = update_id
     query = f"UPDATE complaint_updates SET {', '.join(fields)} WHERE update_id = %(update_id)s"
-    db.execute_query(query, params, fetch=False)
-    return get_complaint_update(update_id)
+    if not returning:
+        db.execute_query(query, params, fetch=False)
+        return {"update_id": update_id}
+    return db.update_returning(query, params, "complaint_updates", "update_id")
 
 def delete_complaint_update(update_id: int):
     query = "DELETE FROM complaint_updates WHERE update_id = %s"
     db.execute_query(query, (update_id,), fetch=False)
     return {"message": "Complaint update deleted successfully"}
 
+# ==================== USAGE ANOMALIES ====================
+def get_usage_anomalies(utility: Optional[str] = None, account_id: Optional[int] = None,
+                        year: Optional[int] = None, month: Optional[int] = None, kind: Optional[str] = None,
+                        skip: int = 0, limit: int = 100):
+    """Stored anomalies from the last detection run, most recent period and strongest score first"""
+    conditions = []
+    params = []
+    for column, value in (("utility", utility), ("account_id", account_id), ("usage_month", year),
+                          ("usage_month_number", month), ("kind", kind)):
+        if value is not None:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT * FROM usage_anomalies {where}
+        ORDER BY usage_month DESC, usage_month_number DESC, ABS(z_score) DESC, anomaly_id
+        LIMIT %s OFFSET %s
+    """
+    return db.execute_query(query, (*params, limit, skip))
+
+# ==================== CONSUMPTION ROLLUP ====================
+# Dimensions the rollup can be grouped and filtered by -> consumption_rollup column
+ROLLUP_DIMENSIONS = {
+    "utility": "utility",
+    "year": "period_year",
+    "month": "period_month",
+    "city": "city",
+    "area": "area",
+}
+
+def get_consumption_rollup(group_by: List[str], filters: dict, limit: int = 1000):
+    """Slice the pre-aggregated cube: sum its measures over every cell matching filters"""
+    columns = [ROLLUP_DIMENSIONS[dimension] for dimension in group_by]
+    conditions = []
+    params = []
+    for dimension, value in filters.items():
+        if value is not None:
+            conditions.append(f"{ROLLUP_DIMENSIONS[dimension]} = %s")
+            params.append(value)
+    select = "".join(f"{column}, " for column in columns)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    grouping = f"GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}" if columns else ""
+    query = f"""
+        SELECT {select}SUM(accounts) AS accounts, SUM(readings) AS readings, SUM(consumed) AS consumed,
+               SUM(bills) AS bills, SUM(billed) AS billed
+        FROM consumption_rollup {where} {grouping}
+        LIMIT %s
+    """
+    return db.execute_query(query, (*params, limit))
+
 # ==================== DASHBOARD STATS ====================
+DASHBOARD_TOTALS_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM citizens) AS total_citizens,
+        (SELECT COUNT(*) FROM utility_accounts) AS total_utility_accounts,
+        (SELECT COALESCE(SUM(units_consumed), 0) FROM electricity_usage
+            WHERE usage_month = %(year)s AND usage_month_number = %(month)s) AS electricity_usage_kwh,
+        (SELECT COALESCE(SUM(litres_consumed), 0) FROM water_usage
+            WHERE usage_month = %(year)s AND usage_month_number = %(month)s) AS water_usage_litres,
+        (SELECT COUNT(*) FROM buses WHERE active = TRUE) AS active_buses,
+        (SELECT COUNT(*) FROM waste_collection_zones) AS waste_zones,
+        (SELECT COUNT(*) FROM trucks WHERE active = TRUE) AS active_trucks,
+        (SELECT COALESCE(SUM(amount), 0) FROM electricity_bills WHERE status = 'Paid')
+            + (SELECT COALESCE(SUM(amount), 0) FROM water_bills WHERE status = 'Paid') AS total_revenue,
+        (SELECT COUNT(*) FROM electricity_bills WHERE status != 'Paid')
+            + (SELECT COUNT(*) FROM water_bills WHERE status != 'Paid') AS pending_bills
+"""
+
+DASHBOARD_STATUS_QUERY = """
+    SELECT 'emergency' AS source, status, COUNT(*) AS count FROM emergency_requests GROUP BY status
+    UNION ALL
+    SELECT 'complaints' AS source, status, COUNT(*) AS count FROM complaints GROUP BY status
+"""
+
+# (source, status) -> stats key
+DASHBOARD_STATUS_KEYS = {
+    ('emergency', 'Open'): 'emergency_open',
+    ('emergency', 'Dispatched'): 'emergency_dispatched',
+    ('emergency', 'Resolved'): 'emergency_resolved',
+    ('complaints', 'Open'): 'complaints_open',
+    ('complaints', 'In Progress'): 'complaints_in_progress',
+    ('complaints', 'Resolved'): 'complaints_resolved',
+}
+
 def get_dashboard_stats():
     """Get aggregated statistics for dashboard"""
-    stats = {}
-    
-    # Total citizens
-    result = db.execute_one("SELECT COUNT(*) as count FROM citizens")
-    stats['total_citizens'] = result['count'] if result else 0
-    
-    # Total utility accounts
-    result = db.execute_one("SELECT COUNT(*) as count FROM utility_accounts")
-    stats['total_utility_accounts'] = result['count'] if result else 0
-    
-    # Electricity usage (current month)
-    year_result = db.execute_one("SELECT YEAR(CURRENT_DATE) as year")
-    month_result = db.execute_one("SELECT MONTH(CURRENT_DATE) as month")
-    current_year = year_result['year'] if year_result else 2025
-    current_month = month_result['month'] if month_result else 1
-    
-    elec_usage = db.execute_one(
-        "SELECT COALESCE(SUM(units_consumed), 0) as total FROM electricity_usage WHERE usage_month = %s AND usage_month_number = %s",
-        (current_year, current_month)
-    )
-    stats['electricity_usage_kwh'] = float(elec_usage['total']) if elec_usage and elec_usage.get('total') is not None else 0
-    
-    # Water usage (current month)
-    water_usage = db.execute_one(
-        "SELECT COALESCE(SUM(litres_consumed), 0) as total FROM water_usage WHERE usage_month = %s AND usage_month_number = %s",
-        (current_year, current_month)
-    )
-    stats['water_usage_litres'] = float(water_usage['total']) if water_usage and water_usage.get('total') is not None else 0
-    
-    # Active buses
-    result = db.execute_one("SELECT COUNT(*) as count FROM buses WHERE active = TRUE")
-    stats['active_buses'] = result['count'] if result else 0
-    
-    # Emergency requests by status
-    result = db.execute_one("SELECT COUNT(*) as count FROM emergency_requests WHERE status = 'Open'")
-    stats['emergency_open'] = result['count'] if result else 0
-    result = db.execute_one("SELECT COUNT(*) as count FROM emergency_requests WHERE status = 'Dispatched'")
-    stats['emergency_dispatched'] = result['count'] if result else 0
-    result = db.execute_one("SELECT COUNT(*) as count FROM emergency_requests WHERE status = 'Resolved'")
-    stats['emergency_resolved'] = result['count'] if result else 0
-    
-    # Complaints by status
-    result = db.execute_one("SELECT COUNT(*) as count FROM complaints WHERE status = 'Open'")
-    stats['complaints_open'] = result['count'] if result else 0
-    result = db.execute_one("SELECT COUNT(*) as count FROM complaints WHERE status = 'In Progress'")
-    stats['complaints_in_progress'] = result['count'] if result else 0
-    result = db.execute_one("SELECT COUNT(*) as count FROM complaints WHERE status = 'Resolved'")
-    stats['complaints_resolved'] = result['count'] if result else 0
-    
-    # Waste collection stats
-    result = db.execute_one("SELECT COUNT(*) as count FROM waste_collection_zones")
-    stats['waste_zones'] = result['count'] if result else 0
-    result = db.execute_one("SELECT COUNT(*) as count FROM trucks WHERE active = TRUE")
-    stats['active_trucks'] = result['count'] if result else 0
-    
-    # Revenue (sum of paid bills)
-    elec_revenue = db.execute_one(
-        "SELECT COALESCE(SUM(amount), 0) as total FROM electricity_bills WHERE status = 'Paid'"
-    )
-    water_revenue = db.execute_one(
-        "SELECT COALESCE(SUM(amount), 0) as total FROM water_bills WHERE status = 'Paid'"
-    )
-    elec_total = float(elec_revenue['total']) if elec_revenue and elec_revenue.get('total') is not None else 0
-    water_total = float(water_revenue['total']) if water_revenue and water_revenue.get('total') is not None else 0
-    stats['total_revenue'] = elec_total + water_total
-    
-    # Pending bills
-    result = db.execute_one(
-        "SELECT COUNT(*) as count FROM (SELECT bill_id FROM electricity_bills WHERE status != 'Paid' UNION ALL SELECT bill_id FROM water_bills WHERE status != 'Paid') as t"
-    )
-    stats['pending_bills'] = result['count'] if result else 0
-    
+    # Bound as values rather than CURRENT_DATE so the usage subqueries prune to this year's partition
+    today = date.today()
+    totals = db.execute_one(DASHBOARD_TOTALS_QUERY, {"year": today.year, "month": today.month}) or {}
+    stats = {
+        'total_citizens': totals.get('total_citizens') or 0,
+        'total_utility_accounts': totals.get('total_utility_accounts') or 0,
+        'electricity_usage_kwh': float(totals.get('electricity_usage_kwh') or 0),
+        'water_usage_litres': float(totals.get('water_usage_litres') or 0),
+        'active_buses': totals.get('active_buses') or 0,
+        'waste_zones': totals.get('waste_zones') or 0,
+        'active_trucks': totals.get('active_trucks') or 0,
+        'total_revenue': float(totals.get('total_revenue') or 0),
+        'pending_bills': int(totals.get('pending_bills') or 0),
+    }
+
+    # Emergency requests and complaints by status
+    for key in DASHBOARD_STATUS_KEYS.values():
+        stats[key] = 0
+    for row in db.execute_query(DASHBOARD_STATUS_QUERY):
+        key = DASHBOARD_STATUS_KEYS.get((row['source'], row['status']))
+        if key:
+            stats[key] = row['count']
+
     # Recent emergency requests (last 5)
     stats['recent_emergencies'] = db.execute_query(
         "SELECT req_id, service_id, location, status, request_datetime, created_at FROM emergency_requests ORDER BY request_datetime DESC LIMIT 5"
     ) or []
-    
+
     # Recent complaints (last 5)
     stats['recent_complaints'] = db.execute_query(
         "SELECT complaint_id, category, description, status, date_reported, created_at FROM complaints ORDER BY date_reported DESC LIMIT 5"
     ) or []
-    
-    return stats
 
+    return stats
@@ -0,0 +1,93 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+import base64
+import binascii
+import json
+from typing import Optional
+
+# Sort keys usable for keyset pagination. Each key is backed by the primary key
+# or by a secondary index (InnoDB appends the primary key to every secondary
+# index, so the trailing id column is covered too).
+KEYSET_SORTS = {
+    'addresses': {'id': ('address_id',)},
+    'citizens': {'id': ('citizen_id',)},
+    'utility_accounts': {'id': ('account_id',)},
+    'electricity_usage': {'id': ('usage_id',), 'period': ('usage_month', 'usage_month_number', 'usage_id')},
+    'water_usage': {'id': ('usage_id',), 'period': ('usage_month', 'usage_month_number', 'usage_id')},
+    'electricity_bills': {'id': ('bill_id',), 'period': ('bill_year', 'bill_month', 'bill_id')},
+    'water_bills': {'id': ('bill_id',), 'period': ('bill_year', 'bill_month', 'bill_id')},
+    'payments': {'id': ('payment_id',), 'payment_date': ('payment_date', 'payment_id')},
+    'public_transport_routes': {'id': ('route_id',)},
+    'drivers': {'id': ('driver_id',)},
+    'buses': {'id': ('bus_id',)},
+    'emergency_services': {'id': ('service_id',)},
+    'emergency_requests': {'id': ('req_id',)},
+    'waste_collection_zones': {'id': ('zone_id',)},
+    'trucks': {'id': ('truck_id',)},
+    'waste_collection_logs': {'id': ('log_id',)},
+    'complaints': {'id': ('complaint_id',)},
+    'complaint_updates': {'id': ('update_id',)},
+}
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded or used"""
+
+
+def sort_columns(table: str, sort: str):
+    sorts = KEYSET_SORTS[table]
+    if sort not in sorts:
+        raise InvalidCursorError(f"Unknown sort '{sort}' for {table}; expected one of {', '.join(sorts)}")
+    return sorts[sort]
+
+
+def encode_cursor(sort: str, values) -> str:
+    payload = json.dumps({'s': sort, 'k': list(values)}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str, width: int) -> Optional[list]:
+    """Decode a cursor into key values; an empty cursor means the first page"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = payload['k']
+        cursor_sort = payload['s']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursorError("Malformed pagination cursor")
+    if cursor_sort != sort or not isinstance(values, list) or len(values) != width:
+        raise InvalidCursorError("Pagination cursor does not match the requested sort")
+    return values
+
+
+def keyset_query(table: str, cursor: str, limit: int, sort: str = 'id', where: str = '', params=()):
+    """Build the seek query for one page; fetches one extra row to detect more pages"""
+    columns = sort_columns(table, sort)
+    after = decode_cursor(cursor, sort, len(columns))
+    conditions = [where] if where else []
+    params = list(params)
+    if after is not None:
+        if len(columns) == 1:
+            conditions.append(f"{columns[0]} > %s")
+        else:
+            placeholders = ', '.join(['%s'] * len(columns))
+            conditions.append(f"({', '.join(columns)}) > ({placeholders})")
+        params.extend(after)
+    where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    query = f"SELECT * FROM {table}{where_clause} ORDER BY {', '.join(columns)} LIMIT %s"
+    params.append(limit + 1)
+    return query, tuple(params)
+
+
+def build_page(table: str, rows, limit: int, sort: str = 'id'):
+    """Trim the look-ahead row and attach the cursor for the next page"""
+    columns = sort_columns(table, sort)
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, [rows[-1][column] for column in columns])
+    return {'items': rows, 'next_cursor': next_cursor}
@@ -1,59 +1,411 @@
 """
 Database connection module
 """
+import threading
+import time
+from collections import deque
 import pymysql
-from app.config import DB_CONFIG
+from pymysql.constants import CLIENT
+from app.config import DB_CONFIG, DB_POOL_CONFIG
+from app.query_cache import query_cache, TrackingCursor
+from app.query_stats import query_stats, Probe, InstrumentedCursor
 from contextlib import contextmanager
 
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class _PooledConnection:
+    """Bookkeeping wrapper around a raw pymysql connection"""
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of pymysql connections"""
+
+    def __init__(self, config, min_size=2, max_size=20, checkout_timeout=30.0,
+                 max_idle_time=300.0, max_lifetime=3600.0, ping_interval=30.0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.config = config
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'closed': 0,
+            'recycled': 0,
+            'failed_pings': 0,
+        }
+
+    def _connect(self):
+        entry = _PooledConnection(pymysql.connect(**self.config))
+        with self._lock:
+            self._stats['created'] += 1
+        return entry
+
+    def _close(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._stats['closed'] += 1
+
+    def _expired(self, entry, now):
+        return self.max_lifetime and now - entry.created_at > self.max_lifetime
+
+    def _reap_idle(self, now):
+        """Pop idle connections past their idle or lifetime limit (lock held)"""
+        stale = []
+        keep = deque()
+        while self._idle:
+            entry = self._idle.popleft()
+            too_idle = (self.max_idle_time and now - entry.last_used > self.max_idle_time
+                        and self._size - len(stale) > self.min_size)
+            if too_idle or self._expired(entry, now):
+                stale.append(entry)
+            else:
+                keep.append(entry)
+        self._idle = keep
+        self._size -= len(stale)
+        self._stats['recycled'] += len(stale)
+        return stale
+
+    def _is_alive(self, entry, now):
+        if not self.ping_interval or now - entry.last_used < self.ping_interval:
+            return True
+        try:
+            entry.conn.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._lock:
+                self._stats['failed_pings'] += 1
+            return False
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if allowed"""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            entry = None
+            create = False
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                stale = self._reap_idle(time.monotonic())
+                while entry is None and not create:
+                    if self._idle:
+                        entry = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats['timeouts'] += 1
+                            raise PoolTimeoutError(
+                                f"Timed out after {self.checkout_timeout}s waiting for a database connection"
+                            )
+                        self._stats['waits'] += 1
+                        self._available.wait(remaining)
+            for old in stale:
+                self._close(old)
+
+            if create:
+                try:
+                    entry = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._available.notify()
+                    raise
+            elif not self._is_alive(entry, time.monotonic()):
+                self._discard(entry)
+                continue
+
+            with self._lock:
+                self._in_use[id(entry.conn)] = entry
+                self._stats['checkouts'] += 1
+            return entry.conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if discard is set"""
+        with self._lock:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            return
+        now = time.monotonic()
+        if discard or self._closed or not conn.open or self._expired(entry, now):
+            self._discard(entry)
+            return
+        entry.last_used = now
+        with self._lock:
+            self._idle.append(entry)
+            self._available.notify()
+
+    def _discard(self, entry):
+        with self._lock:
+            self._size -= 1
+            self._available.notify()
+        self._close(entry)
+
+    def warm_up(self):
+        """Open connections until the pool holds min_size of them"""
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._connect()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+            with self._lock:
+                self._idle.append(entry)
+                self._available.notify()
+
+    def close(self):
+        """Close idle connections; busy ones are closed when released"""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._available.notify_all()
+        for entry in idle:
+            self._close(entry)
+
+    def stats(self):
+        """Snapshot of pool utilisation counters"""
+        with self._lock:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                **self._stats,
+            }
+
+
+def server_supports_returning(server_info):
+    """Whether the server accepts INSERT ... RETURNING (MariaDB 10.5+)"""
+    if 'mariadb' not in server_info.lower():
+        return False
+    try:
+        major, minor = (int(part) for part in server_info.split('-')[0].split('.')[:2])
+    except ValueError:
+        return False
+    return (major, minor) >= (10, 5)
+
+
+def returning_batch(write_query, select_query):
+    """Wrap a write and its echo SELECT in one multi-statement transaction"""
+    return f"START TRANSACTION; {write_query}; {select_query}; COMMIT"
+
+
 class Database:
     def __init__(self):
         self.config = DB_CONFIG
-    
+        self.pool = ConnectionPool(self.config, **DB_POOL_CONFIG)
+        self.multi_statements = bool(self.config.get('client_flag', 0) & CLIENT.MULTI_STATEMENTS)
+        self._supports_returning = None
+
     @contextmanager
-    def get_connection(self):
-        """Get database connection with context manager"""
-        conn = None
+    def get_connection(self, probe=None):
+        """Get a pooled database connection with context manager"""
+        conn = self.pool.acquire()
+        if probe is not None:
+            probe.acquired()
+        discard = False
         try:
-            conn = pymysql.connect(**self.config)
             yield conn
         except Exception as e:
-            if conn:
+            try:
                 conn.rollback()
+            except Exception:
+                # The connection is unusable; drop it instead of pooling it
+                discard = True
             raise e
         finally:
-            if conn:
-                conn.close()
-    
+            self.pool.release(conn, discard=discard)
+
+    @contextmanager
+    def transaction(self):
+        """Run statements on one connection inside a single transaction"""
+        with self.get_connection() as conn:
+            conn.begin()
+            cursor = TrackingCursor(InstrumentedCursor(conn.cursor(pymysql.cursors.DictCursor), query_stats))
+            try:
+                yield cursor
+                conn.commit()
+            finally:
+                cursor.close()
+                query_cache.invalidate(cursor.written)
+
+    def pool_stats(self):
+        """Get connection pool statistics"""
+        return self.pool.stats()
+
+    def close(self):
+        """Close the connection pool"""
+        self.pool.close()
+
     def execute_query(self, query, params=None, fetch=True):
         """Execute a query and return results"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor(pymysql.cursors.DictCursor)
-            cursor.execute(query, params)
-            if fetch:
-                result = cursor.fetchall()
+        ticket = None
+        if fetch:
+            hit, cached, ticket = query_cache.lookup('all', query, params)
+            if hit:
+                return cached
+        try:
+            with query_stats.observe(query, params) as probe, self.get_connection(probe) as conn:
+                cursor = conn.cursor(pymysql.cursors.DictCursor)
+                cursor.execute(query, params)
+                if fetch:
+                    result = cursor.fetchall()
+                    cursor.close()
+                    probe.rows = len(result)
+                    query_cache.store(ticket, result)
+                    return result
+                probe.rows = max(cursor.rowcount, 0)
                 cursor.close()
-                return result
-            cursor.close()
-            return None
-    
+                return None
+        finally:
+            if ticket is None:
+                query_cache.written(query)
+
     def execute_one(self, query, params=None):
         """Execute a query and return single result"""
-        with self.get_connection() as conn:
+        hit, cached, ticket = query_cache.lookup('one', query, params)
+        if hit:
+            return cached
+        with query_stats.observe(query, params) as probe, self.get_connection(probe) as conn:
             cursor = conn.cursor(pymysql.cursors.DictCursor)
             cursor.execute(query, params)
             result = cursor.fetchone()
             cursor.close()
-            return result
-    
+            probe.rows = int(result is not None)
+        query_cache.store(ticket, result)
+        return result
+
     def execute_insert(self, query, params=None):
         """Execute insert and return last insert id"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        try:
+            with query_stats.observe(query, params) as probe, self.get_connection(probe) as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                probe.rows = max(cursor.rowcount, 0)
+                last_id = cursor.lastrowid
+                cursor.close()
+                return last_id
+        finally:
+            query_cache.written(query)
+
+    def stream_query(self, query, params=None, batch_size=1000):
+        """Yield batches of rows from an unbuffered server-side cursor"""
+        probe = Probe()
+        conn = self.pool.acquire()
+        probe.acquired()
+        finished = False
+        error = False
+        try:
+            cursor = conn.cursor(pymysql.cursors.SSDictCursor)
             cursor.execute(query, params)
-            last_id = cursor.lastrowid
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                probe.rows += len(rows)
+                yield rows
             cursor.close()
-            return last_id
+            finished = True
+        except Exception:
+            error = True
+            raise
+        finally:
+            # An abandoned unbuffered result would have to be drained before the
+            # connection could be reused, so drop the connection instead
+            self.pool.release(conn, discard=not finished)
+            # Includes time the consumer spent between batches
+            query_stats.record(query, params, probe, time.perf_counter(), error)
+
+    def _returns_rows(self, conn):
+        if self._supports_returning is None:
+            self._supports_returning = server_supports_returning(conn.get_server_info())
+        return self._supports_returning
+
+    def _fetch_batch(self, cursor, query, params):
+        """Execute a multi-statement batch and return the row of its SELECT"""
+        cursor.execute(query, params)
+        row = None
+        while True:
+            if cursor.description:
+                row = cursor.fetchone()
+            if not cursor.nextset():
+                return row
+
+    def insert_returning(self, query, params, table, key):
+        """Insert a row and return it without a second round trip"""
+        select_query = f"SELECT * FROM {table} WHERE {key} = LAST_INSERT_ID()"
+        with query_stats.observe(query, params) as probe, self.get_connection(probe) as conn:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            try:
+                if self._returns_rows(conn):
+                    cursor.execute(f"{query.rstrip()} RETURNING *", params)
+                    return cursor.fetchone()
+                if self.multi_statements:
+                    return self._fetch_batch(cursor, returning_batch(query, select_query), params)
+                # No batching available: still one connection and one transaction
+                conn.begin()
+                cursor.execute(query, params)
+                cursor.execute(select_query)
+                row = cursor.fetchone()
+                conn.commit()
+                return row
+            finally:
+                cursor.close()
+                query_cache.written(query)
+
+    def update_returning(self, query, params, table, key):
+        """Update a row keyed by params[key] and return it in the same round trip"""
+        select_query = f"SELECT * FROM {table} WHERE {key} = %({key})s"
+        with query_stats.observe(query, params) as probe, self.get_connection(probe) as conn:
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            try:
+                if self.multi_statements:
+                    return self._fetch_batch(cursor, returning_batch(query, select_query), params)
+                conn.begin()
+                cursor.execute(query, params)
+                cursor.execute(select_query, params)
+                row = cursor.fetchone()
+                conn.commit()
+                return row
+            finally:
+                cursor.close()
+                query_cache.written(query)
 
 # Global database instance
 db = Database()
-
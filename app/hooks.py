@@ -0,0 +1,57 @@
+"""
+Change notifications for CRUD writes
+"""
+import asyncio
+import functools
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# table -> [(listener, blocking)]
+_listeners = defaultdict(list)
+
+
+def on_change(*tables, blocking: bool = False):
+    """Register fn(table, action, rows) to run after writes to the given tables.
+
+    action is 'insert', 'update', 'delete' or 'upsert' (either of the first
+    two); rows is a list of the written rows. Single-row writes include the
+    primary key; bulk inserts and upserts may not know it. An update that
+    moves a row to another parent (say a payment to another bill) also
+    carries the previous version of the row. Blocking listeners (ones that
+    do I/O) are run in a worker thread when notified from the async CRUD
+    path.
+    """
+    def decorator(fn):
+        for table in tables:
+            _listeners[table].append((fn, blocking))
+        return fn
+    return decorator
+
+
+def _call(fn, table, action, rows):
+    # A failing listener must never fail the write that triggered it
+    try:
+        fn(table, action, rows)
+    except Exception:
+        logger.exception("Change listener %s failed for %s %s", getattr(fn, '__name__', fn), action, table)
+
+
+def notify(table: str, action: str, rows):
+    """Run every listener for a committed write (sync CRUD path)"""
+    for fn, _ in _listeners.get(table, ()):
+        _call(fn, table, action, rows)
+
+
+async def notify_async(table: str, action: str, rows):
+    """Run every listener for a committed write (async CRUD path)"""
+    listeners = _listeners.get(table, ())
+    if not listeners:
+        return
+    loop = asyncio.get_running_loop()
+    for fn, blocking in listeners:
+        if blocking:
+            await loop.run_in_executor(None, functools.partial(_call, fn, table, action, rows))
+        else:
+            _call(fn, table, action, rows)
@@ -0,0 +1,3 @@
+"""
+Batch jobs runnable from the API or the command line
+"""
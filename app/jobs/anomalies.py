@@ -0,0 +1,200 @@
+"""
+Usage anomaly detection: score each monthly reading against the account's own recent history
+
+Usage:
+    python -m app.jobs.anomalies electricity [--dry-run]
+"""
+import argparse
+import json
+import logging
+import time
+import numpy as np
+from app.config import ANOMALY_CONFIG
+from app.database import db
+from app.jobs.billing import BILLING_UTILITIES
+
+logger = logging.getLogger(__name__)
+
+_INSERT_ANOMALY = """
+    INSERT INTO usage_anomalies (utility, usage_id, account_id, usage_month, usage_month_number,
+                                 consumed, baseline, baseline_std, history, z_score, kind)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Stored kinds; a reading's kind code is its index here plus one, 0 meaning not flagged
+ANOMALY_KINDS = ('spike', 'drop', 'zero')
+# z-scores are clipped to what usage_anomalies.z_score can hold
+MAX_Z = 9999.0
+
+
+def rolling_baselines(account_ids, values, window: int):
+    """Mean, sample std and count of each reading's previous `window` readings of the same account.
+
+    Rows must be sorted by account and period. Prefix sums over the whole
+    batch give every trailing window in O(1); values are shifted by each
+    account's first reading so the sums stay small and precise.
+    """
+    size = values.size
+    index = np.arange(size)
+    starts = np.ones(size, dtype=bool)
+    starts[1:] = account_ids[1:] != account_ids[:-1]
+    first = np.maximum.accumulate(np.where(starts, index, 0))
+    history = np.minimum(index - first, window)
+    low = index - history
+
+    shifted = values - values[first]
+    sums = np.concatenate(([0.0], np.cumsum(shifted)))
+    squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+    total = sums[index] - sums[low]
+    total_sq = squares[index] - squares[low]
+    mean = total / np.maximum(history, 1)
+    variance = np.where(history > 1, (total_sq - history * mean * mean) / np.maximum(history - 1, 1), 0.0)
+    return mean + values[first], np.sqrt(np.maximum(variance, 0.0)), history
+
+
+def score_readings(account_ids, values, window: int, min_history: int, threshold: float, min_std_ratio: float):
+    """z-score every reading against its baseline and classify the outliers"""
+    baseline, std, history = rolling_baselines(account_ids, values, window)
+    # A sample std needs at least two readings
+    scored = history >= max(min_history, 2)
+    # Near-constant histories would otherwise turn tiny changes into huge scores
+    spread = np.maximum(std, min_std_ratio * np.abs(baseline))
+    deviation = values - baseline
+    z = np.where(spread > 0, deviation / np.where(spread > 0, spread, 1.0), np.sign(deviation) * MAX_Z)
+    z = np.clip(z, -MAX_Z, MAX_Z)
+
+    codes = np.zeros(values.size, dtype=np.int8)
+    codes[scored & (z >= threshold)] = 1
+    codes[scored & (z <= -threshold)] = 2
+    codes[scored & (values <= 0) & (baseline > 0)] = 3
+    return baseline, std, history, z, codes
+
+
+class _Batch:
+    """Columns of streamed readings, accumulated until an account's history is complete"""
+
+    def __init__(self):
+        self.columns = {'usage_id': [], 'account_id': [], 'year': [], 'month': [], 'value': []}
+
+    def extend(self, rows):
+        columns = self.columns
+        count = len(rows)
+        columns['usage_id'].append(np.fromiter((row['usage_id'] for row in rows), dtype=np.int64, count=count))
+        columns['account_id'].append(np.fromiter((row['account_id'] for row in rows), dtype=np.int64, count=count))
+        columns['year'].append(np.fromiter((row['usage_month'] for row in rows), dtype=np.int64, count=count))
+        columns['month'].append(np.fromiter((row['usage_month_number'] for row in rows), dtype=np.int64,
+                                            count=count))
+        columns['value'].append(np.fromiter((row['consumed'] for row in rows), dtype=np.float64, count=count))
+
+    def split(self, final: bool):
+        """Take every complete account, keeping the last (possibly partial) one unless final"""
+        arrays = {name: np.concatenate(parts) for name, parts in self.columns.items() if parts}
+        if not arrays:
+            return None
+        accounts = arrays['account_id']
+        cut = accounts.size if final else int(np.searchsorted(accounts, accounts[-1], side='left'))
+        self.columns = {name: [array[cut:]] if cut < array.size else [] for name, array in arrays.items()}
+        if cut == 0:
+            return None
+        return {name: array[:cut] for name, array in arrays.items()}
+
+
+def _replace_anomalies(utility: str, after_account, through_account, rows):
+    """Swap the stored anomalies of an account range for a fresh result, in one transaction"""
+    delete = "DELETE FROM usage_anomalies WHERE utility = %s AND account_id <= %s"
+    params = [utility, through_account]
+    if after_account is not None:
+        delete += " AND account_id > %s"
+        params.append(after_account)
+    with db.transaction() as cursor:
+        cursor.execute(delete, tuple(params))
+        if rows:
+            cursor.executemany(_INSERT_ANOMALY, rows)
+
+
+def _flagged_rows(utility: str, block, config):
+    baseline, std, history, z, codes = score_readings(
+        block['account_id'], block['value'], config['window'], config['min_history'],
+        config['z_threshold'], config['min_std_ratio'])
+    return [
+        (utility, int(block['usage_id'][i]), int(block['account_id'][i]), int(block['year'][i]),
+         int(block['month'][i]), round(float(block['value'][i]), 2), round(float(baseline[i]), 2),
+         round(float(std[i]), 2), int(history[i]), round(float(z[i]), 2), ANOMALY_KINDS[codes[i] - 1])
+        for i in np.flatnonzero(codes)
+    ]
+
+
+def run_anomaly_detection(utility: str, dry_run: bool = False):
+    """Score every reading of a utility and persist the flagged ones"""
+    if utility not in BILLING_UTILITIES:
+        raise ValueError(f"Unknown utility '{utility}'; expected one of {', '.join(BILLING_UTILITIES)}")
+    usage_table, usage_column = BILLING_UTILITIES[utility][:2]
+    config = ANOMALY_CONFIG
+    query = f"""
+        SELECT usage_id, account_id, usage_month, usage_month_number, {usage_column} AS consumed
+        FROM {usage_table}
+        ORDER BY account_id, usage_month, usage_month_number, usage_id
+    """
+    started = time.perf_counter()
+    readings = accounts = 0
+    kinds = dict.fromkeys(ANOMALY_KINDS, 0)
+    last_account = None
+    batch = _Batch()
+
+    def flush(final):
+        nonlocal readings, accounts, last_account
+        block = batch.split(final)
+        if block is None:
+            return
+        rows = _flagged_rows(utility, block, config)
+        readings += block['account_id'].size
+        accounts += int(np.unique(block['account_id']).size)
+        for row in rows:
+            kinds[row[-1]] += 1
+        through = int(block['account_id'][-1])
+        if not dry_run:
+            _replace_anomalies(utility, last_account, through, rows)
+        last_account = through
+
+    for rows in db.stream_query(query, None, config['batch_size']):
+        batch.extend(rows)
+        flush(final=False)
+    flush(final=True)
+    if not dry_run:
+        # Accounts past the last one read no longer have any readings
+        if last_account is None:
+            db.execute_query("DELETE FROM usage_anomalies WHERE utility = %s", (utility,), fetch=False)
+        else:
+            db.execute_query("DELETE FROM usage_anomalies WHERE utility = %s AND account_id > %s",
+                             (utility, last_account), fetch=False)
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "utility": utility,
+        "dry_run": dry_run,
+        "accounts": accounts,
+        "readings": readings,
+        "flagged": sum(kinds.values()),
+        "by_kind": kinds,
+        "elapsed_seconds": round(elapsed, 3),
+        "readings_per_second": round(readings / elapsed, 1) if elapsed else None,
+    }
+    logger.info("Usage anomaly scan %s: %d of %d readings flagged", utility, report['flagged'], readings)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flag usage readings that depart from the account's baseline")
+    parser.add_argument('utility', choices=sorted(BILLING_UTILITIES))
+    parser.add_argument('--dry-run', action='store_true', help="score and report without storing anomalies")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = run_anomaly_detection(args.utility, args.dry_run)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Account balance ledger: per-account billed, paid and outstanding totals kept in account_balances
+
+Usage:
+    python -m app.jobs.balances [--batch-size N]
+"""
+import argparse
+import json
+import logging
+import time
+from app.config import LEDGER_CONFIG
+from app.database import db
+from app.hooks import on_change
+from app.jobs.reconciliation import BILL_TABLES, payment_bill_keys
+
+logger = logging.getLogger(__name__)
+
+# Account filters in the refresh query; each takes the same parameters
+_SCANS = 5
+
+
+def _refresh_query(condition: str):
+    """Recompute the ledger rows of every account matching condition.
+
+    condition is a WHERE fragment with a {column} placeholder; it is applied
+    to each bill scan too, so only the selected accounts' bills and payments
+    are read. Recomputing from the source tables (rather than applying
+    deltas) makes every refresh idempotent.
+    """
+    where = {alias: condition.format(column=f"{alias}.account_id") for alias in ('a', 'eb', 'wb')}
+    return f"""
+        INSERT INTO account_balances (account_id, billed, paid, balance, open_bills)
+        SELECT a.account_id, COALESCE(b.billed, 0), COALESCE(p.paid, 0),
+               COALESCE(b.billed, 0) - COALESCE(p.paid, 0), COALESCE(b.open_bills, 0)
+        FROM utility_accounts a
+        LEFT JOIN (
+            SELECT account_id, SUM(amount) AS billed, SUM(status <> 'Paid') AS open_bills
+            FROM (
+                SELECT eb.account_id, COALESCE(eb.amount, 0), eb.status FROM electricity_bills eb WHERE {where['eb']}
+                UNION ALL
+                SELECT wb.account_id, COALESCE(wb.amount, 0), wb.status FROM water_bills wb WHERE {where['wb']}
+            ) bills
+            GROUP BY account_id
+        ) b ON b.account_id = a.account_id
+        LEFT JOIN (
+            SELECT account_id, SUM(amount_paid) AS paid
+            FROM (
+                SELECT eb.account_id, p.amount_paid FROM electricity_bills eb
+                JOIN payments p ON p.bill_type = 'Electricity' AND p.bill_id = eb.bill_id
+                WHERE {where['eb']}
+                UNION ALL
+                SELECT wb.account_id, p.amount_paid FROM water_bills wb
+                JOIN payments p ON p.bill_type = 'Water' AND p.bill_id = wb.bill_id
+                WHERE {where['wb']}
+            ) paid
+            GROUP BY account_id
+        ) p ON p.account_id = a.account_id
+        WHERE {where['a']}
+        ON DUPLICATE KEY UPDATE
+            billed = VALUES(billed),
+            paid = VALUES(paid),
+            balance = VALUES(balance),
+            open_bills = VALUES(open_bills)
+    """
+
+
+def _windows(ids, size: int):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def refresh_accounts(account_ids):
+    """Bring the ledger rows of specific accounts up to date, one short transaction per window of accounts"""
+    ids = sorted({int(account_id) for account_id in account_ids if account_id is not None})
+    for window in _windows(ids, LEDGER_CONFIG['rebuild_batch_size']):
+        placeholders = ', '.join(['%s'] * len(window))
+        with db.transaction() as cursor:
+            cursor.execute(_refresh_query(f"{{column}} IN ({placeholders})"), tuple(window) * _SCANS)
+    return len(ids)
+
+
+def _accounts_for_bills(table: str, rows):
+    accounts = set()
+    missing = []
+    for row in rows:
+        if row.get('account_id') is not None:
+            accounts.add(row['account_id'])
+        elif row.get('bill_id') is not None:
+            missing.append(row['bill_id'])
+    for window in _windows(missing, LEDGER_CONFIG['rebuild_batch_size']):
+        placeholders = ', '.join(['%s'] * len(window))
+        query = f"SELECT account_id FROM {table} WHERE bill_id IN ({placeholders})"
+        accounts.update(row['account_id'] for row in db.execute_query(query, tuple(window)))
+    return accounts
+
+
+def accounts_for_bills(bill_keys):
+    """Accounts owning the bills given as (bill_type, bill_id) pairs"""
+    by_table = {}
+    for bill_type, bill_id in bill_keys:
+        if bill_type in BILL_TABLES:
+            by_table.setdefault(BILL_TABLES[bill_type], []).append({'bill_id': bill_id})
+    accounts = set()
+    for table, bills in by_table.items():
+        accounts |= _accounts_for_bills(table, bills)
+    return accounts
+
+
+def _accounts_for_payments(rows):
+    return accounts_for_bills(payment_bill_keys(rows))
+
+
+# Registered after reconciliation's payments listener, so open_bills sees refreshed statuses
+@on_change('electricity_bills', 'water_bills', 'payments', blocking=True)
+def _refresh_changed_balances(table, action, rows):
+    if not LEDGER_CONFIG['inline']:
+        return
+    if table == 'payments':
+        refresh_accounts(_accounts_for_payments(rows))
+    else:
+        refresh_accounts(_accounts_for_bills(table, rows))
+
+
+def rebuild_balances(batch_size: int = None):
+    """Recompute the whole ledger in account_id windows, one short transaction per window"""
+    batch_size = batch_size or LEDGER_CONFIG['rebuild_batch_size']
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+    started = time.perf_counter()
+    bounds = db.execute_one(
+        "SELECT MIN(account_id) AS low, MAX(account_id) AS high, COUNT(*) AS accounts FROM utility_accounts")
+    query = _refresh_query("{column} >= %s AND {column} < %s")
+    windows = 0
+    if bounds and bounds['low'] is not None:
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            with db.transaction() as cursor:
+                cursor.execute(query, (start, start + batch_size) * _SCANS)
+            windows += 1
+    accounts = bounds['accounts'] if bounds else 0
+    elapsed = time.perf_counter() - started
+    logger.info("Rebuilt account balances for %d accounts in %.3fs", accounts, elapsed)
+    return {
+        "accounts": accounts,
+        "windows": windows,
+        "elapsed_seconds": round(elapsed, 3),
+        "accounts_per_second": round(accounts / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the account_balances ledger from bills and payments")
+    parser.add_argument('--batch-size', type=int, default=None, help="accounts per rebuild window")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = rebuild_balances(args.batch_size)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+Monthly billing runs: turn a month of usage into bills with vectorized slab tariffs
+
+Usage:
+    python -m app.jobs.billing electricity 2025 3 [--dry-run] [--mode insert]
+"""
+import argparse
+import calendar
+import json
+import logging
+import time
+from datetime import date, timedelta
+from itertools import repeat
+import numpy as np
+from app.config import BILLING_CONFIG, LEDGER_CONFIG, ROLLUP_CONFIG
+from app.database import db
+from app.jobs.balances import refresh_accounts
+
+logger = logging.getLogger(__name__)
+
+# utility -> (usage table, usage column, bill table, bill column)
+BILLING_UTILITIES = {
+    'electricity': ('electricity_usage', 'units_consumed', 'electricity_bills', 'units_consumed'),
+    'water': ('water_usage', 'litres_consumed', 'water_bills', 'litres_consumed'),
+}
+BILLING_MODES = ('upsert', 'insert')
+
+
+class SlabTariff:
+    """Progressive tariff: each slab's rate applies only to consumption inside that slab"""
+
+    def __init__(self, slabs, fixed_charge: float = 0.0):
+        if not slabs:
+            raise ValueError("A tariff needs at least one slab")
+        limits = [limit for limit, _ in slabs]
+        if any(limit is None for limit in limits[:-1]):
+            raise ValueError("Only the last slab may be unbounded")
+        uppers = np.array([np.inf if limit is None else float(limit) for limit in limits])
+        if np.any(np.diff(uppers) <= 0) or uppers[0] <= 0:
+            raise ValueError("Slab limits must be positive and increasing")
+        self.lowers = np.concatenate(([0.0], uppers[:-1]))
+        self.widths = uppers - self.lowers
+        self.rates = np.array([float(rate) for _, rate in slabs])
+        self.fixed_charge = float(fixed_charge)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['slabs'], config.get('fixed_charge', 0.0))
+
+    def charges(self, consumed: np.ndarray) -> np.ndarray:
+        """Amount due for every consumption value, in one pass over all slabs"""
+        in_slab = np.clip(consumed[:, None] - self.lowers[None, :], 0.0, self.widths[None, :])
+        return np.round(self.fixed_charge + in_slab @ self.rates, 2)
+
+
+class BillingReport:
+    """Counters, timings and anomalies for one billing run"""
+
+    def __init__(self, utility: str, year: int, month: int, mode: str, dry_run: bool):
+        self.utility = utility
+        self.year = year
+        self.month = month
+        self.mode = mode
+        self.dry_run = dry_run
+        self.accounts = 0
+        self.rows_affected = 0
+        self.total_amount = 0.0
+        self.due_date = None
+        self.timings = {}
+        self.anomalies = {}
+
+    def as_dict(self):
+        elapsed = sum(self.timings.values())
+        return {
+            "utility": self.utility,
+            "period": f"{self.year}-{self.month:02d}",
+            "mode": self.mode,
+            "dry_run": self.dry_run,
+            "accounts": self.accounts,
+            "rows_affected": self.rows_affected,
+            "total_amount": round(self.total_amount, 2),
+            "due_date": self.due_date.isoformat() if self.due_date else None,
+            "timings_seconds": {step: round(seconds, 3) for step, seconds in self.timings.items()},
+            "accounts_per_second": round(self.accounts / elapsed, 1) if elapsed else None,
+            "anomalies": self.anomalies,
+        }
+
+
+def load_usage(utility: str, year: int, month: int, batch_size: int):
+    """Stream one month of usage, summed per account, into NumPy arrays"""
+    usage_table, usage_column, _, _ = BILLING_UTILITIES[utility]
+    query = f"""
+        SELECT account_id, SUM({usage_column}) AS consumed, COUNT(*) AS readings
+        FROM {usage_table}
+        WHERE usage_month = %s AND usage_month_number = %s
+        GROUP BY account_id
+        ORDER BY account_id
+    """
+    account_ids, consumed, readings = [], [], []
+    for rows in db.stream_query(query, (year, month), batch_size):
+        count = len(rows)
+        account_ids.append(np.fromiter((row['account_id'] for row in rows), dtype=np.int64, count=count))
+        consumed.append(np.fromiter((row['consumed'] for row in rows), dtype=np.float64, count=count))
+        readings.append(np.fromiter((row['readings'] for row in rows), dtype=np.int64, count=count))
+    if not account_ids:
+        return np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.int64)
+    return np.concatenate(account_ids), np.concatenate(consumed), np.concatenate(readings)
+
+
+def find_anomalies(account_ids, consumed, readings, threshold: float, sample_size: int = 20):
+    """Flag readings that deserve a human look before bills go out"""
+    anomalies = {}
+
+    def flag(name, mask):
+        count = int(mask.sum())
+        if count:
+            anomalies[name] = {"count": count, "sample_accounts": account_ids[mask][:sample_size].tolist()}
+
+    flag('negative_usage', consumed < 0)
+    flag('zero_usage', consumed == 0)
+    flag('multiple_readings', readings > 1)
+    positive = consumed[consumed > 0]
+    if positive.size:
+        # Robust z-score (median/MAD) so a handful of huge readings cannot hide themselves
+        median = np.median(positive)
+        mad = np.median(np.abs(positive - median))
+        if mad > 0:
+            flag('outliers', 0.6745 * (consumed - median) / mad > threshold)
+    return anomalies
+
+
+def due_date_for(year: int, month: int, due_days: int) -> date:
+    """Bills fall due a fixed number of days after the end of their period"""
+    return date(year, month, calendar.monthrange(year, month)[1]) + timedelta(days=due_days)
+
+
+def _write_query(utility: str, mode: str):
+    _, _, bill_table, bill_column = BILLING_UTILITIES[utility]
+    columns = f"account_id, bill_year, bill_month, {bill_column}, amount, status, due_date"
+    if mode == 'insert':
+        # Leave bills that already exist for the period untouched (a no-op update affects 0 rows).
+        # Unlike INSERT IGNORE, any other error (a missing account, bad data) still fails the chunk
+        return f"""
+            INSERT INTO {bill_table} ({columns}) VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE bill_id = bill_id
+        """
+    # Re-running a period refreshes bills nobody has paid against yet
+    return f"""
+        INSERT INTO {bill_table} ({columns}) VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            {bill_column} = IF(status = 'Unpaid', VALUES({bill_column}), {bill_column}),
+            amount = IF(status = 'Unpaid', VALUES(amount), amount),
+            due_date = IF(status = 'Unpaid', VALUES(due_date), due_date)
+    """
+
+
+def write_bills(utility: str, year: int, month: int, account_ids, consumed, amounts, due: date,
+                mode: str, chunk_size: int):
+    """Write bills in multi-row chunks, one short transaction per chunk.
+
+    No change listeners run per chunk; refresh_derived catches the ledger
+    and rollup up once the whole run is written.
+    """
+    query = _write_query(utility, mode)
+    affected = 0
+    for start in range(0, len(account_ids), chunk_size):
+        end = start + chunk_size
+        chunk_accounts = account_ids[start:end].tolist()
+        rows = list(zip(chunk_accounts, repeat(year), repeat(month),
+                        consumed[start:end].tolist(), amounts[start:end].tolist(),
+                        repeat('Unpaid'), repeat(due)))
+        with db.transaction() as cursor:
+            cursor.executemany(query, rows)
+            affected += cursor.rowcount
+    return affected
+
+
+def refresh_derived(utility: str, year: int, month: int, account_ids):
+    """Refresh the billed accounts' ledger rows and the period's rollup month after a run"""
+    # rollup reads BILLING_UTILITIES from this module
+    from app.jobs.rollup import refresh_months
+    try:
+        if LEDGER_CONFIG['inline']:
+            refresh_accounts(account_ids.tolist())
+        if ROLLUP_CONFIG['inline']:
+            refresh_months(utility, [(year, month)])
+    except Exception as e:
+        # The bills are in; the balances and rollup rebuild jobs catch the derived tables up
+        logger.warning("Refreshing balances and rollup after billing %s %d-%02d failed: %s", utility, year, month, e)
+
+
+def run_billing(utility: str, year: int, month: int, mode: str = 'upsert', dry_run: bool = False,
+                due_days: int = None):
+    """Bill every account with usage in the given month"""
+    if utility not in BILLING_UTILITIES:
+        raise ValueError(f"Unknown utility '{utility}'; expected one of {', '.join(BILLING_UTILITIES)}")
+    if mode not in BILLING_MODES:
+        raise ValueError(f"Unknown mode '{mode}'; expected one of {', '.join(BILLING_MODES)}")
+    if not 1 <= month <= 12:
+        raise ValueError("month must be between 1 and 12")
+    tariff = SlabTariff.from_config(BILLING_CONFIG['tariffs'][utility])
+    report = BillingReport(utility, year, month, mode, dry_run)
+
+    started = time.perf_counter()
+    account_ids, consumed, readings = load_usage(utility, year, month, BILLING_CONFIG['batch_size'])
+    report.timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    report.anomalies = find_anomalies(account_ids, consumed, readings, BILLING_CONFIG['outlier_threshold'])
+    billable = np.maximum(consumed, 0.0)
+    amounts = tariff.charges(billable)
+    report.accounts = int(account_ids.size)
+    report.total_amount = float(amounts.sum())
+    report.due_date = due_date_for(year, month, BILLING_CONFIG['due_days'] if due_days is None else due_days)
+    report.timings['compute'] = time.perf_counter() - started
+
+    if not dry_run and report.accounts:
+        started = time.perf_counter()
+        report.rows_affected = write_bills(utility, year, month, account_ids, np.round(billable, 2), amounts,
+                                           report.due_date, mode, BILLING_CONFIG['chunk_size'])
+        report.timings['write'] = time.perf_counter() - started
+        started = time.perf_counter()
+        refresh_derived(utility, year, month, account_ids)
+        report.timings['refresh'] = time.perf_counter() - started
+
+    result = report.as_dict()
+    logger.info("Billing run %s %s: %d accounts at %s accounts/s", utility, result['period'],
+                report.accounts, result['accounts_per_second'])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate monthly bills from usage readings")
+    parser.add_argument('utility', choices=sorted(BILLING_UTILITIES))
+    parser.add_argument('year', type=int)
+    parser.add_argument('month', type=int)
+    parser.add_argument('--mode', choices=BILLING_MODES, default='upsert',
+                        help="upsert refreshes unpaid bills for the period; insert skips existing ones")
+    parser.add_argument('--dry-run', action='store_true', help="compute and report without writing bills")
+    parser.add_argument('--due-days', type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = run_billing(args.utility, args.year, args.month, args.mode, args.dry_run, args.due_days)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+Meter file import: stream a CSV of usage readings into electricity_usage or water_usage
+
+The file is decoded and split into records as it arrives, validated in a
+pool of worker processes and written by a few writer threads that take
+batches from a bounded queue. Nothing holds more than a handful of batches
+at once, so memory stays flat whatever the file size.
+
+Usage:
+    python -m app.jobs.meter_import electricity readings.csv [--insert] [--workers N]
+"""
+import argparse
+import codecs
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from app.config import IMPORT_CONFIG, ROLLUP_CONFIG
+from app.crud.bulk import BulkReport, insert_chunk
+from app.database import db
+from app.jobs.billing import BILLING_UTILITIES
+from app.jobs.rollup import refresh_months
+from app.models.schemas import ElectricityUsageCreate, WaterUsageCreate
+
+logger = logging.getLogger(__name__)
+
+# utility -> schema each CSV record is validated against
+IMPORT_MODELS = {'electricity': ElectricityUsageCreate, 'water': WaterUsageCreate}
+# Imports currently running in this process, by import_id
+active_imports = {}
+
+
+def iter_lines(chunks):
+    """Decode byte chunks into text lines, keeping line endings for the csv module"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.splitlines(keepends=True)
+        # The last piece may be a partial line; hold it back until the next chunk
+        pending = lines.pop() if lines and not lines[-1].endswith(('\n', '\r')) else ''
+        yield from lines
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def iter_file(path: str, read_size: int = IMPORT_CONFIG['read_size']):
+    """Byte chunks of a file on disk"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(read_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _validate_batch(utility: str, header, records):
+    """Validate (line, values) records against the utility's schema (runs in a worker process)"""
+    model = IMPORT_MODELS[utility]
+    rows = []
+    errors = []
+    for line, values in records:
+        if len(values) != len(header):
+            errors.append((line, f"Expected {len(header)} fields, got {len(values)}"))
+            continue
+        # Empty cells are missing values, so optional columns fall back to their defaults
+        record = {name: value for name, value in zip(header, values) if value != ''}
+        try:
+            rows.append((line, model(**record).dict(exclude_none=True)))
+        except Exception as e:
+            # Sent back to the parent process, so keep it picklable
+            errors.append((line, str(e)))
+    return rows, errors
+
+
+class MeterImport:
+    """One CSV import: a reader feeding validation workers feeding batched DB writers"""
+
+    def __init__(self, utility: str, upsert: bool = True, batch_size: int = None,
+                 workers: int = None, writers: int = None, queue_size: int = None):
+        if utility not in IMPORT_MODELS:
+            raise ValueError(f"Unknown utility '{utility}'; expected one of {', '.join(IMPORT_MODELS)}")
+        self.utility = utility
+        self.table = BILLING_UTILITIES[utility][0]
+        self.upsert = upsert
+        self.batch_size = batch_size or IMPORT_CONFIG['batch_size']
+        self.workers = IMPORT_CONFIG['workers'] if workers is None else workers
+        self.writers = writers or IMPORT_CONFIG['writers']
+        self.queue_size = queue_size or IMPORT_CONFIG['queue_size']
+        if self.batch_size < 1 or self.workers < 0:
+            raise ValueError("batch_size must be positive and workers not negative")
+        self.import_id = uuid.uuid4().hex
+        self.report = BulkReport()
+        self.rejected = 0
+        self.periods = set()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def progress(self):
+        """Counters so far; safe to call from another thread while the import runs"""
+        with self._lock:
+            received, inserted = self.report.received, self.report.inserted
+            affected, failed = self.report.affected_rows, self.report.failed
+        elapsed = (self.finished or time.perf_counter()) - self.started if self.started else 0
+        return {
+            "import_id": self.import_id,
+            "utility": self.utility,
+            "mode": "upsert" if self.upsert else "insert",
+            "running": self.finished is None,
+            "received": received,
+            "inserted": inserted,
+            "affected_rows": affected,
+            # failed counts rejected rows plus rows the database refused
+            "failed": failed,
+            "rejected": self.rejected,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(received / elapsed, 1) if elapsed else None,
+        }
+
+    def _reject(self, errors):
+        with self._lock:
+            for line, error in errors:
+                self.report.add_error(line, error)
+            self.rejected += len(errors)
+
+    def _write(self, batches, failures):
+        """Writer thread: take validated batches off the queue until the sentinel"""
+        while True:
+            rows = batches.get()
+            if rows is None:
+                return
+            if failures:
+                continue
+            report = BulkReport()
+            try:
+                # Listeners would refresh a rollup month per batch; touched months are refreshed once at the end
+                insert_chunk(self.table, rows, report, self.upsert, propagate=False)
+            except Exception as e:
+                failures.append(e)
+                continue
+            with self._lock:
+                self.report.inserted += report.inserted
+                self.report.affected_rows += report.affected_rows
+                self.report.failed += report.failed
+                room = self.report.max_errors - len(self.report.errors)
+                self.report.errors.extend(report.errors[:max(room, 0)])
+                self.periods.update((row['usage_month'], row['usage_month_number']) for _, row in rows)
+
+    def _records(self, chunks):
+        reader = csv.reader(iter_lines(chunks))
+        header = next(reader, None)
+        if header is None:
+            raise ValueError("The file is empty")
+        header = [name.strip().lower() for name in header]
+        fields = IMPORT_MODELS[self.utility].model_fields
+        missing = [name for name, field in fields.items() if field.is_required() and name not in header]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        # Lines are numbered as in the file, header included
+        records = ((reader.line_num, values) for values in reader if any(values))
+        return header, records
+
+    def run(self, chunks):
+        """Import an iterable of byte chunks; returns the final report"""
+        self.started = time.perf_counter()
+        active_imports[self.import_id] = self
+        try:
+            header, records = self._records(chunks)
+            self._pipeline(header, records)
+        finally:
+            self.finished = time.perf_counter()
+            active_imports.pop(self.import_id, None)
+        refreshed = self._refresh_rollup()
+        report = self.progress()
+        with self._lock:
+            report['errors'] = list(self.report.errors)
+            report['errors_truncated'] = self.report.failed > len(self.report.errors)
+        report['rollup_months_refreshed'] = refreshed
+        logger.info("Meter import %s into %s: %d rows, %d written, %d failed in %.3fs",
+                    self.import_id, self.table, report['received'], report['inserted'], report['failed'],
+                    report['elapsed_seconds'])
+        return report
+
+    def _pipeline(self, header, records):
+        batches = queue.Queue(maxsize=self.queue_size)
+        failures = []
+        writers = [threading.Thread(target=self._write, args=(batches, failures), daemon=True)
+                   for _ in range(self.writers)]
+        for writer in writers:
+            writer.start()
+        # Spawned rather than forked, so workers never inherit the server's threads or DB sockets
+        pool = (ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                if self.workers else None)
+        pending = deque()
+        last_log = time.perf_counter()
+
+        def collect(result):
+            rows, errors = result
+            self._reject(errors)
+            if rows:
+                # Blocks while the writers are behind, which in turn stops reading
+                batches.put(rows)
+
+        try:
+            while not failures:
+                batch = list(itertools.islice(records, self.batch_size))
+                if not batch:
+                    break
+                with self._lock:
+                    self.report.received += len(batch)
+                if pool is None:
+                    collect(_validate_batch(self.utility, header, batch))
+                else:
+                    pending.append(pool.submit(_validate_batch, self.utility, header, batch))
+                    # Keep every worker busy without letting parsed batches pile up
+                    while len(pending) > self.workers * 2:
+                        collect(pending.popleft().result())
+                if time.perf_counter() - last_log >= IMPORT_CONFIG['progress_interval']:
+                    last_log = time.perf_counter()
+                    progress = self.progress()
+                    logger.info("Meter import %s: %d rows read, %d written, %d rejected, %s rows/s",
+                                self.import_id, progress['received'], progress['inserted'],
+                                progress['failed'], progress['rows_per_second'])
+            while pending and not failures:
+                collect(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+            if pool is not None:
+                pool.shutdown(wait=True)
+            for _ in writers:
+                batches.put(None)
+            for writer in writers:
+                writer.join()
+        if failures:
+            raise failures[0]
+
+    def _refresh_rollup(self):
+        if not ROLLUP_CONFIG['inline'] or not self.periods:
+            return 0
+        try:
+            return refresh_months(self.utility, self.periods)
+        except Exception as e:
+            # The rows are in; a later rollup rebuild catches the cube up
+            logger.warning("Rollup refresh after meter import %s failed: %s", self.import_id, e)
+            return 0
+
+
+def run_meter_import(utility: str, chunks, upsert: bool = True, workers: int = None):
+    """Stream one CSV file (as byte chunks) into a usage table; returns the report dict"""
+    return MeterImport(utility, upsert=upsert, workers=workers).run(chunks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a CSV file of meter readings")
+    parser.add_argument('utility', choices=sorted(IMPORT_MODELS))
+    parser.add_argument('path', help="CSV file with a header row naming the usage columns")
+    parser.add_argument('--insert', action='store_true',
+                        help="plain inserts; by default readings are upserted by account and month")
+    parser.add_argument('--workers', type=int, default=None, help="validation processes (0 validates inline)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = run_meter_import(args.utility, iter_file(args.path), not args.insert, args.workers)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
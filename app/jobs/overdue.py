@@ -0,0 +1,147 @@
+"""
+Overdue sweeper: move bills that are past their due date and not fully paid to Overdue
+
+Usage:
+    python -m app.jobs.overdue [--as-of YYYY-MM-DD] [--chunk-size N]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import date
+from fastapi.concurrency import run_in_threadpool
+from app.config import OVERDUE_CONFIG
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+OVERDUE_TABLES = ('electricity_bills', 'water_bills')
+# Statuses that still owe money; Paid bills are never swept
+SWEPT_STATUSES = ('Unpaid', 'Partially Paid')
+
+
+def _bounds(table: str, as_of: date):
+    """Lowest and highest bill_id still due, found through the (status, due_date) index"""
+    query = f"""
+        SELECT MIN(bill_id) AS low, MAX(bill_id) AS high FROM {table}
+        WHERE status IN (%s, %s) AND due_date < %s
+    """
+    row = db.execute_one(query, (*SWEPT_STATUSES, as_of))
+    return (row['low'], row['high']) if row and row['low'] is not None else (None, None)
+
+
+def sweep_table(table: str, as_of: date, chunk_size: int):
+    """Walk one bill table in primary-key windows, one short transaction per window.
+
+    Each transaction locks at most chunk_size ids worth of rows, so payments
+    landing on other bills never wait behind the sweep for long. The status
+    and due date are re-checked under the lock, so a bill paid since the
+    bounds were read is left alone.
+
+    The change listeners are not notified: Unpaid or Partially Paid to
+    Overdue changes no amount, so reconciliation, the consumption rollup
+    (which never reads status) and the ledger's billed and open_bills
+    counts are all unaffected, and a per-chunk notify would only make them
+    redo derived-table work for every window of a large sweep.
+    """
+    started = time.perf_counter()
+    chunks = updated = 0
+    low, high = _bounds(table, as_of)
+    select = f"""
+        SELECT bill_id, account_id FROM {table}
+        WHERE bill_id >= %s AND bill_id < %s AND status IN (%s, %s) AND due_date < %s
+        FOR UPDATE
+    """
+    if low is not None:
+        for start in range(low, high + 1, chunk_size):
+            with db.transaction() as cursor:
+                cursor.execute(select, (start, start + chunk_size, *SWEPT_STATUSES, as_of))
+                rows = cursor.fetchall()
+                if rows:
+                    placeholders = ', '.join(['%s'] * len(rows))
+                    cursor.execute(f"UPDATE {table} SET status = 'Overdue' WHERE bill_id IN ({placeholders})",
+                                   tuple(row['bill_id'] for row in rows))
+            chunks += 1
+            updated += len(rows)
+    elapsed = time.perf_counter() - started
+    return {
+        "chunks": chunks,
+        "rows_updated": updated,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(updated / elapsed, 1) if elapsed else None,
+    }
+
+
+def run_overdue_sweep(as_of: date = None, chunk_size: int = None):
+    """Sweep every bill table; bills due before as_of (default today) become Overdue"""
+    as_of = as_of or date.today()
+    chunk_size = chunk_size or OVERDUE_CONFIG['chunk_size']
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    started = time.perf_counter()
+    tables = {table: sweep_table(table, as_of, chunk_size) for table in OVERDUE_TABLES}
+    elapsed = time.perf_counter() - started
+    updated = sum(report['rows_updated'] for report in tables.values())
+    logger.info("Overdue sweep as of %s: %d bills in %.3fs", as_of, updated, elapsed)
+    return {
+        "as_of": as_of.isoformat(),
+        "chunk_size": chunk_size,
+        "rows_updated": updated,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(updated / elapsed, 1) if elapsed else None,
+        "tables": tables,
+    }
+
+
+class OverdueSweeper:
+    """Runs the sweep on a fixed interval in the background"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last_report = None
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.last_report = await run_in_threadpool(run_overdue_sweep)
+            except Exception as e:
+                logger.warning("Overdue sweep failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start the sweep loop on the running event loop; a zero interval disables it"""
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global scheduled sweeper, started with the API
+overdue_sweeper = OverdueSweeper(OVERDUE_CONFIG['interval_seconds'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mark bills past their due date as Overdue")
+    parser.add_argument('--as-of', type=date.fromisoformat, default=None,
+                        help="sweep bills due before this date (default: today)")
+    parser.add_argument('--chunk-size', type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = run_overdue_sweep(args.as_of, args.chunk_size)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Partition maintenance for the yearly RANGE-partitioned usage, bill and payment tables
+
+Keeps a partition ready for each of the next few years and moves years past
+the retention window out of the live tables, either into per-year archive
+tables or straight to a DROP.
+
+Usage:
+    python -m app.jobs.partitions [--future-years N] [--retain-years N] [--drop] [--dry-run]
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import date
+from app.config import PARTITION_CONFIG
+from app.database import db
+from app.query_cache import query_cache
+
+logger = logging.getLogger(__name__)
+
+# table -> partitioning expression (see sql/SQL_Commands.sql)
+PARTITIONED_TABLES = {
+    'electricity_usage': 'usage_month',
+    'water_usage': 'usage_month',
+    'electricity_bills': 'bill_year',
+    'water_bills': 'bill_year',
+    'payments': 'YEAR(payment_date)',
+}
+# Catch-all partition for rows past the last yearly one
+FUTURE_PARTITION = 'pfuture'
+
+
+def table_partitions(table: str):
+    """Partitions of a table in order, with their exclusive upper bound (None for MAXVALUE)"""
+    # Read on a cursor rather than through execute_query: the query cache knows nothing of DDL
+    with db.transaction() as cursor:
+        cursor.execute("""
+            SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound, TABLE_ROWS AS row_estimate
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (table,))
+        rows = cursor.fetchall()
+    return [
+        {"name": row['name'], "bound": None if row['bound'] == 'MAXVALUE' else int(row['bound']),
+         "row_estimate": row['row_estimate']}
+        for row in rows
+    ]
+
+
+def archive_tables(table: str):
+    """Existing <table>_<year> archive tables, with whether each is still partitioned and whether it is empty"""
+    with db.transaction() as cursor:
+        cursor.execute("""
+            SELECT TABLE_NAME AS name, CREATE_OPTIONS AS options
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME REGEXP %s
+        """, (f"^{table}_[0-9]{{4}}$",))
+        rows = cursor.fetchall()
+        archives = {}
+        for row in rows:
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {row['name']}) AS has_rows")
+            archives[row['name']] = {"partitioned": 'partitioned' in (row['options'] or ''),
+                                     "empty": not cursor.fetchone()['has_rows']}
+    return archives
+
+
+def _yearly(years):
+    return ', '.join(f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in years)
+
+
+def plan_table(table: str, partitions, this_year: int, future_years: int, retain_years: int, archive: bool,
+               archives=None):
+    """DDL statements that bring one table's partitions in line with the policy.
+
+    Partition p<year> holds rows of that year (the first one also holds
+    anything older). Missing years up to this_year + future_years are split
+    out of the catch-all partition, which is normally empty, so this is
+    cheap. With retain_years, partitions wholly before the retained years
+    are exchanged into an empty <table>_<year> table and then dropped, which
+    moves the rows without copying them. archives (see archive_tables) lets
+    a rerun finish a year an earlier run left half archived.
+    """
+    statements = []
+    bounded = [partition for partition in partitions if partition['bound'] is not None]
+    has_future = any(partition['bound'] is None for partition in partitions)
+
+    if retain_years:
+        cutoff = this_year - retain_years + 1
+        # The newest yearly partition always stays, so the table keeps a valid range layout
+        for partition in bounded[:-1]:
+            if partition['bound'] > cutoff:
+                break
+            name = partition['name']
+            if archive:
+                archive_table = f"{table}_{partition['bound'] - 1}"
+                existing = (archives or {}).get(archive_table)
+                if existing is None:
+                    statements.append(f"CREATE TABLE IF NOT EXISTS {archive_table} LIKE {table}")
+                if existing is None or existing['partitioned']:
+                    statements.append(f"ALTER TABLE {archive_table} REMOVE PARTITIONING")
+                if existing is None or existing['empty']:
+                    statements.append(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive_table}")
+                else:
+                    # Already exchanged by a run that stopped before the drop: exchanging again would swap
+                    # the archived rows back, so only copy over rows written to the partition since
+                    statements.append(f"INSERT IGNORE INTO {archive_table} SELECT * FROM {table} PARTITION ({name})")
+            statements.append(f"ALTER TABLE {table} DROP PARTITION {name}")
+
+    first_missing = bounded[-1]['bound'] if bounded else this_year
+    years = list(range(first_missing, this_year + future_years + 1))
+    if years:
+        if has_future:
+            statements.append(f"ALTER TABLE {table} REORGANIZE PARTITION {FUTURE_PARTITION} INTO "
+                              f"({_yearly(years)}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE)")
+        else:
+            statements.append(f"ALTER TABLE {table} ADD PARTITION ({_yearly(years)})")
+    return statements
+
+
+def maintain_partitions(future_years: int = None, retain_years: int = None, archive: bool = None,
+                        dry_run: bool = False, this_year: int = None):
+    """Add upcoming yearly partitions and retire old ones on every partitioned table"""
+    future_years = PARTITION_CONFIG['future_years'] if future_years is None else future_years
+    retain_years = PARTITION_CONFIG['retain_years'] if retain_years is None else retain_years
+    archive = PARTITION_CONFIG['archive'] if archive is None else archive
+    if future_years < 0 or retain_years < 0:
+        raise ValueError("future_years and retain_years must not be negative")
+    this_year = this_year or date.today().year
+    started = time.perf_counter()
+    tables = {}
+    for table in PARTITIONED_TABLES:
+        partitions = table_partitions(table)
+        if not partitions:
+            tables[table] = {"partitioned": False, "statements": []}
+            logger.warning("%s is not partitioned; see note 6 in sql/SQL_Commands.sql", table)
+            continue
+        archives = archive_tables(table) if archive and retain_years else None
+        statements = plan_table(table, partitions, this_year, future_years, retain_years, archive, archives)
+        if not dry_run:
+            try:
+                for statement in statements:
+                    db.execute_query(statement, fetch=False)
+            finally:
+                if statements:
+                    query_cache.invalidate({table})
+            partitions = table_partitions(table)
+        tables[table] = {
+            "partitioned": True,
+            "statements": statements,
+            "partitions": [partition['name'] for partition in partitions],
+        }
+    elapsed = time.perf_counter() - started
+    changed = sum(len(report['statements']) for report in tables.values())
+    logger.info("Partition maintenance%s: %d statements in %.3fs", " (dry run)" if dry_run else "", changed, elapsed)
+    return {
+        "this_year": this_year,
+        "future_years": future_years,
+        "retain_years": retain_years,
+        "archive": archive,
+        "dry_run": dry_run,
+        "elapsed_seconds": round(elapsed, 3),
+        "tables": tables,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add upcoming yearly partitions and archive or drop old ones")
+    parser.add_argument('--future-years', type=int, default=None, help="years to keep partitions ready for")
+    parser.add_argument('--retain-years', type=int, default=None,
+                        help="years kept in the live tables, this one included (0 keeps everything)")
+    parser.add_argument('--drop', action='store_true', help="drop retired years instead of archiving them")
+    parser.add_argument('--dry-run', action='store_true', help="print the DDL without running it")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = maintain_partitions(args.future_years, args.retain_years, False if args.drop else None,
+                                     args.dry_run)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
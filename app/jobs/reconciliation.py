@@ -0,0 +1,204 @@
+"""
+Payment reconciliation: keep bill statuses in line with the payments recorded against them
+
+Usage:
+    python -m app.jobs.reconciliation [--full] [--batch-size N]
+"""
+import argparse
+import json
+import logging
+import time
+from app.config import LEDGER_CONFIG, RECONCILIATION_CONFIG
+from app.database import db
+from app.hooks import on_change
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'payment_reconciliation'
+# payments.bill_type -> bill table
+BILL_TABLES = {'Electricity': 'electricity_bills', 'Water': 'water_bills'}
+
+
+def _status_update(table: str, touched_bills: str):
+    """Set-based status refresh for every bill selected by touched_bills.
+
+    Totals are taken over all payments of each touched bill, not only the
+    new ones, so replaying a batch is harmless. Bills past their due date
+    are Overdue until they are paid in full, as the overdue sweep has it.
+    """
+    return f"""
+        UPDATE {table} b
+        JOIN (
+            SELECT bill_id, SUM(amount_paid) AS paid
+            FROM payments
+            WHERE bill_type = %s AND bill_id IN ({touched_bills})
+            GROUP BY bill_id
+        ) s ON s.bill_id = b.bill_id
+        SET b.status = CASE
+            WHEN s.paid >= b.amount THEN 'Paid'
+            WHEN b.status = 'Overdue' OR b.due_date < CURDATE() THEN 'Overdue'
+            WHEN s.paid > 0 THEN 'Partially Paid'
+            ELSE 'Unpaid'
+        END
+    """
+
+
+def _unpaid_reset(table: str, placeholders: str):
+    """Bills whose last payment was deleted or moved go back to Unpaid, or Overdue once past due"""
+    return f"""
+        UPDATE {table} b SET b.status = IF(b.due_date < CURDATE(), 'Overdue', 'Unpaid')
+        WHERE b.bill_id IN ({placeholders}) AND b.status IN ('Paid', 'Partially Paid')
+          AND NOT EXISTS (SELECT 1 FROM payments p WHERE p.bill_type = %s AND p.bill_id = b.bill_id)
+    """
+
+
+def reconcile_bills(bill_keys, reset: bool = True):
+    """Refresh the status of specific bills given as (bill_type, bill_id) pairs, a batch per transaction.
+
+    reset=False leaves bills without any payments alone instead of moving
+    Paid ones back to Unpaid.
+    """
+    by_type = {}
+    for bill_type, bill_id in bill_keys:
+        if bill_type in BILL_TABLES and bill_id is not None:
+            by_type.setdefault(bill_type, set()).add(int(bill_id))
+    changed = 0
+    batch_size = RECONCILIATION_CONFIG['batch_size']
+    for bill_type, bill_ids in by_type.items():
+        table = BILL_TABLES[bill_type]
+        ids = sorted(bill_ids)
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            with db.transaction() as cursor:
+                cursor.execute(_status_update(table, placeholders), (bill_type, *batch))
+                changed += cursor.rowcount
+                if reset:
+                    cursor.execute(_unpaid_reset(table, placeholders), (*batch, bill_type))
+                    changed += cursor.rowcount
+    return changed
+
+
+def payment_bill_keys(rows):
+    """(bill_type, bill_id) of changed payments, looking up any the change did not carry"""
+    keys = set()
+    missing = []
+    for row in rows:
+        if row.get('bill_type') is not None and row.get('bill_id') is not None:
+            keys.add((row['bill_type'], row['bill_id']))
+        elif row.get('payment_id') is not None:
+            missing.append(row['payment_id'])
+    if missing:
+        placeholders = ', '.join(['%s'] * len(missing))
+        query = f"SELECT bill_type, bill_id FROM payments WHERE payment_id IN ({placeholders})"
+        keys.update((row['bill_type'], row['bill_id']) for row in db.execute_query(query, tuple(missing)))
+    return keys
+
+
+@on_change('payments', blocking=True)
+def _reconcile_changed_payments(table, action, rows):
+    if RECONCILIATION_CONFIG['inline']:
+        reconcile_bills(payment_bill_keys(rows))
+
+
+# Registered ahead of the balances listener on the same tables, so open_bills sees the new status
+@on_change(*BILL_TABLES.values(), blocking=True)
+def _reconcile_changed_bills(table, action, rows):
+    # A new amount can tip a paid bill back to partially paid or the other way round; writes that
+    # leave the amount alone (a status change, say) carry no amount and are skipped
+    if not RECONCILIATION_CONFIG['inline'] or action not in ('update', 'upsert'):
+        return
+    bill_type = next(name for name, bill_table in BILL_TABLES.items() if bill_table == table)
+    # Bills without payments keep whatever status they were given by hand
+    reconcile_bills({(bill_type, row['bill_id']) for row in rows
+                     if 'amount' in row and row.get('bill_id') is not None}, reset=False)
+
+
+def run_reconciliation(full: bool = False, batch_size: int = None, max_batches: int = None):
+    """Catch up on payments past the high-water mark, one short transaction per batch.
+
+    Only payments older than RECONCILE_LAG_SECONDS are scanned. An id is
+    taken when the insert starts but becomes visible at commit, so the
+    newest ids may still have uncommitted lower ones below them; moving
+    the mark past those would skip them for good.
+
+    With the ledger kept inline, the accounts owning each batch's bills are
+    refreshed after the batch commits, as bulk.catch_up does: their paid
+    totals and open_bills counts follow the statuses set here.
+    """
+    # balances reads BILL_TABLES and payment_bill_keys from this module
+    from app.jobs.balances import refresh_accounts
+    batch_size = batch_size or RECONCILIATION_CONFIG['batch_size']
+    lag = RECONCILIATION_CONFIG['lag_seconds']
+    started = time.perf_counter()
+    db.execute_query("INSERT IGNORE INTO job_watermarks (job_name, last_id) VALUES (%s, 0)", (JOB_NAME,), fetch=False)
+    if full:
+        db.execute_query("UPDATE job_watermarks SET last_id = 0 WHERE job_name = %s", (JOB_NAME,), fetch=False)
+
+    batches = payments = changed = refreshed = 0
+    watermark = None
+    while max_batches is None or batches < max_batches:
+        with db.transaction() as cursor:
+            # The row lock also keeps two catch-up runs from interleaving
+            cursor.execute("SELECT last_id FROM job_watermarks WHERE job_name = %s FOR UPDATE", (JOB_NAME,))
+            low = cursor.fetchone()['last_id']
+            cursor.execute("""
+                SELECT MAX(payment_id) AS high, COUNT(*) AS payments
+                FROM (
+                    SELECT payment_id FROM payments
+                    WHERE payment_id > %s AND created_at < NOW() - INTERVAL %s SECOND
+                    ORDER BY payment_id LIMIT %s
+                ) batch
+            """, (low, lag, batch_size))
+            window = cursor.fetchone()
+            watermark = low
+            if not window['payments']:
+                break
+            high = window['high']
+            touched = "SELECT bill_id FROM payments WHERE bill_type = %s AND payment_id > %s AND payment_id <= %s"
+            accounts = set()
+            for bill_type, table in BILL_TABLES.items():
+                cursor.execute(_status_update(table, touched), (bill_type, bill_type, low, high))
+                changed += cursor.rowcount
+                if LEDGER_CONFIG['inline']:
+                    cursor.execute(f"SELECT DISTINCT account_id FROM {table} WHERE bill_id IN ({touched})",
+                                   (bill_type, low, high))
+                    accounts.update(row['account_id'] for row in cursor.fetchall())
+            cursor.execute("UPDATE job_watermarks SET last_id = %s WHERE job_name = %s", (high, JOB_NAME))
+        watermark = high
+        if accounts:
+            try:
+                refreshed += refresh_accounts(accounts)
+            except Exception as e:
+                # The statuses are in; the balances rebuild job catches the ledger up
+                logger.warning("Refreshing balances after reconciling payments %d-%d failed: %s", low + 1, high, e)
+        batches += 1
+        payments += window['payments']
+
+    elapsed = time.perf_counter() - started
+    return {
+        "batches": batches,
+        "payments_scanned": payments,
+        "bills_changed": changed,
+        "accounts_refreshed": refreshed,
+        "watermark": watermark,
+        "elapsed_seconds": round(elapsed, 3),
+        "payments_per_second": round(payments / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile bill statuses with recorded payments")
+    parser.add_argument('--full', action='store_true', help="reset the high-water mark and rescan every payment")
+    parser.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = run_reconciliation(args.full, args.batch_size)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Consumption rollup: usage and billing totals per (utility, year, month, city, area) in consumption_rollup
+
+Usage:
+    python -m app.jobs.rollup [--utility electricity] [--year 2025]
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import pymysql
+from app.config import ROLLUP_CONFIG
+from app.database import db
+from app.hooks import on_change
+from app.jobs.billing import BILLING_UTILITIES
+
+logger = logging.getLogger(__name__)
+
+# table -> (utility, year column, month column, key column)
+_SOURCES = {
+    **{usage_table: (utility, 'usage_month', 'usage_month_number', 'usage_id')
+       for utility, (usage_table, _, _, _) in BILLING_UTILITIES.items()},
+    **{bill_table: (utility, 'bill_year', 'bill_month', 'bill_id')
+       for utility, (_, _, bill_table, _) in BILLING_UTILITIES.items()},
+}
+# Cell refreshes delete and re-insert, so two refreshes of one utility-month would deadlock on its
+# gap locks; each month gets its own lock and different months refresh in parallel
+_month_locks = {}
+_month_locks_guard = threading.Lock()
+# MySQL's deadlock error; a refresh can still collide with one of a neighbouring month at the range edge
+_DEADLOCK = 1213
+_DEADLOCK_RETRIES = 3
+
+# Accounts without an address roll up under an empty city and area
+_PLACE = "COALESCE(ad.city, '') AS city, COALESCE(ad.area, '') AS area"
+_ACCOUNT_PLACE = """
+    JOIN utility_accounts ua ON ua.account_id = src.account_id
+    JOIN citizens c ON c.citizen_id = ua.citizen_id
+    LEFT JOIN addresses ad ON ad.address_id = c.address_id
+"""
+
+
+def _place_filter(places):
+    """WHERE fragment matching addresses in any of the given (city, area) cells.
+
+    Named places compare with plain equality so the (city, area) index can
+    drive the join; the empty cell also has to catch NULLs and missing
+    addresses.
+    """
+    clauses = []
+    params = []
+    for city, area in sorted(places):
+        parts = []
+        for column, value in (('ad.city', city), ('ad.area', area)):
+            if value:
+                parts.append(f"{column} = %s")
+                params.append(value)
+            else:
+                parts.append(f"({column} IS NULL OR {column} = '')")
+        clauses.append(f"({' AND '.join(parts)})")
+    return f"({' OR '.join(clauses)})", params
+
+
+def refresh_cells(utility: str, year: int, month: int, places=None):
+    """Recompute the cells of one utility-month, either all of them or only the given places"""
+    usage_table, usage_column, bill_table, _ = BILLING_UTILITIES[utility]
+    if places is None:
+        source_filter, source_params = "1 = 1", []
+        cell_filter, cell_params = "1 = 1", []
+    else:
+        places = {(city or '', area or '') for city, area in places}
+        if not places:
+            return
+        source_filter, source_params = _place_filter(places)
+        cell_filter = f"(city, area) IN ({', '.join(['(%s, %s)'] * len(places))})"
+        cell_params = [value for place in sorted(places) for value in place]
+
+    with db.transaction() as cursor:
+        cursor.execute(f"""
+            DELETE FROM consumption_rollup
+            WHERE utility = %s AND period_year = %s AND period_month = %s AND {cell_filter}
+        """, (utility, year, month, *cell_params))
+        cursor.execute(f"""
+            INSERT INTO consumption_rollup (utility, period_year, period_month, city, area,
+                                            accounts, readings, consumed)
+            SELECT %s, %s, %s, {_PLACE}, COUNT(DISTINCT src.account_id), COUNT(*), SUM(src.{usage_column})
+            FROM {usage_table} src {_ACCOUNT_PLACE}
+            WHERE src.usage_month = %s AND src.usage_month_number = %s AND {source_filter}
+            GROUP BY COALESCE(ad.city, ''), COALESCE(ad.area, '')
+        """, (utility, year, month, year, month, *source_params))
+        cursor.execute(f"""
+            INSERT INTO consumption_rollup (utility, period_year, period_month, city, area, bills, billed)
+            SELECT %s, %s, %s, {_PLACE}, COUNT(*), COALESCE(SUM(src.amount), 0)
+            FROM {bill_table} src {_ACCOUNT_PLACE}
+            WHERE src.bill_year = %s AND src.bill_month = %s AND {source_filter}
+            GROUP BY COALESCE(ad.city, ''), COALESCE(ad.area, '')
+            ON DUPLICATE KEY UPDATE bills = VALUES(bills), billed = VALUES(billed)
+        """, (utility, year, month, year, month, *source_params))
+
+
+def _month_lock(utility: str, year: int, month: int):
+    # A handful of locks per utility and year; they are never dropped
+    with _month_locks_guard:
+        return _month_locks.setdefault((utility, int(year), int(month)), threading.Lock())
+
+
+def _refresh_month(utility: str, year: int, month: int, places=None):
+    """refresh_cells under the month's lock; the refresh is idempotent, so a deadlock victim just reruns"""
+    with _month_lock(utility, year, month):
+        for attempt in range(_DEADLOCK_RETRIES):
+            try:
+                refresh_cells(utility, year, month, places)
+                return
+            except pymysql.err.OperationalError as e:
+                if e.args[0] != _DEADLOCK or attempt == _DEADLOCK_RETRIES - 1:
+                    raise
+
+
+def _changed_periods(table: str, rows):
+    """(year, month) -> account ids touched by a write to a usage or bill table"""
+    utility, year_column, month_column, key = _SOURCES[table]
+    periods = {}
+    missing = []
+    for row in rows:
+        if all(row.get(column) is not None for column in ('account_id', year_column, month_column)):
+            periods.setdefault((row[year_column], row[month_column]), set()).add(row['account_id'])
+        elif row.get(key) is not None:
+            missing.append(row[key])
+    if missing:
+        placeholders = ', '.join(['%s'] * len(missing))
+        query = (f"SELECT account_id, {year_column} AS year, {month_column} AS month "
+                 f"FROM {table} WHERE {key} IN ({placeholders})")
+        for row in db.execute_query(query, tuple(missing)):
+            periods.setdefault((row['year'], row['month']), set()).add(row['account_id'])
+    return utility, periods
+
+
+def _account_places(account_ids):
+    """(city, area) cells of the accounts, or None when some were deleted and their cells are unknown"""
+    placeholders = ', '.join(['%s'] * len(account_ids))
+    query = f"""
+        SELECT src.account_id, {_PLACE}
+        FROM utility_accounts src
+        JOIN citizens c ON c.citizen_id = src.citizen_id
+        LEFT JOIN addresses ad ON ad.address_id = c.address_id
+        WHERE src.account_id IN ({placeholders})
+    """
+    rows = db.execute_query(query, tuple(sorted(account_ids)))
+    if len({row['account_id'] for row in rows}) < len(account_ids):
+        return None
+    return {(row['city'], row['area']) for row in rows}
+
+
+@on_change(*_SOURCES, blocking=True)
+def _refresh_changed_cells(table, action, rows):
+    if not ROLLUP_CONFIG['inline']:
+        return
+    utility, periods = _changed_periods(table, rows)
+    for (year, month), account_ids in periods.items():
+        places = _account_places(account_ids)
+        # Past a point, one pass over the whole month is cheaper than a long OR of places
+        if places is not None and len(places) > ROLLUP_CONFIG['max_cells']:
+            places = None
+        _refresh_month(utility, year, month, places)
+
+
+def refresh_months(utility: str, periods):
+    """Recompute whole utility-months, e.g. after a load that skipped the inline refresh"""
+    periods = sorted(set(periods))
+    for year, month in periods:
+        _refresh_month(utility, year, month)
+    return len(periods)
+
+
+def rebuild_rollup(utility: str = None, year: int = None):
+    """Recompute the cube month by month, one short transaction per utility-month"""
+    utilities = [utility] if utility else list(BILLING_UTILITIES)
+    for name in utilities:
+        if name not in BILLING_UTILITIES:
+            raise ValueError(f"Unknown utility '{name}'; expected one of {', '.join(BILLING_UTILITIES)}")
+    started = time.perf_counter()
+    months = 0
+    for name in utilities:
+        usage_table, _, bill_table, _ = BILLING_UTILITIES[name]
+        query = f"""
+            SELECT DISTINCT usage_month AS year, usage_month_number AS month FROM {usage_table}
+            WHERE %s IS NULL OR usage_month = %s
+            UNION
+            SELECT DISTINCT bill_year, bill_month FROM {bill_table}
+            WHERE %s IS NULL OR bill_year = %s
+        """
+        periods = sorted((row['year'], row['month']) for row in db.execute_query(query, (year,) * 4))
+        months += refresh_months(name, periods)
+        # Drop months that no longer have any usage or bills
+        stale = "DELETE FROM consumption_rollup WHERE utility = %s"
+        params = [name]
+        if year is not None:
+            stale += " AND period_year = %s"
+            params.append(year)
+        if periods:
+            stale += f" AND (period_year, period_month) NOT IN ({', '.join(['(%s, %s)'] * len(periods))})"
+            params.extend(value for period in periods for value in period)
+        db.execute_query(stale, tuple(params), fetch=False)
+    elapsed = time.perf_counter() - started
+    logger.info("Rebuilt consumption rollup: %d utility-months in %.3fs", months, elapsed)
+    return {
+        "utilities": utilities,
+        "year": year,
+        "months": months,
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the consumption rollup cube from usage and bills")
+    parser.add_argument('--utility', choices=sorted(BILLING_UTILITIES), default=None)
+    parser.add_argument('--year', type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = rebuild_rollup(args.utility, args.year)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,43 @@
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+import logging
+import time
+from datetime import date, timezone
+from fastapi import FastAPI, HTTPException, Query, Path, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
-from app import crud
+from app.crud import async_operations as async_crud
+from app.async_database import adb
+from app.database import db
+from app.query_cache import query_cache
+from app.query_stats import query_stats
+from app.crud.pagination import InvalidCursorError
+from app.crud.export import EXPORT_TABLES, EXPORT_FORMATS, stream_export
+from app.crud import bulk
+from app.config import BULK_CONFIG, GEO_CONFIG, METRICS_CONFIG
+from app.metrics import MetricsMiddleware, http_metrics, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.services.stats_snapshot import stats_snapshot
+from app.jobs.billing import run_billing
+from app.jobs.reconciliation import run_reconciliation
+from app.jobs.overdue import overdue_sweeper, run_overdue_sweep
+from app.jobs.balances import rebuild_balances
+from app.jobs.anomalies import ANOMALY_KINDS, run_anomaly_detection
+from app.jobs.rollup import rebuild_rollup
+from app.jobs.meter_import import active_imports, run_meter_import
+from app.jobs.partitions import PARTITIONED_TABLES, maintain_partitions, table_partitions
+from app.services.citizen_search import citizen_index, load_citizen_index
+from app.services.transit_graph import PATH_MODES, transit_graph, load_transit_graph
+from app.services.bus_positions import MAX_CLOCK_SKEW, fleet_positions, load_fleet_positions
+from app.services.events import EVENT_TOPICS, Subscriber, event_hub
+from app.services.dispatch import claim_next, dispatch_queue, load_dispatch_queue
+from app.services.geocoding import gazetteer
+from app.services.spatial_index import incident_map, load_incident_map
 from app.models import *
 from typing import Union
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Smart City Management System API",
     description="REST API for managing smart city services",
@@ -20,33 +53,195 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics; added last so it wraps CORS and times the whole request
+if METRICS_CONFIG['enabled']:
+    app.add_middleware(MetricsMiddleware, metrics=http_metrics)
+
+@app.on_event("startup")
+async def startup():
+    """Open the async connection pool used by the API routes"""
+    try:
+        await adb.connect()
+    except Exception as e:
+        logger.warning("Could not open async database pool: %s", e)
+    stats_snapshot.start()
+    overdue_sweeper.start()
+    event_hub.bind()
+    # Built off the event loop; name searches fall back to SQL until it is ready
+    asyncio.get_running_loop().run_in_executor(None, load_citizen_index)
+    asyncio.get_running_loop().run_in_executor(None, load_transit_graph)
+    asyncio.get_running_loop().run_in_executor(None, load_fleet_positions)
+    asyncio.get_running_loop().run_in_executor(None, load_dispatch_queue)
+    asyncio.get_running_loop().run_in_executor(None, load_incident_map)
+    fleet_positions.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop background tasks and close pooled database connections"""
+    await stats_snapshot.stop()
+    await overdue_sweeper.stop()
+    await fleet_positions.stop()
+    await adb.close()
+    db.close()
+
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursorError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+CURSOR_DESCRIPTION = ("Opaque keyset pagination cursor. Pass an empty value to get the first page, "
+                      "then the next_cursor from each response; skip is ignored in this mode")
+
+def wants_representation(
+    return_mode: str = Query("representation", alias="return", pattern="^(representation|minimal)$",
+                             description="Use 'minimal' to skip echoing the written row back")
+) -> bool:
+    """Whether a write route should return the full row"""
+    return return_mode == "representation"
+
+async def bulk_ingest(request: Request, table: str, model, upsert: bool = False):
+    """Validate a JSON array or NDJSON body and insert (or upsert) it in chunked transactions"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        records = bulk.iter_ndjson(request.stream())
+    else:
+        try:
+            records = bulk.iter_json_array(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    report = bulk.BulkReport()
+    chunk = []
+    async for index, record in records:
+        row = bulk.validate_record(index, record, model, report)
+        if row is not None:
+            chunk.append((index, row))
+        if len(chunk) >= BULK_CONFIG['chunk_size']:
+            await run_in_threadpool(bulk.insert_chunk, table, chunk, report, upsert, False)
+            chunk = []
+    await run_in_threadpool(bulk.insert_chunk, table, chunk, report, upsert, False)
+    # Derived tables are refreshed once for the whole body rather than per chunk
+    await run_in_threadpool(bulk.catch_up, table, report)
+    return report.as_dict()
+
+def ping_row(ping: dict, received_at: float):
+    """(bus_id, epoch, lat, lon, speed, heading) tuple for the position store"""
+    recorded_at = ping.get('recorded_at')
+    if recorded_at is None:
+        recorded_at = received_at
+    else:
+        # Naive timestamps are taken as UTC
+        recorded_at = (recorded_at if recorded_at.tzinfo else recorded_at.replace(tzinfo=timezone.utc)).timestamp()
+        if recorded_at > received_at + MAX_CLOCK_SKEW:
+            raise ValueError("recorded_at is in the future")
+    return (ping['bus_id'], recorded_at, ping['latitude'], ping['longitude'],
+            ping.get('speed_kmh', float('nan')), ping.get('heading', float('nan')))
+
+def search_point(
+    latitude: Optional[float] = Query(None, alias="lat", ge=-90, le=90),
+    longitude: Optional[float] = Query(None, alias="lon", ge=-180, le=180),
+    location: Optional[str] = Query(None, min_length=1, description="Place to search around instead of lat/lon")
+):
+    """Centre of a spatial search: lat/lon, or a location geocoded against the gazetteer"""
+    if latitude is not None and longitude is not None:
+        return latitude, longitude
+    if location is None:
+        raise HTTPException(status_code=400, detail="Pass lat and lon, or location")
+    point = gazetteer.geocode(location)
+    if point is None:
+        raise HTTPException(status_code=404, detail=f"Unknown location: {location}")
+    return point['latitude'], point['longitude']
+
+def spatial_results(matches):
+    """Index matches as response rows with coordinates and distance"""
+    if not incident_map.ready:
+        raise HTTPException(status_code=503, detail="Spatial index is still loading")
+    return [
+        {**payload, "latitude": latitude, "longitude": longitude, "distance_km": round(distance, 3)}
+        for distance, _, latitude, longitude, payload in matches
+    ]
+
+def complaint_filter(status: Optional[str], category: Optional[str]):
+    """Payload filter for complaint spatial queries, or None when nothing is filtered"""
+    if not status and not category:
+        return None
+    return lambda complaint: ((not status or complaint['status'] == status)
+                              and (not category or complaint['category'] == category))
+
+async def csv_import(request: Request, utility: str, mode: str):
+    """Stream a CSV body through the meter import pipeline, reading it only as fast as rows are written"""
+    loop = asyncio.get_running_loop()
+    body = request.stream()
+
+    async def next_chunk():
+        try:
+            return await body.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def chunks():
+        # Runs in the import's thread; each chunk is pulled from the event loop on demand
+        while True:
+            chunk = asyncio.run_coroutine_threadsafe(next_chunk(), loop).result()
+            if chunk is None:
+                return
+            yield chunk
+
+    try:
+        return await run_in_threadpool(run_meter_import, utility, chunks(), mode == "upsert")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+YEAR_FILTER = Query(None, description="Only this year; reads a single partition of the table")
+
+IMPORT_MODE = Query("upsert", pattern="^(insert|upsert)$",
+                    description="upsert replaces readings with the same account and month; insert rejects them")
+
 # ==================== ADDRESSES ROUTES ====================
 @app.post("/addresses", response_model=dict, tags=["Addresses"])
-def create_address(address: AddressCreate):
+async def create_address(address: AddressCreate, returning: bool = Depends(wants_representation)):
     """Create a new address"""
     try:
-        return crud.create_address(address.dict(exclude_none=True))
+        return await async_crud.create_address(address.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/addresses", response_model=List[dict], tags=["Addresses"])
-def read_addresses(skip: int = 0, limit: int = 100):
+@app.get("/addresses", response_model=Union[List[dict], Page], tags=["Addresses"])
+async def read_addresses(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all addresses"""
-    return crud.get_all_addresses(skip, limit)
+    return await async_crud.get_all_addresses(skip, limit, cursor)
+
+@app.get("/geocode", response_model=dict, tags=["Addresses"])
+async def geocode_location(q: str = Query(..., min_length=1, description="Free-text location, e.g. 'MG Road, Pune'")):
+    """Resolve a location string to coordinates using the local gazetteer"""
+    point = gazetteer.geocode(q)
+    if point is None:
+        raise HTTPException(status_code=404, detail=f"Unknown location: {q}")
+    return {"query": q, **point}
+
+@app.get("/addresses/{address_id}/geocode", response_model=dict, tags=["Addresses"])
+async def geocode_address(address_id: int):
+    """Resolve an address to coordinates using the local gazetteer"""
+    address = await async_crud.get_address(address_id)
+    if address is None:
+        raise HTTPException(status_code=404, detail="Address not found")
+    point = gazetteer.geocode_address(address)
+    if point is None:
+        raise HTTPException(status_code=404, detail="Address could not be geocoded")
+    return {"address_id": address_id, **point}
 
 @app.get("/addresses/{address_id}", response_model=dict, tags=["Addresses"])
-def read_address(address_id: int):
+async def read_address(address_id: int):
     """Get address by ID"""
-    address = crud.get_address(address_id)
+    address = await async_crud.get_address(address_id)
     if address is None:
         raise HTTPException(status_code=404, detail="Address not found")
     return address
 
 @app.put("/addresses/{address_id}", response_model=dict, tags=["Addresses"])
-def update_address(address_id: int, address: AddressUpdate):
+async def update_address(address_id: int, address: AddressUpdate, returning: bool = Depends(wants_representation)):
     """Update an address"""
     try:
-        result = crud.update_address(address_id, address.dict(exclude_none=True))
+        result = await async_crud.update_address(address_id, address.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Address not found")
         return result
@@ -54,19 +249,19 @@ def update_address(address_id: int, address: AddressUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/addresses/{address_id}", tags=["Addresses"])
-def delete_address(address_id: int):
+async def delete_address(address_id: int):
     """Delete an address"""
     try:
-        return crud.delete_address(address_id)
+        return await async_crud.delete_address(address_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== CITIZENS ROUTES ====================
 @app.post("/citizens", response_model=dict, tags=["Citizens"])
-def create_citizen(citizen: CitizenCreate):
+async def create_citizen(citizen: CitizenCreate, returning: bool = Depends(wants_representation)):
     """Create a new citizen"""
     try:
-        return crud.create_citizen(citizen.dict(exclude_none=True))
+        return await async_crud.create_citizen(citizen.dict(exclude_none=True), returning)
     except Exception as e:
         error_detail = str(e)
         # Provide more user-friendly error messages
@@ -76,28 +271,37 @@ def create_citizen(citizen: CitizenCreate):
             error_detail = "A citizen with this information already exists."
         raise HTTPException(status_code=400, detail=error_detail)
 
-@app.get("/citizens", response_model=List[dict], tags=["Citizens"])
-def read_citizens(
+@app.get("/citizens", response_model=Union[List[dict], Page], tags=["Citizens"])
+async def read_citizens(
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
-    name: Optional[str] = Query(None, description="Search citizens by name (partial match, case-insensitive)")
+    name: Optional[str] = Query(None, description="Search citizens by name (partial match, case-insensitive, best matches first)"),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)
 ):
     """Get all citizens, optionally filtered by name"""
-    return crud.get_all_citizens(skip, limit, name)
+    return await async_crud.get_all_citizens(skip, limit, name, cursor)
+
+@app.get("/citizens/search", response_model=List[dict], tags=["Citizens"])
+async def search_citizens(
+    q: str = Query(..., min_length=1, max_length=200, description="Name fragment: prefix, substring, any case"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of matches to return")
+):
+    """Search citizens by name, ranked exact > prefix > word prefix > substring"""
+    return await async_crud.search_citizens(q, limit)
 
 @app.get("/citizens/{identifier}", response_model=dict, tags=["Citizens"])
-def read_citizen(identifier: Union[int, str]):
+async def read_citizen(identifier: Union[int, str]):
     """Get citizen by ID (if integer) or by name (if string)"""
-    citizen = crud.get_citizen(identifier)
+    citizen = await async_crud.get_citizen(identifier)
     if citizen is None:
         raise HTTPException(status_code=404, detail="Citizen not found")
     return citizen
 
 @app.put("/citizens/{citizen_id}", response_model=dict, tags=["Citizens"])
-def update_citizen(citizen_id: int, citizen: CitizenUpdate):
+async def update_citizen(citizen_id: int, citizen: CitizenUpdate, returning: bool = Depends(wants_representation)):
     """Update a citizen"""
     try:
-        result = crud.update_citizen(citizen_id, citizen.dict(exclude_none=True))
+        result = await async_crud.update_citizen(citizen_id, citizen.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Citizen not found")
         return result
@@ -105,45 +309,58 @@ def update_citizen(citizen_id: int, citizen: CitizenUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/citizens/{citizen_id}", tags=["Citizens"])
-def delete_citizen(citizen_id: int):
+async def delete_citizen(citizen_id: int):
     """Delete a citizen"""
     try:
-        return crud.delete_citizen(citizen_id)
+        return await async_crud.delete_citizen(citizen_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== UTILITY ACCOUNTS ROUTES ====================
 @app.post("/utility-accounts", response_model=dict, tags=["Utility Accounts"])
-def create_utility_account(account: UtilityAccountCreate):
+async def create_utility_account(account: UtilityAccountCreate, returning: bool = Depends(wants_representation)):
     """Create a new utility account"""
     try:
-        return crud.create_utility_account(account.dict(exclude_none=True))
+        return await async_crud.create_utility_account(account.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/utility-accounts", response_model=List[dict], tags=["Utility Accounts"])
-def read_utility_accounts(skip: int = 0, limit: int = 100):
+@app.get("/utility-accounts", response_model=Union[List[dict], Page], tags=["Utility Accounts"])
+async def read_utility_accounts(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all utility accounts"""
-    return crud.get_all_utility_accounts(skip, limit)
+    return await async_crud.get_all_utility_accounts(skip, limit, cursor)
+
+@app.get("/utility-accounts/top-debtors", response_model=List[dict], tags=["Utility Accounts"])
+async def read_top_debtors(limit: int = Query(10, ge=1, le=1000)):
+    """Accounts with the largest outstanding balances"""
+    return await async_crud.get_top_debtors(limit)
 
 @app.get("/utility-accounts/{account_id}", response_model=dict, tags=["Utility Accounts"])
-def read_utility_account(account_id: int):
+async def read_utility_account(account_id: int):
     """Get utility account by ID"""
-    account = crud.get_utility_account(account_id)
+    account = await async_crud.get_utility_account(account_id)
     if account is None:
         raise HTTPException(status_code=404, detail="Utility account not found")
     return account
 
+@app.get("/utility-accounts/{account_id}/balance", response_model=dict, tags=["Utility Accounts"])
+async def read_utility_account_balance(account_id: int):
+    """Get the billed, paid and outstanding totals of a utility account"""
+    balance = await async_crud.get_account_balance(account_id)
+    if balance is None:
+        raise HTTPException(status_code=404, detail="Utility account not found")
+    return balance
+
 @app.get("/utility-accounts/citizen/{citizen_id}", response_model=List[dict], tags=["Utility Accounts"])
-def read_utility_accounts_by_citizen(citizen_id: int):
+async def read_utility_accounts_by_citizen(citizen_id: int):
     """Get utility accounts by citizen ID"""
-    return crud.get_utility_accounts_by_citizen(citizen_id)
+    return await async_crud.get_utility_accounts_by_citizen(citizen_id)
 
 @app.put("/utility-accounts/{account_id}", response_model=dict, tags=["Utility Accounts"])
-def update_utility_account(account_id: int, account: UtilityAccountUpdate):
+async def update_utility_account(account_id: int, account: UtilityAccountUpdate, returning: bool = Depends(wants_representation)):
     """Update a utility account"""
     try:
-        result = crud.update_utility_account(account_id, account.dict(exclude_none=True))
+        result = await async_crud.update_utility_account(account_id, account.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Utility account not found")
         return result
@@ -151,45 +368,69 @@ def update_utility_account(account_id: int, account: UtilityAccountUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/utility-accounts/{account_id}", tags=["Utility Accounts"])
-def delete_utility_account(account_id: int):
+async def delete_utility_account(account_id: int):
     """Delete a utility account"""
     try:
-        return crud.delete_utility_account(account_id)
+        return await async_crud.delete_utility_account(account_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== ELECTRICITY USAGE ROUTES ====================
+@app.post("/electricity-usage/bulk", response_model=dict, tags=["Electricity Usage"])
+async def bulk_create_electricity_usage(request: Request):
+    """Bulk insert electricity usage records from a JSON array or NDJSON body"""
+    return await bulk_ingest(request, "electricity_usage", ElectricityUsageCreate)
+
+@app.put("/electricity-usage/bulk", response_model=dict, tags=["Electricity Usage"])
+async def bulk_upsert_electricity_usage(request: Request):
+    """Bulk upsert electricity readings keyed by account and month; replaying a batch changes nothing"""
+    return await bulk_ingest(request, "electricity_usage", ElectricityUsageCreate, upsert=True)
+
+@app.post("/electricity-usage/import", response_model=dict, tags=["Electricity Usage"])
+async def import_electricity_usage(request: Request, mode: str = IMPORT_MODE):
+    """Import a CSV meter file of electricity readings, streamed without buffering"""
+    return await csv_import(request, "electricity", mode)
+
 @app.post("/electricity-usage", response_model=dict, tags=["Electricity Usage"])
-def create_electricity_usage(usage: ElectricityUsageCreate):
+async def create_electricity_usage(usage: ElectricityUsageCreate, returning: bool = Depends(wants_representation)):
     """Create a new electricity usage record"""
     try:
-        return crud.create_electricity_usage(usage.dict(exclude_none=True))
+        return await async_crud.create_electricity_usage(usage.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/electricity-usage", response_model=List[dict], tags=["Electricity Usage"])
-def read_electricity_usage(skip: int = 0, limit: int = 100):
+@app.get("/electricity-usage", response_model=Union[List[dict], Page], tags=["Electricity Usage"])
+async def read_electricity_usage(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION), sort: str = Query("id", description="Keyset sort key: id or period")):
     """Get all electricity usage records"""
-    return crud.get_all_electricity_usage(skip, limit)
+    return await async_crud.get_all_electricity_usage(skip, limit, cursor, sort)
 
 @app.get("/electricity-usage/{usage_id}", response_model=dict, tags=["Electricity Usage"])
-def read_electricity_usage_by_id(usage_id: int):
+async def read_electricity_usage_by_id(usage_id: int):
     """Get electricity usage by ID"""
-    usage = crud.get_electricity_usage(usage_id)
+    usage = await async_crud.get_electricity_usage(usage_id)
     if usage is None:
         raise HTTPException(status_code=404, detail="Electricity usage not found")
     return usage
 
 @app.get("/electricity-usage/account/{account_id}", response_model=List[dict], tags=["Electricity Usage"])
-def read_electricity_usage_by_account(account_id: int):
+async def read_electricity_usage_by_account(account_id: int, year: Optional[int] = YEAR_FILTER):
     """Get electricity usage by account ID"""
-    return crud.get_electricity_usage_by_account(account_id)
+    return await async_crud.get_electricity_usage_by_account(account_id, year)
+
+@app.put("/electricity-usage/account/{account_id}/{year}/{month}", response_model=dict, tags=["Electricity Usage"])
+async def upsert_electricity_usage(account_id: int, year: int, reading: ElectricityUsageReading,
+                              month: int = Path(..., ge=1, le=12), returning: bool = Depends(wants_representation)):
+    """Create or replace the electricity reading of an account for one month"""
+    try:
+        return await async_crud.upsert_electricity_usage(account_id, year, month, reading.dict(exclude_none=True), returning)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/electricity-usage/{usage_id}", response_model=dict, tags=["Electricity Usage"])
-def update_electricity_usage(usage_id: int, usage: ElectricityUsageUpdate):
+async def update_electricity_usage(usage_id: int, usage: ElectricityUsageUpdate, returning: bool = Depends(wants_representation)):
     """Update electricity usage"""
     try:
-        result = crud.update_electricity_usage(usage_id, usage.dict(exclude_none=True))
+        result = await async_crud.update_electricity_usage(usage_id, usage.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Electricity usage not found")
         return result
@@ -197,45 +438,69 @@ def update_electricity_usage(usage_id: int, usage: ElectricityUsageUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/electricity-usage/{usage_id}", tags=["Electricity Usage"])
-def delete_electricity_usage(usage_id: int):
+async def delete_electricity_usage(usage_id: int):
     """Delete electricity usage"""
     try:
-        return crud.delete_electricity_usage(usage_id)
+        return await async_crud.delete_electricity_usage(usage_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== WATER USAGE ROUTES ====================
+@app.post("/water-usage/bulk", response_model=dict, tags=["Water Usage"])
+async def bulk_create_water_usage(request: Request):
+    """Bulk insert water usage records from a JSON array or NDJSON body"""
+    return await bulk_ingest(request, "water_usage", WaterUsageCreate)
+
+@app.put("/water-usage/bulk", response_model=dict, tags=["Water Usage"])
+async def bulk_upsert_water_usage(request: Request):
+    """Bulk upsert water readings keyed by account and month; replaying a batch changes nothing"""
+    return await bulk_ingest(request, "water_usage", WaterUsageCreate, upsert=True)
+
+@app.post("/water-usage/import", response_model=dict, tags=["Water Usage"])
+async def import_water_usage(request: Request, mode: str = IMPORT_MODE):
+    """Import a CSV meter file of water readings, streamed without buffering"""
+    return await csv_import(request, "water", mode)
+
 @app.post("/water-usage", response_model=dict, tags=["Water Usage"])
-def create_water_usage(usage: WaterUsageCreate):
+async def create_water_usage(usage: WaterUsageCreate, returning: bool = Depends(wants_representation)):
     """Create a new water usage record"""
     try:
-        return crud.create_water_usage(usage.dict(exclude_none=True))
+        return await async_crud.create_water_usage(usage.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/water-usage", response_model=List[dict], tags=["Water Usage"])
-def read_water_usage(skip: int = 0, limit: int = 100):
+@app.get("/water-usage", response_model=Union[List[dict], Page], tags=["Water Usage"])
+async def read_water_usage(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION), sort: str = Query("id", description="Keyset sort key: id or period")):
     """Get all water usage records"""
-    return crud.get_all_water_usage(skip, limit)
+    return await async_crud.get_all_water_usage(skip, limit, cursor, sort)
 
 @app.get("/water-usage/{usage_id}", response_model=dict, tags=["Water Usage"])
-def read_water_usage_by_id(usage_id: int):
+async def read_water_usage_by_id(usage_id: int):
     """Get water usage by ID"""
-    usage = crud.get_water_usage(usage_id)
+    usage = await async_crud.get_water_usage(usage_id)
     if usage is None:
         raise HTTPException(status_code=404, detail="Water usage not found")
     return usage
 
 @app.get("/water-usage/account/{account_id}", response_model=List[dict], tags=["Water Usage"])
-def read_water_usage_by_account(account_id: int):
+async def read_water_usage_by_account(account_id: int, year: Optional[int] = YEAR_FILTER):
     """Get water usage by account ID"""
-    return crud.get_water_usage_by_account(account_id)
+    return await async_crud.get_water_usage_by_account(account_id, year)
+
+@app.put("/water-usage/account/{account_id}/{year}/{month}", response_model=dict, tags=["Water Usage"])
+async def upsert_water_usage(account_id: int, year: int, reading: WaterUsageReading,
+                             month: int = Path(..., ge=1, le=12), returning: bool = Depends(wants_representation)):
+    """Create or replace the water reading of an account for one month"""
+    try:
+        return await async_crud.upsert_water_usage(account_id, year, month, reading.dict(exclude_none=True), returning)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/water-usage/{usage_id}", response_model=dict, tags=["Water Usage"])
-def update_water_usage(usage_id: int, usage: WaterUsageUpdate):
+async def update_water_usage(usage_id: int, usage: WaterUsageUpdate, returning: bool = Depends(wants_representation)):
     """Update water usage"""
     try:
-        result = crud.update_water_usage(usage_id, usage.dict(exclude_none=True))
+        result = await async_crud.update_water_usage(usage_id, usage.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Water usage not found")
         return result
@@ -243,45 +508,50 @@ def update_water_usage(usage_id: int, usage: WaterUsageUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/water-usage/{usage_id}", tags=["Water Usage"])
-def delete_water_usage(usage_id: int):
+async def delete_water_usage(usage_id: int):
     """Delete water usage"""
     try:
-        return crud.delete_water_usage(usage_id)
+        return await async_crud.delete_water_usage(usage_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== ELECTRICITY BILLS ROUTES ====================
+@app.post("/electricity-bills/bulk", response_model=dict, tags=["Electricity Bills"])
+async def bulk_create_electricity_bills(request: Request):
+    """Bulk insert electricity bills from a JSON array or NDJSON body"""
+    return await bulk_ingest(request, "electricity_bills", ElectricityBillCreate)
+
 @app.post("/electricity-bills", response_model=dict, tags=["Electricity Bills"])
-def create_electricity_bill(bill: ElectricityBillCreate):
+async def create_electricity_bill(bill: ElectricityBillCreate, returning: bool = Depends(wants_representation)):
     """Create a new electricity bill"""
     try:
-        return crud.create_electricity_bill(bill.dict(exclude_none=True))
+        return await async_crud.create_electricity_bill(bill.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/electricity-bills", response_model=List[dict], tags=["Electricity Bills"])
-def read_electricity_bills(skip: int = 0, limit: int = 100):
+@app.get("/electricity-bills", response_model=Union[List[dict], Page], tags=["Electricity Bills"])
+async def read_electricity_bills(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION), sort: str = Query("id", description="Keyset sort key: id or period")):
     """Get all electricity bills"""
-    return crud.get_all_electricity_bills(skip, limit)
+    return await async_crud.get_all_electricity_bills(skip, limit, cursor, sort)
 
 @app.get("/electricity-bills/{bill_id}", response_model=dict, tags=["Electricity Bills"])
-def read_electricity_bill(bill_id: int):
+async def read_electricity_bill(bill_id: int):
     """Get electricity bill by ID"""
-    bill = crud.get_electricity_bill(bill_id)
+    bill = await async_crud.get_electricity_bill(bill_id)
     if bill is None:
         raise HTTPException(status_code=404, detail="Electricity bill not found")
     return bill
 
 @app.get("/electricity-bills/account/{account_id}", response_model=List[dict], tags=["Electricity Bills"])
-def read_electricity_bills_by_account(account_id: int):
+async def read_electricity_bills_by_account(account_id: int, year: Optional[int] = YEAR_FILTER):
     """Get electricity bills by account ID"""
-    return crud.get_electricity_bills_by_account(account_id)
+    return await async_crud.get_electricity_bills_by_account(account_id, year)
 
 @app.put("/electricity-bills/{bill_id}", response_model=dict, tags=["Electricity Bills"])
-def update_electricity_bill(bill_id: int, bill: ElectricityBillUpdate):
+async def update_electricity_bill(bill_id: int, bill: ElectricityBillUpdate, returning: bool = Depends(wants_representation)):
     """Update electricity bill"""
     try:
-        result = crud.update_electricity_bill(bill_id, bill.dict(exclude_none=True))
+        result = await async_crud.update_electricity_bill(bill_id, bill.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Electricity bill not found")
         return result
@@ -289,45 +559,50 @@ def update_electricity_bill(bill_id: int, bill: ElectricityBillUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/electricity-bills/{bill_id}", tags=["Electricity Bills"])
-def delete_electricity_bill(bill_id: int):
+async def delete_electricity_bill(bill_id: int):
     """Delete electricity bill"""
     try:
-        return crud.delete_electricity_bill(bill_id)
+        return await async_crud.delete_electricity_bill(bill_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== WATER BILLS ROUTES ====================
+@app.post("/water-bills/bulk", response_model=dict, tags=["Water Bills"])
+async def bulk_create_water_bills(request: Request):
+    """Bulk insert water bills from a JSON array or NDJSON body"""
+    return await bulk_ingest(request, "water_bills", WaterBillCreate)
+
 @app.post("/water-bills", response_model=dict, tags=["Water Bills"])
-def create_water_bill(bill: WaterBillCreate):
+async def create_water_bill(bill: WaterBillCreate, returning: bool = Depends(wants_representation)):
     """Create a new water bill"""
     try:
-        return crud.create_water_bill(bill.dict(exclude_none=True))
+        return await async_crud.create_water_bill(bill.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/water-bills", response_model=List[dict], tags=["Water Bills"])
-def read_water_bills(skip: int = 0, limit: int = 100):
+@app.get("/water-bills", response_model=Union[List[dict], Page], tags=["Water Bills"])
+async def read_water_bills(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION), sort: str = Query("id", description="Keyset sort key: id or period")):
     """Get all water bills"""
-    return crud.get_all_water_bills(skip, limit)
+    return await async_crud.get_all_water_bills(skip, limit, cursor, sort)
 
 @app.get("/water-bills/{bill_id}", response_model=dict, tags=["Water Bills"])
-def read_water_bill(bill_id: int):
+async def read_water_bill(bill_id: int):
     """Get water bill by ID"""
-    bill = crud.get_water_bill(bill_id)
+    bill = await async_crud.get_water_bill(bill_id)
     if bill is None:
         raise HTTPException(status_code=404, detail="Water bill not found")
     return bill
 
 @app.get("/water-bills/account/{account_id}", response_model=List[dict], tags=["Water Bills"])
-def read_water_bills_by_account(account_id: int):
+async def read_water_bills_by_account(account_id: int, year: Optional[int] = YEAR_FILTER):
     """Get water bills by account ID"""
-    return crud.get_water_bills_by_account(account_id)
+    return await async_crud.get_water_bills_by_account(account_id, year)
 
 @app.put("/water-bills/{bill_id}", response_model=dict, tags=["Water Bills"])
-def update_water_bill(bill_id: int, bill: WaterBillUpdate):
+async def update_water_bill(bill_id: int, bill: WaterBillUpdate, returning: bool = Depends(wants_representation)):
     """Update water bill"""
     try:
-        result = crud.update_water_bill(bill_id, bill.dict(exclude_none=True))
+        result = await async_crud.update_water_bill(bill_id, bill.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Water bill not found")
         return result
@@ -335,45 +610,50 @@ def update_water_bill(bill_id: int, bill: WaterBillUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/water-bills/{bill_id}", tags=["Water Bills"])
-def delete_water_bill(bill_id: int):
+async def delete_water_bill(bill_id: int):
     """Delete water bill"""
     try:
-        return crud.delete_water_bill(bill_id)
+        return await async_crud.delete_water_bill(bill_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== PAYMENTS ROUTES ====================
+@app.post("/payments/bulk", response_model=dict, tags=["Payments"])
+async def bulk_create_payments(request: Request):
+    """Bulk insert payments from a JSON array or NDJSON body"""
+    return await bulk_ingest(request, "payments", PaymentCreate)
+
 @app.post("/payments", response_model=dict, tags=["Payments"])
-def create_payment(payment: PaymentCreate):
+async def create_payment(payment: PaymentCreate, returning: bool = Depends(wants_representation)):
     """Create a new payment"""
     try:
-        return crud.create_payment(payment.dict(exclude_none=True))
+        return await async_crud.create_payment(payment.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/payments", response_model=List[dict], tags=["Payments"])
-def read_payments(skip: int = 0, limit: int = 100):
+@app.get("/payments", response_model=Union[List[dict], Page], tags=["Payments"])
+async def read_payments(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION), sort: str = Query("id", description="Keyset sort key: id or payment_date")):
     """Get all payments"""
-    return crud.get_all_payments(skip, limit)
+    return await async_crud.get_all_payments(skip, limit, cursor, sort)
 
 @app.get("/payments/{payment_id}", response_model=dict, tags=["Payments"])
-def read_payment(payment_id: int):
+async def read_payment(payment_id: int):
     """Get payment by ID"""
-    payment = crud.get_payment(payment_id)
+    payment = await async_crud.get_payment(payment_id)
     if payment is None:
         raise HTTPException(status_code=404, detail="Payment not found")
     return payment
 
 @app.get("/payments/bill/{bill_type}/{bill_id}", response_model=List[dict], tags=["Payments"])
-def read_payments_by_bill(bill_type: str, bill_id: int):
+async def read_payments_by_bill(bill_type: str, bill_id: int):
     """Get payments by bill type and bill ID"""
-    return crud.get_payments_by_bill(bill_type, bill_id)
+    return await async_crud.get_payments_by_bill(bill_type, bill_id)
 
 @app.put("/payments/{payment_id}", response_model=dict, tags=["Payments"])
-def update_payment(payment_id: int, payment: PaymentUpdate):
+async def update_payment(payment_id: int, payment: PaymentUpdate, returning: bool = Depends(wants_representation)):
     """Update payment"""
     try:
-        result = crud.update_payment(payment_id, payment.dict(exclude_none=True))
+        result = await async_crud.update_payment(payment_id, payment.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Payment not found")
         return result
@@ -381,40 +661,40 @@ def update_payment(payment_id: int, payment: PaymentUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/payments/{payment_id}", tags=["Payments"])
-def delete_payment(payment_id: int):
+async def delete_payment(payment_id: int):
     """Delete payment"""
     try:
-        return crud.delete_payment(payment_id)
+        return await async_crud.delete_payment(payment_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== PUBLIC TRANSPORT ROUTES ====================
 @app.post("/routes", response_model=dict, tags=["Public Transport Routes"])
-def create_route(route: PublicTransportRouteCreate):
+async def create_route(route: PublicTransportRouteCreate, returning: bool = Depends(wants_representation)):
     """Create a new route"""
     try:
-        return crud.create_route(route.dict(exclude_none=True))
+        return await async_crud.create_route(route.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/routes", response_model=List[dict], tags=["Public Transport Routes"])
-def read_routes(skip: int = 0, limit: int = 100):
+@app.get("/routes", response_model=Union[List[dict], Page], tags=["Public Transport Routes"])
+async def read_routes(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all routes"""
-    return crud.get_all_routes(skip, limit)
+    return await async_crud.get_all_routes(skip, limit, cursor)
 
 @app.get("/routes/{route_id}", response_model=dict, tags=["Public Transport Routes"])
-def read_route(route_id: int):
+async def read_route(route_id: int):
     """Get route by ID"""
-    route = crud.get_route(route_id)
+    route = await async_crud.get_route(route_id)
     if route is None:
         raise HTTPException(status_code=404, detail="Route not found")
     return route
 
 @app.put("/routes/{route_id}", response_model=dict, tags=["Public Transport Routes"])
-def update_route(route_id: int, route: PublicTransportRouteUpdate):
+async def update_route(route_id: int, route: PublicTransportRouteUpdate, returning: bool = Depends(wants_representation)):
     """Update route"""
     try:
-        result = crud.update_route(route_id, route.dict(exclude_none=True))
+        result = await async_crud.update_route(route_id, route.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Route not found")
         return result
@@ -422,40 +702,63 @@ def update_route(route_id: int, route: PublicTransportRouteUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/routes/{route_id}", tags=["Public Transport Routes"])
-def delete_route(route_id: int):
+async def delete_route(route_id: int):
     """Delete route"""
     try:
-        return crud.delete_route(route_id)
+        return await async_crud.delete_route(route_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/transport/path", response_model=dict, tags=["Public Transport Routes"])
+async def find_transport_path(
+    origin: str = Query(..., alias="from", min_length=1, description="Start stop name"),
+    destination: str = Query(..., alias="to", min_length=1, description="End stop name"),
+    mode: str = Query("distance", pattern=f"^({'|'.join(PATH_MODES)})$",
+                      description="distance: shortest km; transfers: fewest line changes, then shortest km")
+):
+    """Best path between two stops over the route graph"""
+    if not transit_graph.ready:
+        raise HTTPException(status_code=503, detail="Transit graph is still loading")
+    try:
+        result = await run_in_threadpool(transit_graph.path, origin, destination, mode)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown stop: {e.args[0]}")
+    if result is None:
+        raise HTTPException(status_code=404, detail="No route connects these stops")
+    return result
+
+@app.get("/routes/{route_id}/fleet", response_model=List[dict], tags=["Public Transport Routes"])
+async def read_route_fleet(route_id: int, active_only: bool = Query(False, description="Skip buses marked inactive")):
+    """Get every bus on a route with its latest known position"""
+    return fleet_positions.route_fleet(route_id, active_only)
+
 # ==================== DRIVERS ROUTES ====================
 @app.post("/drivers", response_model=dict, tags=["Drivers"])
-def create_driver(driver: DriverCreate):
+async def create_driver(driver: DriverCreate, returning: bool = Depends(wants_representation)):
     """Create a new driver"""
     try:
-        return crud.create_driver(driver.dict(exclude_none=True))
+        return await async_crud.create_driver(driver.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/drivers", response_model=List[dict], tags=["Drivers"])
-def read_drivers(skip: int = 0, limit: int = 100):
+@app.get("/drivers", response_model=Union[List[dict], Page], tags=["Drivers"])
+async def read_drivers(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all drivers"""
-    return crud.get_all_drivers(skip, limit)
+    return await async_crud.get_all_drivers(skip, limit, cursor)
 
 @app.get("/drivers/{driver_id}", response_model=dict, tags=["Drivers"])
-def read_driver(driver_id: int):
+async def read_driver(driver_id: int):
     """Get driver by ID"""
-    driver = crud.get_driver(driver_id)
+    driver = await async_crud.get_driver(driver_id)
     if driver is None:
         raise HTTPException(status_code=404, detail="Driver not found")
     return driver
 
 @app.put("/drivers/{driver_id}", response_model=dict, tags=["Drivers"])
-def update_driver(driver_id: int, driver: DriverUpdate):
+async def update_driver(driver_id: int, driver: DriverUpdate, returning: bool = Depends(wants_representation)):
     """Update driver"""
     try:
-        result = crud.update_driver(driver_id, driver.dict(exclude_none=True))
+        result = await async_crud.update_driver(driver_id, driver.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Driver not found")
         return result
@@ -463,45 +766,86 @@ def update_driver(driver_id: int, driver: DriverUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/drivers/{driver_id}", tags=["Drivers"])
-def delete_driver(driver_id: int):
+async def delete_driver(driver_id: int):
     """Delete driver"""
     try:
-        return crud.delete_driver(driver_id)
+        return await async_crud.delete_driver(driver_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== BUSES ROUTES ====================
 @app.post("/buses", response_model=dict, tags=["Buses"])
-def create_bus(bus: BusCreate):
+async def create_bus(bus: BusCreate, returning: bool = Depends(wants_representation)):
     """Create a new bus"""
     try:
-        return crud.create_bus(bus.dict(exclude_none=True))
+        return await async_crud.create_bus(bus.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/buses", response_model=List[dict], tags=["Buses"])
-def read_buses(skip: int = 0, limit: int = 100):
+@app.get("/buses", response_model=Union[List[dict], Page], tags=["Buses"])
+async def read_buses(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all buses"""
-    return crud.get_all_buses(skip, limit)
+    return await async_crud.get_all_buses(skip, limit, cursor)
+
+@app.post("/buses/pings", response_model=dict, tags=["Buses"])
+async def ingest_bus_pings(request: Request):
+    """Record GPS pings (JSON array or NDJSON) in the live position buffers; nothing is written to the database"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        records = bulk.iter_ndjson(request.stream())
+    else:
+        try:
+            records = bulk.iter_json_array(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    report = bulk.BulkReport()
+    received_at = time.time()
+    pings = []
+    async for index, record in records:
+        ping = bulk.validate_record(index, record, BusPing, report)
+        if ping is not None:
+            try:
+                pings.append(ping_row(ping, received_at))
+            except ValueError as e:
+                report.add_error(index, e)
+    stored, stale, unknown = fleet_positions.ingest(pings)
+    return {
+        "received": report.received,
+        "stored": stored,
+        "stale": stale,
+        "rejected": report.failed,
+        "unknown_buses": unknown,
+        "errors": report.errors,
+        "errors_truncated": report.failed > len(report.errors),
+    }
 
 @app.get("/buses/{bus_id}", response_model=dict, tags=["Buses"])
-def read_bus(bus_id: int):
+async def read_bus(bus_id: int):
     """Get bus by ID"""
-    bus = crud.get_bus(bus_id)
+    bus = await async_crud.get_bus(bus_id)
     if bus is None:
         raise HTTPException(status_code=404, detail="Bus not found")
     return bus
 
+@app.get("/buses/{bus_id}/positions", response_model=List[dict], tags=["Buses"])
+async def read_bus_positions(bus_id: int, limit: int = Query(20, ge=1, le=1000)):
+    """Get the latest buffered GPS pings of a bus, newest first"""
+    positions = fleet_positions.history(bus_id, limit)
+    if positions is None:
+        raise HTTPException(status_code=404, detail="No positions recorded for this bus")
+    return positions
+
 @app.get("/buses/route/{route_id}", response_model=List[dict], tags=["Buses"])
-def read_buses_by_route(route_id: int):
+async def read_buses_by_route(route_id: int):
     """Get buses by route ID"""
-    return crud.get_buses_by_route(route_id)
+    return await async_crud.get_buses_by_route(route_id)
 
 @app.put("/buses/{bus_id}", response_model=dict, tags=["Buses"])
-def update_bus(bus_id: int, bus: BusUpdate):
+async def update_bus(bus_id: int, bus: BusUpdate, returning: bool = Depends(wants_representation)):
     """Update bus"""
     try:
-        result = crud.update_bus(bus_id, bus.dict(exclude_none=True))
+        result = await async_crud.update_bus(bus_id, bus.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Bus not found")
         return result
@@ -509,40 +853,62 @@ def update_bus(bus_id: int, bus: BusUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/buses/{bus_id}", tags=["Buses"])
-def delete_bus(bus_id: int):
+async def delete_bus(bus_id: int):
     """Delete bus"""
     try:
-        return crud.delete_bus(bus_id)
+        return await async_crud.delete_bus(bus_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== EMERGENCY SERVICES ROUTES ====================
 @app.post("/emergency-services", response_model=dict, tags=["Emergency Services"])
-def create_emergency_service(service: EmergencyServiceCreate):
+async def create_emergency_service(service: EmergencyServiceCreate, returning: bool = Depends(wants_representation)):
     """Create a new emergency service"""
     try:
-        return crud.create_emergency_service(service.dict(exclude_none=True))
+        return await async_crud.create_emergency_service(service.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/emergency-services", response_model=List[dict], tags=["Emergency Services"])
-def read_emergency_services(skip: int = 0, limit: int = 100):
+@app.get("/emergency-services", response_model=Union[List[dict], Page], tags=["Emergency Services"])
+async def read_emergency_services(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all emergency services"""
-    return crud.get_all_emergency_services(skip, limit)
+    return await async_crud.get_all_emergency_services(skip, limit, cursor)
+
+@app.get("/emergency-services/nearby", response_model=List[dict], tags=["Emergency Services"])
+async def read_nearby_emergency_services(
+    point: tuple = Depends(search_point),
+    radius_km: float = Query(5, gt=0, le=GEO_CONFIG['max_radius_km']),
+    service_type: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Get service units within a radius, nearest first"""
+    where = (lambda service: service['service_type'] == service_type) if service_type else None
+    return spatial_results(incident_map.services.radius(*point, radius_km, limit, where))
+
+@app.get("/emergency-services/nearest", response_model=List[dict], tags=["Emergency Services"])
+async def read_nearest_emergency_services(
+    point: tuple = Depends(search_point),
+    k: int = Query(5, ge=1, le=100),
+    max_km: Optional[float] = Query(None, gt=0),
+    service_type: Optional[str] = None
+):
+    """Get the k closest service units"""
+    where = (lambda service: service['service_type'] == service_type) if service_type else None
+    return spatial_results(incident_map.services.nearest(*point, k, max_km, where))
 
 @app.get("/emergency-services/{service_id}", response_model=dict, tags=["Emergency Services"])
-def read_emergency_service(service_id: int):
+async def read_emergency_service(service_id: int):
     """Get emergency service by ID"""
-    service = crud.get_emergency_service(service_id)
+    service = await async_crud.get_emergency_service(service_id)
     if service is None:
         raise HTTPException(status_code=404, detail="Emergency service not found")
     return service
 
 @app.put("/emergency-services/{service_id}", response_model=dict, tags=["Emergency Services"])
-def update_emergency_service(service_id: int, service: EmergencyServiceUpdate):
+async def update_emergency_service(service_id: int, service: EmergencyServiceUpdate, returning: bool = Depends(wants_representation)):
     """Update emergency service"""
     try:
-        result = crud.update_emergency_service(service_id, service.dict(exclude_none=True))
+        result = await async_crud.update_emergency_service(service_id, service.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Emergency service not found")
         return result
@@ -550,45 +916,85 @@ def update_emergency_service(service_id: int, service: EmergencyServiceUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/emergency-services/{service_id}", tags=["Emergency Services"])
-def delete_emergency_service(service_id: int):
+async def delete_emergency_service(service_id: int):
     """Delete emergency service"""
     try:
-        return crud.delete_emergency_service(service_id)
+        return await async_crud.delete_emergency_service(service_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== EMERGENCY REQUESTS ROUTES ====================
 @app.post("/emergency-requests", response_model=dict, tags=["Emergency Requests"])
-def create_emergency_request(request: EmergencyRequestCreate):
+async def create_emergency_request(request: EmergencyRequestCreate, returning: bool = Depends(wants_representation)):
     """Create a new emergency request"""
     try:
-        return crud.create_emergency_request(request.dict(exclude_none=True))
+        return await async_crud.create_emergency_request(request.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/emergency-requests", response_model=List[dict], tags=["Emergency Requests"])
-def read_emergency_requests(skip: int = 0, limit: int = 100):
+@app.get("/emergency-requests", response_model=Union[List[dict], Page], tags=["Emergency Requests"])
+async def read_emergency_requests(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all emergency requests"""
-    return crud.get_all_emergency_requests(skip, limit)
+    return await async_crud.get_all_emergency_requests(skip, limit, cursor)
+
+@app.get("/emergency-requests/queue", response_model=List[dict], tags=["Emergency Requests"])
+async def read_dispatch_queue(service_id: Optional[int] = None, limit: int = Query(50, ge=1, le=1000)):
+    """Get open emergency requests in dispatch order (severity, service type, age)"""
+    if not dispatch_queue.ready:
+        raise HTTPException(status_code=503, detail="Dispatch queue is still loading")
+    return dispatch_queue.peek(service_id, limit)
+
+@app.post("/emergency-requests/next", response_model=dict, tags=["Emergency Requests"])
+async def claim_next_emergency_request(service_id: Optional[int] = Query(None, description="Only claim requests for this service")):
+    """Claim the next open emergency request for dispatch and mark it Dispatched"""
+    try:
+        request = await claim_next(service_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request is None:
+        raise HTTPException(status_code=404, detail="No open emergency requests")
+    return request
+
+@app.get("/emergency-requests/nearby", response_model=List[dict], tags=["Emergency Requests"])
+async def read_nearby_emergency_requests(
+    point: tuple = Depends(search_point),
+    radius_km: float = Query(5, gt=0, le=GEO_CONFIG['max_radius_km']),
+    status: Optional[str] = Query(None, pattern="^(Open|Dispatched)$"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Get open and dispatched incidents within a radius, nearest first"""
+    where = (lambda incident: incident['status'] == status) if status else None
+    return spatial_results(incident_map.incidents.radius(*point, radius_km, limit, where))
+
+@app.get("/emergency-requests/nearest", response_model=List[dict], tags=["Emergency Requests"])
+async def read_nearest_emergency_requests(
+    point: tuple = Depends(search_point),
+    k: int = Query(5, ge=1, le=100),
+    max_km: Optional[float] = Query(None, gt=0),
+    status: Optional[str] = Query(None, pattern="^(Open|Dispatched)$")
+):
+    """Get the k closest open and dispatched incidents"""
+    where = (lambda incident: incident['status'] == status) if status else None
+    return spatial_results(incident_map.incidents.nearest(*point, k, max_km, where))
 
 @app.get("/emergency-requests/{req_id}", response_model=dict, tags=["Emergency Requests"])
-def read_emergency_request(req_id: int):
+async def read_emergency_request(req_id: int):
     """Get emergency request by ID"""
-    request = crud.get_emergency_request(req_id)
+    request = await async_crud.get_emergency_request(req_id)
     if request is None:
         raise HTTPException(status_code=404, detail="Emergency request not found")
     return request
 
 @app.get("/emergency-requests/status/{status}", response_model=List[dict], tags=["Emergency Requests"])
-def read_emergency_requests_by_status(status: str):
+async def read_emergency_requests_by_status(status: str):
     """Get emergency requests by status"""
-    return crud.get_emergency_requests_by_status(status)
+    return await async_crud.get_emergency_requests_by_status(status)
 
 @app.put("/emergency-requests/{req_id}", response_model=dict, tags=["Emergency Requests"])
-def update_emergency_request(req_id: int, request: EmergencyRequestUpdate):
+async def update_emergency_request(req_id: int, request: EmergencyRequestUpdate, returning: bool = Depends(wants_representation)):
     """Update emergency request"""
     try:
-        result = crud.update_emergency_request(req_id, request.dict(exclude_none=True))
+        result = await async_crud.update_emergency_request(req_id, request.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Emergency request not found")
         return result
@@ -596,40 +1002,40 @@ def update_emergency_request(req_id: int, request: EmergencyRequestUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/emergency-requests/{req_id}", tags=["Emergency Requests"])
-def delete_emergency_request(req_id: int):
+async def delete_emergency_request(req_id: int):
     """Delete emergency request"""
     try:
-        return crud.delete_emergency_request(req_id)
+        return await async_crud.delete_emergency_request(req_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== WASTE COLLECTION ZONES ROUTES ====================
 @app.post("/waste-collection-zones", response_model=dict, tags=["Waste Collection Zones"])
-def create_waste_collection_zone(zone: WasteCollectionZoneCreate):
+async def create_waste_collection_zone(zone: WasteCollectionZoneCreate, returning: bool = Depends(wants_representation)):
     """Create a new waste collection zone"""
     try:
-        return crud.create_waste_collection_zone(zone.dict(exclude_none=True))
+        return await async_crud.create_waste_collection_zone(zone.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/waste-collection-zones", response_model=List[dict], tags=["Waste Collection Zones"])
-def read_waste_collection_zones(skip: int = 0, limit: int = 100):
+@app.get("/waste-collection-zones", response_model=Union[List[dict], Page], tags=["Waste Collection Zones"])
+async def read_waste_collection_zones(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all waste collection zones"""
-    return crud.get_all_waste_collection_zones(skip, limit)
+    return await async_crud.get_all_waste_collection_zones(skip, limit, cursor)
 
 @app.get("/waste-collection-zones/{zone_id}", response_model=dict, tags=["Waste Collection Zones"])
-def read_waste_collection_zone(zone_id: int):
+async def read_waste_collection_zone(zone_id: int):
     """Get waste collection zone by ID"""
-    zone = crud.get_waste_collection_zone(zone_id)
+    zone = await async_crud.get_waste_collection_zone(zone_id)
     if zone is None:
         raise HTTPException(status_code=404, detail="Waste collection zone not found")
     return zone
 
 @app.put("/waste-collection-zones/{zone_id}", response_model=dict, tags=["Waste Collection Zones"])
-def update_waste_collection_zone(zone_id: int, zone: WasteCollectionZoneUpdate):
+async def update_waste_collection_zone(zone_id: int, zone: WasteCollectionZoneUpdate, returning: bool = Depends(wants_representation)):
     """Update waste collection zone"""
     try:
-        result = crud.update_waste_collection_zone(zone_id, zone.dict(exclude_none=True))
+        result = await async_crud.update_waste_collection_zone(zone_id, zone.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Waste collection zone not found")
         return result
@@ -637,40 +1043,40 @@ def update_waste_collection_zone(zone_id: int, zone: WasteCollectionZoneUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/waste-collection-zones/{zone_id}", tags=["Waste Collection Zones"])
-def delete_waste_collection_zone(zone_id: int):
+async def delete_waste_collection_zone(zone_id: int):
     """Delete waste collection zone"""
     try:
-        return crud.delete_waste_collection_zone(zone_id)
+        return await async_crud.delete_waste_collection_zone(zone_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== TRUCKS ROUTES ====================
 @app.post("/trucks", response_model=dict, tags=["Trucks"])
-def create_truck(truck: TruckCreate):
+async def create_truck(truck: TruckCreate, returning: bool = Depends(wants_representation)):
     """Create a new truck"""
     try:
-        return crud.create_truck(truck.dict(exclude_none=True))
+        return await async_crud.create_truck(truck.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/trucks", response_model=List[dict], tags=["Trucks"])
-def read_trucks(skip: int = 0, limit: int = 100):
+@app.get("/trucks", response_model=Union[List[dict], Page], tags=["Trucks"])
+async def read_trucks(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all trucks"""
-    return crud.get_all_trucks(skip, limit)
+    return await async_crud.get_all_trucks(skip, limit, cursor)
 
 @app.get("/trucks/{truck_id}", response_model=dict, tags=["Trucks"])
-def read_truck(truck_id: int):
+async def read_truck(truck_id: int):
     """Get truck by ID"""
-    truck = crud.get_truck(truck_id)
+    truck = await async_crud.get_truck(truck_id)
     if truck is None:
         raise HTTPException(status_code=404, detail="Truck not found")
     return truck
 
 @app.put("/trucks/{truck_id}", response_model=dict, tags=["Trucks"])
-def update_truck(truck_id: int, truck: TruckUpdate):
+async def update_truck(truck_id: int, truck: TruckUpdate, returning: bool = Depends(wants_representation)):
     """Update truck"""
     try:
-        result = crud.update_truck(truck_id, truck.dict(exclude_none=True))
+        result = await async_crud.update_truck(truck_id, truck.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Truck not found")
         return result
@@ -678,45 +1084,45 @@ def update_truck(truck_id: int, truck: TruckUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/trucks/{truck_id}", tags=["Trucks"])
-def delete_truck(truck_id: int):
+async def delete_truck(truck_id: int):
     """Delete truck"""
     try:
-        return crud.delete_truck(truck_id)
+        return await async_crud.delete_truck(truck_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== WASTE COLLECTION LOGS ROUTES ====================
 @app.post("/waste-collection-logs", response_model=dict, tags=["Waste Collection Logs"])
-def create_waste_collection_log(log: WasteCollectionLogCreate):
+async def create_waste_collection_log(log: WasteCollectionLogCreate, returning: bool = Depends(wants_representation)):
     """Create a new waste collection log"""
     try:
-        return crud.create_waste_collection_log(log.dict(exclude_none=True))
+        return await async_crud.create_waste_collection_log(log.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/waste-collection-logs", response_model=List[dict], tags=["Waste Collection Logs"])
-def read_waste_collection_logs(skip: int = 0, limit: int = 100):
+@app.get("/waste-collection-logs", response_model=Union[List[dict], Page], tags=["Waste Collection Logs"])
+async def read_waste_collection_logs(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all waste collection logs"""
-    return crud.get_all_waste_collection_logs(skip, limit)
+    return await async_crud.get_all_waste_collection_logs(skip, limit, cursor)
 
 @app.get("/waste-collection-logs/{log_id}", response_model=dict, tags=["Waste Collection Logs"])
-def read_waste_collection_log(log_id: int):
+async def read_waste_collection_log(log_id: int):
     """Get waste collection log by ID"""
-    log = crud.get_waste_collection_log(log_id)
+    log = await async_crud.get_waste_collection_log(log_id)
     if log is None:
         raise HTTPException(status_code=404, detail="Waste collection log not found")
     return log
 
 @app.get("/waste-collection-logs/zone/{zone_id}", response_model=List[dict], tags=["Waste Collection Logs"])
-def read_waste_collection_logs_by_zone(zone_id: int):
+async def read_waste_collection_logs_by_zone(zone_id: int):
     """Get waste collection logs by zone ID"""
-    return crud.get_waste_collection_logs_by_zone(zone_id)
+    return await async_crud.get_waste_collection_logs_by_zone(zone_id)
 
 @app.put("/waste-collection-logs/{log_id}", response_model=dict, tags=["Waste Collection Logs"])
-def update_waste_collection_log(log_id: int, log: WasteCollectionLogUpdate):
+async def update_waste_collection_log(log_id: int, log: WasteCollectionLogUpdate, returning: bool = Depends(wants_representation)):
     """Update waste collection log"""
     try:
-        result = crud.update_waste_collection_log(log_id, log.dict(exclude_none=True))
+        result = await async_crud.update_waste_collection_log(log_id, log.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Waste collection log not found")
         return result
@@ -724,50 +1130,72 @@ def update_waste_collection_log(log_id: int, log: WasteCollectionLogUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/waste-collection-logs/{log_id}", tags=["Waste Collection Logs"])
-def delete_waste_collection_log(log_id: int):
+async def delete_waste_collection_log(log_id: int):
     """Delete waste collection log"""
     try:
-        return crud.delete_waste_collection_log(log_id)
+        return await async_crud.delete_waste_collection_log(log_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== COMPLAINTS ROUTES ====================
 @app.post("/complaints", response_model=dict, tags=["Complaints"])
-def create_complaint(complaint: ComplaintCreate):
+async def create_complaint(complaint: ComplaintCreate, returning: bool = Depends(wants_representation)):
     """Create a new complaint"""
     try:
-        return crud.create_complaint(complaint.dict(exclude_none=True))
+        return await async_crud.create_complaint(complaint.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/complaints", response_model=List[dict], tags=["Complaints"])
-def read_complaints(skip: int = 0, limit: int = 100):
+@app.get("/complaints", response_model=Union[List[dict], Page], tags=["Complaints"])
+async def read_complaints(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all complaints"""
-    return crud.get_all_complaints(skip, limit)
+    return await async_crud.get_all_complaints(skip, limit, cursor)
+
+@app.get("/complaints/nearby", response_model=List[dict], tags=["Complaints"])
+async def read_nearby_complaints(
+    point: tuple = Depends(search_point),
+    radius_km: float = Query(5, gt=0, le=GEO_CONFIG['max_radius_km']),
+    status: Optional[str] = Query(None, pattern="^(Open|In Progress)$"),
+    category: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Get open and in-progress complaints within a radius, nearest first"""
+    return spatial_results(incident_map.complaints.radius(*point, radius_km, limit, complaint_filter(status, category)))
+
+@app.get("/complaints/nearest", response_model=List[dict], tags=["Complaints"])
+async def read_nearest_complaints(
+    point: tuple = Depends(search_point),
+    k: int = Query(5, ge=1, le=100),
+    max_km: Optional[float] = Query(None, gt=0),
+    status: Optional[str] = Query(None, pattern="^(Open|In Progress)$"),
+    category: Optional[str] = None
+):
+    """Get the k closest open and in-progress complaints"""
+    return spatial_results(incident_map.complaints.nearest(*point, k, max_km, complaint_filter(status, category)))
 
 @app.get("/complaints/{complaint_id}", response_model=dict, tags=["Complaints"])
-def read_complaint(complaint_id: int):
+async def read_complaint(complaint_id: int):
     """Get complaint by ID"""
-    complaint = crud.get_complaint(complaint_id)
+    complaint = await async_crud.get_complaint(complaint_id)
     if complaint is None:
         raise HTTPException(status_code=404, detail="Complaint not found")
     return complaint
 
 @app.get("/complaints/status/{status}", response_model=List[dict], tags=["Complaints"])
-def read_complaints_by_status(status: str):
+async def read_complaints_by_status(status: str):
     """Get complaints by status"""
-    return crud.get_complaints_by_status(status)
+    return await async_crud.get_complaints_by_status(status)
 
 @app.get("/complaints/citizen/{citizen_id}", response_model=List[dict], tags=["Complaints"])
-def read_complaints_by_citizen(citizen_id: int):
+async def read_complaints_by_citizen(citizen_id: int):
     """Get complaints by citizen ID"""
-    return crud.get_complaints_by_citizen(citizen_id)
+    return await async_crud.get_complaints_by_citizen(citizen_id)
 
 @app.put("/complaints/{complaint_id}", response_model=dict, tags=["Complaints"])
-def update_complaint(complaint_id: int, complaint: ComplaintUpdate):
+async def update_complaint(complaint_id: int, complaint: ComplaintUpdate, returning: bool = Depends(wants_representation)):
     """Update complaint"""
     try:
-        result = crud.update_complaint(complaint_id, complaint.dict(exclude_none=True))
+        result = await async_crud.update_complaint(complaint_id, complaint.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Complaint not found")
         return result
@@ -775,45 +1203,45 @@ def update_complaint(complaint_id: int, complaint: ComplaintUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/complaints/{complaint_id}", tags=["Complaints"])
-def delete_complaint(complaint_id: int):
+async def delete_complaint(complaint_id: int):
     """Delete complaint"""
     try:
-        return crud.delete_complaint(complaint_id)
+        return await async_crud.delete_complaint(complaint_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== COMPLAINT UPDATES ROUTES ====================
 @app.post("/complaint-updates", response_model=dict, tags=["Complaint Updates"])
-def create_complaint_update(update: ComplaintUpdateCreate):
+async def create_complaint_update(update: ComplaintUpdateCreate, returning: bool = Depends(wants_representation)):
     """Create a new complaint update"""
     try:
-        return crud.create_complaint_update(update.dict(exclude_none=True))
+        return await async_crud.create_complaint_update(update.dict(exclude_none=True), returning)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/complaint-updates", response_model=List[dict], tags=["Complaint Updates"])
-def read_complaint_updates(skip: int = 0, limit: int = 100):
+@app.get("/complaint-updates", response_model=Union[List[dict], Page], tags=["Complaint Updates"])
+async def read_complaint_updates(skip: int = 0, limit: int = 100, cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION)):
     """Get all complaint updates"""
-    return crud.get_all_complaint_updates(skip, limit)
+    return await async_crud.get_all_complaint_updates(skip, limit, cursor)
 
 @app.get("/complaint-updates/{update_id}", response_model=dict, tags=["Complaint Updates"])
-def read_complaint_update(update_id: int):
+async def read_complaint_update(update_id: int):
     """Get complaint update by ID"""
-    update = crud.get_complaint_update(update_id)
+    update = await async_crud.get_complaint_update(update_id)
     if update is None:
         raise HTTPException(status_code=404, detail="Complaint update not found")
     return update
 
 @app.get("/complaint-updates/complaint/{complaint_id}", response_model=List[dict], tags=["Complaint Updates"])
-def read_complaint_updates_by_complaint(complaint_id: int):
+async def read_complaint_updates_by_complaint(complaint_id: int):
     """Get complaint updates by complaint ID"""
-    return crud.get_complaint_updates_by_complaint(complaint_id)
+    return await async_crud.get_complaint_updates_by_complaint(complaint_id)
 
 @app.put("/complaint-updates/{update_id}", response_model=dict, tags=["Complaint Updates"])
-def update_complaint_update(update_id: int, update: ComplaintUpdateUpdate):
+async def update_complaint_update(update_id: int, update: ComplaintUpdateUpdate, returning: bool = Depends(wants_representation)):
     """Update complaint update"""
     try:
-        result = crud.update_complaint_update(update_id, update.dict(exclude_none=True))
+        result = await async_crud.update_complaint_update(update_id, update.dict(exclude_none=True), returning)
         if result is None:
             raise HTTPException(status_code=404, detail="Complaint update not found")
         return result
@@ -821,22 +1249,265 @@ def update_complaint_update(update_id: int, update: ComplaintUpdateUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/complaint-updates/{update_id}", tags=["Complaint Updates"])
-def delete_complaint_update(update_id: int):
+async def delete_complaint_update(update_id: int):
     """Delete complaint update"""
     try:
-        return crud.delete_complaint_update(update_id)
+        return await async_crud.delete_complaint_update(update_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # ==================== DASHBOARD STATS ROUTE ====================
 @app.get("/stats", response_model=dict, tags=["Dashboard"])
-def get_stats():
-    """Get dashboard statistics"""
-    return crud.get_dashboard_stats()
+async def get_stats():
+    """Get dashboard statistics from the periodically refreshed snapshot"""
+    return await stats_snapshot.get()
+
+# ==================== BILLING ROUTES ====================
+@app.post("/billing/runs", response_model=dict, tags=["Billing"])
+async def create_billing_run(run: BillingRunRequest):
+    """Bill every account with usage in a month using the configured slab tariffs"""
+    try:
+        return await run_in_threadpool(run_billing, run.utility, run.year, run.month, run.mode,
+                                       run.dry_run, run.due_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/billing/reconcile", response_model=dict, tags=["Billing"])
+async def reconcile_payments(
+    full: bool = Query(False, description="Rescan every payment instead of only those past the high-water mark")
+):
+    """Move bills to Paid / Partially Paid from the payments recorded against them"""
+    return await run_in_threadpool(run_reconciliation, full)
+
+@app.post("/billing/overdue-sweep", response_model=dict, tags=["Billing"])
+async def sweep_overdue_bills(
+    as_of: Optional[date] = Query(None, description="Sweep bills due before this date (default: today)"),
+    chunk_size: Optional[int] = Query(None, ge=1, le=100000)
+):
+    """Move Unpaid / Partially Paid bills past their due date to Overdue"""
+    return await run_in_threadpool(run_overdue_sweep, as_of, chunk_size)
+
+@app.post("/billing/balances/rebuild", response_model=dict, tags=["Billing"])
+async def rebuild_account_balances(batch_size: Optional[int] = Query(None, ge=1, le=100000)):
+    """Recompute the account_balances ledger from every bill and payment"""
+    return await run_in_threadpool(rebuild_balances, batch_size)
+
+# ==================== ANALYTICS ROUTES ====================
+@app.get("/analytics/usage-anomalies", response_model=List[dict], tags=["Analytics"])
+async def read_usage_anomalies(
+    utility: Optional[str] = Query(None, pattern="^(electricity|water)$"),
+    account_id: Optional[int] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = Query(None, ge=1, le=12),
+    kind: Optional[str] = Query(None, pattern=f"^({'|'.join(ANOMALY_KINDS)})$"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Readings flagged by the last anomaly detection run"""
+    return await async_crud.get_usage_anomalies(utility, account_id, year, month, kind, skip, limit)
+
+@app.post("/analytics/usage-anomalies/run", response_model=dict, tags=["Analytics"])
+async def run_usage_anomaly_detection(
+    utility: str = Query(..., pattern="^(electricity|water)$"),
+    dry_run: bool = False
+):
+    """Rescore every reading of a utility against rolling per-account baselines"""
+    return await run_in_threadpool(run_anomaly_detection, utility, dry_run)
+
+@app.get("/analytics/consumption", response_model=List[dict], tags=["Analytics"])
+async def read_consumption_rollup(
+    group_by: str = Query("", description="Comma-separated dimensions: utility, year, month, city, area"),
+    utility: Optional[str] = Query(None, pattern="^(electricity|water)$"),
+    year: Optional[int] = None,
+    month: Optional[int] = Query(None, ge=1, le=12),
+    city: Optional[str] = None,
+    area: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    """Usage and billing totals from the city/area/month rollup cube"""
+    dimensions = [dimension.strip() for dimension in group_by.split(",") if dimension.strip()]
+    unknown = [dimension for dimension in dimensions if dimension not in async_crud.ROLLUP_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dimension(s): {', '.join(unknown)}")
+    filters = {"utility": utility, "year": year, "month": month, "city": city, "area": area}
+    return await async_crud.get_consumption_rollup(list(dict.fromkeys(dimensions)), filters, limit)
+
+@app.post("/analytics/consumption/rebuild", response_model=dict, tags=["Analytics"])
+async def rebuild_consumption_rollup(
+    utility: Optional[str] = Query(None, pattern="^(electricity|water)$"),
+    year: Optional[int] = None
+):
+    """Recompute the rollup cube from the usage and bill tables"""
+    return await run_in_threadpool(rebuild_rollup, utility, year)
+
+# ==================== EXPORT ROUTES ====================
+@app.get("/export/{table}", tags=["Export"])
+async def export_table(
+    table: str,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    account_id: Optional[int] = None,
+    zone_id: Optional[int] = None,
+    citizen_id: Optional[int] = None,
+    status: Optional[str] = None
+):
+    """Stream a whole table as NDJSON or CSV using a server-side cursor"""
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="Unknown export table")
+    filters = {"account_id": account_id, "zone_id": zone_id, "citizen_id": citizen_id, "status": status}
+    try:
+        chunks = stream_export(table, filters, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{fmt}"'}
+    )
+
+# ==================== EVENTS ROUTE ====================
+@app.get("/events", tags=["Events"])
+async def stream_events(
+    request: Request,
+    topics: Optional[List[str]] = Query(None, description=f"Any of {', '.join(EVENT_TOPICS)}; all by default"),
+    status: Optional[List[str]] = Query(None, description="Emergency requests in these statuses"),
+    service_id: Optional[List[int]] = Query(None, description="Emergency requests for these services"),
+    zone: Optional[str] = Query(None, min_length=1, description="Emergency requests whose location contains this text"),
+    route_id: Optional[List[int]] = Query(None, description="Buses on these routes")
+):
+    """Server-sent events for emergency request and bus changes"""
+    unknown = set(topics or ()) - set(EVENT_TOPICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topics: {', '.join(sorted(unknown))}")
+    if event_hub.full:
+        raise HTTPException(status_code=503, detail="Too many event subscribers")
+    last_event_id = request.headers.get("last-event-id")
+    subscriber = event_hub.subscribe(
+        Subscriber(topics, status, route_id, service_id, zone, event_hub.queue_size),
+        int(last_event_id) if last_event_id and last_event_id.isdigit() else None,
+    )
+    return StreamingResponse(event_hub.stream(subscriber), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ==================== ADMIN ROUTES ====================
+@app.get("/metrics", tags=["Admin"])
+async def get_metrics():
+    """Request, connection pool and query cache metrics in Prometheus text format"""
+    return Response(render_metrics(http_metrics), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/admin/db-pool", response_model=dict, tags=["Admin"])
+async def get_db_pool_stats():
+    """Get database connection pool statistics"""
+    return {"async": adb.pool_stats(), "sync": db.pool_stats()}
+
+@app.get("/admin/query-stats", response_model=dict, tags=["Admin"])
+async def get_query_stats(
+    sort: str = Query("total_time_ms", pattern="^(total_time_ms|calls|errors|rows|mean_ms|max_ms|acquire_total_ms)$",
+                      description="Field to rank statements by, descending"),
+    limit: int = Query(50, ge=1, le=500, description="Maximum number of statements to return")
+):
+    """Get per-statement latency, rows, connection wait and error statistics"""
+    return query_stats.snapshot(sort, limit)
+
+@app.post("/admin/query-stats/reset", response_model=dict, tags=["Admin"])
+async def reset_query_stats():
+    """Start collecting statement statistics from scratch"""
+    query_stats.reset()
+    return {"message": "Query statistics reset"}
+
+@app.get("/admin/query-cache", response_model=dict, tags=["Admin"])
+async def get_query_cache_stats():
+    """Get query result cache hit/miss counters"""
+    return query_cache.stats()
+
+@app.post("/admin/query-cache/clear", response_model=dict, tags=["Admin"])
+async def clear_query_cache():
+    """Drop every cached query result"""
+    query_cache.clear()
+    return query_cache.stats()
+
+@app.get("/admin/search-index", response_model=dict, tags=["Admin"])
+async def get_search_index_stats():
+    """Get citizen name index statistics"""
+    return citizen_index.stats()
+
+@app.post("/admin/search-index/rebuild", response_model=dict, tags=["Admin"])
+async def rebuild_search_index():
+    """Rebuild the citizen name index from the citizens table"""
+    await run_in_threadpool(load_citizen_index)
+    return citizen_index.stats()
+
+@app.get("/admin/imports", response_model=List[dict], tags=["Admin"])
+async def get_running_imports():
+    """Progress of the CSV meter imports currently running"""
+    return [job.progress() for job in list(active_imports.values())]
+
+@app.get("/admin/partitions", response_model=dict, tags=["Admin"])
+async def get_partitions():
+    """Yearly partitions of the usage, bill and payment tables, with estimated row counts"""
+    try:
+        return {table: await run_in_threadpool(table_partitions, table) for table in PARTITIONED_TABLES}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/partitions/maintain", response_model=dict, tags=["Admin"])
+async def run_partition_maintenance(
+    future_years: Optional[int] = Query(None, ge=0, description="Years ahead to keep partitions ready for"),
+    retain_years: Optional[int] = Query(None, ge=0, description="Years kept in the live tables; 0 keeps everything"),
+    archive: Optional[bool] = Query(None, description="Archive retired years to <table>_<year> instead of dropping"),
+    dry_run: bool = Query(False, description="Only return the DDL that would run")
+):
+    """Add upcoming yearly partitions and archive or drop the ones past retention"""
+    try:
+        return await run_in_threadpool(maintain_partitions, future_years, retain_years, archive, dry_run)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/admin/transit-graph", response_model=dict, tags=["Admin"])
+async def get_transit_graph_stats():
+    """Get transit graph size and path cache statistics"""
+    return transit_graph.stats()
+
+@app.post("/admin/transit-graph/rebuild", response_model=dict, tags=["Admin"])
+async def rebuild_transit_graph():
+    """Rebuild the transit graph from the routes table"""
+    await run_in_threadpool(load_transit_graph)
+    return transit_graph.stats()
+
+@app.get("/admin/bus-positions", response_model=dict, tags=["Admin"])
+async def get_bus_position_stats():
+    """Get live bus position buffer statistics"""
+    return fleet_positions.stats()
+
+@app.get("/admin/dispatch-queue", response_model=dict, tags=["Admin"])
+async def get_dispatch_queue_stats():
+    """Get dispatch queue size and claim statistics"""
+    return dispatch_queue.stats()
+
+@app.post("/admin/dispatch-queue/rebuild", response_model=dict, tags=["Admin"])
+async def rebuild_dispatch_queue():
+    """Rebuild the dispatch queue from the open requests in the table"""
+    await run_in_threadpool(load_dispatch_queue)
+    return dispatch_queue.stats()
+
+@app.get("/admin/spatial-index", response_model=dict, tags=["Admin"])
+async def get_spatial_index_stats():
+    """Get spatial index and geocoding cache statistics"""
+    return incident_map.stats()
+
+@app.post("/admin/spatial-index/rebuild", response_model=dict, tags=["Admin"])
+async def rebuild_spatial_index():
+    """Reload the gazetteer and re-geocode every open request, open complaint and service unit"""
+    await run_in_threadpool(load_incident_map)
+    return incident_map.stats()
+
+@app.get("/admin/events", response_model=dict, tags=["Admin"])
+async def get_event_stats():
+    """Get live event subscriber and queue statistics"""
+    return event_hub.stats()
 
 # ==================== ROOT ROUTE ====================
 @app.get("/", tags=["Root"])
-def root():
+async def root():
     """API root endpoint"""
     return {
         "message": "Smart City Management System API",
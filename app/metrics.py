@@ -0,0 +1,187 @@
+"""
+Prometheus text-format metrics for HTTP requests, connection pools and the query cache
+"""
+import bisect
+import time
+from app.async_database import adb
+from app.database import db
+from app.query_cache import query_cache
+
+# Histogram upper bounds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+# Label for requests that matched no route, so scanners cannot inflate cardinality
+UNMATCHED_ROUTE = '<unmatched>'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _render_histogram(lines, name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=f"{bound:g}")} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram.total:.6f}')
+    lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
+
+
+class HttpMetrics:
+    """Request counters and histograms keyed by route template.
+
+    Updated only from the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self):
+        self.requests = {}
+        self.durations = {}
+        self.sizes = {}
+        self.in_flight = 0
+        self._route_paths = {}
+
+    def route_template(self, scope):
+        """Map the matched endpoint back to its path template"""
+        route = scope.get('route')
+        if route is not None:
+            return route.path
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            app = scope.get('app')
+            for candidate in getattr(app, 'routes', ()):
+                if getattr(candidate, 'endpoint', None) is not None:
+                    self._route_paths[candidate.endpoint] = candidate.path
+            path = self._route_paths.setdefault(endpoint, UNMATCHED_ROUTE)
+        return path
+
+    def record(self, method, route, status, duration, size):
+        key = (method, route)
+        counter_key = (method, route, status)
+        self.requests[counter_key] = self.requests.get(counter_key, 0) + 1
+        histogram = self.durations.get(key)
+        if histogram is None:
+            histogram = self.durations[key] = _Histogram(DURATION_BUCKETS)
+            self.sizes[key] = _Histogram(SIZE_BUCKETS)
+        histogram.observe(duration)
+        self.sizes[key].observe(size)
+
+    def render(self, lines):
+        lines.append('# HELP http_requests_total HTTP requests by method, route template and status')
+        lines.append('# TYPE http_requests_total counter')
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{_labels(method=method, route=route, status=status)} {count}')
+        lines.append('# HELP http_requests_in_flight HTTP requests currently being served')
+        lines.append('# TYPE http_requests_in_flight gauge')
+        lines.append(f'http_requests_in_flight {self.in_flight}')
+        lines.append('# HELP http_request_duration_seconds Time from request start to the last response byte')
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        for (method, route), histogram in sorted(self.durations.items()):
+            _render_histogram(lines, 'http_request_duration_seconds', {'method': method, 'route': route}, histogram)
+        lines.append('# HELP http_response_size_bytes Response body size')
+        lines.append('# TYPE http_response_size_bytes histogram')
+        for (method, route), histogram in sorted(self.sizes.items()):
+            _render_histogram(lines, 'http_response_size_bytes', {'method': method, 'route': route}, histogram)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing each HTTP request through to its last body chunk"""
+
+    def __init__(self, app, metrics: HttpMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        metrics = self.metrics
+        started = time.perf_counter()
+        response = {'status': 500, 'size': 0}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['size'] += len(message.get('body', b''))
+            await send(message)
+
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            metrics.record(scope['method'], metrics.route_template(scope), response['status'],
+                           time.perf_counter() - started, response['size'])
+
+
+def _render_pool(lines, pools):
+    gauges = (('size', 'Open connections'), ('idle', 'Idle connections'),
+              ('in_use', 'Checked-out connections'), ('max_size', 'Connection limit'))
+    for field, help_text in gauges:
+        lines.append(f'# HELP db_pool_{field} {help_text}')
+        lines.append(f'# TYPE db_pool_{field} gauge')
+        for pool, stats in pools.items():
+            lines.append(f'db_pool_{field}{_labels(pool=pool)} {stats[field]}')
+    counters = (('checkouts', 'Connection checkouts'), ('waits', 'Checkouts that had to wait'),
+                ('timeouts', 'Checkouts that timed out'), ('created', 'Connections opened'),
+                ('recycled', 'Connections recycled for age or idleness'), ('failed_pings', 'Stale connections dropped'))
+    for field, help_text in counters:
+        lines.append(f'# HELP db_pool_{field}_total {help_text}')
+        lines.append(f'# TYPE db_pool_{field}_total counter')
+        for pool, stats in pools.items():
+            if field in stats:
+                lines.append(f'db_pool_{field}_total{_labels(pool=pool)} {stats[field]}')
+
+
+def _render_cache(lines, stats):
+    lines.append('# HELP query_cache_entries Cached query results')
+    lines.append('# TYPE query_cache_entries gauge')
+    lines.append(f'query_cache_entries {stats["entries"]}')
+    counters = (('hits', 'Lookups answered from the cache'), ('misses', 'Lookups that went to the database'),
+                ('stores', 'Results cached'), ('rejected_stores', 'Results not cached because a write raced the read'),
+                ('invalidations', 'Cached results dropped after a write'),
+                ('evictions', 'Cached results dropped to stay within the size limit'),
+                ('expirations', 'Cached results found past their TTL'))
+    for field, help_text in counters:
+        lines.append(f'# HELP query_cache_{field}_total {help_text}')
+        lines.append(f'# TYPE query_cache_{field}_total counter')
+        lines.append(f'query_cache_{field}_total {stats[field]}')
+
+
+def render_metrics(metrics: HttpMetrics) -> str:
+    """Render every metric family in the Prometheus text exposition format"""
+    lines = []
+    metrics.render(lines)
+    _render_pool(lines, {'async': adb.pool_stats(), 'sync': db.pool_stats()})
+    _render_cache(lines, query_cache.stats())
+    lines.append('')
+    return '\n'.join(lines)
+
+
+# Global HTTP metrics, fed by MetricsMiddleware
+http_metrics = HttpMetrics()
@@ -1,10 +1,15 @@
 """
 Pydantic models for request/response validation
 """
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Literal
 from datetime import date, datetime
 
+# Pagination Models
+class Page(BaseModel):
+    items: List[dict]
+    next_cursor: Optional[str] = None
+
 # Address Models
 class AddressBase(BaseModel):
     street: Optional[str] = None
@@ -86,6 +91,10 @@ class ElectricityUsageUpdate(BaseModel):
     units_consumed: Optional[float] = None
     meter_reading_time: Optional[datetime] = None
 
+class ElectricityUsageReading(BaseModel):
+    units_consumed: float
+    meter_reading_time: Optional[datetime] = None
+
 class ElectricityUsage(ElectricityUsageBase):
     usage_id: int
     created_at: datetime
@@ -110,6 +119,10 @@ class WaterUsageUpdate(BaseModel):
     litres_consumed: Optional[float] = None
     recorded_at: Optional[datetime] = None
 
+class WaterUsageReading(BaseModel):
+    litres_consumed: float
+    recorded_at: Optional[datetime] = None
+
 class WaterUsage(WaterUsageBase):
     usage_id: int
     created_at: datetime
@@ -268,6 +281,15 @@ class Bus(BusBase):
     class Config:
         from_attributes = True
 
+class BusPing(BaseModel):
+    bus_id: int
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    # Time the unit took the fix; defaults to the time it was received
+    recorded_at: Optional[datetime] = None
+    speed_kmh: Optional[float] = Field(None, ge=0)
+    heading: Optional[float] = Field(None, ge=0, lt=360)
+
 # Emergency Service Models
 class EmergencyServiceBase(BaseModel):
     service_type: str
@@ -297,6 +319,8 @@ class EmergencyRequestBase(BaseModel):
     incident_datetime: Optional[datetime] = None
     location: Optional[str] = None
     status: Optional[str] = "Open"
+    # 1 (critical) to 5 (minor)
+    severity: int = Field(3, ge=1, le=5)
     notes: Optional[str] = None
 
 class EmergencyRequestCreate(EmergencyRequestBase):
@@ -309,6 +333,7 @@ class EmergencyRequestUpdate(BaseModel):
     incident_datetime: Optional[datetime] = None
     location: Optional[str] = None
     status: Optional[str] = None
+    severity: Optional[int] = Field(None, ge=1, le=5)
     notes: Optional[str] = None
 
 class EmergencyRequest(EmergencyRequestBase):
@@ -438,3 +463,11 @@ class ComplaintUpdate(ComplaintUpdateBase):
     class Config:
         from_attributes = True
 
+# Billing Run Models
+class BillingRunRequest(BaseModel):
+    utility: Literal['electricity', 'water']
+    year: int
+    month: int
+    mode: Literal['upsert', 'insert'] = 'upsert'
+    dry_run: bool = False
+    due_days: Optional[int] = None
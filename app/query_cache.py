@@ -0,0 +1,200 @@
+"""
+Process-local cache of SELECT results with table-level invalidation
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from app.config import QUERY_CACHE_CONFIG
+
+# Tables a SELECT reads from
+_READ_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+`?(\w+)`?', re.IGNORECASE)
+# Tables written by each statement of a (possibly multi-statement) query
+_WRITE_TABLES = re.compile(
+    r'(?:^|;)\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE\s+(?:TABLE\s+)?)\s*`?(\w+)`?',
+    re.IGNORECASE,
+)
+# Reads whose result depends on more than the table contents
+_VOLATILE = re.compile(r'\b(?:NOW|CURDATE|CURRENT_TIMESTAMP|RAND|UUID|LAST_INSERT_ID)\b|\bFOR\s+UPDATE\b|\bLOCK\s+IN\b',
+                       re.IGNORECASE)
+
+
+def read_tables(query: str):
+    return {table.lower() for table in _READ_TABLES.findall(query)}
+
+
+def written_tables(query: str):
+    return {table.lower() for table in _WRITE_TABLES.findall(query)}
+
+
+def _freeze(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    if isinstance(params, (list, tuple)):
+        return tuple(params)
+    return params
+
+
+def _copy(value):
+    # Callers may mutate returned rows (e.g. decoding JSON columns in place)
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return dict(value)
+    return [dict(row) for row in value]
+
+
+class TrackingCursor:
+    """Cursor proxy that records the tables written through it"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.written = set()
+
+    def execute(self, query, args=None):
+        self.written |= written_tables(query)
+        return self._cursor.execute(query, args)
+
+    def executemany(self, query, args):
+        self.written |= written_tables(query)
+        return self._cursor.executemany(query, args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class QueryCache:
+    """LRU + TTL memo of SELECT results keyed by query text and parameters.
+
+    Only reads that touch the configured tables are cached. Every write made
+    through this process bumps a per-table generation; a result read before a
+    concurrent write is refused when it is stored, so the cache never holds
+    rows older than the last local write. Writes from other processes are
+    bounded by the TTL.
+    """
+
+    def __init__(self, enabled=True, max_entries=2048, ttl=60.0, max_rows=1000, tables=None):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.tables = None if tables is None else frozenset(tables)
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'rejected_stores': 0,
+            'invalidations': 0,
+            'evictions': 0,
+            'expirations': 0,
+        }
+
+    def _cacheable_tables(self, query):
+        if not self.enabled or query.lstrip()[:6].upper() != 'SELECT' or _VOLATILE.search(query):
+            return None
+        tables = read_tables(query)
+        if not tables or (self.tables is not None and not tables <= self.tables):
+            return None
+        return tables
+
+    def lookup(self, kind, query, params=None):
+        """Return (hit, value, ticket); pass the ticket to store() after a miss"""
+        tables = self._cacheable_tables(query)
+        if tables is None:
+            return False, None, None
+        try:
+            key = (kind, query, _freeze(params))
+            hash(key)
+        except TypeError:
+            return False, None, None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return True, _copy(value), None
+                self._drop(key)
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            generations = tuple(self._generations.get(table, 0) for table in sorted(tables))
+        return False, None, (key, tables, generations)
+
+    def store(self, ticket, value):
+        """Cache a result fetched after a miss, unless a write raced with the read"""
+        if ticket is None:
+            return
+        key, tables, generations = ticket
+        if isinstance(value, list) and len(value) > self.max_rows:
+            return
+        with self._lock:
+            if generations != tuple(self._generations.get(table, 0) for table in sorted(tables)):
+                self._stats['rejected_stores'] += 1
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tables, _copy(value))
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def _drop(self, key):
+        _, tables, _ = self._entries.pop(key)
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def invalidate(self, tables):
+        """Forget every cached result that read from any of the given tables"""
+        if not tables:
+            return
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in list(self._by_table.get(table, ())):
+                    self._drop(key)
+                    self._stats['invalidations'] += 1
+
+    def written(self, query):
+        """Invalidate the tables a just-executed statement wrote to"""
+        if self.enabled:
+            self.invalidate(written_tables(query))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            for table in self._generations:
+                self._generations[table] += 1
+
+    def stats(self):
+        """Snapshot of cache counters"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'tables': sorted(self.tables) if self.tables is not None else '*',
+                'hit_ratio': round(self._stats['hits'] / lookups, 4) if lookups else None,
+                **self._stats,
+            }
+
+
+# Global query cache shared by the sync and async database layers
+query_cache = QueryCache(**QUERY_CACHE_CONFIG)
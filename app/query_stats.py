@@ -0,0 +1,260 @@
+"""
+Per-statement instrumentation and slow-query log for the database layers
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from app.config import QUERY_STATS_CONFIG
+
+slow_query_logger = logging.getLogger('app.slow_query')
+
+# Latency histogram upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+OVERFLOW_FINGERPRINT = '<other>'
+
+_COMMENTS = re.compile(r'/\*.*?\*/|--[^\n]*', re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_PLACEHOLDERS = re.compile(r'%\(\w+\)s|%s')
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(query: str) -> str:
+    """Normalize a statement so every execution of it shares one key"""
+    text = _COMMENTS.sub(' ', query)
+    text = _STRINGS.sub('?', text)
+    text = _PLACEHOLDERS.sub('?', text)
+    text = _NUMBERS.sub('?', text)
+    text = _IN_LISTS.sub('(?+)', text)
+    return _WHITESPACE.sub(' ', text).strip().rstrip(';').strip()
+
+
+def _shape(value):
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return f"<str:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact(params):
+    """Replace parameter values with their types so logs never carry data"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _shape(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        if params and isinstance(params[0], (dict, list, tuple)):
+            return f"<{len(params)} rows>"
+        return [_shape(value) for value in params]
+    return _shape(params)
+
+
+class _StatementStats:
+    __slots__ = ('calls', 'errors', 'rows', 'total_time', 'max_time', 'acquire_time',
+                 'max_acquire_time', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.acquire_time = 0.0
+        self.max_acquire_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def copy(self):
+        other = _StatementStats()
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        other.buckets = list(self.buckets)
+        return other
+
+
+def _percentile(buckets, calls, fraction):
+    """Upper bound of the histogram bucket holding the given fraction of calls"""
+    if not calls:
+        return None
+    target = calls * fraction
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, buckets):
+        seen += count
+        if seen >= target:
+            return bound
+    return float('inf')
+
+
+class Probe:
+    """Measurements for one statement, filled in while it runs"""
+    __slots__ = ('started', 'acquired_at', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.acquired_at = None
+        self.rows = 0
+
+    def acquired(self):
+        """Mark the moment a pooled connection was handed over"""
+        self.acquired_at = time.perf_counter()
+
+
+class QueryStats:
+    """Aggregates latency, rows, connection wait and errors per query fingerprint"""
+
+    def __init__(self, enabled=True, slow_query_ms=500.0, max_fingerprints=500):
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.max_fingerprints = max_fingerprints
+        self._statements = {}
+        self._lock = threading.Lock()
+        self.reset_at = time.time()
+
+    @contextmanager
+    def observe(self, query, params=None):
+        """Time a statement from connection checkout to its last fetched row"""
+        if not self.enabled:
+            yield Probe()
+            return
+        probe = Probe()
+        error = False
+        try:
+            yield probe
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(query, params, probe, time.perf_counter(), error)
+
+    def record(self, query, params, probe, finished, error=False):
+        """Fold one finished statement into its fingerprint's totals"""
+        if not self.enabled:
+            return
+        acquired_at = probe.acquired_at or probe.started
+        acquire = acquired_at - probe.started
+        elapsed = finished - acquired_at
+        key = fingerprint(query)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                if len(self._statements) >= self.max_fingerprints:
+                    key = OVERFLOW_FINGERPRINT
+                    stats = self._statements.get(key)
+                if stats is None:
+                    stats = self._statements[key] = _StatementStats()
+            stats.calls += 1
+            stats.errors += error
+            stats.rows += probe.rows
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            stats.acquire_time += acquire
+            stats.max_acquire_time = max(stats.max_acquire_time, acquire)
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        if self.slow_query_seconds and elapsed >= self.slow_query_seconds:
+            slow_query_logger.warning("Slow query %.1f ms (waited %.1f ms for a connection, %d rows%s): %s params=%s",
+                                      elapsed * 1000, acquire * 1000, probe.rows, ", failed" if error else "",
+                                      key, redact(params))
+
+    def histograms(self):
+        """Raw per-fingerprint histograms, for metrics exporters"""
+        with self._lock:
+            return {key: stats.copy() for key, stats in self._statements.items()}
+
+    def snapshot(self, sort='total_time_ms', limit=50):
+        """Per-fingerprint summaries, heaviest first"""
+        with self._lock:
+            items = [(key, stats.copy()) for key, stats in self._statements.items()]
+        summaries = []
+        for key, stats in items:
+            calls, buckets = stats.calls, stats.buckets
+            summaries.append({
+                'fingerprint': key,
+                'calls': calls,
+                'errors': stats.errors,
+                'rows': stats.rows,
+                'rows_per_call': round(stats.rows / calls, 2) if calls else 0,
+                'total_time_ms': round(stats.total_time * 1000, 3),
+                'mean_ms': round(stats.total_time * 1000 / calls, 3) if calls else 0,
+                'max_ms': round(stats.max_time * 1000, 3),
+                'p50_ms': _bound_ms(_percentile(buckets, calls, 0.5)),
+                'p95_ms': _bound_ms(_percentile(buckets, calls, 0.95)),
+                'p99_ms': _bound_ms(_percentile(buckets, calls, 0.99)),
+                'acquire_total_ms': round(stats.acquire_time * 1000, 3),
+                'acquire_max_ms': round(stats.max_acquire_time * 1000, 3),
+                'histogram_ms': {_bucket_label(i): count for i, count in enumerate(buckets) if count},
+            })
+        summaries.sort(key=lambda summary: summary[sort], reverse=True)
+        return {
+            'since': self.reset_at,
+            'slow_query_ms': self.slow_query_seconds * 1000,
+            'fingerprints': len(items),
+            'statements': summaries[:limit],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self.reset_at = time.time()
+
+
+def _bound_ms(bound):
+    if bound is None:
+        return None
+    return '+Inf' if bound == float('inf') else bound * 1000
+
+
+def _bucket_label(index):
+    return f"le_{LATENCY_BUCKETS[index] * 1000:g}" if index < len(LATENCY_BUCKETS) else 'le_+Inf'
+
+
+class InstrumentedCursor:
+    """Cursor proxy that records each statement run through it"""
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, query, args=None):
+        with self._stats.observe(query, args) as probe:
+            probe.acquired()
+            result = self._cursor.execute(query, args)
+            probe.rows = max(self._cursor.rowcount, 0)
+            return result
+
+    def executemany(self, query, args):
+        with self._stats.observe(query, args) as probe:
+            probe.acquired()
+            result = self._cursor.executemany(query, args)
+            probe.rows = max(self._cursor.rowcount, 0)
+            return result
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class AsyncInstrumentedCursor(InstrumentedCursor):
+    """InstrumentedCursor for aiomysql cursors"""
+
+    async def execute(self, query, args=None):
+        with self._stats.observe(query, args) as probe:
+            probe.acquired()
+            result = await self._cursor.execute(query, args)
+            probe.rows = max(self._cursor.rowcount, 0)
+            return result
+
+    async def executemany(self, query, args):
+        with self._stats.observe(query, args) as probe:
+            probe.acquired()
+            result = await self._cursor.executemany(query, args)
+            probe.rows = max(self._cursor.rowcount, 0)
+            return result
+
+
+# Global statement statistics shared by the sync and async database layers
+query_stats = QueryStats(**QUERY_STATS_CONFIG)
@@ -0,0 +1,3 @@
+"""
+In-process services backing the API
+"""
@@ -0,0 +1,291 @@
+"""
+Live bus positions: the last N GPS pings of every bus, held in fixed-size ring buffers
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+from app.config import POSITIONS_CONFIG
+from app.database import db
+from app.hooks import on_change
+
+logger = logging.getLogger(__name__)
+
+# Columns of a stored ping; speed and heading are NaN when the unit did not send them
+PING_FIELDS = ('recorded_at', 'latitude', 'longitude', 'speed_kmh', 'heading')
+_BUS_COLUMNS = ('bus_id', 'route_id', 'registration_no', 'active')
+# Pings stamped further ahead than this are refused; one would hold back every later ping as stale
+MAX_CLOCK_SKEW = 300
+
+
+class PositionRing:
+    """Last `size` pings of one bus in a single float64 array, oldest overwritten first"""
+    __slots__ = ('data', 'head', 'count')
+
+    def __init__(self, size: int):
+        self.data = np.full((size, len(PING_FIELDS)), np.nan)
+        self.head = 0
+        self.count = 0
+
+    @property
+    def newest(self):
+        """Timestamp of the newest ping, -inf when empty"""
+        return self.data[(self.head - 1) % len(self.data), 0] if self.count else -np.inf
+
+    def extend(self, pings):
+        """Append time-ordered pings; at most the last `size` are kept"""
+        size = len(self.data)
+        pings = pings[-size:]
+        n = len(pings)
+        first = min(n, size - self.head)
+        self.data[self.head:self.head + first] = pings[:first]
+        # Wrap around to the start of the buffer
+        self.data[:n - first] = pings[first:]
+        self.head = (self.head + n) % size
+        self.count = min(self.count + n, size)
+
+    def latest(self, limit: int = None):
+        """Pings newest first"""
+        limit = self.count if limit is None else min(limit, self.count)
+        index = (self.head - 1 - np.arange(limit)) % len(self.data)
+        return self.data[index]
+
+
+def _ping_dict(values):
+    ping = {}
+    for field, value in zip(PING_FIELDS, values.tolist()):
+        if field == 'recorded_at':
+            ping[field] = datetime.fromtimestamp(value, timezone.utc).isoformat()
+        else:
+            ping[field] = None if value != value else value
+    return ping
+
+
+class FleetPositions:
+    """Ring buffers per bus plus a bus -> route directory mirrored from the buses table.
+
+    Pings never touch MySQL: ingestion is a few array writes per bus under a
+    lock, fleet queries read straight from memory, and a periodic snapshot
+    to disk lets a restart pick up where it left off.
+    """
+
+    def __init__(self, buffer_size: int = 120, snapshot_path: str = None, snapshot_interval: float = 30):
+        self.buffer_size = buffer_size
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._rings = {}
+        self._buses = {}
+        self._by_route = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self.directory_ready = False
+        self.received = 0
+        self.stored = 0
+        self.last_snapshot_at = None
+
+    # ---- bus directory ----
+
+    def _unlink(self, bus_id):
+        bus = self._buses.pop(bus_id, None)
+        if bus is not None:
+            buses = self._by_route.get(bus['route_id'])
+            if buses is not None:
+                buses.discard(bus_id)
+                if not buses:
+                    del self._by_route[bus['route_id']]
+
+    def put_bus(self, row):
+        with self._lock:
+            self._unlink(row['bus_id'])
+            self._buses[row['bus_id']] = {column: row.get(column) for column in _BUS_COLUMNS}
+            self._by_route.setdefault(row['route_id'], set()).add(row['bus_id'])
+
+    def delete_bus(self, bus_id: int):
+        with self._lock:
+            self._unlink(bus_id)
+            self._rings.pop(bus_id, None)
+
+    def load_buses(self, rows):
+        with self._lock:
+            self._buses.clear()
+            self._by_route.clear()
+        for row in rows:
+            self.put_bus(row)
+        self.directory_ready = True
+
+    # ---- ingestion ----
+
+    def ingest(self, pings):
+        """Store a batch of (bus_id, recorded_at epoch, lat, lon, speed, heading) rows.
+
+        Pings are grouped per bus and ordered by time; any not newer than what
+        the bus already holds (replays, late arrivals, repeats within the
+        batch) are dropped, so every buffer stays strictly in time order. Returns (stored, stale, unknown bus ids).
+        """
+        if not len(pings):
+            return 0, 0, []
+        batch = np.asarray(pings, dtype=np.float64).reshape(-1, len(PING_FIELDS) + 1)
+        batch = batch[np.lexsort((batch[:, 1], batch[:, 0]))]
+        bus_ids, starts = np.unique(batch[:, 0], return_index=True)
+        ends = np.append(starts[1:], len(batch))
+        stored = stale = 0
+        unknown = []
+        with self._lock:
+            for bus_id, start, end in zip(bus_ids.astype(np.int64).tolist(), starts, ends):
+                # Until the directory has loaded every bus is accepted
+                if self.directory_ready and bus_id not in self._buses:
+                    unknown.append(bus_id)
+                    continue
+                ring = self._rings.get(bus_id)
+                if ring is None:
+                    ring = self._rings[bus_id] = PositionRing(self.buffer_size)
+                rows = batch[start:end, 1:]
+                fresh = rows[rows[:, 0] > ring.newest]
+                fresh = fresh[np.diff(fresh[:, 0], prepend=-np.inf) > 0]
+                if len(fresh):
+                    ring.extend(fresh)
+                stored += len(fresh)
+                stale += len(rows) - len(fresh)
+            self.received += len(batch)
+            self.stored += stored
+        return stored, stale, unknown
+
+    # ---- queries ----
+
+    def history(self, bus_id: int, limit: int = None):
+        """Buffered pings of one bus, newest first; None if it has none"""
+        with self._lock:
+            ring = self._rings.get(bus_id)
+            if ring is None or not ring.count:
+                return None
+            return [_ping_dict(values) for values in ring.latest(limit)]
+
+    def route_fleet(self, route_id: int, active_only: bool = False):
+        """Every bus on a route with its latest position (None before its first ping)"""
+        now = time.time()
+        fleet = []
+        with self._lock:
+            for bus_id in sorted(self._by_route.get(route_id, ())):
+                bus = self._buses[bus_id]
+                if active_only and not bus['active']:
+                    continue
+                ring = self._rings.get(bus_id)
+                position = None
+                if ring is not None and ring.count:
+                    values = ring.latest(1)[0]
+                    position = {**_ping_dict(values), 'age_seconds': round(float(now - values[0]), 3)}
+                fleet.append({**bus, 'position': position})
+        return fleet
+
+    def stats(self):
+        with self._lock:
+            return {
+                'directory_ready': self.directory_ready,
+                'buses': len(self._buses),
+                'tracked_buses': len(self._rings),
+                'buffer_size': self.buffer_size,
+                'buffered_pings': sum(ring.count for ring in self._rings.values()),
+                'pings_received': self.received,
+                'pings_stored': self.stored,
+                'memory_bytes': sum(ring.data.nbytes for ring in self._rings.values()),
+                'last_snapshot_at': self.last_snapshot_at,
+            }
+
+    # ---- snapshots ----
+
+    def save_snapshot(self):
+        """Write every buffer to snapshot_path atomically; returns the number of buses saved"""
+        if not self.snapshot_path:
+            return 0
+        with self._lock:
+            bus_ids = np.array(sorted(self._rings), dtype=np.int64)
+            # Oldest first, so loading is a plain extend
+            rings = [self._rings[bus_id] for bus_id in bus_ids.tolist()]
+            counts = np.array([ring.count for ring in rings], dtype=np.int64)
+            data = np.full((len(rings), self.buffer_size, len(PING_FIELDS)), np.nan)
+            for i, ring in enumerate(rings):
+                data[i, :ring.count] = ring.latest()[::-1]
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.snapshot_path}.tmp"
+        with open(temporary, 'wb') as f:
+            np.savez(f, bus_ids=bus_ids, counts=counts, data=data)
+        os.replace(temporary, self.snapshot_path)
+        self.last_snapshot_at = time.time()
+        return len(bus_ids)
+
+    def load_snapshot(self):
+        """Restore buffers from the last snapshot, if there is one"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        with np.load(self.snapshot_path) as snapshot:
+            bus_ids, counts, data = snapshot['bus_ids'], snapshot['counts'], snapshot['data']
+        with self._lock:
+            for bus_id, count, pings in zip(bus_ids.tolist(), counts.tolist(), data):
+                ring = self._rings.setdefault(bus_id, PositionRing(self.buffer_size))
+                pings = pings[:count]
+                ring.extend(pings[pings[:, 0] > ring.newest])
+        logger.info("Restored positions of %d buses from %s", len(bus_ids), self.snapshot_path)
+        return len(bus_ids)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.save_snapshot)
+            except Exception as e:
+                logger.warning("Bus position snapshot failed: %s", e)
+
+    def start(self):
+        """Start the snapshot loop on the running event loop; a zero interval disables it"""
+        if self.snapshot_path and self.snapshot_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the snapshot loop and write a final snapshot"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.save_snapshot)
+        except Exception as e:
+            logger.warning("Bus position snapshot failed: %s", e)
+
+
+# Global live position store
+fleet_positions = FleetPositions(POSITIONS_CONFIG['buffer_size'], POSITIONS_CONFIG['snapshot_path'],
+                                 POSITIONS_CONFIG['snapshot_interval'])
+
+
+def load_fleet_positions():
+    """Restore the last snapshot and load the bus directory; pings are accepted meanwhile"""
+    try:
+        fleet_positions.load_snapshot()
+    except Exception as e:
+        logger.warning("Could not restore bus positions: %s", e)
+    try:
+        fleet_positions.load_buses(db.execute_query(f"SELECT {', '.join(_BUS_COLUMNS)} FROM buses"))
+    except Exception as e:
+        logger.warning("Could not load bus directory: %s", e)
+
+
+@on_change('buses', blocking=True)
+def _sync_bus_directory(table, action, rows):
+    for row in rows:
+        if action == 'delete':
+            fleet_positions.delete_bus(row['bus_id'])
+            continue
+        if any(column not in row for column in _BUS_COLUMNS):
+            # Partial updates only carry the changed columns
+            row = db.execute_one(f"SELECT {', '.join(_BUS_COLUMNS)} FROM buses WHERE bus_id = %s", (row['bus_id'],))
+            if row is None:
+                continue
+        fleet_positions.put_bus(row)
@@ -0,0 +1,337 @@
+"""
+In-memory trigram index over citizen names
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from app.config import SEARCH_CONFIG
+from app.hooks import on_change
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+# Match kinds, best first
+EXACT, NAME_PREFIX, WORD_PREFIX, SUBSTRING = range(4)
+MATCH_KINDS = ('exact', 'prefix', 'word_prefix', 'substring')
+_NO_POSTINGS = frozenset()
+
+
+def normalize(text: str) -> str:
+    """Casefold, strip accents and collapse whitespace"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().split())
+
+
+def name_trigrams(norm: str):
+    """Trigrams of every word, padded so word starts get their own grams"""
+    grams = set()
+    for word in norm.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def query_trigrams(norm: str):
+    """Grams every matching name must contain.
+
+    Words of three or more characters contribute their inner trigrams, so they
+    match anywhere inside a name word. Shorter words can only be anchored to a
+    word start, which holds for any word after the first (it follows a space)
+    and for a query made of a single short word (typeahead prefix search).
+    """
+    words = norm.split()
+    grams = set()
+    for position, word in enumerate(words):
+        if len(word) >= 3:
+            grams.update(word[i:i + 3] for i in range(len(word) - 2))
+        elif position > 0 or len(words) == 1:
+            grams.add(f"  {word}"[-3:])
+    return grams
+
+
+def _rank(norm: str, q: str) -> int:
+    if norm == q:
+        return EXACT
+    if norm.startswith(q):
+        return NAME_PREFIX
+    if f" {q}" in f" {norm}":
+        return WORD_PREFIX
+    return SUBSTRING
+
+
+def _word_starts(norm: str):
+    return [0] + [i + 1 for i, ch in enumerate(norm) if ch == ' ']
+
+
+class SortedKeys:
+    """A sorted sequence kept as a list of short sorted buckets.
+
+    One flat sorted list pays an O(n) memmove on every insert and delete.
+    Here a binary search over the bucket maxima finds the bucket, and the
+    memmove is bounded by the bucket size, so writes stay O(log n) as the
+    index grows. Buckets split once they reach twice bucket_size.
+    """
+
+    def __init__(self, bucket_size: int = 512):
+        self.bucket_size = bucket_size
+        self._buckets = []
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            yield from bucket
+
+    def clear(self):
+        self._buckets = []
+        self._maxes = []
+        self._len = 0
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            return
+        i = min(bisect.bisect_left(self._maxes, key), len(self._maxes) - 1)
+        bucket = self._buckets[i]
+        bisect.insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        self._len += 1
+        if len(bucket) >= 2 * self.bucket_size:
+            self._buckets[i:i + 1] = [bucket[:self.bucket_size], bucket[self.bucket_size:]]
+            self._maxes.insert(i, bucket[self.bucket_size - 1])
+
+    def discard(self, key):
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return
+        bucket = self._buckets[i]
+        j = bisect.bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            return
+        del bucket[j]
+        self._len -= 1
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+
+    def from_key(self, key):
+        """Keys from the first one >= key onwards, in order"""
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return
+        bucket = self._buckets[i]
+        yield from bucket[bisect.bisect_left(bucket, key):]
+        for bucket in self._buckets[i + 1:]:
+            yield from bucket
+
+
+class CitizenNameIndex:
+    """Sorted names and name words plus trigram postings over citizen names.
+
+    Exact, prefix and word-prefix matches come from binary searches over the
+    sorted keys, so they cost O(log n + limit) however broad the query is,
+    and so does keeping the keys sorted on every write (see SortedKeys).
+    Trigram postings are only consulted for the substring tier, when the
+    prefix tiers did not fill the requested page.
+    """
+
+    def __init__(self, max_candidates: int = 20000):
+        self.max_candidates = max_candidates
+        self._names = {}
+        self._by_name = SortedKeys()
+        self._by_word = SortedKeys()
+        self._postings = defaultdict(set)
+        self._lock = threading.RLock()
+        self._loading = False
+        self._touched = set()
+        self.ready = False
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._names)
+
+    def _add(self, citizen_id, name):
+        norm = normalize(name)
+        self._names[citizen_id] = norm
+        self._by_name.add((norm, citizen_id))
+        for start in _word_starts(norm)[1:]:
+            self._by_word.add((norm[start:], citizen_id))
+        for gram in name_trigrams(norm):
+            self._postings[gram].add(citizen_id)
+
+    def _remove(self, citizen_id):
+        norm = self._names.pop(citizen_id, None)
+        if norm is None:
+            return
+        self._by_name.discard((norm, citizen_id))
+        for start in _word_starts(norm)[1:]:
+            self._by_word.discard((norm[start:], citizen_id))
+        for gram in name_trigrams(norm):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(citizen_id)
+                if not postings:
+                    del self._postings[gram]
+
+    def put(self, citizen_id: int, name: str):
+        """Add or replace the indexed name of a citizen"""
+        with self._lock:
+            if self._loading:
+                self._touched.add(citizen_id)
+            self._remove(citizen_id)
+            self._add(citizen_id, name)
+
+    def delete(self, citizen_id: int):
+        with self._lock:
+            if self._loading:
+                self._touched.add(citizen_id)
+            self._remove(citizen_id)
+
+    def load(self, batches):
+        """Rebuild from batches of {citizen_id, name} rows.
+
+        Live writes that land while loading win over the rows being loaded,
+        which may have been read before those writes committed.
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._names.clear()
+            self._by_name.clear()
+            self._by_word.clear()
+            self._postings.clear()
+            self._touched.clear()
+            self._loading = True
+            self.ready = False
+        try:
+            for rows in batches:
+                with self._lock:
+                    for row in rows:
+                        if row['citizen_id'] not in self._touched:
+                            self._add(row['citizen_id'], row['name'])
+        finally:
+            with self._lock:
+                self._loading = False
+                self._touched.clear()
+        self.ready = True
+        self.loaded_at = time.time()
+        logger.info("Indexed %d citizen names in %.2fs", len(self._names), time.monotonic() - started)
+
+    @staticmethod
+    def _scan_prefix(entries, q, limit, hits, seen, kind):
+        for key, citizen_id in entries.from_key((q,)):
+            if len(hits) >= limit or not key.startswith(q):
+                break
+            if citizen_id not in seen:
+                seen.add(citizen_id)
+                hits.append((citizen_id, MATCH_KINDS[EXACT if key == q and kind == NAME_PREFIX else kind]))
+
+    def _scan_substring(self, q, limit, hits, seen):
+        grams = query_trigrams(q)
+        if not grams:
+            return
+        postings = sorted((self._postings.get(gram, _NO_POSTINGS) for gram in grams), key=len)
+        matches = []
+        for citizen_id in postings[0].intersection(*postings[1:]):
+            if citizen_id in seen:
+                continue
+            norm = self._names[citizen_id]
+            if q in norm:
+                matches.append((norm, citizen_id))
+                # Very broad queries are capped to bound latency
+                if len(matches) >= self.max_candidates:
+                    break
+        hits.extend((citizen_id, MATCH_KINDS[SUBSTRING])
+                    for _, citizen_id in heapq.nsmallest(limit - len(hits), matches))
+
+    def search(self, query: str, limit: int = 20):
+        """Return [(citizen_id, match_kind)]: exact, prefix, word prefix, then substring,
+        alphabetical within each kind"""
+        q = normalize(query)
+        if not q:
+            return []
+        hits = []
+        seen = set()
+        with self._lock:
+            # The exact name sorts first among names it prefixes
+            self._scan_prefix(self._by_name, q, limit, hits, seen, NAME_PREFIX)
+            if len(hits) < limit:
+                self._scan_prefix(self._by_word, q, limit, hits, seen, WORD_PREFIX)
+            # Shorter queries are anchored to word starts, which the tiers above cover
+            if len(hits) < limit and len(q) >= 3:
+                self._scan_substring(q, limit, hits, seen)
+        return hits
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'names': len(self._names),
+                'word_keys': len(self._by_word),
+                'trigrams': len(self._postings),
+                'loaded_at': self.loaded_at,
+            }
+
+
+def match_kind(name: str, query: str) -> str:
+    """Classify how a name matched a query, as reported by the search endpoints"""
+    return MATCH_KINDS[_rank(normalize(name), normalize(query))]
+
+
+def fallback_query(query: str, limit: int, skip: int = 0):
+    """SQL used while the index is still loading; ranks like the index does"""
+    q = ' '.join(query.split())
+    escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    sql = """
+        SELECT * FROM citizens WHERE name LIKE %(pattern)s
+        ORDER BY name = %(q)s DESC, name LIKE %(prefix)s DESC, name LIKE %(word_prefix)s DESC, name, citizen_id
+        LIMIT %(limit)s OFFSET %(skip)s
+    """
+    params = {'pattern': f"%{escaped}%", 'prefix': f"{escaped}%", 'word_prefix': f"% {escaped}%", 'q': q, 'limit': limit, 'skip': skip}
+    return sql, params
+
+
+def hits_query(hits):
+    """Fetch the rows for index hits in one round trip"""
+    placeholders = ', '.join(['%s'] * len(hits))
+    return f"SELECT * FROM citizens WHERE citizen_id IN ({placeholders})", tuple(cid for cid, _ in hits)
+
+
+def order_hits(rows, hits):
+    """Put fetched rows back into ranked order and tag each with its match kind"""
+    by_id = {row['citizen_id']: row for row in rows}
+    # Rows deleted since they were indexed are simply dropped
+    return [{**by_id[cid], 'match': kind} for cid, kind in hits if cid in by_id]
+
+
+# Global citizen name index
+citizen_index = CitizenNameIndex(SEARCH_CONFIG['max_candidates'])
+
+
+def load_citizen_index():
+    """Build the index from the citizens table; searches use SQL until it is ready"""
+    try:
+        citizen_index.load(db.stream_query("SELECT citizen_id, name FROM citizens",
+                                           batch_size=SEARCH_CONFIG['load_batch_size']))
+    except Exception as e:
+        logger.warning("Could not build citizen name index: %s", e)
+
+
+@on_change('citizens')
+def _sync_citizen_index(table, action, rows):
+    for row in rows:
+        if action == 'delete':
+            citizen_index.delete(row['citizen_id'])
+        elif row.get('name') is not None:
+            citizen_index.put(row['citizen_id'], row['name'])
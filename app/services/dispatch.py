@@ -0,0 +1,322 @@
+"""
+Emergency dispatch queue: open requests ordered by severity, service type and age
+"""
+import heapq
+import logging
+import threading
+import time
+from app.async_database import adb
+from app.config import DISPATCH_CONFIG
+from app.database import db
+from app.hooks import notify_async, on_change
+
+logger = logging.getLogger(__name__)
+
+# Severity runs from 1 (critical) to 5 (minor); rows written before the column existed are middling
+DEFAULT_SEVERITY = 3
+_QUEUE_COLUMNS = ('req_id', 'service_id', 'status', 'severity', 'request_datetime')
+
+
+class DispatchQueue:
+    """Open emergency requests in one binary heap per service.
+
+    An entry is the request's ordering key (severity, service type rank,
+    request time, req_id). Writes push a fresh key rather than searching the
+    heap; entries that no longer match the request's current key are
+    skipped when they reach the top and compacted away once they outnumber
+    the live ones, so every write and claim is O(log n).
+    """
+
+    def __init__(self, service_priority=()):
+        self.service_rank = {name.casefold(): rank for rank, name in enumerate(service_priority)}
+        self._heaps = {}
+        self._open = {}
+        self._service_types = {}
+        self._entries = 0
+        self._lock = threading.Lock()
+        self._loading = False
+        self._touched = set()
+        self.ready = False
+        self.loaded_at = None
+        self.claimed = 0
+        self.claim_misses = 0
+
+    def rank(self, service_type) -> int:
+        """Position of a service type in the priority list; unlisted types come after all listed ones"""
+        return self.service_rank.get((service_type or '').casefold(), len(self.service_rank))
+
+    def _key(self, row):
+        rank = self.rank(self._service_types.get(row['service_id']))
+        severity = row['severity'] if row.get('severity') is not None else DEFAULT_SEVERITY
+        return (severity, rank, row['request_datetime'], row['req_id'])
+
+    def _push(self, service_id, key):
+        self._open[key[-1]] = (service_id, key)
+        heapq.heappush(self._heaps.setdefault(service_id, []), key)
+        self._entries += 1
+        if self._entries > 2 * len(self._open) + 64:
+            self._compact()
+
+    def _compact(self):
+        heaps = {}
+        for service_id, key in self._open.values():
+            heaps.setdefault(service_id, []).append(key)
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        self._heaps = heaps
+        self._entries = len(self._open)
+
+    def _top(self, service_id):
+        """Best live key of one service, dropping superseded entries on the way"""
+        heap = self._heaps.get(service_id)
+        while heap:
+            key = heap[0]
+            if self._open.get(key[-1]) == (service_id, key):
+                return key
+            heapq.heappop(heap)
+            self._entries -= 1
+        return None
+
+    # ---- maintenance ----
+
+    def set_service_type(self, service_id: int, service_type: str):
+        with self._lock:
+            self._service_types[service_id] = service_type
+
+    def knows_service(self, service_id: int) -> bool:
+        return service_id in self._service_types
+
+    def put(self, row):
+        """Add, re-rank or drop one request after a write"""
+        with self._lock:
+            if self._loading:
+                self._touched.add(row['req_id'])
+            if row.get('status') != 'Open':
+                self._open.pop(row['req_id'], None)
+                return
+            key = self._key(row)
+            if self._open.get(row['req_id']) != (row['service_id'], key):
+                self._push(row['service_id'], key)
+
+    def discard(self, req_id: int):
+        with self._lock:
+            if self._loading:
+                self._touched.add(req_id)
+            self._open.pop(req_id, None)
+
+    def load(self, services, batches):
+        """Rebuild from the services and batches of open request rows; live writes during the load win"""
+        started = time.monotonic()
+        with self._lock:
+            self._service_types = {row['service_id']: row['service_type'] for row in services}
+            self._open.clear()
+            self._touched.clear()
+            self._loading = True
+            self.ready = False
+        try:
+            for rows in batches:
+                with self._lock:
+                    for row in rows:
+                        if row['req_id'] not in self._touched:
+                            self._open[row['req_id']] = (row['service_id'], self._key(row))
+        finally:
+            with self._lock:
+                self._loading = False
+                self._touched.clear()
+                self._compact()
+        self.ready = True
+        self.loaded_at = time.time()
+        logger.info("Built dispatch queue: %d open requests in %.2fs", len(self._open), time.monotonic() - started)
+
+    # ---- claiming ----
+
+    def take(self, service_id: int = None, count: int = 1):
+        """Remove and return up to count best (service_id, key) entries, best first"""
+        taken = []
+        with self._lock:
+            while len(taken) < count:
+                if service_id is not None:
+                    best = (service_id, self._top(service_id))
+                else:
+                    tops = [(heap_service, self._top(heap_service)) for heap_service in list(self._heaps)]
+                    best = min((top for top in tops if top[1] is not None), key=lambda top: top[1],
+                               default=(None, None))
+                if best[1] is None:
+                    break
+                heapq.heappop(self._heaps[best[0]])
+                self._entries -= 1
+                del self._open[best[1][-1]]
+                taken.append(best)
+        return taken
+
+    def restore(self, entries):
+        """Put back taken entries that are still open, unless a write re-queued them meanwhile"""
+        with self._lock:
+            for service_id, key in entries:
+                if key[-1] not in self._open:
+                    self._push(service_id, key)
+
+    # ---- queries ----
+
+    def peek(self, service_id: int = None, limit: int = 50):
+        """The next requests in dispatch order, without claiming them"""
+        with self._lock:
+            entries = [entry for entry in self._open.values() if service_id is None or entry[0] == service_id]
+            best = heapq.nsmallest(limit, entries, key=lambda entry: entry[1])
+            return [
+                {
+                    "req_id": key[-1],
+                    "service_id": entry_service_id,
+                    "service_type": self._service_types.get(entry_service_id),
+                    "severity": key[0],
+                    "request_datetime": key[2],
+                    "position": position,
+                }
+                for position, (entry_service_id, key) in enumerate(best, 1)
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'open_requests': len(self._open),
+                'services': sum(1 for heap in self._heaps.values() if heap),
+                'heap_entries': self._entries,
+                'claimed': self.claimed,
+                'claim_misses': self.claim_misses,
+                'loaded_at': self.loaded_at,
+            }
+
+
+# Global dispatch queue
+dispatch_queue = DispatchQueue(DISPATCH_CONFIG['service_priority'])
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+async def _claim_candidates(candidates):
+    """Lock the first candidate no one else holds and mark it dispatched; returns its row or None.
+
+    SKIP LOCKED leaves out rows another worker is claiming, so two workers
+    never dispatch the same request and neither waits on the other.
+    """
+    ids = [key[-1] for _, key in candidates]
+    try:
+        async with adb.transaction() as cursor:
+            await cursor.execute(f"""
+                SELECT req_id FROM emergency_requests
+                WHERE req_id IN ({_placeholders(ids)}) AND status = 'Open'
+                FOR UPDATE SKIP LOCKED
+            """, ids)
+            locked = {row['req_id'] for row in await cursor.fetchall()}
+            chosen = next((req_id for req_id in ids if req_id in locked), None)
+            row = None
+            if chosen is not None:
+                await cursor.execute("UPDATE emergency_requests SET status = 'Dispatched' WHERE req_id = %s",
+                                     (chosen,))
+                await cursor.execute("SELECT * FROM emergency_requests WHERE req_id = %s", (chosen,))
+                row = await cursor.fetchone()
+    except Exception:
+        # Nothing was claimed; keep the candidates queued
+        dispatch_queue.restore(candidates)
+        raise
+    # The rest go back: ones we locked are open, the others may just be held by another worker
+    unsure = [req_id for req_id in ids if req_id not in locked]
+    still_open = set(locked)
+    if unsure:
+        rows = await adb.fetch_all(f"SELECT req_id FROM emergency_requests WHERE req_id IN ({_placeholders(unsure)}) "
+                                   f"AND status = 'Open'", unsure)
+        still_open.update(row['req_id'] for row in rows)
+    still_open.discard(chosen)
+    dispatch_queue.restore([entry for entry in candidates if entry[1][-1] in still_open])
+    return row
+
+
+async def _claim_from_table(service_id: int = None):
+    """Claim straight from the table, for requests written outside this process or before the queue loaded"""
+    params = []
+    service_filter = ""
+    if service_id is not None:
+        service_filter = "AND service_id = %s"
+        params.append(service_id)
+    async with adb.transaction() as cursor:
+        rank = "0"
+        if dispatch_queue.service_rank:
+            # Ranked by service_id rather than through a join with emergency_services: FOR UPDATE
+            # would lock the joined service row as well, and SKIP LOCKED would then hide every
+            # request of a service another worker is claiming from
+            await cursor.execute("SELECT service_id, service_type FROM emergency_services")
+            ranks = {row['service_id']: dispatch_queue.rank(row['service_type']) for row in await cursor.fetchall()}
+            if ranks:
+                rank = (f"CASE service_id {' '.join(['WHEN %s THEN %s'] * len(ranks))} "
+                        f"ELSE {len(dispatch_queue.service_rank)} END")
+                params.extend(value for pair in ranks.items() for value in pair)
+        await cursor.execute(f"""
+            SELECT req_id FROM emergency_requests
+            WHERE status = 'Open' {service_filter}
+            ORDER BY severity, {rank}, request_datetime, req_id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, params)
+        found = await cursor.fetchone()
+        if found is None:
+            return None
+        await cursor.execute("UPDATE emergency_requests SET status = 'Dispatched' WHERE req_id = %s",
+                             (found['req_id'],))
+        await cursor.execute("SELECT * FROM emergency_requests WHERE req_id = %s", (found['req_id'],))
+        return await cursor.fetchone()
+
+
+async def claim_next(service_id: int = None):
+    """Atomically claim the next request to dispatch (optionally for one service); None if there is none"""
+    row = None
+    if dispatch_queue.ready:
+        for _ in range(DISPATCH_CONFIG['claim_attempts']):
+            candidates = dispatch_queue.take(service_id, DISPATCH_CONFIG['claim_candidates'])
+            if not candidates:
+                break
+            row = await _claim_candidates(candidates)
+            if row is not None:
+                break
+            dispatch_queue.claim_misses += 1
+    if row is None:
+        row = await _claim_from_table(service_id)
+    if row is None:
+        return None
+    dispatch_queue.claimed += 1
+    await notify_async("emergency_requests", "update", [row])
+    return row
+
+
+def load_dispatch_queue():
+    """Build the queue from the open requests in the table"""
+    try:
+        services = db.execute_query("SELECT service_id, service_type FROM emergency_services")
+        dispatch_queue.load(services, db.stream_query(
+            f"SELECT {', '.join(_QUEUE_COLUMNS)} FROM emergency_requests WHERE status = 'Open'",
+            batch_size=DISPATCH_CONFIG['load_batch_size']))
+    except Exception as e:
+        logger.warning("Could not build dispatch queue: %s", e)
+
+
+@on_change('emergency_requests', blocking=True)
+def _sync_dispatch_queue(table, action, rows):
+    for row in rows:
+        if row.get('req_id') is None:
+            continue
+        if action == 'delete' or row.get('status') not in (None, 'Open'):
+            dispatch_queue.discard(row['req_id'])
+            continue
+        if any(row.get(column) is None for column in _QUEUE_COLUMNS):
+            # Partial updates and inserts without returning lack columns the ordering needs
+            row = db.execute_one(f"SELECT {', '.join(_QUEUE_COLUMNS)} FROM emergency_requests WHERE req_id = %s",
+                                 (row['req_id'],))
+            if row is None:
+                continue
+        if not dispatch_queue.knows_service(row['service_id']):
+            service = db.execute_one("SELECT service_type FROM emergency_services WHERE service_id = %s",
+                                     (row['service_id'],))
+            dispatch_queue.set_service_type(row['service_id'], service['service_type'] if service else None)
+        dispatch_queue.put(row)
@@ -0,0 +1,192 @@
+"""
+Live change events: emergency request and bus writes pushed to clients over server-sent events
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from app.config import EVENTS_CONFIG
+from app.database import db
+from app.hooks import on_change
+
+logger = logging.getLogger(__name__)
+
+# topic (table) -> (key column, columns subscribers filter on)
+EVENT_TOPICS = {
+    'emergency_requests': ('req_id', ('service_id', 'status', 'location')),
+    'buses': ('bus_id', ('route_id',)),
+}
+# Sent when a client fell behind or asked to resume from an event no longer held; it should refetch
+RESYNC = "event: resync\ndata: {}\n\n"
+KEEPALIVE = ": keepalive\n\n"
+
+
+def _frame(event_id: int, topic: str, action: str, row):
+    data = json.dumps({"id": event_id, "topic": topic, "action": action, "row": row}, default=str)
+    return f"id: {event_id}\nevent: {topic}.{action}\ndata: {data}\n\n"
+
+
+class Subscriber:
+    """One connected client: its filters and a bounded queue of encoded frames"""
+
+    def __init__(self, topics=None, statuses=None, route_ids=None, service_ids=None, zone: str = None,
+                 queue_size: int = 100):
+        self.topics = set(topics or EVENT_TOPICS)
+        self.statuses = set(statuses or ())
+        self.route_ids = set(route_ids or ())
+        self.service_ids = set(service_ids or ())
+        self.zone = zone.casefold() if zone else None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.connected_at = time.time()
+
+    def matches(self, topic: str, action: str, row) -> bool:
+        if topic not in self.topics:
+            return False
+        # Deleted rows carry only their key, so every subscriber of the topic hears of them
+        if action == 'delete':
+            return True
+        if topic == 'emergency_requests':
+            if self.statuses and row.get('status') not in self.statuses:
+                return False
+            if self.service_ids and row.get('service_id') not in self.service_ids:
+                return False
+            if self.zone and self.zone not in (row.get('location') or '').casefold():
+                return False
+        elif topic == 'buses':
+            if self.route_ids and row.get('route_id') not in self.route_ids:
+                return False
+        return True
+
+    def offer(self, frame: str):
+        """Queue a frame without ever waiting on the client"""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # A client this far behind drops its backlog and is told to refetch instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.dropped += 1
+            self.queue.put_nowait(RESYNC)
+
+
+class EventHub:
+    """Fans committed writes out to subscribers on the event loop.
+
+    Each event is encoded once and handed to every matching client's queue
+    with put_nowait, so publishing never waits on a client; a full queue is
+    replaced by a single resync event. Recent events are kept so a client
+    reconnecting with Last-Event-ID gets what it missed.
+    """
+
+    def __init__(self, queue_size: int = 100, max_clients: int = 1000, replay_size: int = 1000,
+                 heartbeat_interval: float = 15):
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.heartbeat_interval = heartbeat_interval
+        self._subscribers = set()
+        self._history = deque(maxlen=replay_size)
+        self._last_id = 0
+        self._loop = None
+        self.published = 0
+
+    @property
+    def bound(self) -> bool:
+        return self._loop is not None and not self._loop.is_closed()
+
+    @property
+    def full(self) -> bool:
+        return len(self._subscribers) >= self.max_clients
+
+    def bind(self):
+        """Deliver events on the running loop; until then (CLI jobs, say) publishing is a no-op"""
+        self._loop = asyncio.get_running_loop()
+
+    def publish(self, topic: str, action: str, rows):
+        """Queue change events for matching clients; safe to call from any thread"""
+        if not self.bound:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._dispatch(topic, action, rows)
+        else:
+            self._loop.call_soon_threadsafe(self._dispatch, topic, action, list(rows))
+
+    def _dispatch(self, topic, action, rows):
+        for row in rows:
+            self._last_id += 1
+            frame = _frame(self._last_id, topic, action, row)
+            self._history.append((self._last_id, topic, action, row, frame))
+            self.published += 1
+            for subscriber in self._subscribers:
+                if subscriber.matches(topic, action, row):
+                    subscriber.offer(frame)
+
+    def subscribe(self, subscriber: Subscriber, last_event_id: int = None):
+        """Register a client, first replaying what it missed since last_event_id"""
+        if last_event_id is not None:
+            oldest = self._history[0][0] if self._history else self._last_id + 1
+            # Ids restart with the process, and old events fall out of the history
+            if last_event_id > self._last_id or last_event_id < oldest - 1:
+                subscriber.offer(RESYNC)
+            else:
+                for event_id, topic, action, row, frame in self._history:
+                    if event_id > last_event_id and subscriber.matches(topic, action, row):
+                        subscriber.offer(frame)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    async def stream(self, subscriber: Subscriber):
+        """SSE frames for one client until it disconnects"""
+        try:
+            # Browsers reconnect after this many milliseconds, sending Last-Event-ID
+            yield f"retry: {int(self.heartbeat_interval * 1000)}\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield KEEPALIVE
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def stats(self):
+        subscribers = list(self._subscribers)
+        return {
+            'clients': len(subscribers),
+            'max_clients': self.max_clients,
+            'queue_size': self.queue_size,
+            'published': self.published,
+            'last_event_id': self._last_id,
+            'replayable_events': len(self._history),
+            'queued_frames': sum(subscriber.queue.qsize() for subscriber in subscribers),
+            'dropped_frames': sum(subscriber.dropped for subscriber in subscribers),
+        }
+
+
+# Global event hub
+event_hub = EventHub(EVENTS_CONFIG['queue_size'], EVENTS_CONFIG['max_clients'], EVENTS_CONFIG['replay_size'],
+                     EVENTS_CONFIG['heartbeat_interval'])
+
+
+@on_change(*EVENT_TOPICS, blocking=True)
+def _publish_change(table, action, rows):
+    if not event_hub.bound:
+        return
+    key, columns = EVENT_TOPICS[table]
+    if action != 'delete':
+        complete = []
+        for row in rows:
+            if row.get(key) is not None and any(column not in row for column in columns):
+                # Partial updates only carry the changed columns; filters need the whole row
+                row = db.execute_one(f"SELECT * FROM {table} WHERE {key} = %s", (row[key],))
+                if row is None:
+                    continue
+            complete.append(row)
+        rows = complete
+    event_hub.publish(table, action, rows)
@@ -0,0 +1,155 @@
+"""
+Offline geocoding of free-text locations and address rows against a local gazetteer file
+"""
+import csv
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from app.config import GEO_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Words that qualify a place rather than name it ("near MG Road"), and postal codes
+_NOISE = re.compile(r"\b(near|opp|opposite|behind|beside)\b|\b\d{5,6}\b|[^\w\s]")
+_SEPARATORS = re.compile(r"[,;\n]")
+
+
+def _normalize(text: str) -> str:
+    # "M.G. Road" and "MG Road" are the same place
+    return ' '.join(_NOISE.sub(' ', text.casefold().replace('.', '')).split())
+
+
+class Gazetteer:
+    """Place coordinates from a CSV of name, city, latitude, longitude.
+
+    A row whose name is its city is that city's centre. Text resolves to
+    the most specific match: a place within a named city, then a place name
+    that exists in only one city, then the city alone. Lookups are dict
+    probes and results (misses included) are cached.
+    """
+
+    def __init__(self, cache_size: int = 10000):
+        self.cache_size = cache_size
+        self._places = {}
+        self._by_name = {}
+        self._cities = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.path = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: str):
+        """Read the gazetteer file, replacing whatever was loaded before"""
+        places, by_name, cities = {}, {}, {}
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for line, row in enumerate(csv.DictReader(f), 2):
+                try:
+                    name, city = _normalize(row['name']), _normalize(row['city'])
+                    point = (float(row['latitude']), float(row['longitude']))
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning("Skipping gazetteer line %d: %s", line, e)
+                    continue
+                if name == city:
+                    cities[city] = (*point, row['city'].strip())
+                else:
+                    places[(name, city)] = (*point, f"{row['name'].strip()}, {row['city'].strip()}")
+                    by_name.setdefault(name, []).append((name, city))
+        with self._lock:
+            self._places, self._by_name, self._cities = places, by_name, cities
+            self._cache.clear()
+            self.path = path
+        logger.info("Loaded gazetteer %s: %d places in %d cities", path, len(places), len(cities))
+
+    def _parts(self, text: str):
+        parts = []
+        for part in _SEPARATORS.split(text):
+            part = _normalize(part)
+            if not part:
+                continue
+            # "MG Road Pune" without a comma: peel a trailing city name off
+            words = part.split()
+            for size in range(min(3, len(words) - 1), 0, -1):
+                tail = ' '.join(words[-size:])
+                if tail in self._cities:
+                    parts += [' '.join(words[:-size]), tail]
+                    break
+            else:
+                parts.append(part)
+        return parts
+
+    def _resolve(self, text: str):
+        parts = self._parts(text)
+        cities = [part for part in parts if part in self._cities]
+        city = cities[-1] if cities else None
+        for part in parts:
+            if part == city:
+                continue
+            if city is not None:
+                place = self._places.get((part, city))
+            else:
+                matches = self._by_name.get(part, ())
+                # Ambiguous without a city (MG Road is in Pune and Bengaluru)
+                place = self._places[matches[0]] if len(matches) == 1 else None
+            if place is not None:
+                return {"latitude": place[0], "longitude": place[1], "precision": "place", "match": place[2]}
+        if city is not None:
+            latitude, longitude, name = self._cities[city]
+            return {"latitude": latitude, "longitude": longitude, "precision": "city", "match": name}
+        return None
+
+    def geocode(self, text: str):
+        """Coordinates for a location string as a dict, or None if nothing in it is known"""
+        if not text or not text.strip():
+            return None
+        key = ' '.join(text.casefold().split())
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+            result = self._resolve(text)
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return result
+
+    def geocode_address(self, address):
+        """Coordinates for an addresses row: street, then area, then the city alone"""
+        city = address.get('city')
+        for place in (address.get('street'), address.get('area')):
+            if place:
+                result = self.geocode(f"{place}, {city}" if city else place)
+                if result is not None and result['precision'] == 'place':
+                    return result
+        return self.geocode(city) if city else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'places': len(self._places),
+                'cities': len(self._cities),
+                'cached': len(self._cache),
+                'cache_hits': self.hits,
+                'cache_misses': self.misses,
+            }
+
+
+# Global gazetteer
+gazetteer = Gazetteer(GEO_CONFIG['cache_size'])
+
+
+def load_gazetteer():
+    """Load the configured gazetteer file, if it exists"""
+    path = GEO_CONFIG['gazetteer_path']
+    if not os.path.exists(path):
+        logger.warning("Gazetteer file %s not found; locations will not be geocoded", path)
+        return
+    try:
+        gazetteer.load(path)
+    except Exception as e:
+        logger.warning("Could not load gazetteer %s: %s", path, e)
@@ -0,0 +1,320 @@
+"""
+Grid spatial index of open emergency requests, open complaints and emergency service units, for radius and nearest queries
+"""
+import heapq
+import logging
+import math
+import threading
+import time
+from app.config import GEO_CONFIG
+from app.database import db
+from app.hooks import on_change
+from app.services.geocoding import gazetteer, load_gazetteer
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+# Requests still needing attention show up as incidents
+INCIDENT_STATUSES = ('Open', 'Dispatched')
+_INCIDENT_COLUMNS = ('req_id', 'citizen_id', 'service_id', 'status', 'severity', 'location')
+_SERVICE_COLUMNS = ('service_id', 'service_type', 'phone', 'area_covered')
+# Complaints still being worked on; they have no location column and sit at the filing citizen's address
+COMPLAINT_STATUSES = ('Open', 'In Progress')
+_COMPLAINT_COLUMNS = ('complaint_id', 'citizen_id', 'category', 'status', 'priority', 'assigned_to', 'date_reported')
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Equirectangular distance: within metres of the great-circle one over a city, at a quarter of the cost"""
+    x = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = lat2 - lat1
+    return KM_PER_DEGREE * math.sqrt(x * x + y * y)
+
+
+class GridIndex:
+    """Points bucketed into square cells of cell_km a side.
+
+    A radius query only reads the cells overlapping the circle's bounding
+    box, and a nearest query walks rings of cells outward from the centre
+    until no unvisited cell can hold anything closer. Either falls back to
+    scanning the occupied cells when that is fewer, so sparse data far from
+    the query point never means walking thousands of empty cells.
+    """
+
+    def __init__(self, cell_km: float = 1.0):
+        self.cell_km = cell_km
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self._cells = {}
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg))
+
+    def _put(self, item_id, latitude, longitude, payload):
+        self._remove(item_id)
+        cell = self._cell(latitude, longitude)
+        self._cells.setdefault(cell, {})[item_id] = (latitude, longitude, payload)
+        self._items[item_id] = cell
+
+    def _remove(self, item_id):
+        cell = self._items.pop(item_id, None)
+        if cell is not None:
+            items = self._cells[cell]
+            del items[item_id]
+            if not items:
+                del self._cells[cell]
+
+    def put(self, item_id, latitude: float, longitude: float, payload):
+        with self._lock:
+            self._put(item_id, latitude, longitude, payload)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def load(self, items):
+        """Replace the contents with (item_id, latitude, longitude, payload) tuples"""
+        with self._lock:
+            self._cells.clear()
+            self._items.clear()
+            for item in items:
+                self._put(*item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _matches(self, cells, latitude, longitude, where):
+        # distance_km inlined: this loop is where queries spend their time
+        cos, radians, sqrt = math.cos, math.radians, math.sqrt
+        empty = {}
+        for cell in cells:
+            for item_id, (item_latitude, item_longitude, payload) in self._cells.get(cell, empty).items():
+                if where is None or where(payload):
+                    x = (item_longitude - longitude) * cos(radians((latitude + item_latitude) / 2))
+                    y = item_latitude - latitude
+                    yield (KM_PER_DEGREE * sqrt(x * x + y * y), item_id, item_latitude, item_longitude, payload)
+
+    def _column_reach(self, latitude, km):
+        """Cells east or west that km spans at this latitude (cells narrow towards the poles)"""
+        worst = min(89.9, abs(latitude) + km / KM_PER_DEGREE)
+        return math.ceil(km / (self.cell_km * math.cos(math.radians(worst))))
+
+    def radius(self, latitude: float, longitude: float, km: float, limit: int = None, where=None):
+        """Items within km, nearest first, as (distance_km, item_id, latitude, longitude, payload)"""
+        with self._lock:
+            row, column = self._cell(latitude, longitude)
+            rows = math.ceil(km / self.cell_km)
+            columns = self._column_reach(latitude, km)
+            if (2 * rows + 1) * (2 * columns + 1) > len(self._cells):
+                cells = list(self._cells)
+            else:
+                cells = [(row + i, column + j) for i in range(-rows, rows + 1) for j in range(-columns, columns + 1)]
+            found = [match for match in self._matches(cells, latitude, longitude, where) if match[0] <= km]
+        found.sort(key=lambda match: match[0])
+        return found[:limit] if limit else found
+
+    def nearest(self, latitude: float, longitude: float, k: int, max_km: float = None, where=None):
+        """The k closest items (optionally within max_km), nearest first"""
+        with self._lock:
+            row, column = self._cell(latitude, longitude)
+            best = []
+            visited = 0
+            ring = 0
+            while True:
+                if ring == 0:
+                    cells = [(row, column)]
+                else:
+                    cells = [(row + i, column + j) for i in range(-ring, ring + 1) for j in (-ring, ring)]
+                    cells += [(row + i, column + j) for i in (-ring, ring) for j in range(-ring + 1, ring)]
+                visited += len(cells)
+                for match in self._matches(cells, latitude, longitude, where):
+                    if len(best) < k:
+                        heapq.heappush(best, (-match[0], match[1], match))
+                    elif match[0] < -best[0][0]:
+                        heapq.heapreplace(best, (-match[0], match[1], match))
+                # Anything in a cell not yet visited is at least this far away
+                reach = ring * self.cell_km * math.cos(math.radians(min(89.9, abs(latitude) + ring * self.cell_deg)))
+                if len(best) == k and -best[0][0] <= reach:
+                    break
+                if max_km is not None and reach >= max_km:
+                    break
+                if visited >= len(self._cells):
+                    # Walking rings would now cost more than looking at every occupied cell
+                    best = [(-match[0], match[1], match)
+                            for match in heapq.nsmallest(k, self._matches(list(self._cells), latitude, longitude,
+                                                                          where), key=lambda match: match[0])]
+                    break
+                ring += 1
+        found = sorted((entry[2] for entry in best), key=lambda match: match[0])
+        return [match for match in found if max_km is None or match[0] <= max_km]
+
+
+class IncidentMap:
+    """Geocoded open emergency requests, open complaints and service units in three grid indexes"""
+
+    def __init__(self, cell_km: float = 1.0):
+        self.incidents = GridIndex(cell_km)
+        self.complaints = GridIndex(cell_km)
+        self.services = GridIndex(cell_km)
+        self.unresolved = {'incidents': set(), 'complaints': set(), 'services': set()}
+        self.ready = False
+        self.loaded_at = None
+
+    def _place(self, kind, index, item_id, point, payload):
+        if point is None:
+            index.remove(item_id)
+            self.unresolved[kind].add(item_id)
+            return
+        self.unresolved[kind].discard(item_id)
+        index.put(item_id, point['latitude'], point['longitude'],
+                  {**payload, 'precision': point['precision'], 'matched': point['match']})
+
+    def put_incident(self, row, address=None):
+        """Index one request; its location text first, else the requesting citizen's address"""
+        if row.get('status') not in INCIDENT_STATUSES:
+            self.remove_incident(row['req_id'])
+            return
+        point = gazetteer.geocode(row.get('location'))
+        if point is None and address:
+            point = gazetteer.geocode_address(address)
+        self._place('incidents', self.incidents, row['req_id'], point,
+                    {column: row.get(column) for column in _INCIDENT_COLUMNS})
+
+    def remove_incident(self, req_id: int):
+        self.incidents.remove(req_id)
+        self.unresolved['incidents'].discard(req_id)
+
+    def put_complaint(self, row, address=None):
+        """Index one complaint at the filing citizen's address"""
+        if row.get('status') not in COMPLAINT_STATUSES:
+            self.remove_complaint(row['complaint_id'])
+            return
+        self._place('complaints', self.complaints, row['complaint_id'],
+                    gazetteer.geocode_address(address) if address else None,
+                    {column: row.get(column) for column in _COMPLAINT_COLUMNS})
+
+    def remove_complaint(self, complaint_id: int):
+        self.complaints.remove(complaint_id)
+        self.unresolved['complaints'].discard(complaint_id)
+
+    def put_service(self, row):
+        """Index one service unit at its geocoded area_covered"""
+        self._place('services', self.services, row['service_id'], gazetteer.geocode(row.get('area_covered')),
+                    {column: row.get(column) for column in _SERVICE_COLUMNS})
+
+    def remove_service(self, service_id: int):
+        self.services.remove(service_id)
+        self.unresolved['services'].discard(service_id)
+
+    def stats(self):
+        return {
+            'ready': self.ready,
+            'cell_km': self.incidents.cell_km,
+            'incidents': len(self.incidents),
+            'unresolved_incidents': len(self.unresolved['incidents']),
+            'complaints': len(self.complaints),
+            'unresolved_complaints': len(self.unresolved['complaints']),
+            'services': len(self.services),
+            'unresolved_services': len(self.unresolved['services']),
+            'gazetteer': gazetteer.stats(),
+            'loaded_at': self.loaded_at,
+        }
+
+
+# Global incident and service index
+incident_map = IncidentMap(GEO_CONFIG['cell_km'])
+
+_INCIDENT_QUERY = f"""
+    SELECT {', '.join(f'er.{column}' for column in _INCIDENT_COLUMNS)}, ad.street, ad.area, ad.city
+    FROM emergency_requests er
+    LEFT JOIN citizens c ON c.citizen_id = er.citizen_id
+    LEFT JOIN addresses ad ON ad.address_id = c.address_id
+"""
+_COMPLAINT_QUERY = f"""
+    SELECT {', '.join(f'co.{column}' for column in _COMPLAINT_COLUMNS)}, ad.street, ad.area, ad.city
+    FROM complaints co
+    LEFT JOIN citizens c ON c.citizen_id = co.citizen_id
+    LEFT JOIN addresses ad ON ad.address_id = c.address_id
+"""
+
+
+def _address(row):
+    return row if any(row.get(column) for column in ('street', 'area', 'city')) else None
+
+
+def load_incident_map():
+    """Load the gazetteer, then geocode and index every service unit, open request and open complaint"""
+    started = time.monotonic()
+    load_gazetteer()
+    try:
+        incident_map.ready = False
+        incident_map.unresolved = {'incidents': set(), 'complaints': set(), 'services': set()}
+        incident_map.services.load([])
+        for row in db.execute_query(f"SELECT {', '.join(_SERVICE_COLUMNS)} FROM emergency_services"):
+            incident_map.put_service(row)
+        incident_map.incidents.load([])
+        placeholders = ', '.join(['%s'] * len(INCIDENT_STATUSES))
+        for rows in db.stream_query(f"{_INCIDENT_QUERY} WHERE er.status IN ({placeholders})", INCIDENT_STATUSES,
+                                    batch_size=GEO_CONFIG['load_batch_size']):
+            for row in rows:
+                incident_map.put_incident(row, _address(row))
+        incident_map.complaints.load([])
+        placeholders = ', '.join(['%s'] * len(COMPLAINT_STATUSES))
+        for rows in db.stream_query(f"{_COMPLAINT_QUERY} WHERE co.status IN ({placeholders})", COMPLAINT_STATUSES,
+                                    batch_size=GEO_CONFIG['load_batch_size']):
+            for row in rows:
+                incident_map.put_complaint(row, _address(row))
+        incident_map.ready = True
+        incident_map.loaded_at = time.time()
+        logger.info("Built incident map: %d incidents, %d complaints, %d services in %.2fs",
+                    len(incident_map.incidents), len(incident_map.complaints), len(incident_map.services),
+                    time.monotonic() - started)
+    except Exception as e:
+        logger.warning("Could not build incident map: %s", e)
+
+
+@on_change('emergency_requests', blocking=True)
+def _sync_incidents(table, action, rows):
+    for row in rows:
+        if row.get('req_id') is None:
+            continue
+        if action == 'delete' or row.get('status') not in (None, *INCIDENT_STATUSES):
+            incident_map.remove_incident(row['req_id'])
+            continue
+        if any(column not in row for column in _INCIDENT_COLUMNS) or not gazetteer.geocode(row.get('location')):
+            # Partial updates lack columns, and an unknown location falls back to the citizen's address
+            row = db.execute_one(f"{_INCIDENT_QUERY} WHERE er.req_id = %s", (row['req_id'],))
+            if row is None:
+                continue
+        incident_map.put_incident(row, _address(row))
+
+
+@on_change('complaints', blocking=True)
+def _sync_complaints(table, action, rows):
+    for row in rows:
+        if row.get('complaint_id') is None:
+            continue
+        if action == 'delete' or row.get('status') not in (None, *COMPLAINT_STATUSES):
+            incident_map.remove_complaint(row['complaint_id'])
+            continue
+        # The place comes from the citizen's address, which written rows never carry
+        row = db.execute_one(f"{_COMPLAINT_QUERY} WHERE co.complaint_id = %s", (row['complaint_id'],))
+        if row is not None:
+            incident_map.put_complaint(row, _address(row))
+
+
+@on_change('emergency_services', blocking=True)
+def _sync_services(table, action, rows):
+    for row in rows:
+        if row.get('service_id') is None:
+            continue
+        if action == 'delete':
+            incident_map.remove_service(row['service_id'])
+            continue
+        if any(column not in row for column in _SERVICE_COLUMNS):
+            row = db.execute_one(f"SELECT {', '.join(_SERVICE_COLUMNS)} FROM emergency_services WHERE service_id = %s",
+                                 (row['service_id'],))
+            if row is None:
+                continue
+        incident_map.put_service(row)
@@ -0,0 +1,78 @@
+"""
+Process-level snapshot of dashboard statistics
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from app.config import STATS_CONFIG
+from app.crud import async_operations as async_crud
+
+logger = logging.getLogger(__name__)
+
+
+class StatsSnapshot:
+    """Holds the latest dashboard stats and refreshes them in the background"""
+
+    def __init__(self, loader, refresh_interval: float):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self._stats = None
+        self._generated_at = None
+        self._refreshed = 0.0
+        self._lock = None
+        self._task = None
+
+    async def refresh(self):
+        """Recompute the snapshot; concurrent callers share one refresh"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._lock:
+            # Another caller refreshed while we were waiting for the lock
+            if self._refreshed > started:
+                return
+            stats = await self.loader()
+            self._stats = stats
+            self._generated_at = datetime.now(timezone.utc)
+            self._refreshed = time.monotonic()
+
+    async def get(self):
+        """Return the snapshot with its age; only loads inline when it is missing or abandoned"""
+        age = time.monotonic() - self._refreshed
+        # Without a running refresher, fall back to refreshing on read
+        stale = age > self.refresh_interval and (self._task is None or self._task.done())
+        if self._stats is None or stale:
+            await self.refresh()
+            age = time.monotonic() - self._refreshed
+        return {
+            **self._stats,
+            'snapshot_generated_at': self._generated_at.isoformat(),
+            'snapshot_age_seconds': round(age, 3),
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Dashboard stats refresh failed: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Start the background refresh loop on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global dashboard snapshot
+stats_snapshot = StatsSnapshot(async_crud.get_dashboard_stats, STATS_CONFIG['refresh_interval'])
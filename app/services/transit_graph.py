@@ -0,0 +1,329 @@
+"""
+In-memory transit graph over public transport routes, with shortest-path queries
+"""
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from app.config import TRANSIT_CONFIG
+from app.database import db
+from app.hooks import on_change
+
+logger = logging.getLogger(__name__)
+
+PATH_MODES = ('distance', 'transfers')
+_ROUTE_COLUMNS = ('route_id', 'route_name', 'start_point', 'end_point', 'distance_km')
+
+
+def stop_key(name: str) -> str:
+    """Stops are matched case-insensitively, ignoring extra whitespace"""
+    return ' '.join((name or '').casefold().split())
+
+
+class TransitGraph:
+    """Stops as nodes and route segments as undirected weighted edges.
+
+    Each public_transport_routes row is one segment between its start and end
+    point; rows sharing a route_name form one line, and changing lines is a
+    transfer. Results are cached per (mode, from, to) until the graph changes,
+    and the most asked-for pairs are recomputed right after every change, so
+    common queries are answered from a dict lookup.
+    """
+
+    def __init__(self, cache_size: int = 10000, precompute_pairs: int = 200):
+        self.cache_size = cache_size
+        self.precompute_pairs = precompute_pairs
+        self._stops = {}
+        self._segments = {}
+        self._adjacent = {}
+        self._cache = OrderedDict()
+        self._popular = Counter()
+        self._lock = threading.RLock()
+        self._loading = False
+        self._touched = set()
+        self.version = 0
+        self.ready = False
+        self.loaded_at = None
+
+    # ---- graph maintenance ----
+
+    def _add(self, row):
+        start, end = stop_key(row.get('start_point')), stop_key(row.get('end_point'))
+        # Segments without both ends or a length cannot be routed over
+        if not start or not end or start == end or row.get('distance_km') is None:
+            return
+        route_id = row['route_id']
+        distance = float(row['distance_km'])
+        line = row.get('route_name') or f"route {route_id}"
+        self._stops.setdefault(start, row['start_point'].strip())
+        self._stops.setdefault(end, row['end_point'].strip())
+        self._segments[route_id] = (start, end, distance, line)
+        self._adjacent.setdefault(start, {})[route_id] = (end, distance, line)
+        self._adjacent.setdefault(end, {})[route_id] = (start, distance, line)
+
+    def _remove(self, route_id):
+        segment = self._segments.pop(route_id, None)
+        if segment is None:
+            return
+        for stop in segment[:2]:
+            edges = self._adjacent.get(stop)
+            if edges is not None:
+                edges.pop(route_id, None)
+                if not edges:
+                    # A stop lives only as long as some segment touches it
+                    del self._adjacent[stop]
+                    self._stops.pop(stop, None)
+
+    def _changed(self):
+        self.version += 1
+        self._cache.clear()
+
+    def put(self, row):
+        """Add or replace one route segment"""
+        with self._lock:
+            if self._loading:
+                self._touched.add(row['route_id'])
+            self._remove(row['route_id'])
+            self._add(row)
+            self._changed()
+
+    def delete(self, route_id: int):
+        with self._lock:
+            if self._loading:
+                self._touched.add(route_id)
+            self._remove(route_id)
+            self._changed()
+
+    def load(self, batches):
+        """Rebuild from batches of route rows; live writes during the load win"""
+        started = time.monotonic()
+        with self._lock:
+            self._stops.clear()
+            self._segments.clear()
+            self._adjacent.clear()
+            self._touched.clear()
+            self._loading = True
+            self.ready = False
+            self._changed()
+        try:
+            for rows in batches:
+                with self._lock:
+                    for row in rows:
+                        if row['route_id'] not in self._touched:
+                            self._add(row)
+        finally:
+            with self._lock:
+                self._loading = False
+                self._touched.clear()
+                self._changed()
+        self.ready = True
+        self.loaded_at = time.time()
+        logger.info("Built transit graph: %d stops, %d segments in %.2fs",
+                    len(self._stops), len(self._segments), time.monotonic() - started)
+
+    # ---- queries ----
+
+    def _legs(self, steps):
+        legs = []
+        for stop, route_id in steps:
+            start, end, distance, line = self._segments[route_id]
+            legs.append({
+                "route_id": route_id,
+                "route_name": line,
+                "from": self._stops[end if stop == start else start],
+                "to": self._stops[stop],
+                "distance_km": distance,
+            })
+        return legs
+
+    def _fewest_km(self, source, target):
+        """Plain Dijkstra on distance; returns [(stop reached, route_id)]"""
+        best = {source: 0.0}
+        previous = {}
+        heap = [(0.0, source)]
+        while heap:
+            distance, stop = heapq.heappop(heap)
+            if stop == target:
+                break
+            if distance > best[stop]:
+                continue
+            for route_id, (neighbour, length, _) in self._adjacent.get(stop, {}).items():
+                candidate = distance + length
+                if candidate < best.get(neighbour, float('inf')):
+                    best[neighbour] = candidate
+                    previous[neighbour] = (stop, route_id)
+                    heapq.heappush(heap, (candidate, neighbour))
+        if target not in previous and source != target:
+            return None
+        steps = []
+        stop = target
+        while stop != source:
+            prior, route_id = previous[stop]
+            steps.append((stop, route_id))
+            stop = prior
+        return steps[::-1]
+
+    def _fewest_transfers(self, source, target):
+        """Dijkstra over (stop, line) states ordered by (transfers, distance).
+
+        A state is dropped when the stop was already reached with fewer
+        transfers and no more distance: changing lines there is at least as
+        good, which keeps the search close to one label per stop.
+        """
+        start = (source, None)
+        best = {start: (0, 0.0)}
+        settled = {}
+        previous = {}
+        heap = [(0, 0.0, source, None)]
+        found = None
+        while heap:
+            transfers, distance, stop, line = heapq.heappop(heap)
+            state = (stop, line)
+            if stop == target:
+                found = state
+                break
+            if (transfers, distance) > best[state]:
+                continue
+            first = settled.setdefault(stop, (transfers, distance))
+            if first[0] < transfers and first[1] <= distance:
+                continue
+            for route_id, (neighbour, length, next_line) in self._adjacent.get(stop, {}).items():
+                cost = (transfers + (line is not None and next_line != line), distance + length)
+                reached = settled.get(neighbour)
+                if reached is not None and reached[0] < cost[0] and reached[1] <= cost[1]:
+                    continue
+                following = (neighbour, next_line)
+                if cost < best.get(following, (float('inf'), 0.0)):
+                    best[following] = cost
+                    previous[following] = (state, route_id)
+                    heapq.heappush(heap, (*cost, neighbour, next_line))
+        if found is None:
+            return None
+        steps = []
+        state = found
+        while state != start:
+            prior, route_id = previous[state]
+            steps.append((state[0], route_id))
+            state = prior
+        return steps[::-1]
+
+    def _compute(self, mode, source, target):
+        steps = self._fewest_km(source, target) if mode == 'distance' else self._fewest_transfers(source, target)
+        if steps is None:
+            return None
+        legs = self._legs(steps)
+        lines = [leg['route_name'] for leg in legs]
+        return {
+            "from": self._stops[source],
+            "to": self._stops[target],
+            "mode": mode,
+            "distance_km": round(sum(leg['distance_km'] for leg in legs), 2),
+            "transfers": sum(1 for a, b in zip(lines, lines[1:]) if a != b),
+            "legs": legs,
+        }
+
+    def _lookup(self, mode, source, target):
+        """Cached result, computing and storing it on a miss; None means no path.
+
+        Searches run without the lock so a slow miss never holds up cache
+        hits. Writes are rare: if one lands mid-search, the search is redone
+        under the lock against the current graph.
+        """
+        key = (mode, source, target)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key], True
+            version = self.version
+        try:
+            result = self._compute(mode, source, target)
+        except (RuntimeError, KeyError):
+            # The graph was modified under the search
+            version = None
+        with self._lock:
+            if version != self.version:
+                result = (self._compute(mode, source, target)
+                          if source in self._stops and target in self._stops else None)
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return result, False
+
+    def path(self, origin: str, destination: str, mode: str = 'distance'):
+        """Best path between two stops, or None if either is unknown or they are not connected.
+
+        Raises KeyError naming a stop the graph does not know.
+        """
+        if mode not in PATH_MODES:
+            raise ValueError(f"Unknown mode '{mode}'; expected one of {', '.join(PATH_MODES)}")
+        source, target = stop_key(origin), stop_key(destination)
+        with self._lock:
+            for name, key in ((origin, source), (destination, target)):
+                if key not in self._stops:
+                    raise KeyError(name)
+            self._popular[(mode, source, target)] += 1
+            # Only the ranking matters; keep the counter from growing without bound
+            if len(self._popular) > self.precompute_pairs * 50:
+                self._popular = Counter(dict(self._popular.most_common(self.precompute_pairs * 10)))
+        result, cached = self._lookup(mode, source, target)
+        if result is None:
+            return None
+        return {**result, "cached": cached}
+
+    def precompute(self):
+        """Recompute the most queried pairs so they are served from the cache"""
+        started = time.monotonic()
+        with self._lock:
+            pairs = [pair for pair, _ in self._popular.most_common(self.precompute_pairs)]
+        computed = 0
+        for mode, source, target in pairs:
+            if source in self._stops and target in self._stops:
+                self._lookup(mode, source, target)
+                computed += 1
+        if computed:
+            logger.info("Precomputed %d transit paths in %.3fs", computed, time.monotonic() - started)
+        return computed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'stops': len(self._stops),
+                'segments': len(self._segments),
+                'lines': len({segment[3] for segment in self._segments.values()}),
+                'cached_paths': len(self._cache),
+                'tracked_pairs': len(self._popular),
+                'version': self.version,
+                'loaded_at': self.loaded_at,
+            }
+
+
+# Global transit graph
+transit_graph = TransitGraph(TRANSIT_CONFIG['cache_size'], TRANSIT_CONFIG['precompute_pairs'])
+
+
+def load_transit_graph():
+    """Build the graph from the routes table and warm the popular pairs"""
+    try:
+        transit_graph.load(db.stream_query(f"SELECT {', '.join(_ROUTE_COLUMNS)} FROM public_transport_routes",
+                                           batch_size=TRANSIT_CONFIG['load_batch_size']))
+        transit_graph.precompute()
+    except Exception as e:
+        logger.warning("Could not build transit graph: %s", e)
+
+
+@on_change('public_transport_routes', blocking=True)
+def _sync_transit_graph(table, action, rows):
+    for row in rows:
+        if action == 'delete':
+            transit_graph.delete(row['route_id'])
+            continue
+        if any(column not in row for column in _ROUTE_COLUMNS):
+            # Partial updates only carry the changed columns
+            row = db.execute_one(f"SELECT {', '.join(_ROUTE_COLUMNS)} FROM public_transport_routes "
+                                 f"WHERE route_id = %s", (row['route_id'],))
+            if row is None:
+                continue
+        transit_graph.put(row)
+    transit_graph.precompute()
@@ -1,16 +1,21 @@
 /***************************************************
  Smart City Services Management System - MySQL SQL
- 18 tables: addresses, citizens, utility_accounts,
+ 22 tables: addresses, citizens, utility_accounts,
  electricity_usage, water_usage, electricity_bills,
  water_bills, payments, public_transport_routes,
  drivers, buses, emergency_services, emergency_requests,
  waste_collection_zones, trucks, waste_collection_logs,
- complaints, complaint_updates
+ complaints, complaint_updates, job_watermarks,
+ account_balances, usage_anomalies, consumption_rollup
  Charset: utf8mb4, Engine: InnoDB
 ***************************************************/
 SET FOREIGN_KEY_CHECKS = 0;
 
 -- Drop existing tables (drop child tables first)
+DROP TABLE IF EXISTS consumption_rollup;
+DROP TABLE IF EXISTS usage_anomalies;
+DROP TABLE IF EXISTS account_balances;
+DROP TABLE IF EXISTS job_watermarks;
 DROP TABLE IF EXISTS complaint_updates;
 DROP TABLE IF EXISTS complaints;
 DROP TABLE IF EXISTS waste_collection_logs;
@@ -41,7 +46,8 @@ CREATE TABLE addresses (
   state VARCHAR(100),
   zipcode VARCHAR(20),
   country VARCHAR(100) DEFAULT 'India',
-  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_address_city_area (city, area)
 ) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
 
 -- 2) citizens
@@ -57,7 +63,8 @@ CREATE TABLE citizens (
   CONSTRAINT fk_citizen_address FOREIGN KEY (address_id) REFERENCES addresses(address_id)
     ON DELETE SET NULL ON UPDATE CASCADE,
   INDEX idx_citizen_address (address_id),
-  INDEX idx_citizen_phone (phone)
+  INDEX idx_citizen_phone (phone),
+  INDEX idx_citizen_name (name)
 ) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
 
 -- 3) utility_accounts
@@ -74,37 +81,55 @@ CREATE TABLE utility_accounts (
 
 -- 4) electricity_usage
 CREATE TABLE electricity_usage (
-  usage_id INT AUTO_INCREMENT PRIMARY KEY,
+  usage_id INT AUTO_INCREMENT,
   account_id INT NOT NULL,
   usage_month YEAR NOT NULL, -- use YEAR to represent year; you may add month as separate field
   usage_month_number TINYINT UNSIGNED NOT NULL, -- 1..12
   units_consumed DECIMAL(10,2) NOT NULL DEFAULT 0,
   meter_reading_time DATETIME DEFAULT NULL,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  CONSTRAINT fk_eu_account FOREIGN KEY (account_id) REFERENCES utility_accounts(account_id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
-  INDEX idx_eu_account (account_id),
+  -- Partitioned: no foreign keys, and every unique key carries the partition column.
+  -- Deleting an account removes its rows in the API (see note 6).
+  PRIMARY KEY (usage_id, usage_month),
+  UNIQUE KEY uq_eu_account_period (account_id, usage_month, usage_month_number),
   INDEX idx_eu_month (usage_month, usage_month_number)
-) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
+) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci
+-- Yearly partitions; `python -m app.jobs.partitions` adds upcoming years and archives old ones
+PARTITION BY RANGE (usage_month) (
+  PARTITION p2024 VALUES LESS THAN (2025),
+  PARTITION p2025 VALUES LESS THAN (2026),
+  PARTITION p2026 VALUES LESS THAN (2027),
+  PARTITION p2027 VALUES LESS THAN (2028),
+  PARTITION pfuture VALUES LESS THAN MAXVALUE
+);
 
 -- 5) water_usage
 CREATE TABLE water_usage (
-  usage_id INT AUTO_INCREMENT PRIMARY KEY,
+  usage_id INT AUTO_INCREMENT,
   account_id INT NOT NULL,
   usage_month YEAR NOT NULL,
   usage_month_number TINYINT UNSIGNED NOT NULL,
   litres_consumed DECIMAL(12,2) NOT NULL DEFAULT 0,
   recorded_at DATETIME DEFAULT NULL,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  CONSTRAINT fk_wu_account FOREIGN KEY (account_id) REFERENCES utility_accounts(account_id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
-  INDEX idx_wu_account (account_id),
+  -- Partitioned: no foreign keys, and every unique key carries the partition column.
+  -- Deleting an account removes its rows in the API (see note 6).
+  PRIMARY KEY (usage_id, usage_month),
+  UNIQUE KEY uq_wu_account_period (account_id, usage_month, usage_month_number),
   INDEX idx_wu_month (usage_month, usage_month_number)
-) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
+) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci
+-- Yearly partitions; `python -m app.jobs.partitions` adds upcoming years and archives old ones
+PARTITION BY RANGE (usage_month) (
+  PARTITION p2024 VALUES LESS THAN (2025),
+  PARTITION p2025 VALUES LESS THAN (2026),
+  PARTITION p2026 VALUES LESS THAN (2027),
+  PARTITION p2027 VALUES LESS THAN (2028),
+  PARTITION pfuture VALUES LESS THAN MAXVALUE
+);
 
 -- 6) electricity_bills
 CREATE TABLE electricity_bills (
-  bill_id INT AUTO_INCREMENT PRIMARY KEY,
+  bill_id INT AUTO_INCREMENT,
   account_id INT NOT NULL,
   bill_year YEAR NOT NULL,
   bill_month TINYINT UNSIGNED NOT NULL,
@@ -115,36 +140,55 @@ CREATE TABLE electricity_bills (
   issued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 
-  CONSTRAINT fk_eb_account
-    FOREIGN KEY (account_id)
-    REFERENCES utility_accounts(account_id)
-    ON DELETE CASCADE,
-
+  -- Partitioned: no foreign keys, and every unique key carries the partition column.
+  -- Deleting an account removes its rows in the API (see note 6).
+  PRIMARY KEY (bill_id, bill_year),
+  UNIQUE KEY uq_eb_account_period (account_id, bill_year, bill_month),
   INDEX idx_eb_account (account_id),
-  INDEX idx_eb_status (status),
+  INDEX idx_eb_status_due (status, due_date),
   INDEX idx_eb_period (bill_year, bill_month)
-) ENGINE=InnoDB;
+) ENGINE=InnoDB
+-- Yearly partitions; `python -m app.jobs.partitions` adds upcoming years and archives old ones
+PARTITION BY RANGE (bill_year) (
+  PARTITION p2024 VALUES LESS THAN (2025),
+  PARTITION p2025 VALUES LESS THAN (2026),
+  PARTITION p2026 VALUES LESS THAN (2027),
+  PARTITION p2027 VALUES LESS THAN (2028),
+  PARTITION pfuture VALUES LESS THAN MAXVALUE
+);
 
 
 -- 7) water_bills
 CREATE TABLE water_bills (
-  bill_id INT AUTO_INCREMENT PRIMARY KEY,
+  bill_id INT AUTO_INCREMENT,
   account_id INT NOT NULL,
   bill_year YEAR NOT NULL,
   bill_month TINYINT UNSIGNED NOT NULL,
   litres_consumed DECIMAL(10,2),
   amount DECIMAL(12,2),
-  status ENUM('Unpaid','Paid','Overdue') DEFAULT 'Unpaid',
+  status ENUM('Unpaid','Paid','Partially Paid','Overdue') DEFAULT 'Unpaid',
   due_date DATE,
   issued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  FOREIGN KEY (account_id) REFERENCES utility_accounts(account_id)
-    ON DELETE CASCADE
-) ENGINE=InnoDB;
+  -- Partitioned: no foreign keys, and every unique key carries the partition column.
+  -- Deleting an account removes its rows in the API (see note 6).
+  PRIMARY KEY (bill_id, bill_year),
+  UNIQUE KEY uq_wb_account_period (account_id, bill_year, bill_month),
+  INDEX idx_wb_status_due (status, due_date),
+  INDEX idx_wb_period (bill_year, bill_month)
+) ENGINE=InnoDB
+-- Yearly partitions; `python -m app.jobs.partitions` adds upcoming years and archives old ones
+PARTITION BY RANGE (bill_year) (
+  PARTITION p2024 VALUES LESS THAN (2025),
+  PARTITION p2025 VALUES LESS THAN (2026),
+  PARTITION p2026 VALUES LESS THAN (2027),
+  PARTITION p2027 VALUES LESS THAN (2028),
+  PARTITION pfuture VALUES LESS THAN MAXVALUE
+);
 
 
 -- 8) payments
 CREATE TABLE payments (
-  payment_id INT AUTO_INCREMENT PRIMARY KEY,
+  payment_id INT AUTO_INCREMENT,
   bill_type ENUM('Electricity','Water') NOT NULL,
   bill_id INT NOT NULL, -- references either electricity_bills.bill_id or water_bills.bill_id depending on bill_type
   payment_date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -152,12 +196,75 @@ CREATE TABLE payments (
   mode ENUM('Cash','NEFT','UPI','Cheque','Card','Online') DEFAULT 'Online',
   transaction_ref VARCHAR(200),
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (payment_id, payment_date),
   INDEX idx_pay_bill (bill_type, bill_id),
   INDEX idx_pay_date (payment_date)
-) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
+) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci
+-- Yearly partitions; `python -m app.jobs.partitions` adds upcoming years and archives old ones
+PARTITION BY RANGE (YEAR(payment_date)) (
+  PARTITION p2024 VALUES LESS THAN (2025),
+  PARTITION p2025 VALUES LESS THAN (2026),
+  PARTITION p2026 VALUES LESS THAN (2027),
+  PARTITION p2027 VALUES LESS THAN (2028),
+  PARTITION pfuture VALUES LESS THAN MAXVALUE
+);
 
 -- NOTE: payments.bill_id is not a strict foreign key because it can refer to multiple bill tables. Enforce referential integrity via application or triggers if desired.
 
+-- Stand-ins for the foreign keys the partitioned tables cannot have: every write that sets an
+-- account_id (or a payment's bill) checks the parent row exists, whichever path it comes from
+-- (CRUD, bulk endpoints, meter imports, billing runs). Like an InnoDB foreign key check, the parent
+-- is read with a shared lock, so a concurrent account delete (which locks the account first) and
+-- the write are serialized and cannot leave an orphan behind.
+DROP PROCEDURE IF EXISTS require_account;
+DROP PROCEDURE IF EXISTS require_bill;
+DELIMITER //
+CREATE PROCEDURE require_account(IN p_account_id INT)
+BEGIN
+  DECLARE found INT;
+  SELECT COUNT(*) INTO found FROM utility_accounts WHERE account_id = p_account_id LOCK IN SHARE MODE;
+  IF found = 0 THEN
+    SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+      MESSAGE_TEXT = 'Cannot add or update a child row: account_id not found in utility_accounts';
+  END IF;
+END//
+CREATE PROCEDURE require_bill(IN p_bill_type VARCHAR(20), IN p_bill_id INT)
+BEGIN
+  DECLARE found INT;
+  IF p_bill_type = 'Electricity' THEN
+    SELECT COUNT(*) INTO found FROM electricity_bills WHERE bill_id = p_bill_id LOCK IN SHARE MODE;
+  ELSE
+    SELECT COUNT(*) INTO found FROM water_bills WHERE bill_id = p_bill_id LOCK IN SHARE MODE;
+  END IF;
+  IF found = 0 THEN
+    SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,
+      MESSAGE_TEXT = 'Cannot add or update a child row: bill_id not found in the bill_type bill table';
+  END IF;
+END//
+CREATE TRIGGER trg_eu_account_insert BEFORE INSERT ON electricity_usage FOR EACH ROW
+  CALL require_account(NEW.account_id)//
+CREATE TRIGGER trg_eu_account_update BEFORE UPDATE ON electricity_usage FOR EACH ROW
+  IF NOT NEW.account_id <=> OLD.account_id THEN CALL require_account(NEW.account_id); END IF//
+CREATE TRIGGER trg_wu_account_insert BEFORE INSERT ON water_usage FOR EACH ROW
+  CALL require_account(NEW.account_id)//
+CREATE TRIGGER trg_wu_account_update BEFORE UPDATE ON water_usage FOR EACH ROW
+  IF NOT NEW.account_id <=> OLD.account_id THEN CALL require_account(NEW.account_id); END IF//
+CREATE TRIGGER trg_eb_account_insert BEFORE INSERT ON electricity_bills FOR EACH ROW
+  CALL require_account(NEW.account_id)//
+CREATE TRIGGER trg_eb_account_update BEFORE UPDATE ON electricity_bills FOR EACH ROW
+  IF NOT NEW.account_id <=> OLD.account_id THEN CALL require_account(NEW.account_id); END IF//
+CREATE TRIGGER trg_wb_account_insert BEFORE INSERT ON water_bills FOR EACH ROW
+  CALL require_account(NEW.account_id)//
+CREATE TRIGGER trg_wb_account_update BEFORE UPDATE ON water_bills FOR EACH ROW
+  IF NOT NEW.account_id <=> OLD.account_id THEN CALL require_account(NEW.account_id); END IF//
+CREATE TRIGGER trg_pay_bill_insert BEFORE INSERT ON payments FOR EACH ROW
+  CALL require_bill(NEW.bill_type, NEW.bill_id)//
+CREATE TRIGGER trg_pay_bill_update BEFORE UPDATE ON payments FOR EACH ROW
+  IF NOT (NEW.bill_type <=> OLD.bill_type AND NEW.bill_id <=> OLD.bill_id) THEN
+    CALL require_bill(NEW.bill_type, NEW.bill_id);
+  END IF//
+DELIMITER ;
+
 -- 9) public_transport_routes
 CREATE TABLE public_transport_routes (
   route_id INT AUTO_INCREMENT PRIMARY KEY,
@@ -217,6 +324,7 @@ CREATE TABLE emergency_requests (
   incident_datetime DATETIME,
   location VARCHAR(300),
   status ENUM('Open','Dispatched','Resolved','Cancelled') DEFAULT 'Open',
+  severity TINYINT NOT NULL DEFAULT 3, -- 1 (critical) .. 5 (minor)
   notes TEXT,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   CONSTRAINT fk_er_citizen FOREIGN KEY (citizen_id) REFERENCES citizens(citizen_id)
@@ -224,7 +332,8 @@ CREATE TABLE emergency_requests (
   CONSTRAINT fk_er_service FOREIGN KEY (service_id) REFERENCES emergency_services(service_id)
     ON DELETE RESTRICT ON UPDATE CASCADE,
   INDEX idx_er_service (service_id),
-  INDEX idx_er_status (status)
+  INDEX idx_er_status (status),
+  INDEX idx_er_dispatch (status, service_id, severity, request_datetime)
 ) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
 
 -- 14) waste_collection_zones
@@ -302,6 +411,74 @@ CREATE TABLE complaint_updates (
   INDEX idx_cu_complaint (complaint_id)
 ) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
 
+-- 19) job_watermarks (high-water marks of incremental background jobs)
+CREATE TABLE job_watermarks (
+  job_name VARCHAR(100) PRIMARY KEY,
+  last_id BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
+
+-- 20) account_balances (per-account ledger maintained by app/jobs/balances.py)
+CREATE TABLE account_balances (
+  account_id INT PRIMARY KEY,
+  billed DECIMAL(14,2) NOT NULL DEFAULT 0,
+  paid DECIMAL(14,2) NOT NULL DEFAULT 0,
+  balance DECIMAL(14,2) NOT NULL DEFAULT 0,
+  open_bills INT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+  CONSTRAINT fk_ab_account
+    FOREIGN KEY (account_id)
+    REFERENCES utility_accounts(account_id)
+    ON DELETE CASCADE,
+
+  INDEX idx_ab_balance (balance)
+) ENGINE=InnoDB;
+
+-- 21) usage_anomalies (readings flagged by app/jobs/anomalies.py)
+CREATE TABLE usage_anomalies (
+  anomaly_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  utility ENUM('electricity','water') NOT NULL,
+  usage_id INT NOT NULL, -- electricity_usage or water_usage row, by utility
+  account_id INT NOT NULL,
+  usage_month YEAR NOT NULL,
+  usage_month_number TINYINT UNSIGNED NOT NULL,
+  consumed DECIMAL(12,2) NOT NULL,
+  baseline DECIMAL(12,2) NOT NULL,
+  baseline_std DECIMAL(12,2) NOT NULL,
+  history TINYINT UNSIGNED NOT NULL, -- readings in the baseline
+  z_score DECIMAL(8,2) NOT NULL,
+  kind ENUM('spike','drop','zero') NOT NULL,
+  detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+  CONSTRAINT fk_ua_anomaly_account
+    FOREIGN KEY (account_id)
+    REFERENCES utility_accounts(account_id)
+    ON DELETE CASCADE,
+
+  UNIQUE KEY uq_anomaly_reading (utility, usage_id),
+  INDEX idx_anomaly_account (utility, account_id),
+  INDEX idx_anomaly_period (utility, usage_month, usage_month_number)
+) ENGINE=InnoDB;
+
+-- 22) consumption_rollup (usage and billing totals per city/area/month, maintained by app/jobs/rollup.py)
+CREATE TABLE consumption_rollup (
+  utility ENUM('electricity','water') NOT NULL,
+  period_year SMALLINT NOT NULL,
+  period_month TINYINT UNSIGNED NOT NULL,
+  city VARCHAR(100) NOT NULL DEFAULT '', -- '' for accounts without an address
+  area VARCHAR(150) NOT NULL DEFAULT '',
+  accounts INT NOT NULL DEFAULT 0, -- accounts with readings in the month
+  readings INT NOT NULL DEFAULT 0,
+  consumed DECIMAL(16,2) NOT NULL DEFAULT 0,
+  bills INT NOT NULL DEFAULT 0,
+  billed DECIMAL(16,2) NOT NULL DEFAULT 0,
+  refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+  PRIMARY KEY (utility, period_year, period_month, city, area),
+  INDEX idx_rollup_place (city, area, period_year, period_month)
+) ENGINE=InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_unicode_ci;
+
 
 ----------------------------------------------------
 -- Sample data (small set) - adapt/extend to 1000+ later
@@ -448,7 +625,36 @@ FROM water_bills wb WHERE wb.status <> 'Paid';
 --    enforce referential integrity with triggers if you want strict cross-table FK checks.
 -- 2) Add triggers:
 --    - to auto-create electricity_bills from electricity_usage,
---    - to update bill status after payments insertion,
+--    - to update bill status after payments insertion (done in the API by
+--      app/jobs/reconciliation.py, inline and as a catch-up job),
 --    - to auto-create notifications on complaint insert.
 -- 3) To produce 1000+ test rows use a small Python script with Faker or MySQL INSERT .. SELECT
---    against a numbers table to bulk-generate data quickly.
\ No newline at end of file
+--    against a numbers table to bulk-generate data quickly.
+-- 4) account_balances and consumption_rollup are kept current by the API's usage, bill and
+--    payment writes. Rows loaded any other way (like the sample data above), and address changes,
+--    show up after `python -m app.jobs.balances` / `python -m app.jobs.rollup` rebuild them.
+-- 5) Usage readings are unique per account and month (uq_eu_account_period / uq_wu_account_period),
+--    so re-sent readings are upserted, not duplicated. Before adding the key to an existing database,
+--    keep only the latest reading of each month, e.g.:
+--      DELETE u FROM electricity_usage u JOIN electricity_usage newer
+--        ON newer.account_id = u.account_id AND newer.usage_month = u.usage_month
+--       AND newer.usage_month_number = u.usage_month_number AND newer.usage_id > u.usage_id;
+-- 6) electricity_usage, water_usage, electricity_bills, water_bills and payments are RANGE
+--    partitioned by year (usage_month, bill_year, YEAR(payment_date)). Queries that filter on
+--    the year only read that year's partition. MySQL does not allow foreign keys on partitioned
+--    tables, so the require_account / require_bill triggers check parents on write, and citizen
+--    and utility account deletes remove the accounts' usage, bills and payments in the API
+--    (app/crud/operations.py). `python -m app.jobs.partitions` keeps partitions ahead of the
+--    calendar and, with --retain N, moves years older than that into <table>_<year> archive
+--    tables (or drops them with --drop). To partition an existing database:
+--      ALTER TABLE electricity_usage DROP FOREIGN KEY fk_eu_account,
+--        DROP PRIMARY KEY, ADD PRIMARY KEY (usage_id, usage_month);
+--      ALTER TABLE electricity_usage PARTITION BY RANGE (usage_month) (
+--        PARTITION p2024 VALUES LESS THAN (2025), ..., PARTITION pfuture VALUES LESS THAN MAXVALUE);
+--    and likewise for the other four tables (the bill foreign keys are fk_eb_account and the
+--    generated water_bills_ibfk_1; payments has none), then create the procedures and triggers
+--    that follow the payments table.
+-- 7) Open emergency requests are dispatched in order of severity, service type and age
+--    (app/services/dispatch.py). To add the column to an existing database:
+--      ALTER TABLE emergency_requests ADD COLUMN severity TINYINT NOT NULL DEFAULT 3 AFTER status,
+--        ADD INDEX idx_er_dispatch (status, service_id, severity, request_datetime);
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""
+Unit tests for the citizen name index (no database needed)
+"""
+import random
+import unittest
+from app.services.citizen_search import CitizenNameIndex, SortedKeys, match_kind
+
+
+class SortedKeysTest(unittest.TestCase):
+
+    def test_matches_a_sorted_list(self):
+        rng = random.Random(5)
+        keys = SortedKeys(bucket_size=4)
+        expected = []
+        for _ in range(2000):
+            key = rng.randint(0, 300)
+            if rng.random() < 0.6:
+                keys.add(key)
+                expected.append(key)
+            else:
+                keys.discard(key)
+                if key in expected:
+                    expected.remove(key)
+            expected.sort()
+        self.assertEqual(len(keys), len(expected))
+        self.assertEqual(list(keys), expected)
+        for key in (-1, 0, 150, 300, 301):
+            self.assertEqual(list(keys.from_key(key)), [value for value in expected if value >= key])
+
+    def test_empty(self):
+        keys = SortedKeys()
+        keys.discard(1)
+        self.assertEqual(len(keys), 0)
+        self.assertEqual(list(keys.from_key(0)), [])
+
+
+class CitizenNameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = CitizenNameIndex()
+        self.index.load([[
+            {'citizen_id': 1, 'name': 'Asha Patil'},
+            {'citizen_id': 2, 'name': 'Asha'},
+            {'citizen_id': 3, 'name': 'Ravi Ashar'},
+            {'citizen_id': 4, 'name': 'Kavita Deshpande'},
+        ], [
+            {'citizen_id': 5, 'name': 'Natasha Rao'},
+        ]])
+
+    def test_tiers_in_order(self):
+        self.assertEqual(self.index.search('asha'),
+                         [(2, 'exact'), (1, 'prefix'), (3, 'word_prefix'), (5, 'substring')])
+        self.assertEqual(self.index.search('asha', limit=2), [(2, 'exact'), (1, 'prefix')])
+
+    def test_put_and_delete(self):
+        self.index.put(4, 'Asha Kulkarni')
+        self.index.delete(2)
+        self.assertEqual(self.index.search('asha'),
+                         [(4, 'prefix'), (1, 'prefix'), (3, 'word_prefix'), (5, 'substring')])
+        self.assertEqual(self.index.search('deshpande'), [])
+        self.assertEqual(self.index.stats()['names'], 4)
+
+    def test_accents_and_case(self):
+        self.index.put(6, 'José Fernandes')
+        self.assertEqual(self.index.search('JOSE'), [(6, 'prefix')])
+        self.assertEqual(match_kind('José Fernandes', 'fern'), 'word_prefix')
+
+
+if __name__ == '__main__':
+    unittest.main()
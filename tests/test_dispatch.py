@@ -0,0 +1,142 @@
+"""
+Unit tests for the in-memory emergency dispatch queue (no database needed)
+"""
+import random
+import unittest
+from datetime import datetime, timedelta
+from app.services.dispatch import DispatchQueue
+
+BASE = datetime(2026, 1, 1)
+SERVICES = [
+    {'service_id': 1, 'service_type': 'Police'},
+    {'service_id': 2, 'service_type': 'Fire'},
+    {'service_id': 3, 'service_type': 'Ambulance'},
+    {'service_id': 4, 'service_type': 'Rescue'},
+]
+PRIORITY = ('Ambulance', 'Fire', 'Police')
+
+
+def request(req_id, service_id, severity=3, minutes=0, status='Open'):
+    return {'req_id': req_id, 'service_id': service_id, 'status': status, 'severity': severity,
+            'request_datetime': BASE + timedelta(minutes=minutes)}
+
+
+def new_queue(rows=()):
+    queue = DispatchQueue(PRIORITY)
+    queue.load(SERVICES, [list(rows)])
+    return queue
+
+
+def taken_ids(entries):
+    return [key[-1] for _, key in entries]
+
+
+class DispatchQueueTest(unittest.TestCase):
+
+    def test_take_orders_by_severity_service_rank_and_age(self):
+        queue = new_queue([
+            request(1, 1, severity=2, minutes=0),   # Police
+            request(2, 3, severity=2, minutes=5),   # Ambulance outranks Police at equal severity
+            request(3, 4, severity=1, minutes=9),   # most severe wins regardless of service
+            request(4, 3, severity=2, minutes=1),   # older Ambulance before the newer one
+            request(5, 4, severity=2, minutes=0),   # Rescue is unranked, so after every ranked type
+        ])
+        self.assertEqual(taken_ids(queue.take(count=10)), [3, 4, 2, 1, 5])
+        self.assertEqual(queue.take(), [])
+
+    def test_take_by_service(self):
+        queue = new_queue([request(1, 1, severity=1), request(2, 2, severity=5), request(3, 2, severity=4)])
+        self.assertEqual(taken_ids(queue.take(2, count=5)), [3, 2])
+        self.assertEqual(taken_ids(queue.take(count=5)), [1])
+
+    def test_missing_severity_counts_as_default(self):
+        queue = new_queue([request(1, 1, severity=None), request(2, 1, severity=4), request(3, 1, severity=2)])
+        self.assertEqual(taken_ids(queue.take(count=3)), [3, 1, 2])
+
+    def test_writes_rerank_and_drop_requests(self):
+        queue = new_queue([request(1, 1, severity=3), request(2, 1, severity=4), request(3, 1, severity=5)])
+        queue.put(request(3, 1, severity=1))
+        queue.put(request(1, 1, status='Dispatched'))
+        queue.discard(2)
+        self.assertEqual(taken_ids(queue.take(count=5)), [3])
+
+    def test_restore_puts_back_taken_entries(self):
+        queue = new_queue([request(1, 1, severity=1), request(2, 1, severity=2)])
+        taken = queue.take(count=2)
+        self.assertEqual(queue.stats()['open_requests'], 0)
+        queue.restore(taken)
+        self.assertEqual(taken_ids(queue.take(count=2)), [1, 2])
+
+    def test_restore_keeps_a_newer_write(self):
+        queue = new_queue([request(1, 1, severity=1), request(2, 1, severity=2)])
+        taken = queue.take()
+        # Re-queued by a write while it was out being claimed
+        queue.put(request(1, 1, severity=5))
+        queue.restore(taken)
+        self.assertEqual(taken_ids(queue.take(count=3)), [2, 1])
+
+    def test_superseded_entries_are_compacted(self):
+        queue = new_queue([request(i, 1 + i % 4, minutes=i) for i in range(100)])
+        for step in range(5000):
+            queue.put(request(step % 100, 1 + step % 4, severity=1 + step % 5, minutes=step))
+        stats = queue.stats()
+        self.assertEqual(stats['open_requests'], 100)
+        self.assertLessEqual(stats['heap_entries'], 2 * stats['open_requests'] + 64)
+        self.assertEqual(sorted(taken_ids(queue.take(count=200))), list(range(100)))
+
+    def test_writes_during_a_load_win_over_loaded_rows(self):
+        queue = DispatchQueue(PRIORITY)
+
+        def batches():
+            yield [request(1, 1, severity=3), request(2, 1, severity=3, minutes=1)]
+            # Live writes between two batches of the load
+            queue.discard(3)
+            queue.put(request(4, 1, severity=1, minutes=9))
+            yield [request(3, 1, severity=3, minutes=2), request(4, 1, severity=5, minutes=3)]
+
+        queue.load(SERVICES, batches())
+        self.assertTrue(queue.ready)
+        self.assertEqual(taken_ids(queue.take(count=5)), [4, 1, 2])
+
+    def test_matches_a_sorted_reference(self):
+        rng = random.Random(1)
+        queue = new_queue()
+        rank = {'ambulance': 0, 'fire': 1, 'police': 2}
+        types = {service['service_id']: service['service_type'] for service in SERVICES}
+        truth = {}
+
+        def key(row):
+            return (row['severity'], rank.get(types[row['service_id']].lower(), 3), row['request_datetime'],
+                    row['req_id'])
+
+        for _ in range(5000):
+            op = rng.random()
+            if op < 0.5:
+                row = request(rng.randint(1, 300), rng.randint(1, 4), rng.randint(1, 5), rng.randint(0, 500),
+                              rng.choice(['Open', 'Open', 'Open', 'Resolved']))
+                queue.put(row)
+                if row['status'] == 'Open':
+                    truth[row['req_id']] = row
+                else:
+                    truth.pop(row['req_id'], None)
+            elif op < 0.6:
+                req_id = rng.randint(1, 300)
+                queue.discard(req_id)
+                truth.pop(req_id, None)
+            else:
+                service_id = rng.choice([None, 1, 2, 3, 4])
+                count = rng.randint(1, 3)
+                taken = queue.take(service_id, count)
+                expected = sorted((row for row in truth.values()
+                                   if service_id is None or row['service_id'] == service_id), key=key)[:count]
+                self.assertEqual(taken_ids(taken), [row['req_id'] for row in expected])
+                if rng.random() < 0.5:
+                    queue.restore(taken)
+                else:
+                    for req_id in taken_ids(taken):
+                        del truth[req_id]
+        self.assertEqual(queue.stats()['open_requests'], len(truth))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Unit tests for offline geocoding against a small gazetteer (no database needed)
+"""
+import os
+import tempfile
+import unittest
+from app.services.geocoding import Gazetteer
+
+GAZETTEER = """name,city,latitude,longitude
+Pune,Pune,18.5204,73.8567
+MG Road,Pune,18.5158,73.8777
+Kothrud,Pune,18.5074,73.8077
+Mumbai,Mumbai,19.0760,72.8777
+Andheri,Mumbai,19.1136,72.8697
+Bengaluru,Bengaluru,12.9716,77.5946
+MG Road,Bengaluru,12.9756,77.6066
+Koramangala,Bengaluru,12.9352,77.6245
+Broken,Pune,not-a-number,73.0
+"""
+
+
+class GazetteerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            f.write(GAZETTEER)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def setUp(self):
+        self.gazetteer = Gazetteer(cache_size=4)
+        with self.assertLogs('app.services.geocoding', 'WARNING'):
+            self.gazetteer.load(self.path)
+
+    def match(self, text):
+        result = self.gazetteer.geocode(text)
+        return result and (result['match'], result['precision'])
+
+    def test_place_within_a_named_city(self):
+        self.assertEqual(self.match('MG Road, Pune'), ('MG Road, Pune', 'place'))
+        self.assertEqual(self.match('MG Road, Bengaluru'), ('MG Road, Bengaluru', 'place'))
+
+    def test_place_names_are_normalized(self):
+        # Dots, postal codes, qualifiers, case and a city without a comma
+        self.assertEqual(self.match('M.G. Road Pune 411001'), ('MG Road, Pune', 'place'))
+        self.assertEqual(self.match('near Andheri, MUMBAI'), ('Andheri, Mumbai', 'place'))
+        self.assertEqual(self.match('  mg road ,  PUNE '), ('MG Road, Pune', 'place'))
+
+    def test_place_name_in_one_city_needs_no_city(self):
+        self.assertEqual(self.match('Koramangala'), ('Koramangala, Bengaluru', 'place'))
+
+    def test_place_name_in_several_cities_is_ambiguous(self):
+        # MG Road is in Pune and Bengaluru
+        self.assertIsNone(self.gazetteer.geocode('MG Road'))
+
+    def test_place_not_in_the_named_city_falls_back_to_the_city(self):
+        self.assertEqual(self.match('Andheri, Pune'), ('Pune', 'city'))
+        self.assertEqual(self.match('Somewhere, Pune'), ('Pune', 'city'))
+
+    def test_last_city_named_wins(self):
+        self.assertEqual(self.match('Pune, MG Road, Bengaluru'), ('MG Road, Bengaluru', 'place'))
+
+    def test_unknown_text(self):
+        self.assertIsNone(self.gazetteer.geocode('Nowhere'))
+        self.assertIsNone(self.gazetteer.geocode('   '))
+        self.assertIsNone(self.gazetteer.geocode(None))
+
+    def test_bad_rows_are_skipped(self):
+        self.assertEqual(self.match('Broken, Pune'), ('Pune', 'city'))
+        self.assertEqual(self.gazetteer.stats()['places'], 5)
+        self.assertEqual(self.gazetteer.stats()['cities'], 3)
+
+    def test_address_rows(self):
+        geocode = self.gazetteer.geocode_address
+        self.assertEqual(geocode({'street': 'MG Road', 'area': 'Central', 'city': 'Pune'})['match'], 'MG Road, Pune')
+        self.assertEqual(geocode({'street': 'Lane 4', 'area': 'Kothrud', 'city': 'Pune'})['match'], 'Kothrud, Pune')
+        result = geocode({'street': 'Lane 4', 'area': 'Central', 'city': 'Mumbai'})
+        self.assertEqual((result['match'], result['precision']), ('Mumbai', 'city'))
+        self.assertIsNone(geocode({'street': 'Lane 4', 'area': None, 'city': None}))
+
+    def test_results_and_misses_are_cached(self):
+        self.gazetteer.geocode('MG Road, Pune')
+        self.gazetteer.geocode('mg road,   pune')
+        self.gazetteer.geocode('Nowhere')
+        self.gazetteer.geocode('nowhere')
+        stats = self.gazetteer.stats()
+        self.assertEqual((stats['cache_hits'], stats['cache_misses']), (2, 2))
+        for text in ('a', 'b', 'c', 'd', 'e'):
+            self.gazetteer.geocode(text)
+        self.assertEqual(self.gazetteer.stats()['cached'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
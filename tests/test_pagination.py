@@ -0,0 +1,91 @@
+"""
+Unit tests for keyset pagination cursors and seek queries (no database needed)
+"""
+import base64
+import unittest
+from datetime import datetime
+from app.crud.pagination import InvalidCursorError, build_page, decode_cursor, encode_cursor, keyset_query
+
+
+class CursorTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        cursor = encode_cursor('period', [2025, 3, 1042])
+        self.assertEqual(decode_cursor(cursor, 'period', 3), [2025, 3, 1042])
+
+    def test_cursor_is_url_safe_without_padding(self):
+        for width in range(1, 12):
+            cursor = encode_cursor('id', [10 ** width - 1])
+            self.assertNotIn('=', cursor)
+            self.assertTrue(set(cursor) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'))
+            self.assertEqual(decode_cursor(cursor, 'id', 1), [10 ** width - 1])
+
+    def test_datetimes_travel_as_text(self):
+        cursor = encode_cursor('payment_date', [datetime(2025, 2, 5, 11, 0), 7])
+        self.assertEqual(decode_cursor(cursor, 'payment_date', 2), ['2025-02-05 11:00:00', 7])
+
+    def test_empty_cursor_is_the_first_page(self):
+        self.assertIsNone(decode_cursor('', 'id', 1))
+        self.assertIsNone(decode_cursor(None, 'id', 1))
+
+    def test_malformed_cursors(self):
+        not_json = base64.urlsafe_b64encode(b'not json').decode()
+        no_keys = base64.urlsafe_b64encode(b'{"s":"id"}').decode()
+        not_an_object = base64.urlsafe_b64encode(b'[1,2]').decode()
+        for cursor in ('%%%', 'abc', not_json, no_keys, not_an_object):
+            with self.assertRaises(InvalidCursorError, msg=cursor):
+                decode_cursor(cursor, 'id', 1)
+
+    def test_cursor_must_match_the_sort(self):
+        with self.assertRaises(InvalidCursorError):
+            decode_cursor(encode_cursor('id', [5]), 'period', 1)
+        with self.assertRaises(InvalidCursorError):
+            decode_cursor(encode_cursor('period', [2025, 3]), 'period', 3)
+
+    def test_invalid_cursor_is_a_value_error(self):
+        self.assertTrue(issubclass(InvalidCursorError, ValueError))
+
+
+class KeysetQueryTest(unittest.TestCase):
+
+    def test_first_page(self):
+        query, params = keyset_query('citizens', '', 50)
+        self.assertEqual(query, "SELECT * FROM citizens ORDER BY citizen_id LIMIT %s")
+        self.assertEqual(params, (51,))
+
+    def test_single_column_seek(self):
+        query, params = keyset_query('citizens', encode_cursor('id', [120]), 50)
+        self.assertEqual(query, "SELECT * FROM citizens WHERE citizen_id > %s ORDER BY citizen_id LIMIT %s")
+        self.assertEqual(params, (120, 51))
+
+    def test_row_constructor_seek_with_extra_filter(self):
+        cursor = encode_cursor('period', [2025, 3, 1042])
+        query, params = keyset_query('electricity_bills', cursor, 10, 'period', 'account_id = %s', (7,))
+        self.assertEqual(query, "SELECT * FROM electricity_bills WHERE account_id = %s AND "
+                                "(bill_year, bill_month, bill_id) > (%s, %s, %s) "
+                                "ORDER BY bill_year, bill_month, bill_id LIMIT %s")
+        self.assertEqual(params, (7, 2025, 3, 1042, 11))
+
+    def test_unknown_sort(self):
+        with self.assertRaises(InvalidCursorError):
+            keyset_query('citizens', '', 10, 'period')
+
+
+class BuildPageTest(unittest.TestCase):
+
+    def test_last_page_has_no_cursor(self):
+        rows = [{'citizen_id': 1}, {'citizen_id': 2}]
+        self.assertEqual(build_page('citizens', rows, 2), {'items': rows, 'next_cursor': None})
+
+    def test_look_ahead_row_is_trimmed_and_becomes_the_cursor(self):
+        rows = [{'bill_id': i, 'bill_year': 2025, 'bill_month': i} for i in (1, 2, 3)]
+        page = build_page('water_bills', rows, 2, 'period')
+        self.assertEqual(page['items'], rows[:2])
+        self.assertEqual(decode_cursor(page['next_cursor'], 'period', 3), [2025, 2, 2])
+        # The next page seeks past the last row returned, not the look-ahead row
+        _, params = keyset_query('water_bills', page['next_cursor'], 2, 'period')
+        self.assertEqual(params, (2025, 2, 2, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Unit tests for partition maintenance planning (no database needed)
+"""
+import unittest
+from app.jobs.partitions import plan_table
+
+
+def layout(*years):
+    return [{"name": f"p{year}", "bound": year + 1, "row_estimate": 0} for year in years] + \
+           [{"name": "pfuture", "bound": None, "row_estimate": 0}]
+
+
+class PlanTableTest(unittest.TestCase):
+
+    def plan(self, archives=None):
+        return plan_table('payments', layout(2020, 2021, 2022, 2023), 2023, 0, 2, True, archives)
+
+    def test_fresh_archive(self):
+        self.assertEqual(self.plan()[:4], [
+            "CREATE TABLE IF NOT EXISTS payments_2020 LIKE payments",
+            "ALTER TABLE payments_2020 REMOVE PARTITIONING",
+            "ALTER TABLE payments EXCHANGE PARTITION p2020 WITH TABLE payments_2020",
+            "ALTER TABLE payments DROP PARTITION p2020",
+        ])
+        self.assertIn("ALTER TABLE payments DROP PARTITION p2021", self.plan())
+        self.assertNotIn("ALTER TABLE payments DROP PARTITION p2022", self.plan())
+
+    def test_rerun_after_create(self):
+        statements = self.plan({'payments_2020': {'partitioned': True, 'empty': True}})
+        self.assertEqual(statements[:3], [
+            "ALTER TABLE payments_2020 REMOVE PARTITIONING",
+            "ALTER TABLE payments EXCHANGE PARTITION p2020 WITH TABLE payments_2020",
+            "ALTER TABLE payments DROP PARTITION p2020",
+        ])
+
+    def test_rerun_after_exchange(self):
+        # Exchanging again would put the archived rows back into the partition about to be dropped
+        statements = self.plan({'payments_2020': {'partitioned': False, 'empty': False}})
+        self.assertEqual(statements[:2], [
+            "INSERT IGNORE INTO payments_2020 SELECT * FROM payments PARTITION (p2020)",
+            "ALTER TABLE payments DROP PARTITION p2020",
+        ])
+        self.assertFalse(any('EXCHANGE PARTITION p2020' in statement for statement in statements))
+
+    def test_drop_without_archive(self):
+        statements = plan_table('payments', layout(2020, 2021, 2022), 2023, 1, 2, False)
+        self.assertEqual(statements, [
+            "ALTER TABLE payments DROP PARTITION p2020",
+            "ALTER TABLE payments DROP PARTITION p2021",
+            "ALTER TABLE payments REORGANIZE PARTITION pfuture INTO (PARTITION p2023 VALUES LESS THAN (2024), "
+            "PARTITION p2024 VALUES LESS THAN (2025), PARTITION pfuture VALUES LESS THAN MAXVALUE)",
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
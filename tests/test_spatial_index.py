@@ -0,0 +1,85 @@
+"""
+Unit tests for the grid spatial index (no database needed)
+"""
+import random
+import unittest
+from app.services.spatial_index import GridIndex, distance_km
+
+
+class GridIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        # A city-sized cloud of points, three kinds of payload
+        self.points = {item_id: (18.3 + rng.random() * 0.5, 73.6 + rng.random() * 0.5) for item_id in range(3000)}
+        self.index = GridIndex(cell_km=1.0)
+        self.index.load([(item_id, latitude, longitude, {'kind': item_id % 3})
+                         for item_id, (latitude, longitude) in self.points.items()])
+        self.rng = rng
+
+    def oracle(self, latitude, longitude, where=None):
+        """Every point with its distance, nearest first, by brute force"""
+        return sorted((distance_km(latitude, longitude, *point), item_id) for item_id, point in self.points.items()
+                      if where is None or where({'kind': item_id % 3}))
+
+    def test_nearest_matches_brute_force(self):
+        for _ in range(100):
+            latitude, longitude = 18.2 + self.rng.random() * 0.7, 73.5 + self.rng.random() * 0.7
+            k = self.rng.randint(1, 20)
+            where = (lambda payload: payload['kind'] == 1) if self.rng.random() < 0.5 else None
+            found = self.index.nearest(latitude, longitude, k, where=where)
+            expected = self.oracle(latitude, longitude, where)[:k]
+            self.assertEqual([match[1] for match in found], [item_id for _, item_id in expected])
+            for match, (distance, _) in zip(found, expected):
+                self.assertAlmostEqual(match[0], distance)
+
+    def test_nearest_within_max_km(self):
+        for _ in range(50):
+            latitude, longitude = 18.2 + self.rng.random() * 0.7, 73.5 + self.rng.random() * 0.7
+            max_km = self.rng.random() * 3
+            found = self.index.nearest(latitude, longitude, 10, max_km=max_km)
+            expected = [item_id for distance, item_id in self.oracle(latitude, longitude) if distance <= max_km][:10]
+            self.assertEqual([match[1] for match in found], expected)
+
+    def test_radius_matches_brute_force(self):
+        for _ in range(100):
+            latitude, longitude = 18.2 + self.rng.random() * 0.7, 73.5 + self.rng.random() * 0.7
+            km = self.rng.random() * 5
+            where = (lambda payload: payload['kind'] != 0) if self.rng.random() < 0.5 else None
+            found = self.index.radius(latitude, longitude, km, where=where)
+            expected = [item_id for distance, item_id in self.oracle(latitude, longitude, where) if distance <= km]
+            self.assertEqual([match[1] for match in found], expected)
+
+    def test_radius_limit(self):
+        found = self.index.radius(18.55, 73.85, 5, limit=7)
+        expected = [item_id for distance, item_id in self.oracle(18.55, 73.85) if distance <= 5][:7]
+        self.assertEqual([match[1] for match in found], expected)
+
+    def test_query_far_from_every_point(self):
+        # Falls back to scanning the occupied cells instead of walking thousands of empty rings
+        found = self.index.nearest(0.0, 0.0, 2)
+        self.assertEqual([match[1] for match in found], [item_id for _, item_id in self.oracle(0.0, 0.0)[:2]])
+        self.assertEqual(self.index.radius(0.0, 0.0, 50), [])
+
+    def test_put_moves_and_remove_drops_items(self):
+        index = GridIndex(cell_km=1.0)
+        index.put('a', 18.5, 73.8, {'name': 'a'})
+        index.put('b', 18.6, 73.9, {'name': 'b'})
+        index.put('a', 18.61, 73.91, {'name': 'moved'})
+        self.assertEqual(len(index), 2)
+        nearest = index.nearest(18.6, 73.9, 2)
+        self.assertEqual([match[1] for match in nearest], ['b', 'a'])
+        self.assertEqual(nearest[1][4], {'name': 'moved'})
+        index.remove('b')
+        index.remove('missing')
+        self.assertEqual([match[1] for match in index.nearest(18.6, 73.9, 2)], ['a'])
+        self.assertEqual(index.nearest(18.6, 73.9, 1, where=lambda payload: payload['name'] == 'b'), [])
+
+    def test_empty_index(self):
+        index = GridIndex()
+        self.assertEqual(index.nearest(18.5, 73.8, 3), [])
+        self.assertEqual(index.radius(18.5, 73.8, 10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+"""
+Unit tests for the in-memory transit graph (no database needed)
+"""
+import random
+import unittest
+from app.services.transit_graph import TransitGraph
+
+
+def segment(route_id, line, start, end, km):
+    return {'route_id': route_id, 'route_name': line, 'start_point': start, 'end_point': end, 'distance_km': km}
+
+
+# A-B-C on line L1 is 10 km with no transfer; A-D-C over L2 and L3 is 4 km with one
+NETWORK = [
+    segment(1, 'L1', 'A', 'B', 5),
+    segment(2, 'L1', 'B', 'C', 5),
+    segment(3, 'L2', 'A', 'D', 2),
+    segment(4, 'L3', 'D', 'C', 2),
+]
+
+
+def brute_force(rows, source, target):
+    """(min km, (min transfers, km)) over every simple path, by exhaustive search"""
+    adjacent = {}
+    for row in rows:
+        adjacent.setdefault(row['start_point'], []).append((row['end_point'], row['distance_km'], row['route_name']))
+        adjacent.setdefault(row['end_point'], []).append((row['start_point'], row['distance_km'], row['route_name']))
+    best_km, best_transfers = None, None
+
+    def walk(stop, visited, km, transfers, line):
+        nonlocal best_km, best_transfers
+        if stop == target:
+            best_km = km if best_km is None else min(best_km, km)
+            best_transfers = (transfers, km) if best_transfers is None else min(best_transfers, (transfers, km))
+            return
+        for neighbour, length, next_line in adjacent.get(stop, ()):
+            if neighbour not in visited:
+                walk(neighbour, visited | {neighbour}, km + length,
+                     transfers + (line is not None and next_line != line), next_line)
+
+    walk(source, {source}, 0, 0, None)
+    return best_km, best_transfers
+
+
+class TransitGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = TransitGraph(cache_size=100, precompute_pairs=5)
+        self.graph.load([NETWORK])
+
+    def test_shortest_distance(self):
+        result = self.graph.path('A', 'C')
+        self.assertEqual(result['distance_km'], 4)
+        self.assertEqual(result['transfers'], 1)
+        self.assertEqual([leg['route_id'] for leg in result['legs']], [3, 4])
+        self.assertEqual((result['from'], result['to']), ('A', 'C'))
+
+    def test_fewest_transfers(self):
+        result = self.graph.path('A', 'C', 'transfers')
+        self.assertEqual(result['transfers'], 0)
+        self.assertEqual(result['distance_km'], 10)
+        self.assertEqual([leg['route_name'] for leg in result['legs']], ['L1', 'L1'])
+
+    def test_stop_names_ignore_case_and_spacing(self):
+        self.assertEqual(self.graph.path(' a ', 'c')['distance_km'], 4)
+
+    def test_unknown_stop_and_bad_mode(self):
+        with self.assertRaises(KeyError):
+            self.graph.path('A', 'Nowhere')
+        with self.assertRaises(ValueError):
+            self.graph.path('A', 'C', 'fastest')
+
+    def test_unconnected_stops(self):
+        self.graph.put(segment(5, 'X', 'Y', 'Z', 1))
+        self.assertIsNone(self.graph.path('A', 'Z'))
+
+    def test_segments_without_both_ends_or_length_are_skipped(self):
+        graph = TransitGraph()
+        graph.load([[segment(1, 'L1', 'A', None, 2), segment(2, 'L1', 'A', 'B', None), segment(3, 'L1', 'A', 'A', 1)]])
+        self.assertEqual(graph.stats()['segments'], 0)
+
+    def test_results_are_cached_until_the_graph_changes(self):
+        self.assertFalse(self.graph.path('A', 'C')['cached'])
+        self.assertTrue(self.graph.path('A', 'C')['cached'])
+        self.graph.delete(3)
+        result = self.graph.path('A', 'C')
+        self.assertFalse(result['cached'])
+        self.assertEqual(result['distance_km'], 10)
+
+    def test_precompute_warms_popular_pairs(self):
+        self.graph.path('A', 'C')
+        self.graph.put(segment(3, 'L2', 'A', 'D', 1))
+        self.assertEqual(self.graph.precompute(), 1)
+        self.assertTrue(self.graph.path('A', 'C')['cached'])
+
+    def test_writes_during_a_load_win_over_loaded_rows(self):
+        graph = TransitGraph()
+
+        def batches():
+            yield NETWORK[:2]
+            # Live writes between two batches of the load
+            graph.delete(3)
+            graph.put(segment(4, 'L3', 'D', 'C', 20))
+            yield NETWORK[2:]
+
+        graph.load(batches())
+        self.assertTrue(graph.ready)
+        self.assertEqual(graph.stats()['segments'], 3)
+        self.assertEqual(graph.path('A', 'C')['distance_km'], 10)
+        self.assertEqual(graph.path('D', 'C')['distance_km'], 20)
+
+    def test_write_during_a_search_is_not_cached_stale(self):
+        graph = TransitGraph()
+        graph.load([NETWORK])
+        compute = graph._compute
+        calls = []
+
+        def racing_compute(mode, source, target):
+            calls.append(mode)
+            if len(calls) == 1:
+                # A write lands after the search read the graph
+                result = compute(mode, source, target)
+                graph.delete(3)
+                return result
+            return compute(mode, source, target)
+
+        graph._compute = racing_compute
+        self.assertEqual(graph.path('A', 'C')['distance_km'], 10)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(graph.path('A', 'C')['distance_km'], 10)
+
+    def test_matches_an_exhaustive_search(self):
+        rng = random.Random(7)
+        for _ in range(30):
+            stops = [f"s{i}" for i in range(8)]
+            rows = []
+            for route_id in range(1, 13):
+                start, end = rng.sample(stops, 2)
+                rows.append(segment(route_id, f"L{rng.randint(1, 3)}", start, end, rng.randint(1, 9)))
+            graph = TransitGraph()
+            graph.load([rows])
+            known = [stop for stop in stops if stop in graph._stops]
+            for source in known:
+                for target in known:
+                    best_km, best_transfers = brute_force(rows, source, target)
+                    by_distance = graph.path(source, target)
+                    by_transfers = graph.path(source, target, 'transfers')
+                    if best_km is None:
+                        self.assertIsNone(by_distance)
+                        self.assertIsNone(by_transfers)
+                        continue
+                    self.assertAlmostEqual(by_distance['distance_km'], best_km)
+                    self.assertEqual((by_transfers['transfers'], by_transfers['distance_km']), best_transfers)
+
+
+if __name__ == '__main__':
+    unittest.main()